@@ -27,7 +27,13 @@ def create_app(config_name=None):
     jwt.init_app(app)
     
     cors.init_app(app)
-    socketio.init_app(app)
+    # 使用Redis作为消息队列，Celery worker中也可以向客户端推送消息
+    cors_origins = app.config['CORS_ORIGINS']
+    socketio.init_app(
+        app,
+        message_queue=app.config['SOCKETIO_MESSAGE_QUEUE'],
+        cors_allowed_origins='*' if cors_origins == ['*'] else cors_origins
+    )
     api_spec.init_app(app)
     init_celery(app)
     init_extensions(app)  # 初始化缓存等其他扩展
@@ -48,6 +54,8 @@ def create_app(config_name=None):
     from app.api import api_bp
 
     app.register_blueprint(api_bp, url_prefix='/api')
+    # 注册Socket.IO事件
+    from app.sockets import events
     # 注册错误处理
     register_error_handlers(app)
     
@@ -242,7 +242,7 @@ def refresh_token():
     user = User.query.get_or_404(int(user_id))
     
     # 创建新的访问令牌
-    access_token = create_access_token(identity=str(user.id))
+    access_token = create_access_token(identity=str(user.id), additional_claims=AuthService.access_token_claims(user))
     
     return APIResponse.success(
         data={
@@ -6,6 +6,9 @@ from app.utils.decorators import api_error_handler
 from app.utils.response import APIResponse
 from app.models.user import User
 from app.models.llm_configuration import LLMConfiguration
+from app.services.ai.llm_config_cache import LLMConfigCache
+from app.services.ai.response_cache import LLMResponseCache
+from app.services.ai.provider_router import ProviderRouter
 from app.api.schemas.config import (
     PromptTemplateSchema,
     UpdatePromptTemplateSchema,
@@ -80,6 +83,9 @@ def update_prompt_template(data, template_id):
     # 保存到数据库
     db.session.commit()
     
+    # 通知所有进程清除该类型提示词的缓存
+    LLMConfigCache.notify_changed(LLMConfigCache.prompt_key(template.type))
+    
     return APIResponse.success(
         data=template.to_dict(),
         message="更新提示词模板成功"
@@ -122,9 +128,44 @@ def activate_llm_configuration(data):
         # 设置激活的提供商
         config = LLMConfiguration.set_active_provider(provider)
         
+        # 通知所有进程清除活跃提供者缓存
+        LLMConfigCache.notify_changed(LLMConfigCache.ACTIVE_PROVIDER_KEY)
+        
         return APIResponse.success(
             data=config.to_dict(),
             message=f"已成功激活 {provider} 提供商"
         )
     except ValueError as e:
         return APIResponse.error(message=str(e), code=400)
+
+@config_bp.route('/llm-response-cache/stats', methods=['GET'])
+@jwt_required()
+@api_error_handler
+def get_llm_response_cache_stats():
+    """获取大模型响应缓存的命中统计"""
+    # 检查权限
+    user_id = get_jwt_identity()
+    user = User.query.get_or_404(int(user_id))
+    if user.user_type != User.USER_TYPE_ADMIN:
+        return APIResponse.error(message="没有权限访问该接口", code=403)
+    
+    return APIResponse.success(
+        data=LLMResponseCache.stats(),
+        message="获取大模型响应缓存统计成功"
+    )
+
+@config_bp.route('/llm-router/status', methods=['GET'])
+@jwt_required()
+@api_error_handler
+def get_llm_router_status():
+    """获取本进程各大模型提供者的路由统计(耗时、错误率、熔断状态)"""
+    # 检查权限
+    user_id = get_jwt_identity()
+    user = User.query.get_or_404(int(user_id))
+    if user.user_type != User.USER_TYPE_ADMIN:
+        return APIResponse.error(message="没有权限访问该接口", code=403)
+    
+    return APIResponse.success(
+        data=ProviderRouter.status(),
+        message="获取大模型路由统计成功"
+    )
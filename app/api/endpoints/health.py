@@ -1,11 +1,13 @@
-from flask import Blueprint, current_app
+from flask import Blueprint, current_app, Response
 from flask_smorest import Blueprint
+from prometheus_client import CONTENT_TYPE_LATEST
 from datetime import datetime
 import os
 
 from app.api.schemas import HealthSchema
 from app.utils.response import APIResponse
 from app.utils.decorators import api_error_handler
+from app.services.ai.telemetry import LLMTelemetry
 
 # 创建蓝图
 health_bp = Blueprint(
@@ -33,4 +35,13 @@ def health_check():
     return APIResponse.success(
         data=health_data,
         message="服务器运行正常"
-    )
\ No newline at end of file
+    )
+
+@health_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus指标接口
+
+    导出大模型调用的耗时、首个分块耗时、token用量和调用结果等指标
+    """
+    return Response(LLMTelemetry.render(), mimetype=CONTENT_TYPE_LATEST)
@@ -8,6 +8,7 @@ from app.models.studentProfile import Student
 from app.models.collegePreference import CollegePreference
 from app.models.user import User
 from app.extensions import db
+from app.tasks.volunteer_tasks import schedule_candidate_precompute
 from datetime import datetime, timezone
 import json
 
@@ -74,6 +75,9 @@ def create_college_preference(data):
         db.session.commit()
         message = "志愿填报意向信息更新成功"
     
+    # 预计算候选集，加速后续生成方案和统计
+    schedule_candidate_precompute(student.id)
+    
     return APIResponse.success(
         data=preference.to_dict(),
         message=message,
@@ -219,6 +223,7 @@ def planner_update_college_preference(data, student_id):
     user_student.updated_at = datetime.now(timezone.utc)
 
     db.session.commit()
+    schedule_candidate_precompute(student.id)
     
     return APIResponse.success(
         data=preference.to_dict(),
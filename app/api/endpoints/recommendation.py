@@ -127,8 +127,7 @@ def get_colleges_by_category(data):
     
     if current_plan:
         # 获取当前志愿方案中的所有院校
-        selected_colleges = VolunteerCollege.query.filter_by(
-            plan_id=current_plan.id,
+        selected_colleges = VolunteerCollege.query_for_plan(current_plan.id).filter_by(
             category_id=category_id,
             group_id=group_id
         ).all()
@@ -331,95 +330,9 @@ def get_college_stats(data):
     # 从学生ID提取学生信息
     recommendation_data = StudentDataService.extract_college_recommendation_data(student_id)
     
-    # 导入哈希计算工具和缓存
-    from app.extensions import cache
-    from app.utils.user_hash import calculate_user_data_hash
-    # 获取当前学生数据的哈希值
-    current_hash = calculate_user_data_hash(recommendation_data)
-    
-    # 为该接口使用特定的缓存键，包含哈希值，确保数据变化时自动失效
-    cache_key = f"college_stats:{student_id}:{current_hash}"
-    
-    # 尝试从缓存获取结果
-    cached_result = cache.get(cache_key)
-
-    # 如果缓存存在，直接返回缓存结果
-    if cached_result:
-        return APIResponse.success(cached_result, message="获取院校统计数据成功(缓存)")
-    from app.utils.cache_utils import delete_old_cache_for_student
-    
-    # 删除旧缓存
-    delete_old_cache_for_student(student_id, current_hash)
-    # 初始化结果
-    result = {
-        'categories': [],
-        'total_colleges': 0
-    }
-    
-    # 定义类别名称映射
-    category_names = {
-        1: "冲",
-        2: "稳",
-        3: "保"
-    }
-    
-    # 批量查询所有组的院校数量，减少数据库查询次数
-    student_score = recommendation_data['student_score'] if recommendation_data['student_score'] is not None and recommendation_data['student_score'] > 0 else recommendation_data['mock_exam_score']
-    subject_type = recommendation_data['subject_type']
-    education_level = recommendation_data['education_level']
-    student_subjects = recommendation_data['student_subjects']
-    area_ids = recommendation_data['area_ids']
-    specialty_types = recommendation_data['specialty_types']
-    
-    # 遍历三个类别（冲、稳、保）
-    for category_id in [1, 2, 3]:
-        category_data = {
-            'category_id': category_id,
-            'category_name': category_names[category_id],
-            'total_colleges': 0,
-            'groups': []
-        }
-        
-        # 每个类别只有4个组（而不是12个）
-        # 计算起始组ID和结束组ID
-        start_group_id = (category_id - 1) * 4 + 1
-        end_group_id = start_group_id + 3
-        
-        # 遍历当前类别下的4个志愿段
-        for group_id in range(start_group_id, end_group_id + 1):
-            # 使用优化的方法获取院校数量
-            group_college_count = RecommendationService.get_college_count_by_category_and_group(
-                student_score=student_score,
-                subject_type=subject_type,
-                education_level=education_level,
-                category_id=category_id,
-                group_id=group_id,
-                student_subjects=student_subjects,
-                area_ids=area_ids,
-                specialty_types=specialty_types,
-                mode=mode,
-                tese_types=recommendation_data.get('tese_types'),
-                leixing_types=recommendation_data.get('leixing_types'),
-                teshu_types=recommendation_data.get('teshu_types'),
-                tuition_ranges=recommendation_data.get('tuition_ranges')
-            )
-            
-            # 添加该组的统计数据（移除selected_count）
-            category_data['groups'].append({
-                'group_id': group_id,
-                'total_colleges': group_college_count
-            })
-            
-            # 累加到类别总数
-            category_data['total_colleges'] += group_college_count
-            
-        # 添加类别数据到结果
-        result['categories'].append(category_data)
-        
-        # 累加到总院校数
-        result['total_colleges'] += category_data['total_colleges']
-    
-    # 将结果存入缓存，有效期1天
-    cache.set(cache_key, result, timeout=86400)  # 一天
+    # 统计结果按学生数据哈希缓存，保存学生信息时会预先计算
+    result, from_cache = RecommendationService.get_college_stats(recommendation_data, mode=mode)
+    if from_cache:
+        return APIResponse.success(result, message="获取院校统计数据成功(缓存)")
     
     return APIResponse.success(result, message="获取院校统计数据成功")
\ No newline at end of file
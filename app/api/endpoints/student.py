@@ -8,7 +8,7 @@ from app.models.studentProfile import Student, AcademicRecord
 from app.models.user import User
 from app.extensions import db
 from datetime import datetime, timezone
-from app.tasks.volunteer_tasks import generate_volunteer_plan_task
+from app.tasks.volunteer_tasks import enqueue_plan_generation, schedule_candidate_precompute
 from app.models.student_volunteer_plan import StudentVolunteerPlan
 from app.services.student.student_data_service import StudentDataService
 from app.utils.user_hash import calculate_user_data_hash
@@ -138,13 +138,16 @@ def create_student_data(data):
     # 嵌套事务结束后，提交外部事务
     db.session.commit()
     
+    # 预计算候选集，加速后续生成方案和统计
+    schedule_candidate_precompute(student.id)
+    
     # 检查是否需要创建志愿方案(在事务之外，只有在数据保存成功后才启动异步任务)
     has_plan = StudentVolunteerPlan.query.filter_by(student_id=student.id, is_current=True).first()
     if not has_plan:
         planner_id = user.planner_id
         student_data = StudentDataService.extract_college_recommendation_data(student.id)
         user_data_hash = calculate_user_data_hash(student_data)
-        generate_volunteer_plan_task.delay(student.id, planner_id, user_data_hash, is_first=True)
+        enqueue_plan_generation(student.id, planner_id, user_data_hash, is_first=True)
     
     # 确定响应状态码：如果是新创建的学生档案或学业记录，则返回200，否则返回200
     if not existing_profile or not existing_record:
@@ -239,7 +242,7 @@ def create_student_profile(data):
         planner_id = user.planner_id
         student_data = StudentDataService.extract_college_recommendation_data(student.id)
         user_data_hash = calculate_user_data_hash(student.to_dict())
-        generate_volunteer_plan_task.delay(student.id, planner_id, user_data_hash, is_first=True)
+        enqueue_plan_generation(student.id, planner_id, user_data_hash, is_first=True)
     return APIResponse.success(
         data=student.to_dict(),
         message=message,
@@ -329,6 +332,9 @@ def create_academic_record(data):
         message = "学业记录创建成功"
         code = 200
     
+    # 预计算候选集，加速后续生成方案和统计
+    schedule_candidate_precompute(student.id)
+    
     return APIResponse.success(
         data=academic_record.to_dict(),
         message=message,
@@ -450,6 +456,7 @@ def planner_update_academic_record(data, student_id):
             academic_record.save()
 
             student_user.updated_at = datetime.now(timezone.utc)
+            schedule_candidate_precompute(student.id)
             return APIResponse.success(
                 data=academic_record.to_dict(),
                 message="学业记录创建成功"
@@ -461,6 +468,7 @@ def planner_update_academic_record(data, student_id):
                 setattr(academic_record, field, value)
         
         db.session.commit()
+        schedule_candidate_precompute(student.id)
         
         return APIResponse.success(
             data=academic_record.to_dict(),
@@ -9,11 +9,16 @@ from sqlalchemy.exc import SQLAlchemyError
 from app.api.schemas.volunteer_analysis import (
   VolunteerCategorySchema, QueryAnalysisResultSchema, CollegeAnalysisSchema, SpecialtyAnalysisSchema
 )
-from app.models.student_volunteer_plan import VolunteerCollege, VolunteerSpecialty, VolunteerCategoryAnalysis
-from app.tasks.volunteer_tasks import analyze_volunteer_category_task, analyze_college_task, analyze_specialty_task, analyze_volunteer_plan_task
+from app.models.student_volunteer_plan import VolunteerCollege, VolunteerSpecialty, VolunteerCategoryAnalysis, DEFERRED_GROUP_AI_ANALYSIS
+from app.tasks.volunteer_tasks import (
+    analyze_volunteer_category_task, analyze_college_task, analyze_specialty_task, analyze_volunteer_plan_task,
+    analyze_colleges_batch_task, analyze_specialties_batch_task
+)
 from app.models.user import User
 from app.models.student_volunteer_plan import StudentVolunteerPlan
 from app.services.student.student_data_service import StudentDataService
+from app.services.volunteer.plan_document_cache import PlanDocumentCache
+from app.services.volunteer.ai_college_specialty_service import AICollegeSpecialtyAnalysisService
 # 创建志愿方案蓝图
 volunteer_analysis_bp = Blueprint(
     'volunteer_analysis', 
@@ -31,6 +36,7 @@ def analyze_volunteer_category(data):
     """
     plan_id = data['plan_id']
     category_id = data['category_id']
+    refresh = data['refresh']
     current_user_id = get_jwt_identity()
     current_user = User.query.get_or_404(current_user_id)
     
@@ -47,12 +53,12 @@ def analyze_volunteer_category(data):
     
     try:
         if existing_analysis:
-            if existing_analysis.status == VolunteerCategoryAnalysis.STATUS_COMPLETED:
-                return APIResponse.error("该方案当前类别已存在分析结果", code=400)
-            elif existing_analysis.status == VolunteerCategoryAnalysis.STATUS_PROCESSING:
+            if existing_analysis.status == VolunteerCategoryAnalysis.STATUS_PROCESSING:
                 return APIResponse.error("该方案当前类别正在分析中，请稍后再试", code=400)
+            elif existing_analysis.status == VolunteerCategoryAnalysis.STATUS_COMPLETED and not refresh:
+                return APIResponse.error("该方案当前类别已存在分析结果", code=400)
             else:
-                # 如果状态为FAILED，更新现有记录而不是创建新记录
+                # 状态为FAILED或要求重新分析时，更新现有记录而不是创建新记录
                 existing_analysis.status = VolunteerCategoryAnalysis.STATUS_PROCESSING
                 existing_analysis.error_message = None
                 db.session.commit()
@@ -66,9 +72,11 @@ def analyze_volunteer_category(data):
             )
             db.session.add(new_analysis)
             db.session.commit()
+
+        PlanDocumentCache.invalidate(plan_id)
         
         # 提交异步任务
-        task = analyze_volunteer_category_task.delay(plan_id, category_id)
+        task = analyze_volunteer_category_task.delay(plan_id, category_id, refresh)
         
         return APIResponse.success(
             message="AI志愿分析任务已提交，正在处理中",
@@ -141,22 +149,31 @@ def analyze_college(data):
     if current_user.user_type != User.USER_TYPE_PLANNER:
         return APIResponse.error("无权限访问该接口", code=403)
     
-    # 验证院校是否存在
-    college = VolunteerCollege.query.get(volunteer_college_id)
+    # 验证院校是否存在(指定方案时须为该方案实际生效的院校)
+    plan_id = data.get('plan_id')
+    query = VolunteerCollege.query_for_plan(plan_id) if plan_id else VolunteerCollege.query
+    college = query.filter(VolunteerCollege.id == volunteer_college_id).first()
     if not college:
         return APIResponse.error(f"未找到ID为{volunteer_college_id}的院校信息", code=404)
     
-    # 判断是否已有分析
-    if college.ai_analysis:
+    # 判断是否已有分析(要求重新分析时覆盖)
+    if college.ai_analysis and not data['refresh']:
         return APIResponse.error("该院校已存在AI分析结果", code=400)
     
+    # 院校被多个方案版本共享时先写时复制，返回分析结果将写入的院校ID
+    plan_id, target_id = AICollegeSpecialtyAnalysisService.prepare_college_analysis(volunteer_college_id, plan_id)
+    if not target_id:
+        return APIResponse.error("提交院校分析任务失败", code=500)
+    
     # 启动异步任务
-    task = analyze_college_task.delay(volunteer_college_id)
+    task = analyze_college_task.delay(target_id, plan_id, data['refresh'])
     
     return APIResponse.success(
         message="AI院校分析任务已提交，正在处理中",
         data={
-            "task_id": task.id
+            "task_id": task.id,
+            "plan_id": plan_id,
+            "volunteer_college_id": target_id
         },
         code=200
     )
@@ -214,22 +231,33 @@ def analyze_specialty(data):
     if current_user.user_type != User.USER_TYPE_PLANNER:
         return APIResponse.error("无权限访问该接口", code=403)
     
-    # 验证专业是否存在
-    specialty = VolunteerSpecialty.query.get(specialty_id)
+    # 验证专业是否存在(指定方案时所属院校须为该方案实际生效的院校)
+    plan_id = data.get('plan_id')
+    query = VolunteerSpecialty.query.filter(VolunteerSpecialty.id == specialty_id)
+    if plan_id:
+        query = query.join(VolunteerCollege).filter(VolunteerCollege.plan_filter(plan_id))
+    specialty = query.first()
     if not specialty:
         return APIResponse.error(f"未找到ID为{specialty_id}的专业信息", code=404)
     
-    # 判断是否已有分析
-    if specialty.ai_analysis:
+    # 判断是否已有分析(要求重新分析时覆盖)
+    if specialty.ai_analysis and not data['refresh']:
         return APIResponse.error("该专业已存在AI分析结果", code=400)
     
+    # 所属院校被多个方案版本共享时先写时复制，返回分析结果将写入的专业ID
+    plan_id, target_id = AICollegeSpecialtyAnalysisService.prepare_specialty_analysis(specialty_id, plan_id)
+    if not target_id:
+        return APIResponse.error("提交专业分析任务失败", code=500)
+    
     # 启动异步任务
-    task = analyze_specialty_task.delay(specialty_id)
+    task = analyze_specialty_task.delay(target_id, plan_id, data['refresh'])
     
     return APIResponse.success(
         message="AI专业分析任务已提交，正在处理中",
         data={
-            "task_id": task.id
+            "task_id": task.id,
+            "plan_id": plan_id,
+            "specialty_id": target_id
         },
         code=200
     )
@@ -291,21 +319,23 @@ def batch_analyze_colleges():
     if not college_ids:
         return APIResponse.error("未提供院校ID列表", code=400)
     
-    # 验证所有院校是否存在
-    colleges = VolunteerCollege.query.filter(VolunteerCollege.id.in_(college_ids)).all()
+    # 验证所有院校是否存在(指定方案时须为该方案实际生效的院校)
+    plan_id = data.get('plan_id')
+    query = VolunteerCollege.query_for_plan(plan_id) if plan_id else VolunteerCollege.query
+    colleges = query.filter(VolunteerCollege.id.in_(college_ids)).options(
+        db.undefer_group(DEFERRED_GROUP_AI_ANALYSIS)
+    ).all()
     if len(colleges) != len(college_ids):
         return APIResponse.error("部分院校ID不存在", code=400)
     
-    # 启动多个异步任务
-    task_count = 0
-    for college_id in college_ids:
-        college = VolunteerCollege.query.get(college_id)
-        if not college.ai_analysis:  # 只分析没有结果的院校
-            analyze_college_task.delay(college_id)
-            task_count += 1
+    # 只分析没有结果的院校(要求重新分析时全部分析)，由一个任务并发调用大模型
+    refresh = bool(data.get('refresh', False))
+    pending_ids = [college.id for college in colleges if refresh or not college.ai_analysis]
+    task_count = len(pending_ids)
+    task_id = analyze_colleges_batch_task.delay(pending_ids, plan_id, refresh).id if pending_ids else None
     
     return APIResponse.success(
-        data={"task_count": task_count},
+        data={"task_count": task_count, "task_id": task_id},
         message=f"已提交{task_count}个院校分析任务"
     )
 
@@ -331,21 +361,25 @@ def batch_analyze_specialties():
     if not specialty_ids:
         return APIResponse.error("未提供专业ID列表", code=400)
     
-    # 验证所有专业是否存在
-    specialties = VolunteerSpecialty.query.filter(VolunteerSpecialty.id.in_(specialty_ids)).all()
+    # 验证所有专业是否存在(指定方案时所属院校须为该方案实际生效的院校)
+    plan_id = data.get('plan_id')
+    query = VolunteerSpecialty.query.filter(VolunteerSpecialty.id.in_(specialty_ids))
+    if plan_id:
+        query = query.join(VolunteerCollege).filter(VolunteerCollege.plan_filter(plan_id))
+    specialties = query.options(
+        db.undefer_group(DEFERRED_GROUP_AI_ANALYSIS)
+    ).all()
     if len(specialties) != len(specialty_ids):
         return APIResponse.error("部分专业ID不存在", code=400)
     
-    # 启动多个异步任务
-    task_count = 0
-    for specialty_id in specialty_ids:
-        specialty = VolunteerSpecialty.query.get(specialty_id)
-        if not specialty.ai_analysis:  # 只分析没有结果的专业
-            analyze_specialty_task.delay(specialty_id)
-            task_count += 1
+    # 只分析没有结果的专业(要求重新分析时全部分析)，由一个任务并发调用大模型
+    refresh = bool(data.get('refresh', False))
+    pending_ids = [specialty.id for specialty in specialties if refresh or not specialty.ai_analysis]
+    task_count = len(pending_ids)
+    task_id = analyze_specialties_batch_task.delay(pending_ids, plan_id, refresh).id if pending_ids else None
     
     return APIResponse.success(
-        data={"task_count": task_count},
+        data={"task_count": task_count, "task_id": task_id},
         message=f"已提交{task_count}个专业分析任务"
     )
 
@@ -365,8 +399,9 @@ def create_plan_analysis(plan_id):
     if current_user.user_type != User.USER_TYPE_PLANNER:
         return APIResponse.error("无权限访问该接口", code=403)
 
-    # 异步执行分析任务
-    task = analyze_volunteer_plan_task.delay(plan_id)
+    # 异步执行分析任务，请求体中 refresh 为true时跳过大模型响应缓存重新分析
+    refresh = bool((request.get_json(silent=True) or {}).get('refresh', False))
+    task = analyze_volunteer_plan_task.delay(plan_id, refresh)
     
     return APIResponse.success({
         'task_id': task.id,
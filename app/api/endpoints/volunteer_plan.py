@@ -1,11 +1,13 @@
 # app/api/endpoints/volunteer_plan.py
-from flask import current_app,request 
+from flask import current_app,request, Response
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.utils.response import APIResponse
 from app.utils.decorators import api_error_handler
 from app.models.student_volunteer_plan import StudentVolunteerPlan
-from app.services.volunteer.plan_service import VolunteerPlanService, generate_complete_volunteer_plan
-from app.tasks.volunteer_tasks import generate_volunteer_plan_task,export_volunteer_plan_to_pdf_task
+from app.services.volunteer.plan_service import VolunteerPlanService, generate_complete_volunteer_plan, PlanVersionConflictError
+from app.services.volunteer.plan_progress_service import PlanProgressService
+from app.services.volunteer.plan_document_cache import PlanDocumentCache
+from app.tasks.volunteer_tasks import generate_volunteer_plan_task,export_volunteer_plan_to_pdf_task, enqueue_plan_generation
 from flask_smorest import Blueprint
 from app.api.schemas.volunteer_plan import (
     PlanHistoryResponseSchema, PlanDetailResponseSchema,GenerateAiPlanSchema,
@@ -13,6 +15,7 @@ from app.api.schemas.volunteer_plan import (
     VolunteerPlanResponseSchema
 )
 from app.models.user import User
+from app.models.studentProfile import Student
 from app.utils.user_hash import calculate_user_data_hash
 from app.services.student.student_data_service import StudentDataService
 from app.services.volunteer.consultation_status_service import update_student_plan_status
@@ -42,7 +45,8 @@ def generate_ai_volunteer_plan(data):
     """
     AI自动生成志愿方案(异步)
     
-    根据学生信息自动生成完整的志愿方案，包含12个批次共48个院校志愿
+    根据学生信息自动生成完整的志愿方案，包含12个批次共48个院校志愿。
+    mode为solver时不调用大模型，由本地求解器直接生成方案
     """
     student_id = data['student_id']
     planner_id = get_jwt_identity()  # 当前登录的规划师ID
@@ -66,18 +70,56 @@ def generate_ai_volunteer_plan(data):
             code=200
         )
     
-    # 启动异步任务，并传递当前数据哈希
-    task = generate_volunteer_plan_task.delay(
+    # 启动异步任务，并传递当前数据哈希；相同数据已有生成任务时直接返回该任务ID
+    task_id, is_new = enqueue_plan_generation(
         student_id=student_id,
         planner_id=planner_id,
-        user_data_hash=current_hash
+        user_data_hash=current_hash,
+        generation_mode=data.get('mode', 'ai')
     )
     
     return APIResponse.success(
-        message="志愿方案生成任务已启动",
+        data={'task_id': task_id},
+        message="志愿方案生成任务已启动" if is_new else "志愿方案正在生成中，请勿重复提交",
         code=200
     )
 
+@volunteer_plan_bp.route('/progress/<int:plan_id>', methods=['GET'])
+@volunteer_plan_bp.response(200)
+@jwt_required()
+@api_error_handler
+def get_plan_progress(plan_id):
+    """
+    获取志愿方案生成进度
+    
+    优先读取Redis中的实时进度，不存在时回退到数据库记录。
+    推荐通过Socket.IO订阅(join_plan事件)接收进度推送，本接口用于不支持Socket.IO的客户端
+    """
+    current_user = User.query.get_or_404(get_jwt_identity())
+    if current_user.user_type != User.USER_TYPE_PLANNER:
+        return APIResponse.error("无权限访问该接口", code=403)
+    
+    # 验证方案所属学生是否属于该规划师(与join_plan事件的校验一致)
+    plan = StudentVolunteerPlan.query.get_or_404(plan_id)
+    student = Student.query.get(plan.student_id)
+    student_user = User.query.get(student.user_id) if student else None
+    if not student_user or student_user.planner_id != current_user.id:
+        return APIResponse.error("无权查看该方案", code=403)
+    
+    progress_data = PlanProgressService.get(plan_id)
+    if not progress_data:
+        progress_data = {
+            'plan_id': plan.id,
+            'generation_status': plan.generation_status,
+            'generation_progress': plan.generation_progress,
+            'generation_message': plan.generation_message,
+        }
+    
+    return APIResponse.success(
+        data=progress_data,
+        message="获取方案生成进度成功"
+    )
+
 @volunteer_plan_bp.route('/history/<int:student_id>', methods=['GET'])
 @volunteer_plan_bp.response(200, PlanHistoryResponseSchema)
 @volunteer_plan_bp.arguments(PlanHistoryQueryParamsSchema, location="query")
@@ -111,8 +153,8 @@ def get_plan_history(query_args, student_id):
         page=page, per_page=per_page
     )
     
-    # 构建响应数据
-    plan_list = [plan.to_dict() for plan in plans.items]
+    # 构建响应数据(列表不返回学生数据快照，需要时通过详情接口获取)
+    plan_list = [plan.to_dict(include_snapshot=False) for plan in plans.items]
     
     return APIResponse.success(
         data={
@@ -147,25 +189,9 @@ def get_plan_detail(query_args, plan_id):
     if not is_planner:
         return APIResponse.error("无权限访问该接口", code=403)
     
-    # 获取查询参数
-    include_details = query_args.get('include_details', True)
-    category_id = query_args.get('category_id')
-    group_id = query_args.get('group_id')
-    volunteer_index = query_args.get('volunteer_index')
-    
-    # 使用服务获取志愿方案详情
-    plan_detail = VolunteerPlanService.get_volunteer_plan(
-        plan_id=plan_id,
-        include_details=include_details,
-        category_id=category_id,
-        group_id=group_id,
-        volunteer_index=volunteer_index
-    )
+    plan = StudentVolunteerPlan.query.get_or_404(plan_id)
     
-    return APIResponse.success(
-        data=plan_detail,
-        message="获取志愿方案详情成功"
-    )
+    return _plan_document_response(plan, query_args, "获取志愿方案详情成功")
 
 @volunteer_plan_bp.route('/current/<int:student_id>', methods=['GET'])
 @volunteer_plan_bp.response(200, PlanDetailResponseSchema)
@@ -196,24 +222,72 @@ def get_current_plan(query_args, student_id):
     if not plan:
         return APIResponse.error("当前学生没有志愿方案", code=404)
     
-    # 获取查询参数
-    include_details = query_args.get('include_details', True)
-    category_id = query_args.get('category_id')
-    group_id = query_args.get('group_id')
-    volunteer_index = query_args.get('volunteer_index')
-    
-    # 使用服务获取志愿方案详情
-    plan_detail = VolunteerPlanService.get_volunteer_plan(
-        plan_id=plan.id,
-        include_details=include_details,
-        category_id=category_id,
-        group_id=group_id,
-        volunteer_index=volunteer_index
+    return _plan_document_response(plan, query_args, "获取当前志愿方案成功")
+
+def _plan_document_response(plan, query_args, message):
+    """
+    返回志愿方案详情，使用预序列化的方案文档缓存并支持ETag/If-None-Match
+    
+    :param plan: 志愿方案对象
+    :param query_args: 查询参数
+    :param message: 响应消息
+    :return: 响应对象
+    """
+    params = {
+        'include_details': query_args.get('include_details', True),
+        'category_id': query_args.get('category_id'),
+        'group_id': query_args.get('group_id'),
+        'volunteer_index': query_args.get('volunteer_index'),
+    }
+    version_field = PlanDocumentCache.version_field(plan, **params)
+    etag = PlanDocumentCache.etag(plan.id, version_field)
+    cacheable = PlanDocumentCache.is_cacheable(plan)
+    
+    # 方案未变化，直接返回304
+    if cacheable and etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    
+    document = PlanDocumentCache.get_document(
+        plan,
+        version_field,
+        lambda: VolunteerPlanService.get_volunteer_plan(plan_id=plan.id, **params)
     )
     
+    # 复用预序列化的data部分，只拼接响应外层结构
+    envelope = current_app.json.dumps({"success": True, "message": message, "code": 200})
+    body = envelope[:-1].encode('utf-8') + b', "data": ' + document + b'}'
+    response = Response(body, status=200, mimetype='application/json')
+    if cacheable:
+        response.set_etag(etag)
+    return response
+
+@volunteer_plan_bp.route('/plan/<int:plan_id>/diff/<int:other_plan_id>', methods=['GET'])
+@volunteer_plan_bp.response(200)
+@jwt_required()
+@api_error_handler
+def diff_volunteer_plans(plan_id, other_plan_id):
+    """
+    对比两个志愿方案版本
+    
+    返回从plan_id到other_plan_id的志愿新增、删除、位置变化和专业变化
+    """
+    current_user_id = get_jwt_identity()
+    current_user = User.query.get_or_404(current_user_id)
+    
+    # 检查用户类型权限 - 只有规划师可以访问该接口
+    if current_user.user_type != User.USER_TYPE_PLANNER:
+        return APIResponse.error("无权限访问该接口", code=403)
+    
+    try:
+        diff = VolunteerPlanService.diff_volunteer_plans(plan_id, other_plan_id)
+    except ValueError as e:
+        return APIResponse.error(message=str(e), code=400)
+    
     return APIResponse.success(
-        data=plan_detail,
-        message="获取当前志愿方案成功"
+        data=diff,
+        message="获取志愿方案差异成功"
     )
 
 @volunteer_plan_bp.route('/plan/<int:plan_id>', methods=['PUT'])
@@ -247,10 +321,23 @@ def update_volunteer_plan(data, plan_id):
     session['last_update_time'] = current_time
     
     # 调用服务更新志愿方案
-    updated_plan = VolunteerPlanService.update_volunteer_plan(
-        plan_id=plan_id,
-        update_data=data,
-    )
+    try:
+        updated_plan = VolunteerPlanService.update_volunteer_plan(
+            plan_id=plan_id,
+            update_data=data,
+        )
+    except PlanVersionConflictError as e:
+        # 基准版本已过期，返回最新版本及其与本次修改所基于方案的差异，由客户端合并后重新提交
+        session.pop('last_update_time', None)
+        return APIResponse.error(
+            message=str(e),
+            errors={
+                'latest_plan_id': e.latest_plan_id,
+                'latest_version': e.latest_version,
+                'diff': VolunteerPlanService.diff_volunteer_plans(plan_id, e.latest_plan_id)
+            },
+            code=409
+        )
     
     # 获取方案对应的学生ID并更新咨询状态
     plan = StudentVolunteerPlan.query.get(plan_id)
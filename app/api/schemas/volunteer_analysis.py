@@ -3,6 +3,7 @@ from marshmallow import Schema, fields
 class VolunteerCategorySchema(Schema):
     plan_id = fields.Int(required=True, description="志愿计划ID")
     category_id = fields.Int(required=True, description="类别ID，例如1.冲, 2.稳, 3.保")
+    refresh = fields.Boolean(load_default=False, description="是否重新分析(已有分析结果时覆盖，并跳过大模型响应缓存)")
     
 class QueryAnalysisResultSchema(Schema):
     """查询分析结果参数Schema"""
@@ -12,7 +13,11 @@ class QueryAnalysisResultSchema(Schema):
 class CollegeAnalysisSchema(Schema):
     """院校分析请求Schema"""
     volunteer_college_id = fields.Integer(required=True, description="志愿院校ID")
+    plan_id = fields.Integer(description="发起分析的志愿方案ID，院校被多个版本共享时只写入该版本，默认为学生当前版本中包含该院校的方案")
+    refresh = fields.Boolean(load_default=False, description="是否重新分析(已有分析结果时覆盖，并跳过大模型响应缓存)")
 
 class SpecialtyAnalysisSchema(Schema):
     """专业分析请求Schema"""
-    specialty_id = fields.Integer(required=True, description="志愿专业ID")
\ No newline at end of file
+    specialty_id = fields.Integer(required=True, description="志愿专业ID")
+    plan_id = fields.Integer(description="发起分析的志愿方案ID，所属院校被多个版本共享时只写入该版本，默认为学生当前版本中包含所属院校的方案")
+    refresh = fields.Boolean(load_default=False, description="是否重新分析(已有分析结果时覆盖，并跳过大模型响应缓存)")
@@ -3,6 +3,11 @@ from marshmallow import Schema, fields, validate, EXCLUDE
 
 class GenerateAiPlanSchema(Schema):
     student_id = fields.Integer(required=True, description='学生ID')
+    mode = fields.String(
+        load_default='ai',
+        validate=validate.OneOf(['ai', 'solver']),
+        description='生成模式：ai-AI选择院校(预算耗尽时自动切换本地求解)，solver-仅本地求解'
+    )
 
 class StudentVolunteerPlanSchema(Schema):
     """学生志愿方案模式"""
@@ -11,6 +16,7 @@ class StudentVolunteerPlanSchema(Schema):
     planner_id = fields.Int(required=True)
     version = fields.Int(dump_only=True)
     is_current = fields.Bool(dump_only=True)
+    is_archived = fields.Bool(dump_only=True)
     remarks = fields.Str()
     generation_status = fields.Str(dump_only=True)
     generation_progress = fields.Int(dump_only=True)
@@ -92,6 +98,10 @@ class UpdateVolunteerPlanSchema(Schema):
     class Meta:
         unknown = EXCLUDE  # 允许忽略未知字段
     remarks = fields.String(allow_none=True)
+    base_version = fields.Integer(
+        required=False,
+        description='客户端修改所基于的方案版本号，与最新版本不一致时返回409及差异'
+    )
     colleges = fields.List(fields.Nested(VolunteerCollegeSchema), required=True)
 
 # 志愿类别分析Schema
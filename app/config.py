@@ -48,6 +48,103 @@ class Config:
     CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL') or 'redis://localhost:6379/0'
     CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND') or 'redis://localhost:6379/0'
     
+    # Socket.IO消息队列，默认与Celery共用Redis
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE') or CELERY_BROKER_URL
+    
+    # 志愿方案生成配置
+    # 单次方案生成最多调用大模型的批次数，超出后自动切换本地求解器
+    VOLUNTEER_PLAN_LLM_BUDGET = int(os.environ.get('VOLUNTEER_PLAN_LLM_BUDGET', 12))
+    # 方案生成单飞锁在任务排队期间的过期时间(秒)，任务消息丢失时锁在此时间后自动释放
+    PLAN_GENERATION_LOCK_TIMEOUT = int(os.environ.get('PLAN_GENERATION_LOCK_TIMEOUT', 1800))
+    # 任务执行期间每隔 PLAN_GENERATION_HEARTBEAT_INTERVAL 秒把锁续期为 PLAN_GENERATION_HEARTBEAT_TTL 秒，
+    # worker异常退出后心跳停止，锁在TTL内过期即可重新生成；正常执行的任务不受时长限制
+    PLAN_GENERATION_HEARTBEAT_TTL = int(os.environ.get('PLAN_GENERATION_HEARTBEAT_TTL', 60))
+    PLAN_GENERATION_HEARTBEAT_INTERVAL = float(os.environ.get('PLAN_GENERATION_HEARTBEAT_INTERVAL', 15))
+    # 同一院校在整个方案中最多出现的专业组数量
+    VOLUNTEER_PLAN_DIVERSITY_CAP = int(os.environ.get('VOLUNTEER_PLAN_DIVERSITY_CAP', 2))
+    # 每个学生除当前版本外保留为热数据的历史方案版本数量，更早的版本压缩转存到归档表
+    PLAN_HOT_VERSIONS = int(os.environ.get('PLAN_HOT_VERSIONS', 5))
+    
+    # 大模型调用配置
+    # 单次请求的读取超时和连接超时(秒)
+    LLM_REQUEST_TIMEOUT = float(os.environ.get('LLM_REQUEST_TIMEOUT', 120))
+    LLM_CONNECT_TIMEOUT = float(os.environ.get('LLM_CONNECT_TIMEOUT', 10))
+    # SDK层面的自动重试次数，默认不重试：失败由路由切换到备选提供者，重试请求会绕过限流并放大耗时
+    LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 0))
+    # 每个进程对同一提供者的最大并发请求数
+    LLM_PROVIDER_CONCURRENCY = {
+        'moonshot': int(os.environ.get('LLM_CONCURRENCY_MOONSHOT', 8)),
+        'deepseek': int(os.environ.get('LLM_CONCURRENCY_DEEPSEEK', 8)),
+        'zhipu': int(os.environ.get('LLM_CONCURRENCY_ZHIPU', 8)),
+        'stub': int(os.environ.get('LLM_CONCURRENCY_STUB', 8)),
+    }
+    # 每个提供者连接池保持的长连接数量
+    LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('LLM_MAX_KEEPALIVE_CONNECTIONS', 10))
+    # 活跃提供者、提示词模板的进程内缓存过期时间(秒)，变更通知丢失时的兜底
+    LLM_CONFIG_CACHE_TTL = int(os.environ.get('LLM_CONFIG_CACHE_TTL', 60))
+    # 分析类调用的大模型响应缓存：是否启用(默认关闭，按需开启)、过期时间(秒)、最大条目数、单条最大字节数(压缩后)
+    LLM_RESPONSE_CACHE_ENABLED = os.environ.get('LLM_RESPONSE_CACHE_ENABLED', '0') == '1'
+    LLM_RESPONSE_CACHE_TTL = int(os.environ.get('LLM_RESPONSE_CACHE_TTL', 60 * 60 * 24 * 3))
+    LLM_RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('LLM_RESPONSE_CACHE_MAX_ENTRIES', 5000))
+    LLM_RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('LLM_RESPONSE_CACHE_MAX_BYTES', 256 * 1024))
+    # 提供者侧上下文缓存(Moonshot)：是否启用、缓存有效期(秒，每次引用时重置)、公共前缀少于多少字符时不创建
+    LLM_CONTEXT_CACHE_ENABLED = os.environ.get('LLM_CONTEXT_CACHE_ENABLED', '1') == '1'
+    LLM_CONTEXT_CACHE_TTL = int(os.environ.get('LLM_CONTEXT_CACHE_TTL', 600))
+    LLM_CONTEXT_CACHE_MIN_CHARS = int(os.environ.get('LLM_CONTEXT_CACHE_MIN_CHARS', 1000))
+    # 多提供者路由：是否启用、统计窗口(最近调用次数)、连续失败多少次熔断、熔断冷却时间(秒)
+    LLM_ROUTER_ENABLED = os.environ.get('LLM_ROUTER_ENABLED', '1') == '1'
+    LLM_ROUTER_WINDOW_SIZE = int(os.environ.get('LLM_ROUTER_WINDOW_SIZE', 50))
+    LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('LLM_CIRCUIT_FAILURE_THRESHOLD', 5))
+    LLM_CIRCUIT_RESET_TIMEOUT = float(os.environ.get('LLM_CIRCUIT_RESET_TIMEOUT', 30))
+    # 对冲请求：首选提供者超过其p95耗时(至少LLM_HEDGE_MIN_DELAY秒)仍未返回时向备选提供者再发一次
+    LLM_HEDGE_ENABLED = os.environ.get('LLM_HEDGE_ENABLED', '0') == '1'
+    LLM_HEDGE_MIN_SAMPLES = int(os.environ.get('LLM_HEDGE_MIN_SAMPLES', 10))
+    LLM_HEDGE_MIN_DELAY = float(os.environ.get('LLM_HEDGE_MIN_DELAY', 2))
+    # 集群级限流(Redis令牌桶)：每个提供者每分钟的请求数和token数上限(0表示不限制)，
+    # 令牌不足时最多等待的秒数，以及预估token时每次调用的输出token数
+    LLM_RATE_LIMIT_ENABLED = os.environ.get('LLM_RATE_LIMIT_ENABLED', '1') == '1'
+    LLM_RATE_LIMITS = {
+        'moonshot': {
+            'rpm': int(os.environ.get('LLM_RPM_MOONSHOT', 200)),
+            'tpm': int(os.environ.get('LLM_TPM_MOONSHOT', 1000000)),
+        },
+        'deepseek': {
+            'rpm': int(os.environ.get('LLM_RPM_DEEPSEEK', 0)),
+            'tpm': int(os.environ.get('LLM_TPM_DEEPSEEK', 0)),
+        },
+        'zhipu': {
+            'rpm': int(os.environ.get('LLM_RPM_ZHIPU', 200)),
+            'tpm': int(os.environ.get('LLM_TPM_ZHIPU', 0)),
+        },
+        'stub': {
+            'rpm': int(os.environ.get('LLM_RPM_STUB', 0)),
+            'tpm': int(os.environ.get('LLM_TPM_STUB', 0)),
+        },
+    }
+    LLM_RATE_LIMIT_MAX_WAIT = float(os.environ.get('LLM_RATE_LIMIT_MAX_WAIT', 60))
+    LLM_RATE_LIMIT_COMPLETION_TOKENS = int(os.environ.get('LLM_RATE_LIMIT_COMPLETION_TOKENS', 1500))
+    # 为交互式调用(聊天等)预留的额度比例，后台调用(方案生成、分析任务)不能使用这部分令牌
+    LLM_RATE_LIMIT_INTERACTIVE_RESERVE = float(os.environ.get('LLM_RATE_LIMIT_INTERACTIVE_RESERVE', 0.2))
+    # Celery worker 独立暴露Prometheus指标的端口，为空时不启动(多进程部署需同时设置 PROMETHEUS_MULTIPROC_DIR)
+    CELERY_METRICS_PORT = int(os.environ.get('CELERY_METRICS_PORT', 0)) or None
+    # 聊天工具调用：最多连续几轮工具调用、单个工具的超时时间(秒)、同一轮工具的并发数、等待期间推送进度的间隔(秒)
+    LLM_TOOL_MAX_ROUNDS = int(os.environ.get('LLM_TOOL_MAX_ROUNDS', 3))
+    LLM_TOOL_TIMEOUT = float(os.environ.get('LLM_TOOL_TIMEOUT', 30))
+    LLM_TOOL_CONCURRENCY = int(os.environ.get('LLM_TOOL_CONCURRENCY', 4))
+    LLM_TOOL_PROGRESS_INTERVAL = float(os.environ.get('LLM_TOOL_PROGRESS_INTERVAL', 3))
+    # 强制使用的提供者(如压测时设为stub)，为空时使用数据库中激活的提供者
+    LLM_PROVIDER_OVERRIDE = os.environ.get('LLM_PROVIDER_OVERRIDE') or None
+    # 桩提供者的延迟预设(instant/fast/realistic/slow)，以及单独指定的首个分块耗时(秒)、每秒输出token数
+    LLM_STUB_PROFILE = os.environ.get('LLM_STUB_PROFILE', 'realistic')
+    LLM_STUB_TTFT = float(os.environ['LLM_STUB_TTFT']) if os.environ.get('LLM_STUB_TTFT') else None
+    LLM_STUB_TOKENS_PER_SECOND = float(os.environ['LLM_STUB_TOKENS_PER_SECOND']) if os.environ.get('LLM_STUB_TOKENS_PER_SECOND') else None
+    # 桩提供者注入429/500错误的比例、普通文本回复的字数
+    LLM_STUB_ERROR_RATE = float(os.environ.get('LLM_STUB_ERROR_RATE', 0))
+    LLM_STUB_RESPONSE_CHARS = int(os.environ.get('LLM_STUB_RESPONSE_CHARS', 400))
+    # 大模型响应录制：record 录制真实提供者的响应，replay 由桩提供者回放，为空时不启用
+    LLM_CASSETTE_MODE = os.environ.get('LLM_CASSETTE_MODE') or None
+    LLM_CASSETTE_DIR = os.environ.get('LLM_CASSETTE_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cassettes'))
+    
     # 上传文件配置
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
 
@@ -46,10 +46,18 @@ class AuthService:
             return user
         return None
     
+    # 访问令牌中的机构ID声明，投递后台任务时据此记录发起用户所属机构(见 LLMPriority)，无需查询用户表
+    INSTITUTION_CLAIM = 'institution_id'
+    
+    @staticmethod
+    def access_token_claims(user):
+        """访问令牌的附加声明"""
+        return {AuthService.INSTITUTION_CLAIM: user.institution_id}
+    
     @staticmethod
     def generate_tokens(user):
         """生成JWT令牌"""
-        access_token = create_access_token(identity=str(user.id))
+        access_token = create_access_token(identity=str(user.id), additional_claims=AuthService.access_token_claims(user))
         refresh_token = create_refresh_token(identity=str(user.id))
         return {
             'access_token': access_token,
@@ -0,0 +1,194 @@
+# app/core/recommendation/plan_solver.py
+import math
+
+
+class PlanSolver:
+    """
+    志愿方案本地求解器（不调用大模型）
+
+    按"录取概率 + 学生偏好"的综合得分为每个志愿段挑选院校专业组及专业，同时满足：
+    - 志愿段梯度：候选池已按志愿段分差范围筛选，段内再按分差从高到低排列
+    - 整个方案内院校专业组不重复
+    - 多样性约束：同一院校在整个方案中最多出现 diversity_cap 个专业组
+    - 学费约束：所选专业的学费需落在学生填写的学费范围内
+
+    每个志愿段的约束（段内数量上限 + 每院校数量上限）构成拟阵，按得分贪心选取即为该段最优解，
+    整个方案12个志愿段合计只做内存计算，耗时为毫秒级。
+    """
+
+    # 每个志愿段的院校数量上限
+    MAX_COLLEGES_PER_SEGMENT = 4
+    # 每个院校专业组的专业数量上限
+    MAX_SPECIALTIES_PER_COLLEGE = 6
+    # 同一院校在整个方案中最多出现的专业组数量
+    DEFAULT_DIVERSITY_CAP = 2
+    # 分差换算为录取概率时的缩放系数（分差每增加该值，概率的对数几率减少1）
+    PROBABILITY_SCALE = 6.0
+
+    # 院校特色偏好权重
+    TESE_WEIGHTS = {
+        "985": 0.3,
+        "211": 0.2,
+        "双一流大学": 0.2,
+        "强基计划": 0.1,
+        "研究生院": 0.05,
+        "硕博点": 0.05,
+    }
+    # 特色偏好得分上限
+    MAX_TESE_SCORE = 0.5
+
+    def __init__(self, student_score=0, tuition_ranges=None, diversity_cap=DEFAULT_DIVERSITY_CAP):
+        """
+        :param student_score: 学生分数（高考成绩或模考成绩）
+        :param tuition_ranges: 学费范围列表，格式为[(min1, max1), (min2, max2), ...]
+        :param diversity_cap: 同一院校在整个方案中最多出现的专业组数量
+        """
+        self.student_score = int(student_score or 0)
+        self.tuition_ranges = tuition_ranges or []
+        self.diversity_cap = diversity_cap
+        # 已选中的院校专业组ID
+        self.used_group_ids = set()
+        # 已选中的各院校专业组数量 {cid: count}
+        self.college_counts = {}
+
+    def _tuition_ok(self, tuition):
+        """判断学费是否满足学生的学费范围（学费未知时视为满足）"""
+        if not self.tuition_ranges or not tuition:
+            return True
+        for min_fee, max_fee in self.tuition_ranges:
+            if tuition >= min_fee and (max_fee is None or tuition <= max_fee):
+                return True
+        return False
+
+    def _admission_probability(self, score_diff):
+        """将分差（预测分 - 学生分）换算为 0~1 之间的录取概率估计"""
+        x = -float(score_diff or 0) / self.PROBABILITY_SCALE
+        # 防止极端分差导致溢出
+        x = max(min(x, 30.0), -30.0)
+        return 1.0 / (1.0 + math.exp(-x))
+
+    def _specialty_score(self, specialty):
+        """专业得分：录取概率 + 计划人数加成"""
+        prediction_score = int(specialty.get('prediction_score') or 0)
+        if self.student_score and prediction_score:
+            probability = self._admission_probability(prediction_score - self.student_score)
+        else:
+            probability = 0.5
+        plan_number = int(specialty.get('plan_number') or 0)
+        return probability + math.log1p(plan_number) / 20
+
+    def select_specialties(self, college):
+        """
+        为院校专业组挑选专业
+
+        :param college: 院校专业组信息（包含specialties列表）
+        :return: 选中的专业ID列表，保持候选列表中的原始顺序
+        """
+        candidates = [
+            specialty for specialty in college.get('specialties', [])
+            if specialty.get('spid') and self._tuition_ok(specialty.get('tuition'))
+        ]
+        if not candidates:
+            return []
+
+        ranked = sorted(candidates, key=self._specialty_score, reverse=True)
+        chosen = {specialty['spid'] for specialty in ranked[:self.MAX_SPECIALTIES_PER_COLLEGE]}
+        return [specialty['spid'] for specialty in candidates if specialty['spid'] in chosen]
+
+    def score_college(self, college, selected_spids):
+        """
+        院校专业组综合得分
+
+        :param college: 院校专业组信息
+        :param selected_spids: 该专业组选中的专业ID列表
+        :return: 得分，越高越优先
+        """
+        probability = self._admission_probability(college.get('score_diff'))
+
+        tese_score = sum(self.TESE_WEIGHTS.get(tese, 0) for tese in (college.get('tese_text') or []))
+        tese_score = min(tese_score, self.MAX_TESE_SCORE)
+
+        # 可选专业越多，专业调剂空间越大
+        coverage = len(selected_spids) / self.MAX_SPECIALTIES_PER_COLLEGE * 0.2
+        nature_bonus = 0.1 if college.get('school_nature') == '公办' else 0
+
+        return probability + tese_score + coverage + nature_bonus
+
+    def solve(self, filtered_colleges):
+        """
+        为一个志愿段求解院校及专业选择
+
+        :param filtered_colleges: 该志愿段的候选院校专业组列表
+        :return: 选择结果 {cgid字符串: [spid字符串, ...]}，格式与AI推荐结果一致
+        """
+        scored = []
+        for college in filtered_colleges:
+            cgid = college.get('cgid')
+            if not cgid or cgid in self.used_group_ids:
+                continue
+            selected_spids = self.select_specialties(college)
+            if not selected_spids:
+                continue
+            scored.append((self.score_college(college, selected_spids), college, selected_spids))
+
+        # 得分相同时按专业组ID排序，保证结果确定
+        scored.sort(key=lambda item: (-item[0], item[1]['cgid']))
+
+        chosen = []
+        segment_counts = {}
+        for _, college, selected_spids in scored:
+            if len(chosen) >= self.MAX_COLLEGES_PER_SEGMENT:
+                break
+            cid = college.get('cid')
+            used = self.college_counts.get(cid, 0) + segment_counts.get(cid, 0)
+            if used >= self.diversity_cap:
+                continue
+            segment_counts[cid] = segment_counts.get(cid, 0) + 1
+            chosen.append((college, selected_spids))
+
+        # 段内梯度：分差大（更冲）的排在前面
+        chosen.sort(key=lambda item: (-(item[0].get('score_diff') or 0), item[0]['cgid']))
+
+        selection = {}
+        for college, selected_spids in chosen:
+            selection[str(college['cgid'])] = [str(spid) for spid in selected_spids]
+
+        self.register(filtered_colleges, selection)
+        return selection
+
+    def register(self, filtered_colleges, selection):
+        """
+        记录已选中的专业组（AI或其他方式选出的结果也需登记，以便后续志愿段满足去重和多样性约束）
+
+        :param filtered_colleges: 该志愿段的候选院校专业组列表
+        :param selection: 选择结果 {cgid: [spid, ...]}
+        """
+        colleges_by_cgid = {str(college.get('cgid')): college for college in filtered_colleges}
+        for cgid in selection or {}:
+            college = colleges_by_cgid.get(str(cgid))
+            if not college or college['cgid'] in self.used_group_ids:
+                continue
+            self.used_group_ids.add(college['cgid'])
+            cid = college.get('cid')
+            self.college_counts[cid] = self.college_counts.get(cid, 0) + 1
+
+
+class LLMCallBudget:
+    """单次志愿方案生成过程中的大模型调用预算"""
+
+    def __init__(self, max_calls):
+        self.remaining = max(int(max_calls or 0), 0)
+
+    @property
+    def available(self):
+        """是否还有可用的调用次数"""
+        return self.remaining > 0
+
+    def consume(self):
+        """消耗一次调用"""
+        if self.remaining > 0:
+            self.remaining -= 1
+
+    def exhaust(self):
+        """耗尽预算（如大模型调用失败或被限流），后续批次全部走本地求解"""
+        self.remaining = 0
@@ -134,6 +134,51 @@ class CollegeRepository:
         
         return path
 
+    @staticmethod
+    def get_complete_area_paths(area_ids):
+        """
+        批量获取多个地区的完整路径，按层级逐层查询父级，查询次数只与地区层级深度有关
+        
+        :param area_ids: 地区ID列表
+        :return: 字典 {地区ID: 地区路径字典列表}，路径格式同 get_complete_area_path
+        """
+        area_ids = {area_id for area_id in area_ids if area_id}
+        if not area_ids:
+            return {}
+        
+        # 逐层查询地区信息，直到所有节点都到达顶级节点(afather=0)
+        areas = {}
+        pending_ids = set(area_ids)
+        while pending_ids:
+            rows = db.session.query(ZwhAreas.aid, ZwhAreas.aname, ZwhAreas.afather).filter(
+                ZwhAreas.aid.in_(list(pending_ids))
+            ).all()
+            for row in rows:
+                areas[row.aid] = row
+            pending_ids = {
+                row.afather for row in rows
+                if row.afather and row.afather not in areas
+            }
+        
+        # 在内存中组装每个地区的路径
+        paths = {}
+        for area_id in area_ids:
+            path = []
+            current_id = area_id
+            while current_id and current_id in areas:
+                area = areas[current_id]
+                path.append({
+                    'aid': area.aid,
+                    'aname': area.aname
+                })
+                if area.afather == 0:
+                    break
+                current_id = area.afather
+            path.reverse()
+            paths[area_id] = path
+        
+        return paths
+
     @staticmethod
     def get_college_groups_by_category(student_score, subject_type, education_level, 
                                     category_id, group_id, student_subjects,
@@ -478,8 +523,7 @@ class CollegeRepository:
             ZwhXgkFenshuxian2025.subclassid,     # 专业类别ID
             ZwhXgkZhuanye2025.teacher,           # 教师
             ZwhXgkZhuanye2025.doctor,            # 医生
-            ZwhXgkZhuanye2025.official,          # 公务员
-            ZwhXgkZhuanye2025.content            # 专业介绍
+            ZwhXgkZhuanye2025.official           # 公务员
         ).outerjoin(
             ZwhXgkZhuanye2025,
             ZwhXgkFenshuxian2025.spid == ZwhXgkZhuanye2025.spid
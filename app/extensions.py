@@ -11,7 +11,10 @@ from flask_caching import Cache
 db = SQLAlchemy()
 migrate = Migrate()
 jwt = JWTManager()
-socketio = SocketIO()
+# 显式使用线程模式：依赖中包含eventlet，不指定时Flask-SocketIO会自动选用eventlet，
+# 而应用未做monkey patch，数据库、Redis等阻塞调用会卡住整个进程。
+# WebSocket由simple-websocket提供，生产环境部署方式见 wsgi.py
+socketio = SocketIO(async_mode='threading')
 cors = CORS()
 celery = Celery(__name__)
 api_spec = ApiSpec()
@@ -24,13 +27,32 @@ def init_celery(app=None):
         celery.conf.update(
             broker_url=app.config["CELERY_BROKER_URL"],
             result_backend=app.config["CELERY_RESULT_BACKEND"],
-            result_expires=app.config.get("CELERY_RESULT_EXPIRES", 60 * 60 * 24)  # 默认1天过期
+            result_expires=app.config.get("CELERY_RESULT_EXPIRES", 60 * 60 * 24),  # 默认1天过期
+            # 启用Redis队列的消息优先级(0最高，9最低)，预计算等后台任务使用低优先级
+            broker_transport_options={
+                'priority_steps': list(range(10)),
+                'queue_order_strategy': 'priority'
+            }
         )
     
+    from celery.signals import before_task_publish
+    from app.services.ai.telemetry import LLMTelemetry
+    from app.services.ai.llm_priority import LLMPriority
+
+    # 投递任务时记录发起用户所属机构，任务中的大模型调用按机构公平分配后台额度
+    before_task_publish.connect(LLMPriority.add_publish_headers, weak=False)
+
     class ContextTask(celery.Task):
         def __call__(self, *args, **kwargs):
-            with app.app_context():
-                return self.run(*args, **kwargs)
+            # 任务中的大模型调用均为后台调用，优先级低于Web请求中的交互式调用
+            institution_id = LLMPriority.task_institution_id(self.request)
+            with app.app_context(), LLMTelemetry.collect() as llm_usage, \
+                    LLMPriority.use(LLMPriority.BACKGROUND, institution_id):
+                result = self.run(*args, **kwargs)
+            # 任务中有大模型调用时，把调用汇总(耗时、token用量、结果)附加到任务结果中
+            if isinstance(result, dict) and llm_usage.records:
+                result['llm_usage'] = llm_usage.summary()
+            return result
                 
     celery.Task = ContextTask
     return celery
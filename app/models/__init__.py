@@ -25,7 +25,9 @@ from app.models.zwh_xgk_picixian import ZwhXgkPicixian
 from app.models.zwh_xgk_yuanxiao_2025 import ZwhXgkYuanxiao2025
 from app.models.zwh_xgk_zhuanye_2025 import ZwhXgkZhuanye2025
 
-from app.models.student_volunteer_plan import StudentVolunteerPlan, VolunteerCollege, VolunteerSpecialty
+from app.models.student_data_snapshot import StudentDataSnapshot
+from app.models.student_volunteer_plan import StudentVolunteerPlan, VolunteerCollege, VolunteerSpecialty, PlanVolunteerLink
+from app.models.volunteer_plan_archive import VolunteerPlanArchive
 
 # AI聊天
 from app.models.messages import Message
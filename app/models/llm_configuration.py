@@ -10,9 +10,10 @@ class LLMConfiguration(Base):
     PROVIDER_MOONSHOT = 'moonshot'
     PROVIDER_DEEPSEEK = 'deepseek'
     PROVIDER_ZHIPU = 'zhipu'
+    PROVIDER_STUB = 'stub'  # 进程内桩模型，用于压测和离线开发
     
     # 所有支持的提供者列表
-    PROVIDERS = [PROVIDER_MOONSHOT, PROVIDER_DEEPSEEK, PROVIDER_ZHIPU]
+    PROVIDERS = [PROVIDER_MOONSHOT, PROVIDER_DEEPSEEK, PROVIDER_ZHIPU, PROVIDER_STUB]
     
     # 默认提供者
     DEFAULT_PROVIDER = PROVIDER_MOONSHOT
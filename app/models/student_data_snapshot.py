@@ -0,0 +1,55 @@
+# app/models/student_data_snapshot.py
+import hashlib
+import zlib
+from sqlalchemy.exc import IntegrityError
+from app.extensions import db
+from app.models.base import Base
+
+class StudentDataSnapshot(Base):
+    """学生数据快照表(按内容哈希去重，压缩存储)"""
+    __tablename__ = 'student_data_snapshots'
+
+    # zlib压缩级别
+    COMPRESS_LEVEL = 6
+
+    content_hash = db.Column(db.String(64), nullable=False, unique=True, comment='快照JSON内容的SHA-256哈希')
+    compressed_data = db.Column(db.LargeBinary, nullable=False, comment='zlib压缩后的快照JSON')
+    raw_size = db.Column(db.Integer, comment='压缩前字节数')
+
+    @property
+    def text(self):
+        """解压后的快照JSON字符串"""
+        return zlib.decompress(self.compressed_data).decode('utf-8')
+
+    @staticmethod
+    def compute_hash(text):
+        """计算快照内容哈希"""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def get_or_create(cls, text):
+        """
+        按内容获取快照，不存在时压缩后写入(不提交事务)
+
+        :param text: 快照JSON字符串
+        :return: 快照对象
+        """
+        content_hash = cls.compute_hash(text)
+        snapshot = cls.query.filter_by(content_hash=content_hash).first()
+        if snapshot:
+            return snapshot
+
+        raw = text.encode('utf-8')
+        snapshot = cls(
+            content_hash=content_hash,
+            compressed_data=zlib.compress(raw, cls.COMPRESS_LEVEL),
+            raw_size=len(raw)
+        )
+        try:
+            # 使用保存点写入，并发写入同一快照时回退到读取已存在的记录
+            with db.session.begin_nested():
+                db.session.add(snapshot)
+        except IntegrityError:
+            snapshot = cls.query.filter_by(content_hash=content_hash).first()
+
+        return snapshot
@@ -1,5 +1,13 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from app.extensions import db
 from app.models.base import Base
+from app.models.student_data_snapshot import StudentDataSnapshot
+
+# 延迟加载的大字段分组：列表查询不加载，详情查询通过 db.undefer_group 一次性加载
+DEFERRED_GROUP_SNAPSHOT = 'snapshot'          # 方案的候选集指纹
+DEFERRED_GROUP_AI_ANALYSIS = 'ai_analysis'    # 院校、专业的AI解析
+
 
 class StudentVolunteerPlan(Base):
     """学生志愿方案表"""
@@ -21,21 +29,40 @@ class StudentVolunteerPlan(Base):
     generation_progress = db.Column(db.Integer, default=0, comment='生成进度百分比(0-100)')
     generation_message = db.Column(db.String(255), comment='生成过程信息或错误信息')
     user_data_hash = db.Column(db.String(64), comment='用户数据哈希，用于检测用户数据是否变化')
-    student_data_snapshot = db.Column(db.Text, comment='生成方案时的学生数据快照，JSON格式')
+    snapshot_id = db.Column(db.Integer, db.ForeignKey('student_data_snapshots.id'), comment='生成方案时的学生数据快照ID')
     data_changes = db.Column(db.Text, comment='与上一版方案相比的数据变化描述')
+    segment_fingerprints = db.deferred(db.Column(db.JSON, comment='各志愿段候选集指纹，用于增量重新生成'), group=DEFERRED_GROUP_SNAPSHOT)
+    parent_plan_id = db.Column(db.Integer, db.ForeignKey('student_volunteer_plans.id'), comment='修改来源的上一版本方案ID')
+    is_archived = db.Column(db.Boolean, default=False, nullable=False, comment='是否已归档(院校、专业志愿及分析已压缩转存到归档表)')
 
     # 关系
     volunteers = db.relationship('VolunteerCollege', backref='plan', lazy='dynamic', cascade='all, delete-orphan')
+    snapshot = db.relationship('StudentDataSnapshot', lazy='select')
     
     # 索引
     __table_args__ = (
         db.Index('idx_student_current', 'student_id', 'is_current'),
-        db.Index('idx_student_version', 'student_id', 'version'),
+        # 版本号在学生内唯一，并发创建同一版本时后写入者失败(见 VolunteerPlanService._add_plan_version)
+        db.UniqueConstraint('student_id', 'version', name='unique_student_version'),
     )
     
-    def to_dict(self):
-        """转换为字典表示"""
-        return {
+    @property
+    def student_data_snapshot(self):
+        """生成方案时的学生数据快照，JSON字符串"""
+        return self.snapshot.text if self.snapshot else None
+    
+    @student_data_snapshot.setter
+    def student_data_snapshot(self, value):
+        # 快照按内容去重存储，相同内容的方案共用一条快照记录
+        self.snapshot = StudentDataSnapshot.get_or_create(value) if value else None
+    
+    def to_dict(self, include_snapshot=True):
+        """
+        转换为字典表示
+        
+        :param include_snapshot: 是否包含学生数据快照(列表场景传False，避免加载延迟字段)
+        """
+        result = {
             'id': self.id,  # 学生的id
             'student_id': self.student_id, 
             'planner_id': self.planner_id,
@@ -46,11 +73,17 @@ class StudentVolunteerPlan(Base):
             'generation_progress': self.generation_progress,
             'generation_message': self.generation_message,
             'data_changes': self.data_changes,
-            'student_data_snapshot': self.student_data_snapshot,
             'user_data_hash': self.user_data_hash,
+            'parent_plan_id': self.parent_plan_id,
+            'is_archived': self.is_archived,
             'created_at': self.created_at,
             'updated_at': self.updated_at
         }
+        
+        if include_snapshot:
+            result['student_data_snapshot'] = self.student_data_snapshot
+        
+        return result
     
 class VolunteerCollege(Base):
     """志愿详情表"""
@@ -71,7 +104,7 @@ class VolunteerCollege(Base):
     score_diff = db.Column(db.Integer, comment='分差')
     prediction_score = db.Column(db.Integer, comment='预测分数')
     recommend_type = db.Column(db.String(20), default=RECOMMEND_AI, nullable=False, comment='推荐类型(ai/planner)')
-    ai_analysis = db.Column(db.Text, comment='AI解析结果，包含推荐理由等信息')
+    ai_analysis = db.deferred(db.Column(db.Text, comment='AI解析结果，包含推荐理由等信息'), group=DEFERRED_GROUP_AI_ANALYSIS)
     area_name = db.Column(db.String(100), comment='地区名称，如"河南省郑州市"')
     group_name = db.Column(db.String(100), comment='专业组名称，如"第121组"')
     min_tuition = db.Column(db.Integer, comment='最低学费')
@@ -94,6 +127,32 @@ class VolunteerCollege(Base):
         db.UniqueConstraint('plan_id', 'group_id', 'volunteer_index', name='unique_volunteer_index'),
     )
     
+    @staticmethod
+    def plan_filter(plan_id):
+        """
+        方案实际生效的院校志愿过滤条件：本方案写入的院校 + 从上一版本共享的院校
+        
+        :param plan_id: 志愿方案ID
+        :return: 过滤条件
+        """
+        shared_ids = db.session.query(PlanVolunteerLink.volunteer_college_id).filter(
+            PlanVolunteerLink.plan_id == plan_id
+        )
+        return db.or_(
+            VolunteerCollege.plan_id == plan_id,
+            VolunteerCollege.id.in_(shared_ids)
+        )
+    
+    @staticmethod
+    def query_for_plan(plan_id):
+        """
+        方案实际生效的院校志愿查询
+        
+        :param plan_id: 志愿方案ID
+        :return: 院校志愿查询对象
+        """
+        return VolunteerCollege.query.filter(VolunteerCollege.plan_filter(plan_id))
+    
     def to_dict(self, include_specialties=False):
         """转换为字典表示"""
         result = {
@@ -131,6 +190,27 @@ class VolunteerCollege(Base):
         return result
 
 
+class PlanVolunteerLink(Base):
+    """志愿方案共享志愿表
+
+    修改方案时未变化的院校志愿不再复制，新版本通过本表引用原院校志愿记录(写时复制)，
+    引用始终指向实际存储的院校记录，不会形成多级引用链。
+    """
+    __tablename__ = 'plan_volunteer_links'
+    
+    # 基础字段继承自Base模型(id, created_at, updated_at)
+    plan_id = db.Column(db.Integer, db.ForeignKey('student_volunteer_plans.id', ondelete='CASCADE'), nullable=False, comment='引用方志愿方案ID')
+    volunteer_college_id = db.Column(db.Integer, db.ForeignKey('volunteer_colleges.id', ondelete='CASCADE'), nullable=False, comment='被引用的院校志愿ID')
+    group_id = db.Column(db.Integer, nullable=False, comment='志愿段ID(1-12)')
+    volunteer_index = db.Column(db.Integer, nullable=False, comment='志愿在方案中的序号(1-48)')
+    
+    # 索引
+    __table_args__ = (
+        db.Index('idx_link_volunteer', 'volunteer_college_id'),
+        db.UniqueConstraint('plan_id', 'group_id', 'volunteer_index', name='unique_link_volunteer_index'),
+    )
+
+
 class VolunteerSpecialty(Base):
     """专业选择表"""
     __tablename__ = 'volunteer_specialties'
@@ -145,7 +225,7 @@ class VolunteerSpecialty(Base):
     plan_number = db.Column(db.Integer, comment='计划招生人数')
     tuition = db.Column(db.Integer, comment='学费')
     remarks = db.Column(db.String(500), comment='专业备注')
-    ai_analysis = db.Column(db.Text, comment='AI对该专业的解析结果，包含适配度分析等信息')
+    ai_analysis = db.deferred(db.Column(db.Text, comment='AI对该专业的解析结果，包含适配度分析等信息'), group=DEFERRED_GROUP_AI_ANALYSIS)
     fenshuxian_id = db.Column(db.Integer, comment='关联到分数线表(zwh_xgk_fenshuxian_2025)的ID')
     
     # 索引
@@ -214,4 +294,27 @@ class VolunteerCategoryAnalysis(Base):
             'analyzed_at': self.analyzed_at,
             'created_at': self.created_at,
             'updated_at': self.updated_at
-        }
\ No newline at end of file
+        }
+
+@event.listens_for(Session, 'before_flush')
+def guard_shared_volunteer_delete(session, flush_context, instances):
+    """
+    删除方案前，方案自有且仍被其他版本共享的院校志愿须先转交(见 VolunteerPlanService.delete_volunteer_plan)，
+    否则级联删除会使引用这些院校的版本丢失志愿
+    """
+    plan_ids = [
+        obj.id for obj in session.deleted
+        if isinstance(obj, StudentVolunteerPlan) and obj.id is not None
+    ]
+    if not plan_ids:
+        return
+
+    with session.no_autoflush:
+        shared = session.query(PlanVolunteerLink.plan_id).join(
+            VolunteerCollege, VolunteerCollege.id == PlanVolunteerLink.volunteer_college_id
+        ).filter(
+            VolunteerCollege.plan_id.in_(plan_ids),
+            PlanVolunteerLink.plan_id.notin_(plan_ids)
+        ).first()
+    if shared:
+        raise ValueError(f"志愿方案的院校志愿仍被方案{shared.plan_id}共享，请通过 VolunteerPlanService.delete_volunteer_plan 删除")
@@ -0,0 +1,53 @@
+# app/models/volunteer_plan_archive.py
+import json
+import zlib
+from app.extensions import db
+from app.models.base import Base
+
+class VolunteerPlanArchive(Base):
+    """志愿方案归档表(冷数据，压缩存储历史版本的院校、专业志愿和类别分析)"""
+    __tablename__ = 'volunteer_plan_archives'
+
+    # zlib压缩级别
+    COMPRESS_LEVEL = 6
+
+    plan_id = db.Column(db.Integer, db.ForeignKey('student_volunteer_plans.id', ondelete='CASCADE'), nullable=False, unique=True, comment='志愿方案ID')
+    compressed_data = db.Column(db.LargeBinary, nullable=False, comment='zlib压缩后的方案文档JSON(院校志愿及专业、类别分析)')
+    raw_size = db.Column(db.Integer, comment='压缩前字节数')
+    college_count = db.Column(db.Integer, comment='归档的院校志愿数量')
+
+    @property
+    def document(self):
+        """解压后的方案文档"""
+        return json.loads(zlib.decompress(self.compressed_data).decode('utf-8'))
+
+    @classmethod
+    def from_text(cls, plan_id, text, college_count=None):
+        """
+        根据方案文档JSON字符串创建归档记录(不写入会话)
+
+        :param plan_id: 志愿方案ID
+        :param text: 方案文档JSON字符串
+        :param college_count: 院校志愿数量
+        :return: 归档对象
+        """
+        raw = text.encode('utf-8')
+        return cls(
+            plan_id=plan_id,
+            compressed_data=zlib.compress(raw, cls.COMPRESS_LEVEL),
+            raw_size=len(raw),
+            college_count=college_count
+        )
+
+    @classmethod
+    def load_document(cls, plan_id):
+        """
+        读取方案的归档文档，没有归档记录时返回空文档
+
+        :param plan_id: 志愿方案ID
+        :return: 字典 {'category_analyses': [...], 'colleges': [...]}
+        """
+        archive = cls.query.filter_by(plan_id=plan_id).first()
+        if not archive:
+            return {'category_analyses': [], 'colleges': []}
+        return archive.document
@@ -7,7 +7,7 @@ class ZwhXgkZhuanye2025(db.Model):
     spid = db.Column(db.Integer, primary_key=True, comment='编号')
     spname = db.Column(db.String(250), comment='专业名称')
     spfather = db.Column(db.SmallInteger, comment='上级专业')
-    content = db.Column(db.TEXT, comment='专业介绍')
+    content = db.deferred(db.Column(db.TEXT, comment='专业介绍'))  # 专业介绍较长，按需加载
     subclassid = db.Column(db.String(250), comment='Subclassid')
     teacher = db.Column(db.String(6), server_default=db.text("'否'"), comment='教师')
     doctor = db.Column(db.String(6), server_default=db.text("'否'"), comment='医生')
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# app/scripts/llm_benchmark.py
+import sys
+import os
+import json
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加项目根目录到系统路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from app import create_app
+from app.services.ai.llm_service import LLMService
+from app.services.ai.llm_priority import LLMPriority
+from app.services.ai.telemetry import LLMTelemetry
+
+
+def make_user_info():
+    """生成模拟的学生档案"""
+    return json.dumps({
+        "省份": "河北",
+        "选科": "物理+化学+生物",
+        "分数": random.randint(480, 650),
+        "位次": random.randint(5000, 60000),
+        "意向地区": ["北京", "天津", "河北"],
+        "意向专业": ["计算机类", "电子信息类", "临床医学"],
+        "备注": "家庭经济条件一般，希望就读公办院校" * 10,
+    }, ensure_ascii=False)
+
+
+def make_colleges(count=10):
+    """生成模拟的备选院校(与方案生成中传给筛选的格式一致)"""
+    return json.dumps([
+        {
+            "cgid": 10000 + index,
+            "name": f"模拟大学{index}",
+            "city": random.choice(["北京", "天津", "石家庄"]),
+            "tese": "双一流",
+            "specialties": [
+                {"spname": f"模拟专业{index}-{number}", "tuition": 5000, "spid": 100000 + index * 100 + number}
+                for number in range(8)
+            ],
+        }
+        for index in range(count)
+    ], ensure_ascii=False)
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p))], 3)
+
+
+def run_filter(round_index):
+    """一次院校筛选，返回(耗时, 首个分块耗时, 是否有效)"""
+    started = time.monotonic()
+    content = LLMService.filter_colleges(make_user_info(), make_colleges(), use_cache=False)
+    result = json.loads(content)
+    valid = isinstance(result, dict) and len(result) <= 4 and all(len(spids) <= 6 for spids in result.values())
+    return time.monotonic() - started, None, valid
+
+
+def run_analysis(round_index):
+    """一组并发的分层解读(run_concurrently)，返回(耗时, 首个分块耗时, 是否全部有效)"""
+    started = time.monotonic()
+    user_info = make_user_info()
+    results = LLMService.run_concurrently([
+        (LLMService.analyzing_category, {
+            "user_info": user_info,
+            "simplified_colleges_json": make_colleges(4),
+            "category": category,
+            "use_cache": False,
+        })
+        for category in ("冲刺志愿", "稳妥志愿", "保底志愿")
+    ])
+    valid = True
+    for content in results:
+        try:
+            json.loads(content)
+        except (TypeError, ValueError):
+            valid = False
+    return time.monotonic() - started, None, valid
+
+
+def run_chat(round_index):
+    """一次流式聊天，返回(耗时, 首个分块耗时, 是否有内容)"""
+    started = time.monotonic()
+    time_to_first_token = None
+    length = 0
+    for text in LLMService.common_chat("请帮我分析一下志愿方案的风险", []):
+        if time_to_first_token is None:
+            time_to_first_token = time.monotonic() - started
+        length += len(text)
+    return time.monotonic() - started, time_to_first_token, length > 0
+
+
+SCENARIOS = {
+    'filter': (run_filter, LLMPriority.BACKGROUND),
+    'analysis': (run_analysis, LLMPriority.BACKGROUND),
+    'chat': (run_chat, LLMPriority.INTERACTIVE),
+}
+
+
+def run_benchmark(scenario, requests, concurrency, provider):
+    """按场景并发执行调用并输出耗时、首个分块耗时和吞吐量"""
+    app = create_app()
+    if provider:
+        app.config['LLM_PROVIDER_OVERRIDE'] = provider
+    func, priority = SCENARIOS[scenario]
+
+    def worker(round_index):
+        # 每个线程单独的应用上下文和收集器，与Celery任务中的调用方式一致
+        with app.app_context(), LLMTelemetry.collect() as collector, LLMPriority.use(priority):
+            try:
+                latency, time_to_first_token, valid = func(round_index)
+                error = None
+            except Exception as e:
+                latency, time_to_first_token, valid, error = None, None, False, str(e)
+            return latency, time_to_first_token, valid, error, collector.summary()
+
+    with app.app_context():
+        print(f"场景: {scenario}，提供者: {LLMService.get_active_provider()}，请求数: {requests}，并发数: {concurrency}")
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, range(requests)))
+    elapsed = time.monotonic() - started
+
+    latencies = [result[0] for result in results if result[0] is not None]
+    ttfts = [result[1] for result in results if result[1] is not None]
+    errors = [result[3] for result in results if result[3]]
+    calls = sum(result[4]['calls'] for result in results)
+    completion_tokens = sum(result[4]['completion_tokens'] for result in results)
+
+    print(f"总耗时: {elapsed:.2f}秒，吞吐量: {len(latencies) / elapsed:.2f}次/秒，大模型调用: {calls}次，"
+          f"输出token: {completion_tokens}({completion_tokens / elapsed:.1f}/秒)")
+    print(f"耗时 p50: {percentile(latencies, 0.5)} p95: {percentile(latencies, 0.95)} max: {percentile(latencies, 1)}")
+    if ttfts:
+        print(f"首个分块耗时 p50: {percentile(ttfts, 0.5)} p95: {percentile(ttfts, 0.95)} max: {percentile(ttfts, 1)}")
+    print(f"无效响应: {sum(1 for result in results if not result[2]) - len(errors)}，失败: {len(errors)}")
+    for error in errors[:5]:
+        print(f"  {error}")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='大模型调用压测(默认使用进程内桩模型，经过路由、限流、遥测等完整调用链)')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='filter', help='压测场景')
+    parser.add_argument('--requests', type=int, default=50, help='总请求数')
+    parser.add_argument('--concurrency', type=int, default=10, help='并发线程数')
+    parser.add_argument('--provider', default='stub', help='使用的提供者，为空时使用数据库中激活的提供者')
+
+    args = parser.parse_args()
+
+    run_benchmark(args.scenario, args.requests, args.concurrency, args.provider)
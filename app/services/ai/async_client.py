@@ -0,0 +1,372 @@
+# app/services/ai/async_client.py
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+import httpx
+from openai import AsyncOpenAI
+from flask import current_app
+from app.services.ai.telemetry import LLMTelemetry
+from app.services.ai.llm_priority import LLMPriority
+from app.services.ai.rate_limiter import LLMRateLimiter
+from app.services.ai.stub_provider import StubTransport, LLMCassette
+
+
+class _PrioritySemaphore:
+    """
+    按调用优先级放行的并发信号量(只在事件循环线程中使用)
+
+    名额释放时先交给等待中的交互式调用，再交给后台调用，同一优先级内先到先得。
+    限流令牌桶(LLMRateLimiter)只在配置了rpm/tpm时区分优先级，并发名额在任何配置下都让交互式调用优先。
+    """
+
+    def __init__(self, value):
+        self._value = value
+        # 按放行顺序排列
+        self._waiters = {LLMPriority.INTERACTIVE: deque(), LLMPriority.BACKGROUND: deque()}
+
+    async def acquire(self, priority):
+        # 有空闲名额时没有等待者(释放时名额直接交给等待者)
+        if self._value > 0:
+            self._value -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.get(priority, self._waiters[LLMPriority.BACKGROUND]).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 已分得名额后被取消，转交给下一个等待者
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        for waiters in self._waiters.values():
+            while waiters:
+                future = waiters.popleft()
+                # 跳过已取消的等待者
+                if not future.done():
+                    future.set_result(None)
+                    return
+        self._value += 1
+
+    @asynccontextmanager
+    async def hold(self, priority):
+        """占用一个名额直到退出上下文"""
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class AsyncLLMClient:
+    """
+    异步大模型客户端层
+
+    每个进程维护一个后台事件循环线程，所有提供者共用该循环上的 AsyncOpenAI 客户端
+    (底层为带长连接池的 httpx.AsyncClient)，并按提供者用信号量限制并发和设置超时，
+    并发名额不足时交互式调用先于后台调用获得名额(见 LLMPriority)。
+    同步代码(Flask请求、Celery任务)通过 create / stream / create_many 调用，
+    调用线程只等待结果，多个请求可以在同一个worker内并发执行。
+
+    协程在事件循环线程中运行，没有应用上下文，所需配置在调用线程中通过 settings() 读取后传入。
+    发送请求前先经 LLMRateLimiter 获取集群级限流令牌；每个请求的耗时、token用量和结果通过 LLMTelemetry 记录。
+    桩提供者(配置中 stub 为真)的客户端使用进程内的 StubTransport，不访问网络；
+    录制模式下真实提供者的响应通过 LLMCassette 写入录制目录，供桩提供者回放。
+    """
+
+    _lock = threading.Lock()
+    _loop = None
+    _thread = None
+    _pid = None
+
+    # 事件循环线程内使用的客户端和信号量，按提供者缓存
+    _clients = {}
+    _semaphores = {}
+
+    # 默认配置
+    DEFAULT_CONCURRENCY = 8
+    DEFAULT_REQUEST_TIMEOUT = 120
+    DEFAULT_CONNECT_TIMEOUT = 10
+    DEFAULT_MAX_RETRIES = 0
+    DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 10
+
+    @classmethod
+    def _ensure_loop(cls):
+        """获取后台事件循环，进程fork后(如Celery prefork)重新创建"""
+        if cls._loop is not None and cls._pid == os.getpid():
+            return cls._loop
+
+        with cls._lock:
+            if cls._loop is None or cls._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True)
+                thread.start()
+                cls._loop = loop
+                cls._thread = thread
+                cls._pid = os.getpid()
+                # 父进程的客户端和信号量绑定在父进程的事件循环上，不能复用
+                cls._clients = {}
+                cls._semaphores = {}
+        return cls._loop
+
+    @classmethod
+    def run(cls, coro, timeout=None):
+        """
+        在后台事件循环中执行协程并等待结果(同步调用)
+
+        :param coro: 协程对象
+        :param timeout: 等待超时时间(秒)，None表示不限制
+        :return: 协程返回值
+        """
+        loop = cls._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    @classmethod
+    def submit(cls, coro):
+        """
+        在后台事件循环中执行协程，不等待结果(协程需自行处理异常)
+
+        :param coro: 协程对象
+        :return: concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(coro, cls._ensure_loop())
+
+    @staticmethod
+    def settings(provider_name):
+        """
+        读取提供者的调用配置(需要在应用上下文中调用)
+
+        :param provider_name: 提供者名称
+        :return: 配置字典
+        """
+        config = current_app.config
+        concurrency = config.get('LLM_PROVIDER_CONCURRENCY', {}).get(provider_name, AsyncLLMClient.DEFAULT_CONCURRENCY)
+        return {
+            'concurrency': concurrency,
+            'request_timeout': config.get('LLM_REQUEST_TIMEOUT', AsyncLLMClient.DEFAULT_REQUEST_TIMEOUT),
+            'connect_timeout': config.get('LLM_CONNECT_TIMEOUT', AsyncLLMClient.DEFAULT_CONNECT_TIMEOUT),
+            'max_retries': config.get('LLM_MAX_RETRIES', AsyncLLMClient.DEFAULT_MAX_RETRIES),
+            'max_keepalive_connections': config.get(
+                'LLM_MAX_KEEPALIVE_CONNECTIONS', AsyncLLMClient.DEFAULT_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            'rate_limit': LLMRateLimiter.settings(provider_name),
+            'stub': StubTransport.settings(),
+            'cassette': LLMCassette.settings(),
+        }
+
+    @classmethod
+    def _get_client(cls, provider_name, provider_config, settings):
+        """获取提供者的异步客户端(在事件循环线程中调用)"""
+        client = cls._clients.get(provider_name)
+        if client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings['concurrency'],
+                    max_keepalive_connections=settings['max_keepalive_connections']
+                ),
+                transport=StubTransport(settings['stub'], settings['cassette']) if provider_config.get("stub") else None
+            )
+            client = AsyncOpenAI(
+                # 桩提供者不校验密钥
+                api_key=os.getenv(provider_config["api_env_key"], "stub" if provider_config.get("stub") else None),
+                base_url=provider_config["base_url"],
+                http_client=http_client,
+                timeout=httpx.Timeout(settings['request_timeout'], connect=settings['connect_timeout']),
+                max_retries=settings['max_retries']
+            )
+            cls._clients[provider_name] = client
+        return client
+
+    @classmethod
+    def _get_semaphore(cls, provider_name, settings):
+        """获取提供者的并发信号量(在事件循环线程中调用)"""
+        semaphore = cls._semaphores.get(provider_name)
+        if semaphore is None:
+            semaphore = _PrioritySemaphore(settings['concurrency'])
+            cls._semaphores[provider_name] = semaphore
+        return semaphore
+
+    @classmethod
+    async def acreate(cls, provider_name, provider_config, params, settings, trace=None):
+        """
+        异步调用 chat.completions.create(非流式)
+
+        :param provider_name: 提供者名称
+        :param provider_config: 提供者配置(LLMService.PROVIDERS中的项)
+        :param params: 请求参数
+        :param settings: settings() 的结果
+        :param trace: LLMTelemetry.trace() 的结果
+        :return: completion对象
+        """
+        started = time.monotonic()
+        client = cls._get_client(provider_name, provider_config, settings)
+        try:
+            reserved_tokens = await LLMRateLimiter.acquire(provider_name, params, settings['rate_limit'])
+            async with cls._get_semaphore(provider_name, settings).hold(settings['rate_limit']['priority']):
+                completion = await client.chat.completions.create(**params)
+        except BaseException as e:
+            LLMTelemetry.observe(provider_name, trace, LLMTelemetry.outcome_of(e), time.monotonic() - started)
+            raise
+
+        LLMTelemetry.observe(
+            provider_name, trace, LLMTelemetry.OUTCOME_SUCCESS, time.monotonic() - started, usage=completion.usage
+        )
+        await LLMRateLimiter.reconcile(provider_name, reserved_tokens, completion.usage, settings['rate_limit'])
+        if not provider_config.get("stub") and completion.choices:
+            await LLMCassette.arecord(
+                settings['cassette'], provider_name, params, completion.choices[0].message.content, completion.usage
+            )
+        return completion
+
+    @classmethod
+    async def apost(cls, provider_name, provider_config, path, body, settings, trace=None):
+        """
+        异步调用提供者的其他接口(如上下文缓存的 /caching)，与对话请求共用客户端、限流令牌和并发名额
+
+        :param provider_name: 提供者名称
+        :param provider_config: 提供者配置(LLMService.PROVIDERS中的项)
+        :param path: 接口路径(相对于 base_url)
+        :param body: 请求体，其中的 messages 用于预估限流token
+        :param settings: settings() 的结果
+        :param trace: LLMTelemetry.trace() 的结果
+        :return: 响应JSON
+        """
+        started = time.monotonic()
+        client = cls._get_client(provider_name, provider_config, settings)
+        try:
+            reserved_tokens = await LLMRateLimiter.acquire(provider_name, body, settings['rate_limit'])
+            async with cls._get_semaphore(provider_name, settings).hold(settings['rate_limit']['priority']):
+                response = await client.post(path, cast_to=object, body=body)
+        except BaseException as e:
+            LLMTelemetry.observe(provider_name, trace, LLMTelemetry.outcome_of(e), time.monotonic() - started)
+            raise
+
+        # 缓存创建接口返回缓存的token数，按输入token计入遥测和限流
+        tokens = response.get("tokens") if isinstance(response, dict) else None
+        usage = {"prompt_tokens": tokens, "completion_tokens": 0, "total_tokens": tokens} if tokens else None
+        LLMTelemetry.observe(
+            provider_name, trace, LLMTelemetry.OUTCOME_SUCCESS, time.monotonic() - started, usage=usage
+        )
+        await LLMRateLimiter.reconcile(provider_name, reserved_tokens, usage, settings['rate_limit'])
+        return response
+
+    @classmethod
+    async def astream(cls, provider_name, provider_config, params, settings, trace=None):
+        """
+        异步流式调用，逐块产出chunk，流结束前一直占用该提供者的一个并发名额
+
+        OpenAI兼容接口默认不在流式响应中返回usage，除在choice中返回usage的提供者(stream_usage_in_choice)外
+        请求时设置 stream_options.include_usage；只含usage、没有choice的最后一个分块只用于统计，不产出给调用方
+
+        :return: 异步生成器
+        """
+        started = time.monotonic()
+        time_to_first_token = None
+        usage = None
+        outcome = LLMTelemetry.OUTCOME_SUCCESS
+        # 录制模式下拼接完整回复
+        recorded = [] if not provider_config.get("stub") and settings['cassette']['mode'] == LLMCassette.MODE_RECORD else None
+        client = cls._get_client(provider_name, provider_config, settings)
+        try:
+            reserved_tokens = await LLMRateLimiter.acquire(provider_name, params, settings['rate_limit'])
+            async with cls._get_semaphore(provider_name, settings).hold(settings['rate_limit']['priority']):
+                request_params = params
+                if not provider_config.get("stream_usage_in_choice"):
+                    request_params = dict(params, stream_options={"include_usage": True})
+                stream = await client.chat.completions.create(**request_params)
+                try:
+                    async for chunk in stream:
+                        if time_to_first_token is None:
+                            time_to_first_token = time.monotonic() - started
+                        usage = LLMTelemetry.chunk_usage(chunk) or usage
+                        if not chunk.choices:
+                            continue
+                        if recorded is not None and chunk.choices[0].delta.content:
+                            recorded.append(chunk.choices[0].delta.content)
+                        yield chunk
+                finally:
+                    await stream.close()
+            await LLMRateLimiter.reconcile(provider_name, reserved_tokens, usage, settings['rate_limit'])
+            if recorded is not None:
+                await LLMCassette.arecord(settings['cassette'], provider_name, params, "".join(recorded), usage)
+        except BaseException as e:
+            # 调用方提前结束迭代时记为cancelled
+            outcome = LLMTelemetry.outcome_of(e)
+            raise
+        finally:
+            LLMTelemetry.observe(
+                provider_name, trace, outcome, time.monotonic() - started,
+                usage=usage, time_to_first_token=time_to_first_token
+            )
+
+    @classmethod
+    def create(cls, provider_name, provider_config, params, trace=None):
+        """
+        同步调用入口(非流式)
+
+        :return: completion对象
+        """
+        settings = cls.settings(provider_name)
+        return cls.run(cls.acreate(provider_name, provider_config, params, settings, trace))
+
+    @classmethod
+    def stream(cls, provider_name, provider_config, params, trace=None):
+        """
+        同步调用入口(流式)，返回逐块产出chunk的同步生成器，调用方提前结束迭代时关闭底层连接
+
+        :return: 生成器
+        """
+        # 配置在调用时读取，生成器可能在应用上下文之外被迭代
+        settings = cls.settings(provider_name)
+        return cls._iterate(cls.astream(provider_name, provider_config, params, settings, trace))
+
+    @classmethod
+    def _iterate(cls, agen):
+        """把异步生成器转换为同步生成器"""
+        try:
+            while True:
+                try:
+                    chunk = cls.run(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+                yield chunk
+        finally:
+            cls.run(agen.aclose())
+
+    @classmethod
+    def create_many(cls, requests):
+        """
+        同步调用入口(批量并发，非流式)，单个请求失败不影响其他请求
+
+        :param requests: 列表 [(provider_name, provider_config, params), ...]
+        :return: 与请求顺序一致的列表，元素为completion对象或异常对象
+        """
+        settings_by_provider = {}
+        coros = []
+        for provider_name, provider_config, params in requests:
+            if provider_name not in settings_by_provider:
+                settings_by_provider[provider_name] = cls.settings(provider_name)
+            coros.append(cls.acreate(provider_name, provider_config, params, settings_by_provider[provider_name]))
+        return cls.gather(coros)
+
+    @classmethod
+    def gather(cls, coros):
+        """
+        在后台事件循环中并发执行多个协程并等待全部完成，单个协程失败不影响其他协程
+
+        :param coros: 协程列表
+        :return: 与协程顺序一致的结果列表，失败的为异常对象
+        """
+        async def gather_all():
+            return await asyncio.gather(*coros, return_exceptions=True)
+
+        return cls.run(gather_all())
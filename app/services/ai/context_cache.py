@@ -0,0 +1,157 @@
+# app/services/ai/context_cache.py
+import json
+import asyncio
+import hashlib
+import functools
+from flask import current_app
+from app.extensions import cache
+from app.services.ai.async_client import AsyncLLMClient
+from app.services.ai.telemetry import LLMTelemetry
+
+
+class LLMContextCache:
+    """
+    提供者侧上下文缓存(目前为Moonshot的 /caching 接口)
+
+    一次方案生成和随后的分析中，同一段系统提示词和学生档案会在十几次调用中重复发送。
+    支持上下文缓存的提供者，把 (系统提示词, 学生档案) 这段公共前缀创建为缓存，后续调用用一条
+    role 为 cache 的消息引用它，不再重复传输和计费完整前缀。
+    缓存标签由模型和前缀内容的哈希得出，档案变化(新一次生成)自然对应新的缓存；
+    Redis中记录各标签的状态，所有进程共用，同一标签只由一个进程创建。
+    缓存在 AsyncLLMClient 的事件循环中异步创建(经限流和遥测)，调用线程不等待创建结果；
+    提供者不支持、前缀过短、创建失败或创建中时返回None，调用方按原样发送完整消息。
+    """
+
+    # Redis键前缀
+    KEY_PREFIX = "llm_ctx"
+    # 标签状态
+    STATUS_READY = "ready"
+    STATUS_CREATING = "creating"
+    STATUS_FAILED = "failed"
+    # 创建中状态的过期时间(秒)，创建进程异常退出时其他进程可在此后重试
+    CREATING_TTL = 30
+    # 创建缓存使用的模型系列
+    CACHE_MODEL = "moonshot-v1"
+    # 创建缓存的接口路径(相对于 base_url)和遥测中的调用名称
+    CACHE_PATH = "/caching"
+    CALL_NAME = "context_cache"
+
+    # 默认配置
+    DEFAULT_TTL = 600
+    DEFAULT_MIN_CHARS = 1000
+
+    @staticmethod
+    def enabled():
+        """是否启用上下文缓存(录制响应时不使用，保证录制的请求与回放时的完整消息一致)"""
+        config = current_app.config
+        return config.get('LLM_CONTEXT_CACHE_ENABLED', True) and config.get('LLM_CASSETTE_MODE') != 'record'
+
+    @staticmethod
+    def supported(provider_config):
+        """提供者是否支持上下文缓存"""
+        return bool(provider_config.get("context_cache"))
+
+    @staticmethod
+    def make_tag(prefix_messages):
+        """根据缓存前缀计算缓存标签"""
+        digest = hashlib.sha256(
+            json.dumps([LLMContextCache.CACHE_MODEL, prefix_messages], ensure_ascii=False, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+        return f"ctx-{digest[:40]}"
+
+    @staticmethod
+    def _status_key(tag):
+        return f"{LLMContextCache.KEY_PREFIX}:{tag}"
+
+    @staticmethod
+    def reference(provider_name, provider_config, prefix_messages):
+        """
+        获取引用公共前缀的缓存消息，缓存不存在时在后台创建，本次先发送完整消息
+
+        :param provider_name: 提供者名称
+        :param provider_config: 提供者配置(LLMService.PROVIDERS中的项)
+        :param prefix_messages: 公共前缀消息列表
+        :return: role 为 cache 的消息，无法使用缓存时返回None
+        """
+        if not LLMContextCache.enabled() or not LLMContextCache.supported(provider_config):
+            return None
+
+        config = current_app.config
+        if sum(len(message.get("content") or "") for message in prefix_messages) \
+                < config.get('LLM_CONTEXT_CACHE_MIN_CHARS', LLMContextCache.DEFAULT_MIN_CHARS):
+            return None
+
+        ttl = config.get('LLM_CONTEXT_CACHE_TTL', LLMContextCache.DEFAULT_TTL)
+        tag = LLMContextCache.make_tag(prefix_messages)
+        status_key = LLMContextCache._status_key(tag)
+        try:
+            redis_client = cache.cache._write_client
+            status = redis_client.get(status_key)
+            if isinstance(status, bytes):
+                status = status.decode('utf-8')
+
+            if status is None:
+                # 抢占创建权并在后台创建，创建完成前(包括本次)直接发送完整消息
+                if redis_client.set(status_key, LLMContextCache.STATUS_CREATING, nx=True, ex=LLMContextCache.CREATING_TTL):
+                    LLMContextCache._schedule_create(provider_name, provider_config, prefix_messages, tag, ttl)
+                return None
+            elif status == LLMContextCache.STATUS_READY:
+                # 每次引用都会通过 reset_ttl 延长提供者侧的有效期，这里同步延长
+                redis_client.expire(status_key, ttl)
+        except Exception as e:
+            current_app.logger.error(f"获取大模型上下文缓存失败: {str(e)}")
+            return None
+
+        if status != LLMContextCache.STATUS_READY:
+            return None
+        return {"role": "cache", "content": f"tag={tag};reset_ttl={ttl}"}
+
+    @staticmethod
+    def _schedule_create(provider_name, provider_config, prefix_messages, tag, ttl):
+        """在后台事件循环中创建缓存，不等待结果(配置在调用线程的应用上下文中读取)"""
+        body = {
+            "model": LLMContextCache.CACHE_MODEL,
+            "messages": prefix_messages,
+            "ttl": ttl,
+            "tags": [tag],
+        }
+        AsyncLLMClient.submit(LLMContextCache._acreate(
+            provider_name, provider_config, body, AsyncLLMClient.settings(provider_name),
+            LLMTelemetry.trace(LLMContextCache.CALL_NAME), cache.cache._write_client, current_app.logger
+        ))
+
+    @staticmethod
+    async def _acreate(provider_name, provider_config, body, settings, trace, redis_client, logger):
+        """
+        在提供者侧创建缓存并记录标签状态(在事件循环中执行)
+
+        失败状态同样保留一个有效期，避免反复创建
+        """
+        tag = body["tags"][0]
+        try:
+            await AsyncLLMClient.apost(
+                provider_name, provider_config, LLMContextCache.CACHE_PATH, body, settings, trace
+            )
+            status = LLMContextCache.STATUS_READY
+            logger.info(f"已创建大模型上下文缓存: {tag}")
+        except Exception as e:
+            status = LLMContextCache.STATUS_FAILED
+            logger.error(f"创建大模型上下文缓存失败: {str(e)}")
+
+        # Redis客户端是同步的，放到线程池执行，不阻塞事件循环
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, functools.partial(
+                redis_client.set, LLMContextCache._status_key(tag), status, ex=body["ttl"]
+            ))
+        except Exception as e:
+            logger.error(f"记录大模型上下文缓存状态失败: {str(e)}")
+
+    @staticmethod
+    def invalidate(cache_message):
+        """引用缓存的调用失败时(如提供者侧缓存已过期)清除标签状态，下次调用重新创建"""
+        tag = cache_message["content"].split(";")[0].split("=", 1)[1]
+        try:
+            cache.cache._write_client.delete(LLMContextCache._status_key(tag))
+        except Exception as e:
+            current_app.logger.error(f"清除大模型上下文缓存状态失败: {str(e)}")
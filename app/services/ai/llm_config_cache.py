@@ -0,0 +1,149 @@
+# app/services/ai/llm_config_cache.py
+import os
+import time
+import threading
+from flask import current_app
+from app.extensions import cache
+
+
+class LLMConfigCache:
+    """
+    大模型配置的进程内缓存(活跃提供者、提示词模板)
+
+    每次大模型调用都要读取活跃提供者和提示词模板，这里把它们缓存在进程内存中，
+    管理端修改配置后通过 Redis 发布/订阅通知所有进程(Web、Celery worker)立即清除对应缓存。
+    订阅线程断线期间可能漏掉通知，因此缓存仍设置较短的过期时间兜底，重新连接后清空全部缓存。
+    loader在锁外执行，每个缓存键维护一个代数，清除缓存时代数加一，加载期间代数变化则不写入加载结果，
+    避免把失效通知之前读到的旧值写回缓存。
+    """
+
+    # Redis发布/订阅频道
+    CHANNEL = "llm_config_changed"
+    # 通知所有缓存失效的消息
+    ALL_KEYS = "*"
+    # 缓存键
+    ACTIVE_PROVIDER_KEY = "active_provider"
+    PROMPT_KEY_PREFIX = "prompt"
+    # 默认过期时间(秒)
+    DEFAULT_TTL = 60
+    # 订阅断线后的重连间隔(秒)
+    RECONNECT_INTERVAL = 1
+
+    # 缓存未命中的标记(区分"值为None"与"未缓存")
+    _MISSING = object()
+
+    _lock = threading.Lock()
+    _entries = {}
+    # 缓存代数：清除单个键时该键的代数加一，清除全部缓存时全局代数加一
+    _generations = {}
+    _generation = 0
+    _listener = None
+    _listener_pid = None
+
+    @staticmethod
+    def prompt_key(prompt_type):
+        """提示词模板的缓存键"""
+        return f"{LLMConfigCache.PROMPT_KEY_PREFIX}:{prompt_type}"
+
+    @classmethod
+    def get(cls, key, loader):
+        """
+        读取缓存，未命中或已过期时调用loader从数据库加载
+
+        :param key: 缓存键
+        :param loader: 无参函数，返回要缓存的值
+        :return: 缓存值
+        """
+        cls._ensure_listener()
+
+        entry = cls._entries.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+
+        with cls._lock:
+            generation = cls._current_generation(key)
+        value = loader()
+        ttl = current_app.config.get('LLM_CONFIG_CACHE_TTL', cls.DEFAULT_TTL)
+        with cls._lock:
+            # 加载期间缓存已被清除，加载结果可能是旧值，本次直接返回但不写入缓存
+            if cls._current_generation(key) == generation:
+                cls._entries[key] = (value, time.monotonic() + ttl)
+        return value
+
+    @classmethod
+    def _current_generation(cls, key):
+        """缓存键当前的代数(调用方需持有锁)"""
+        return cls._generation, cls._generations.get(key, 0)
+
+    @classmethod
+    def invalidate_local(cls, key=ALL_KEYS):
+        """清除本进程的缓存"""
+        with cls._lock:
+            if key == cls.ALL_KEYS:
+                cls._entries.clear()
+                cls._generation += 1
+            else:
+                cls._entries.pop(key, None)
+                cls._generations[key] = cls._generations.get(key, 0) + 1
+
+    @classmethod
+    def notify_changed(cls, key=ALL_KEYS):
+        """
+        配置变化后调用：清除本进程缓存，并通知其他进程清除
+
+        :param key: 变化的缓存键，默认全部
+        """
+        cls.invalidate_local(key)
+        try:
+            cache.cache._write_client.publish(cls.CHANNEL, key)
+        except Exception as e:
+            current_app.logger.error(f"发布大模型配置变更通知失败: {str(e)}")
+
+    @classmethod
+    def _ensure_listener(cls):
+        """启动本进程的订阅线程(进程fork后重新启动)"""
+        if cls._listener is not None and cls._listener_pid == os.getpid():
+            return
+
+        with cls._lock:
+            if cls._listener is not None and cls._listener_pid == os.getpid():
+                return
+            # fork前父进程的缓存可能已过时，子进程从空缓存开始
+            cls._entries.clear()
+            cls._generation += 1
+            listener = threading.Thread(
+                target=cls._listen,
+                args=(current_app.logger,),
+                name="llm-config-listener",
+                daemon=True
+            )
+            listener.start()
+            cls._listener = listener
+            cls._listener_pid = os.getpid()
+
+    @classmethod
+    def _listen(cls, logger):
+        """订阅配置变更通知并清除对应缓存(在后台线程中运行)"""
+        while True:
+            pubsub = None
+            try:
+                pubsub = cache.cache._read_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(cls.CHANNEL)
+                # 断线期间的通知已丢失，重新订阅后清空全部缓存
+                cls.invalidate_local()
+                for message in pubsub.listen():
+                    if message.get('type') != 'message':
+                        continue
+                    key = message['data']
+                    if isinstance(key, bytes):
+                        key = key.decode('utf-8')
+                    cls.invalidate_local(key)
+            except Exception as e:
+                logger.error(f"大模型配置变更订阅中断，{cls.RECONNECT_INTERVAL}秒后重连: {str(e)}")
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+            time.sleep(cls.RECONNECT_INTERVAL)
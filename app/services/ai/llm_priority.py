@@ -0,0 +1,100 @@
+# app/services/ai/llm_priority.py
+import threading
+from contextlib import contextmanager
+from flask import current_app, has_request_context
+
+
+class LLMPriority:
+    """
+    大模型调用的优先级上下文
+
+    Web请求中的调用(聊天流式回复等)为交互式，Celery任务中的调用(方案生成、各类分析)为后台调用。
+    LLMRateLimiter 让交互式调用优先获取令牌，并在后台调用之间按机构公平分配剩余额度。
+    投递任务时把发起请求的用户所属机构写入任务消息头，任务执行时以该机构的身份进行后台调用。
+    """
+
+    INTERACTIVE = 'interactive'
+    BACKGROUND = 'background'
+
+    # 任务消息头中的机构ID字段
+    INSTITUTION_HEADER = 'llm_institution_id'
+    # 没有机构的用户(管理员、个人用户)共用的机构标识
+    DEFAULT_INSTITUTION = 'default'
+
+    _local = threading.local()
+
+    @classmethod
+    @contextmanager
+    def use(cls, priority, institution_id=None):
+        """
+        在当前线程中以指定优先级调用大模型(可嵌套，结束后恢复外层)
+
+        :param priority: INTERACTIVE 或 BACKGROUND
+        :param institution_id: 机构ID，仅后台调用使用
+        """
+        previous = getattr(cls._local, 'context', None)
+        cls._local.context = (priority, institution_id)
+        try:
+            yield
+        finally:
+            cls._local.context = previous
+
+    @classmethod
+    def current(cls):
+        """
+        当前线程的优先级
+
+        :return: (优先级, 机构标识)，未设置时为交互式
+        """
+        priority, institution_id = getattr(cls._local, 'context', None) or (cls.INTERACTIVE, None)
+        return priority, str(institution_id) if institution_id else cls.DEFAULT_INSTITUTION
+
+    @staticmethod
+    def request_institution_id():
+        """
+        当前Web请求登录用户所属的机构ID，不在请求中或未登录时返回None
+
+        从访问令牌的机构声明中读取，不查询用户表；声明缺失(此前签发的令牌)时回退到查询用户
+        """
+        if not has_request_context():
+            return None
+        try:
+            from flask_jwt_extended import get_jwt, get_jwt_identity
+            from app.core.auth.service import AuthService
+            claims = get_jwt()
+            if AuthService.INSTITUTION_CLAIM in claims:
+                return claims[AuthService.INSTITUTION_CLAIM]
+            user_id = get_jwt_identity()
+            if not user_id:
+                return None
+            from app.models.user import User
+            user = User.query.get(int(user_id))
+            return user.institution_id if user else None
+        except Exception as e:
+            current_app.logger.error(f"获取请求用户所属机构失败: {str(e)}")
+            return None
+
+    @classmethod
+    def publish_institution_id(cls):
+        """投递任务时应写入消息头的机构ID(任务中再投递任务时沿用当前任务的机构)"""
+        context = getattr(cls._local, 'context', None)
+        if context and context[0] == cls.BACKGROUND:
+            return context[1]
+        return cls.request_institution_id()
+
+    @classmethod
+    def task_institution_id(cls, task_request):
+        """从任务请求中读取投递时写入的机构ID"""
+        institution_id = getattr(task_request, cls.INSTITUTION_HEADER, None)
+        if institution_id is None:
+            institution_id = (getattr(task_request, 'headers', None) or {}).get(cls.INSTITUTION_HEADER)
+        return institution_id
+
+    @classmethod
+    def add_publish_headers(cls, headers=None, **kwargs):
+        """before_task_publish 信号处理：把机构ID写入任务消息头"""
+        if headers is None or cls.INSTITUTION_HEADER in headers:
+            return
+        institution_id = cls.publish_institution_id()
+        if institution_id is not None:
+            headers[cls.INSTITUTION_HEADER] = institution_id
@@ -1,7 +1,10 @@
 # app/services/ai/llm_service.py
 import os
-import importlib
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from flask import current_app
+from app.extensions import db
 from app.models.prompt_template import PromptTemplate
 from app.models.llm_configuration import LLMConfiguration
 from app.services.ai.prompt import (
@@ -27,6 +30,12 @@ import json
 from app.core.recommendation.ai_function_call import get_college_detail_by_name,get_colleges_by_major_names,get_colleges_by_location
 from app.models.conversations import Conversation
 from app.services.student.student_data_service import StudentDataService
+from app.services.ai.async_client import AsyncLLMClient
+from app.services.ai.llm_config_cache import LLMConfigCache
+from app.services.ai.response_cache import LLMResponseCache
+from app.services.ai.provider_router import ProviderRouter
+from app.services.ai.telemetry import LLMTelemetry
+from app.services.ai.context_cache import LLMContextCache
 
 CONVERSATION_PROMPTS = {
     Conversation.TYPE_1: PromptTemplate.TYPE_CAREER_ANALYZING_PROMPT,  # 就业倾向解析
@@ -38,11 +47,15 @@ CONVERSATION_PROMPTS = {
     Conversation.TYPE_7: PromptTemplate.TYPE_W_SUBJECT_ANALYZING_PROMPT,  # 劣势学科解析
 }
 
+class ToolProgress(str):
+    """kimi_tools 执行工具期间产出的进度提示(与回复内容区分，不计入回复)"""
+
+
 class LLMService:
     """统一的大语言模型服务类"""
 
-    # 客户端缓存
-    _clients = {}
+    # run_concurrently 收集请求期间，_call_api 只构造请求不发送(按线程隔离)
+    _deferred = threading.local()
 
     # 当前活跃的提供者名称
     _active_provider = None
@@ -53,6 +66,13 @@ class LLMService:
         "get_colleges_by_major_names": get_colleges_by_major_names,
         "get_colleges_by_location": get_colleges_by_location
     }
+
+    # 工具在进度提示中的名称
+    tool_labels = {
+        "get_college_detail_by_name": "院校详情",
+        "get_colleges_by_major_names": "按专业推荐的院校",
+        "get_colleges_by_location": "按地区推荐的院校"
+    }
     
     tools = [
         {
@@ -134,36 +154,53 @@ class LLMService:
         }
     ]
 
-    # 支持的AI配置
+    # 支持的AI配置(均通过OpenAI兼容接口调用，见 AsyncLLMClient)
+    # base_url 可通过环境变量覆盖，便于指向本地桩服务测试路由和熔断
     PROVIDERS = {
         "moonshot": {
             "api_env_key": "MOONSHOT_API_KEY",
-            "client_class": "openai.OpenAI",
-            "base_url": "https://api.moonshot.cn/v1",
+            "base_url": os.getenv("MOONSHOT_BASE_URL", "https://api.moonshot.cn/v1"),
             "model_name": "moonshot-v1-auto",
+            "context_cache": True,  # 支持上下文缓存(见 LLMContextCache)
+            "stream_usage_in_choice": True,  # 流式响应的usage在最后一个分块的choice中返回，不支持 stream_options
         },
         "deepseek": {
             "api_env_key": "DEEPSEEK_API_KEY",
-            "client_class": "openai.OpenAI",
-            "base_url": "https://api.deepseek.com",
+            "base_url": os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com"),
             "model_name": "deepseek-chat",
         },
         "zhipu": {
             "api_env_key": "ZHIPU_API_KEY",
-            "client_class": "zhipuai.ZhipuAI",
-            "base_url": None,  # zhipuai客户端不需要base_url
+            "base_url": os.getenv("ZHIPU_BASE_URL", "https://open.bigmodel.cn/api/paas/v4/"),  # 智谱的OpenAI兼容接口
             "model_name": "GLM-4-Air-250414",
         },
+        "stub": {
+            "api_env_key": "LLM_STUB_API_KEY",
+            "base_url": "http://llm-stub.local/v1",
+            "model_name": "stub-model",
+            "stub": True,  # 进程内桩模型(见 StubTransport)，不访问网络
+        },
     }
 
+    @classmethod
+    def _override_provider(cls):
+        """配置中强制使用的提供者(LLM_PROVIDER_OVERRIDE)，未配置或不受支持时返回None"""
+        provider_name = current_app.config.get('LLM_PROVIDER_OVERRIDE')
+        return provider_name if provider_name in cls.PROVIDERS else None
+
+    @classmethod
+    def _load_active_provider(cls):
+        """从数据库读取当前激活的提供者名称"""
+        config = LLMConfiguration.query.filter_by(is_active=True).first()
+        return config.provider if config else "moonshot"
+
     @classmethod
     def get_active_provider(cls):
-        """获取当前活跃的提供者名称"""
+        """获取当前活跃的提供者名称(进程内缓存，配置变更时通过Redis通知失效)"""
 
         try:
-            # 从数据库获取当前激活的配置
-            config = LLMConfiguration.query.filter_by(is_active=True).first()
-            provider_name = config.provider if config else "moonshot"
+            provider_name = cls._override_provider() or \
+                LLMConfigCache.get(LLMConfigCache.ACTIVE_PROVIDER_KEY, cls._load_active_provider)
 
             # 检查提供者是否受支持
             if provider_name not in cls.PROVIDERS:
@@ -180,48 +217,17 @@ class LLMService:
             current_app.logger.error(f"获取活跃提供者时出错: {str(e)}")
             return "moonshot"  # 默认使用moonshot
 
-    @classmethod
-    def _get_client(cls, provider_name=None):
-        """获取或创建对应提供者的客户端"""
-        if not provider_name:
-            provider_name = cls.get_active_provider()
-
-        # 如果客户端已经创建，直接返回
-        if provider_name in cls._clients:
-            return cls._clients[provider_name]
-
-        try:
-            provider_config = cls.PROVIDERS[provider_name]
-            api_key = os.getenv(provider_config["api_env_key"])
-
-            # 动态导入和实例化客户端类
-            module_path, class_name = provider_config["client_class"].rsplit(".", 1)
-            module = importlib.import_module(module_path)
-            client_class = getattr(module, class_name)
-
-            # 创建客户端实例
-            if provider_config["base_url"]:
-                client = client_class(
-                    api_key=api_key, base_url=provider_config["base_url"]
-                )
-            else:
-                client = client_class(api_key=api_key)
-
-            # 缓存客户端
-            cls._clients[provider_name] = client
-            return client
-        except Exception as e:
-            current_app.logger.error(f"创建{provider_name}客户端时出错: {str(e)}")
-            raise
-
     @classmethod
     def _get_prompt_by_type(cls, prompt_type):
-        """从数据库获取提示词模板"""
-        template = PromptTemplate.get_prompt_by_type(prompt_type)
-        if template:
+        """获取提示词模板内容(进程内缓存，模板修改时通过Redis通知失效)"""
+        def load():
+            template = PromptTemplate.get_prompt_by_type(prompt_type)
+            if not template:
+                current_app.logger.error(f"未找到类型为 {prompt_type} 的提示词模板")
+                return ""
             return template.content
-        current_app.logger.error(f"未找到类型为 {prompt_type} 的提示词模板")
-        return ""
+
+        return LLMConfigCache.get(LLMConfigCache.prompt_key(prompt_type), load)
 
     @classmethod
     def _call_api(
@@ -234,14 +240,41 @@ class LLMService:
         response_format=None,
         stream=False,
         provider_name=None,
-        tools_messages=None
+        tools_messages=None,
+        call_name=None,
+        cache_response=False,
+        use_cache=True,
+        shared_context=None,
+        context_cache=False
     ):
-        """处理API调用的通用方法"""
+        """
+        处理API调用的通用方法
+        
+        请求通过 AsyncLLMClient 的共享连接池发送，调用线程同步等待结果；
+        流式调用返回逐块产出chunk的生成器。
+        
+        :param call_name: 调用名称(如 analyzing_category)，用于缓存统计和调用遥测
+        :param cache_response: 是否启用响应缓存(由输入确定即可复用结果的分析类方法开启，仅非流式调用)
+        :param use_cache: 为False时跳过缓存读取强制重新调用，新结果仍写入缓存
+        :param provider_name: 指定提供者(如需要工具调用时)，不指定时以活跃提供者为首选并由 ProviderRouter 路由
+        :param shared_context: 多次调用共用的上下文(如学生档案)，拼接在用户输入之前
+        :param context_cache: 是否把 (系统提示词, shared_context) 创建为提供者侧上下文缓存(仅非流式调用，
+                              提供者不支持时按原样发送)
+        """
+        routed = not provider_name
         if not provider_name:
             provider_name = cls.get_active_provider()
 
-        client = cls._get_client(provider_name)
         provider_config = cls.PROVIDERS[provider_name]
+        context = None
+        if shared_context:
+            if context_cache and not stream and not history_msg and not tools_messages:
+                # 缓存前缀为系统提示词和公共上下文，引用缓存时只需发送本次的用户输入
+                prefix = [{"role": "system", "content": system}] if system else []
+                prefix.append({"role": "system", "content": shared_context})
+                context = {"prefix": prefix, "user_message": {"role": "user", "content": user_input}}
+            user_input = f"{shared_context}\n{user_input}"
+
         if tools_messages:
             messages = tools_messages
 
@@ -255,7 +288,7 @@ class LLMService:
             if system:
                 messages.insert(0, {"role": "system", "content": system})
 
-        current_app.logger.info(f"当前AI大模型为: {provider_name}")
+        current_app.logger.info(f"当前AI大模型为: {provider_name}, 调用: {call_name}")
         # current_app.logger.info(f"AI_messages内容: {messages}")
 
         # 构造API调用参数
@@ -272,35 +305,230 @@ class LLMService:
         if response_format:
             params["response_format"] = response_format
 
-        # 调用API获取响应
-        completion = client.chat.completions.create(**params)
-        
+        cache_key = None
+        if cache_response and not stream and LLMResponseCache.enabled():
+            cache_key = LLMResponseCache.make_key(provider_name, params)
+        request = {
+            "provider_name": provider_name,
+            "params": params,
+            "call_name": call_name,
+            "cache_key": cache_key,
+            "use_cache": use_cache,
+            "routed": routed,
+            "trace": LLMTelemetry.trace(call_name),
+            "context": context,
+            "inline_params": None
+        }
+
+        # 并发收集阶段只返回构造好的请求，由 run_concurrently 统一发送
+        if getattr(cls._deferred, "active", False):
+            if stream:
+                raise ValueError("并发调用不支持流式输出")
+            return request
+
         if stream:
-            # 对于流式输出，直接返回流对象，让调用者处理
-            return completion
+            # 对于流式输出，直接返回流对象，让调用者处理(流式调用只选择状态正常的提供者，不做对冲)
+            if routed:
+                provider_name = ProviderRouter.select(cls.PROVIDERS, provider_name)
+                provider_config = cls.PROVIDERS[provider_name]
+                params["model"] = provider_config["model_name"]
+            return AsyncLLMClient.stream(provider_name, provider_config, params, request["trace"])
         else:
             # 非流式输出，返回完整内容
+            cached_content = cls._cached_content(request)
+            if cached_content is not None:
+                return cached_content
+
+            cls._apply_context_cache(request)
+            try:
+                answered_by, completion = cls._send(request)
+            except Exception as e:
+                if not request["inline_params"]:
+                    raise
+                # 引用上下文缓存的调用失败(如缓存已过期)时按完整消息重试
+                current_app.logger.warning(f"引用上下文缓存的调用失败，改为发送完整消息: {str(e)}")
+                request = cls._without_context_cache(request)
+                answered_by, completion = cls._send(request)
             content = completion.choices[0].message.content
+            cls._store_response(request, answered_by, content)
 
-            current_app.logger.info(f"AI response: {content}")
+            current_app.logger.info(
+                f"AI响应完成: {call_name}, 提供者: {answered_by}, 模型: {completion.model}, 长度: {len(content or '')}"
+            )
+            current_app.logger.debug(f"AI response: {content}")
             return content
 
+    @classmethod
+    def _apply_context_cache(cls, request):
+        """
+        为请求引用提供者侧上下文缓存(在调用线程中执行)
+
+        引用缓存后 params 中只包含缓存消息和本次用户输入，完整消息保留在 inline_params 中，
+        路由到其他提供者或引用失败时使用。
+        """
+        context = request["context"]
+        if not context:
+            return
+        provider_name = request["provider_name"]
+        cache_message = LLMContextCache.reference(provider_name, cls.PROVIDERS[provider_name], context["prefix"])
+        if not cache_message:
+            return
+        request["inline_params"] = request["params"]
+        request["params"] = dict(request["params"], messages=[cache_message, context["user_message"]])
+        request["cache_message"] = cache_message
+
+    @staticmethod
+    def _without_context_cache(request):
+        """清除失效的上下文缓存状态，返回使用完整消息的请求"""
+        LLMContextCache.invalidate(request["cache_message"])
+        return dict(request, params=request["inline_params"], inline_params=None, cache_message=None)
+
+    @classmethod
+    def _send(cls, request):
+        """
+        同步发送非流式请求
+
+        :return: (实际应答的提供者名称, completion对象)
+        """
+        provider_name = request["provider_name"]
+        if request["routed"] and ProviderRouter.options()["enabled"]:
+            return ProviderRouter.create(
+                cls.PROVIDERS, provider_name, request["params"], request["trace"], request["inline_params"]
+            )
+        return provider_name, AsyncLLMClient.create(
+            provider_name, cls.PROVIDERS[provider_name], request["params"], request["trace"]
+        )
+
+    @classmethod
+    async def _send_async(cls, request, settings_by_provider, router_options):
+        """
+        发送非流式请求的协程(在事件循环中执行)
+
+        :return: (实际应答的提供者名称, completion对象)
+        """
+        provider_name = request["provider_name"]
+        if request["routed"] and router_options["enabled"]:
+            return await ProviderRouter.acreate(
+                cls.PROVIDERS, provider_name, request["params"], settings_by_provider, router_options,
+                request["trace"], request["inline_params"]
+            )
+        completion = await AsyncLLMClient.acreate(
+            provider_name, cls.PROVIDERS[provider_name], request["params"],
+            settings_by_provider[provider_name], request["trace"]
+        )
+        return provider_name, completion
+
+    @classmethod
+    def _store_response(cls, request, answered_by, content):
+        """
+        把响应写入响应缓存
+
+        缓存键按首选提供者计算，路由切换或对冲后由其他提供者应答时，
+        按实际应答的提供者(及其模型、完整消息)重新计算缓存键，避免其他提供者的结果以首选提供者的键缓存
+
+        :param request: _call_api 构造的请求
+        :param answered_by: 实际应答的提供者名称
+        :param content: 响应内容
+        """
+        cache_key = request["cache_key"]
+        if not cache_key:
+            return
+        if answered_by != request["provider_name"]:
+            params = request["inline_params"] or request["params"]
+            cache_key = LLMResponseCache.make_key(
+                answered_by, dict(params, model=cls.PROVIDERS[answered_by]["model_name"])
+            )
+        LLMResponseCache.set(cache_key, content)
+
+    @staticmethod
+    def _cached_content(request):
+        """读取请求的缓存响应，未启用缓存、跳过缓存或未命中时返回None"""
+        if not request["cache_key"] or not request["use_cache"]:
+            return None
+        content = LLMResponseCache.get(request["cache_key"], request["call_name"])
+        if content is not None:
+            LLMTelemetry.observe(request["provider_name"], request["trace"], LLMTelemetry.OUTCOME_CACHE_HIT, 0)
+        return content
+
+    @classmethod
+    def run_concurrently(cls, calls):
+        """
+        在当前线程中并发执行多个非流式大模型调用
+        
+        先依次调用各方法构造请求(提示词组装等仍在当前线程和应用上下文中完成)，
+        命中响应缓存的请求直接返回，其余请求通过 AsyncLLMClient 并发发送(经 ProviderRouter 路由)，
+        受各提供者并发数限制。
+        
+        :param calls: 列表 [(方法, 参数字典), ...]，如 [(LLMService.analyzing_college, {...})]，
+                      方法需直接返回 _call_api 的结果
+        :return: 与调用顺序一致的列表，元素为响应内容，失败的调用为异常对象
+        """
+        requests = []
+        cls._deferred.active = True
+        try:
+            for method, kwargs in calls:
+                requests.append(method(**kwargs))
+        finally:
+            cls._deferred.active = False
+
+        results = [cls._cached_content(request) for request in requests]
+        pending = [index for index, content in enumerate(results) if content is None]
+
+        router_options = ProviderRouter.options()
+        settings_by_provider = {name: AsyncLLMClient.settings(name) for name in cls.PROVIDERS}
+        for index in pending:
+            cls._apply_context_cache(requests[index])
+        completions = AsyncLLMClient.gather([
+            cls._send_async(requests[index], settings_by_provider, router_options) for index in pending
+        ])
+
+        # 引用上下文缓存失败的请求按完整消息重试一次
+        retry = [
+            position for position, index in enumerate(pending)
+            if isinstance(completions[position], Exception) and requests[index]["inline_params"]
+        ]
+        if retry:
+            current_app.logger.warning(f"{len(retry)}个引用上下文缓存的调用失败，改为发送完整消息")
+            for position in retry:
+                requests[pending[position]] = cls._without_context_cache(requests[pending[position]])
+            retried = AsyncLLMClient.gather([
+                cls._send_async(requests[pending[position]], settings_by_provider, router_options) for position in retry
+            ])
+            for position, completion in zip(retry, retried):
+                completions[position] = completion
+
+        for index, outcome in zip(pending, completions):
+            if isinstance(outcome, BaseException):
+                current_app.logger.error(f"并发调用大模型失败: {str(outcome)}")
+                results[index] = outcome
+            else:
+                answered_by, completion = outcome
+                content = completion.choices[0].message.content
+                cls._store_response(requests[index], answered_by, content)
+                results[index] = content
+        return results
+
     # 所有AI方法实现
     @classmethod
     def analyzing_strategy(cls, user_info, **kwargs):
         """分析策略"""
         user_input = ANALYZING_STRATEGY_PROMPT.format(user_info=user_info)
+        kwargs.setdefault("call_name", "analyzing_strategy")
         return cls._call_api(user_input=user_input, **kwargs)
 
     @classmethod
     def filter_colleges(cls, user_info, simplified_colleges_json, **kwargs):
         """筛选院校"""
         system = FILTER_COLLEGE_PROMPT
-        user_input = f"""这是我的个人档案：
+        kwargs.setdefault("call_name", "filter_colleges")
+        kwargs.setdefault("cache_response", True)
+        # 同一次方案生成的各批次共用系统提示词和学生档案，作为上下文缓存
+        kwargs.setdefault("context_cache", True)
+        shared_context = f"""这是我的个人档案：
             ```
             {user_info}
-            ```
-            这是我的备选院校信息：
+            ```"""
+        user_input = f"""这是我的备选院校信息：
             ```
             {simplified_colleges_json}
             ```"""
@@ -309,6 +537,7 @@ class LLMService:
             user_input=user_input,
             system=system,
             response_format=response_format,
+            shared_context=shared_context,
             **kwargs,
         )
 
@@ -318,6 +547,8 @@ class LLMService:
         # system = cls._get_prompt_by_type(PromptTemplate.TYPE_ANALYZING_FULL_PLAN)
         system = ANALYZING_FULL_PLAN_PROMPT
         kwargs["response_format"] = {"type": "json_object"}
+        kwargs.setdefault("call_name", "analyzing_full_plan")
+        kwargs.setdefault("cache_response", True)
         user_input = f"""我的个人档案如下：
             {user_info}
             我的完整志愿方案如下：
@@ -333,29 +564,35 @@ class LLMService:
         # system = cls._get_prompt_by_type(PromptTemplate.TYPE_ANALYZING_CATEGORY)
         system = ANALYZING_CATEGORY_PROMPT
         kwargs["response_format"] = {"type": "json_object"}
-        user_input = f"""请对我的【{category}】进行全面而专业的解读分析。当前需要解读的是：【{category}】
-
-            我的个人档案如下：
+        kwargs.setdefault("call_name", "analyzing_category")
+        kwargs.setdefault("cache_response", True)
+        kwargs.setdefault("context_cache", True)
+        shared_context = f"""我的个人档案如下：
             ```
             {user_info}
-            ```
+            ```"""
+        user_input = f"""请对我的【{category}】进行全面而专业的解读分析。当前需要解读的是：【{category}】
+
             我的【{category}】包含以下院校和专业：
             ```
             {simplified_colleges_json}
             ```"""
-        return cls._call_api(user_input=user_input, system=system, **kwargs)
+        return cls._call_api(user_input=user_input, system=system, shared_context=shared_context, **kwargs)
 
     @classmethod
     def analyzing_college(cls, user_info, college_json, **kwargs):
         """院校分析"""
         system = cls._get_prompt_by_type(PromptTemplate.TYPE_ANALYZING_COLLEGE)
-        user_input = f"""
+        kwargs.setdefault("call_name", "analyzing_college")
+        kwargs.setdefault("cache_response", True)
+        kwargs.setdefault("context_cache", True)
+        shared_context = f"""
             ## 学生信息
-            {user_info}
-            ## 院校信息
+            {user_info}"""
+        user_input = f"""## 院校信息
             {college_json}
             """
-        return cls._call_api(user_input=user_input, system=system, **kwargs)
+        return cls._call_api(user_input=user_input, system=system, shared_context=shared_context, **kwargs)
 
     @classmethod
     def analyzing_specialty(cls, user_info, specialty_json, **kwargs):
@@ -363,6 +600,8 @@ class LLMService:
         user_input = ANALYZING_SPECIALTY_PROMPT.format(
             user_info=user_info, specialty_json=specialty_json
         )
+        kwargs.setdefault("call_name", "analyzing_specialty")
+        kwargs.setdefault("cache_response", True)
         return cls._call_api(user_input=user_input, **kwargs)
 
     @classmethod
@@ -372,6 +611,7 @@ class LLMService:
             current_snapshot=current_snapshot,
             previous_snapshot=previous_snapshot,
         )
+        kwargs.setdefault("call_name", "analyzing_student_snapshots")
         return cls._call_api(user_input=user_input, **kwargs)
 
     @classmethod
@@ -380,6 +620,7 @@ class LLMService:
         system = CHANGE_STU_CP_PROMPT.format(stu_cp=stu_cp)
         kwargs["response_format"] = {"type": "json_object"}
         kwargs["stream"] = False
+        kwargs.setdefault("call_name", "change_student_college_preferences")
         return cls._call_api(user_input=user_input, system=system, **kwargs)
 
     @classmethod
@@ -388,6 +629,7 @@ class LLMService:
         system = system or COMMON_PROMPT
 
         kwargs["stream"] = True
+        kwargs.setdefault("call_name", "common_chat")
         stream_response = cls._call_api(
             user_input=user_input, system=system, history_msg=history_msg, **kwargs
         )
@@ -403,6 +645,7 @@ class LLMService:
         """解释信息"""
         system = ANALYZING_EXPLAIN_INFO_PROMPT
         kwargs["stream"] = True
+        kwargs.setdefault("call_name", "analyzing_explain_info")
         stream_response = cls._call_api(
             user_input=user_input, system=system, history_msg=history_msg, **kwargs
         )
@@ -418,11 +661,13 @@ class LLMService:
         user_input = GENERATE_CONVERSATION_TITLE_PROMPT.format(
             user_message=user_message
         )
+        kwargs.setdefault("call_name", "generate_conversation_title")
         return cls._call_api(user_input=user_input, **kwargs)
 
     @classmethod
     def kimi_tools(cls, user_input, history_msg, student_id, conversation_type, **kwargs):
         """kimi工具"""
+        kwargs.setdefault("call_name", "kimi_tools")
         # 获取提示词类型
         prompt_type = CONVERSATION_PROMPTS.get(conversation_type)
         
@@ -443,89 +688,149 @@ class LLMService:
         tools = cls.tools
         system = prompt + f'# 学生ID为：{student_id}'
         kwargs["stream"] = True
-        res = cls._call_api(user_input=user_input, system=system, tools=tools, history_msg=history_msg, provider_name='moonshot', **kwargs)
-        
-        # 用于跟踪是否已触发工具调用
-        has_tool_call = False
-        tool_call_info = None
-        accumulated_arguments = ""
-        
-        # 遍历流式响应
-        for chunk in res:
-            delta = chunk.choices[0].delta
-            # 检查是否有工具调用
-            if delta.tool_calls:
-                # 标记已触发工具调用
-                has_tool_call = True
-                
-                # 收集工具调用信息
-                for tool_call_delta in delta.tool_calls:
-                    # 如果是第一次收到工具调用信息，保存ID和名称
-                    if tool_call_delta.id and not tool_call_info:
-                        tool_call_info = {
-                            "id": tool_call_delta.id,
-                            "name": tool_call_delta.function.name if tool_call_delta.function else None,
-                            "arguments": ""
-                        }
-                    
-                    # 累积参数信息
-                    if tool_call_delta.function and tool_call_delta.function.arguments:
-                        accumulated_arguments += tool_call_delta.function.arguments
-            
-            # 如果有普通内容且未触发工具调用，直接流式返回
-            elif delta.content and not has_tool_call:
-                yield delta.content
-        
-        # 如果已触发工具调用，处理工具调用并返回结果
-        if has_tool_call and tool_call_info:
-            current_app.logger.info(f"触发工具调用: {tool_call_info['name']}，参数: {accumulated_arguments}")
-            # 解析完整的参数
-            try:
-                tool_call_arguments = json.loads(accumulated_arguments)
-                
-                # 执行工具函数
-                tool_call_name = tool_call_info["name"]
-                tool_function = cls.tool_map[tool_call_name]
-                tool_result = tool_function(tool_call_arguments)
-                current_app.logger.info(f"执行工具 {tool_call_name}，参数为 {tool_call_arguments}，结果为 {tool_result}")
-                
-                # 构建工具消息
-                tools_messages = [
+        # 工具调用固定使用moonshot(压测等场景可通过 LLM_PROVIDER_OVERRIDE 替换)
+        tools_provider = cls._override_provider() or 'moonshot'
+        max_rounds = current_app.config.get('LLM_TOOL_MAX_ROUNDS', 3)
+
+        messages = [{"role": "system", "content": system}]
+        messages.extend(history_msg or [])
+        messages.append({"role": "user", "content": user_input})
+
+        # 每轮回复中的全部工具调用并发执行，结果加入消息后进入下一轮，
+        # 达到轮数上限后的一轮不再提供工具，要求模型直接回答
+        for round_index in range(max_rounds + 1):
+            round_tools = tools if round_index < max_rounds else None
+            res = cls._call_api(tools_messages=messages, tools=round_tools, provider_name=tools_provider, **kwargs)
+
+            # 按index累积流式返回的工具调用(同一回复可能包含多个)
+            tool_calls = {}
+            content = ""
+            for chunk in res:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.tool_calls:
+                    for tool_call_delta in delta.tool_calls:
+                        index = tool_call_delta.index if tool_call_delta.index is not None else 0
+                        tool_call = tool_calls.setdefault(index, {"id": None, "name": None, "arguments": ""})
+                        if tool_call_delta.id:
+                            tool_call["id"] = tool_call_delta.id
+                        if tool_call_delta.function:
+                            if tool_call_delta.function.name:
+                                tool_call["name"] = tool_call_delta.function.name
+                            if tool_call_delta.function.arguments:
+                                tool_call["arguments"] += tool_call_delta.function.arguments
+                # 触发工具调用之前的普通内容直接流式返回
+                elif delta.content and not tool_calls:
+                    content += delta.content
+                    yield delta.content
+
+            if not tool_calls:
+                return
+
+            tool_calls = [tool_calls[index] for index in sorted(tool_calls)]
+            current_app.logger.info(
+                f"第{round_index + 1}轮触发工具调用: {[(call['name'], call['arguments']) for call in tool_calls]}"
+            )
+            assistant_message = {
+                "role": "assistant",
+                "tool_calls": [
                     {
-                        "role": "assistant",
-                        "tool_calls": [
-                            {
-                                "id": tool_call_info["id"],
-                                "function": {
-                                    "name": tool_call_name,
-                                    "arguments": accumulated_arguments
-                                },
-                                "type": "function"
-                            }
-                        ]
-                    },
-                    {
-                        "role": "tool",
-                        "tool_call_id": tool_call_info["id"],
-                        "name": tool_call_name,
-                        "content": json.dumps(tool_result)
+                        "id": call["id"],
+                        "function": {"name": call["name"], "arguments": call["arguments"]},
+                        "type": "function"
                     }
+                    for call in tool_calls
                 ]
-                history_msg.append({"role": "user", "content": user_input})
-                tools_messages = history_msg + tools_messages
-                tools_messages.insert(0, {"role": "system", "content": system})
-                # 发送第二次请求获取最终响应
-                kwargs['stream'] = True
-                finally_res = cls._call_api(tools_messages=tools_messages, provider_name='moonshot',**kwargs)
-                
-                # 流式返回最终响应
-                for chunk in finally_res:
-                    delta = chunk.choices[0].delta
-                    if delta.content:
-                        yield delta.content
-            except json.JSONDecodeError as e:
-                # 如果JSON解析失败，返回错误信息
-                error_msg = f"工具调用参数解析失败: {str(e)}"
-                current_app.logger.error(error_msg)
-                yield error_msg
+            }
+            if content:
+                assistant_message["content"] = content
+            tool_messages = yield from cls._execute_tool_calls(tool_calls)
+            messages = messages + [assistant_message] + tool_messages
+
+    @classmethod
+    def _execute_tool_calls(cls, tool_calls):
+        """
+        在线程池中并发执行一轮回复中的全部工具调用，等待期间定期产出进度提示
+
+        每个工具在独立线程中以独立的应用上下文和数据库会话执行，超过 LLM_TOOL_TIMEOUT 秒(自提交起计)
+        未完成的工具不再等待，以超时错误作为该工具的结果返回给模型。
+
+        :param tool_calls: 列表 [{'id', 'name', 'arguments'}, ...]
+        :return: (生成器返回值) 与 tool_calls 顺序一致的 tool 消息列表
+        """
+        config = current_app.config
+        timeout = config.get('LLM_TOOL_TIMEOUT', 30)
+        progress_interval = config.get('LLM_TOOL_PROGRESS_INTERVAL', 3)
+        app = current_app._get_current_object()
+
+        results = {}
+        futures = {}
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, min(len(tool_calls), config.get('LLM_TOOL_CONCURRENCY', 4))),
+            thread_name_prefix="llm-tool"
+        )
+        try:
+            for call in tool_calls:
+                if call["name"] not in cls.tool_map:
+                    results[call["id"]] = {"error": f"未知的工具: {call['name']}"}
+                    continue
+                try:
+                    arguments = json.loads(call["arguments"] or "{}")
+                except json.JSONDecodeError as e:
+                    current_app.logger.error(f"工具调用参数解析失败: {call['name']} {str(e)}")
+                    results[call["id"]] = {"error": f"工具调用参数解析失败: {str(e)}"}
+                    continue
+                futures[executor.submit(cls._run_tool, app, call["name"], arguments)] = call
+
+            labels = "、".join(dict.fromkeys(
+                cls.tool_labels.get(call["name"], call["name"]) for call in futures.values()
+            ))
+            started = time.monotonic()
+            pending = set(futures)
+            if pending:
+                yield ToolProgress(f"正在查询{labels}…\n")
+            while pending:
+                remaining = timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=min(progress_interval, remaining))
+                for future in done:
+                    call = futures[future]
+                    try:
+                        results[call["id"]] = future.result()
+                        current_app.logger.info(f"执行工具 {call['name']} 完成，参数为 {call['arguments']}")
+                    except Exception as e:
+                        current_app.logger.error(f"执行工具 {call['name']} 失败: {str(e)}")
+                        results[call["id"]] = {"error": f"工具执行失败: {str(e)}"}
+                if pending and time.monotonic() - started < timeout:
+                    yield ToolProgress(f"仍在查询{labels}，已用时{int(time.monotonic() - started)}秒…\n")
+
+            for future in pending:
+                future.cancel()
+                call = futures[future]
+                current_app.logger.warning(f"执行工具 {call['name']} 超时({timeout}秒)，参数为 {call['arguments']}")
+                results[call["id"]] = {"error": f"工具执行超时({timeout}秒)"}
+        finally:
+            # 超时的工具在后台线程中自行结束，不阻塞回复
+            executor.shutdown(wait=False)
+
+        return [
+            {
+                "role": "tool",
+                "tool_call_id": call["id"],
+                "name": call["name"],
+                "content": json.dumps(results[call["id"]])
+            }
+            for call in tool_calls
+        ]
+
+    @classmethod
+    def _run_tool(cls, app, tool_name, arguments):
+        """执行一个工具(在线程池中调用，使用独立的应用上下文和数据库会话)"""
+        with app.app_context():
+            try:
+                return cls.tool_map[tool_name](arguments)
+            finally:
+                db.session.remove()
 
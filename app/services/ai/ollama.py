@@ -1,4 +1,5 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import time
 import os
@@ -14,6 +15,9 @@ class OllamaAPI:
     _base_url = None
     _generate_endpoint = None
     _chat_endpoint = None
+    # 共享的HTTP会话(长连接池)及超时设置
+    _session = None
+    _timeout = None
     
     @classmethod
     def _initialize_endpoints(cls):
@@ -33,6 +37,22 @@ class OllamaAPI:
             # 日志记录
             cls._log_info(f"Ollama API 端点初始化: {cls._generate_endpoint}")
 
+    @classmethod
+    def _get_session(cls):
+        """获取共享的HTTP会话，复用连接并设置(连接, 读取)超时"""
+        if cls._session is None:
+            pool_size = int(os.getenv("OLLAMA_POOL_SIZE", 10))
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            cls._timeout = (
+                float(os.getenv("OLLAMA_CONNECT_TIMEOUT", 10)),
+                float(os.getenv("OLLAMA_READ_TIMEOUT", 300))
+            )
+            cls._session = session
+        return cls._session
+
     @classmethod
     def _log_info(cls, message):
         """统一的日志记录方法"""
@@ -70,7 +90,7 @@ class OllamaAPI:
         # 非流式响应处理
         if not stream:
             try:
-                response = requests.post(endpoint, headers=headers, json=payload)
+                response = cls._get_session().post(endpoint, headers=headers, json=payload, timeout=cls._timeout)
                 cls._log_info(f"状态码: {response.status_code}")
                 
                 if response.status_code != 200:
@@ -98,11 +118,12 @@ class OllamaAPI:
             # 创建一个函数，不要立即执行它
             def stream_generator():
                 try:
-                    response = requests.post(
+                    response = cls._get_session().post(
                         endpoint,
                         headers=headers,
                         json=payload,
-                        stream=True
+                        stream=True,
+                        timeout=cls._timeout
                     )
                     
                     if response.status_code != 200:
@@ -0,0 +1,350 @@
+# app/services/ai/provider_router.py
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+import httpx
+import openai
+from flask import current_app
+from app.services.ai.async_client import AsyncLLMClient
+from app.services.ai.rate_limiter import LLMRateLimitTimeout
+
+
+class _ProviderHealth:
+    """单个提供者的滚动调用统计和熔断状态(线程安全由 ProviderRouter 的锁保证)"""
+
+    STATE_CLOSED = 'closed'        # 正常
+    STATE_OPEN = 'open'            # 熔断中，不再分配请求
+    STATE_HALF_OPEN = 'half_open'  # 熔断冷却结束，放行一个试探请求
+
+    def __init__(self, window_size):
+        self.samples = deque(maxlen=window_size)  # (耗时, 是否成功)
+        self.state = self.STATE_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def available(self, now, reset_timeout):
+        """当前是否可以向该提供者发送请求(不改变状态)"""
+        if self.state == self.STATE_CLOSED:
+            return True
+        if self.state == self.STATE_OPEN:
+            return now - self.opened_at >= reset_timeout
+        return not self.trial_in_flight
+
+    def acquire(self, now, reset_timeout):
+        """发送请求前调用，熔断冷却结束后只放行一个试探请求"""
+        if not self.available(now, reset_timeout):
+            return False
+        if self.state != self.STATE_CLOSED:
+            self.state = self.STATE_HALF_OPEN
+            self.trial_in_flight = True
+        return True
+
+    def release(self):
+        """试探请求被取消(未产生结果)时释放名额"""
+        self.trial_in_flight = False
+
+    def record(self, latency, ok, now, failure_threshold):
+        """记录一次调用结果并更新熔断状态"""
+        self.samples.append((latency, ok))
+        if ok:
+            self.consecutive_failures = 0
+            self.state = self.STATE_CLOSED
+            self.trial_in_flight = False
+            return
+
+        self.consecutive_failures += 1
+        if self.state == self.STATE_HALF_OPEN or self.consecutive_failures >= failure_threshold:
+            self.state = self.STATE_OPEN
+            self.opened_at = now
+            self.trial_in_flight = False
+
+    def latency_percentile(self, percentile):
+        """成功调用耗时的百分位数，没有样本时返回None"""
+        latencies = sorted(latency for latency, ok in self.samples if ok)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * percentile))
+        return latencies[index]
+
+    def success_count(self):
+        return sum(1 for _, ok in self.samples if ok)
+
+    def error_rate(self):
+        if not self.samples:
+            return 0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+
+class ProviderRouter:
+    """
+    大模型多提供者路由
+
+    按提供者记录最近的调用耗时和错误率(进程内滚动窗口)：
+    - 连续失败达到阈值时熔断该提供者，冷却后放行一个试探请求，成功则恢复；
+    - 管理端激活的提供者优先，其不可用或调用失败时按错误率、耗时顺序切换到其他已配置密钥的提供者；
+    - 开启对冲时，首选提供者耗时超过其p95仍未返回，则同时向备选提供者发送同一请求，先返回有效结果者胜出。
+    """
+
+    _lock = threading.Lock()
+    _health = {}
+
+    # 默认配置
+    DEFAULT_WINDOW_SIZE = 50
+    DEFAULT_FAILURE_THRESHOLD = 5
+    DEFAULT_RESET_TIMEOUT = 30
+    DEFAULT_HEDGE_MIN_SAMPLES = 10
+    DEFAULT_HEDGE_MIN_DELAY = 2
+
+    @staticmethod
+    def options():
+        """读取路由配置(需要在应用上下文中调用)"""
+        config = current_app.config
+        return {
+            'enabled': config.get('LLM_ROUTER_ENABLED', True),
+            'hedge_enabled': config.get('LLM_HEDGE_ENABLED', False),
+            'window_size': config.get('LLM_ROUTER_WINDOW_SIZE', ProviderRouter.DEFAULT_WINDOW_SIZE),
+            'failure_threshold': config.get('LLM_CIRCUIT_FAILURE_THRESHOLD', ProviderRouter.DEFAULT_FAILURE_THRESHOLD),
+            'reset_timeout': config.get('LLM_CIRCUIT_RESET_TIMEOUT', ProviderRouter.DEFAULT_RESET_TIMEOUT),
+            'hedge_min_samples': config.get('LLM_HEDGE_MIN_SAMPLES', ProviderRouter.DEFAULT_HEDGE_MIN_SAMPLES),
+            'hedge_min_delay': config.get('LLM_HEDGE_MIN_DELAY', ProviderRouter.DEFAULT_HEDGE_MIN_DELAY),
+        }
+
+    @classmethod
+    def _get_health(cls, provider_name, options):
+        health = cls._health.get(provider_name)
+        if health is None:
+            health = cls._health[provider_name] = _ProviderHealth(options['window_size'])
+        return health
+
+    @classmethod
+    def record(cls, provider_name, latency, ok, options):
+        """记录一次调用结果"""
+        with cls._lock:
+            cls._get_health(provider_name, options).record(
+                latency, ok, time.monotonic(), options['failure_threshold']
+            )
+
+    @classmethod
+    def candidates(cls, providers, primary, options):
+        """
+        按优先级排列当前可用的提供者：首选提供者在前，其余按错误率、p50耗时排序；
+        熔断中的提供者和未配置密钥的提供者不参与；桩提供者不与真实提供者互为备选
+
+        :param providers: 提供者配置(LLMService.PROVIDERS)
+        :param primary: 首选提供者名称
+        :return: 提供者名称列表
+        """
+        stub = bool(providers[primary].get("stub"))
+        configured = [
+            name for name, config in providers.items()
+            if name == primary or (os.getenv(config["api_env_key"]) and bool(config.get("stub")) == stub)
+        ]
+
+        def sort_key(name):
+            health = cls._get_health(name, options)
+            p50 = health.latency_percentile(0.5)
+            return (name != primary, health.error_rate(), p50 if p50 is not None else float('inf'))
+
+        now = time.monotonic()
+        with cls._lock:
+            ordered = sorted(configured, key=sort_key)
+            return [name for name in ordered if cls._get_health(name, options).available(now, options['reset_timeout'])]
+
+    @classmethod
+    def select(cls, providers, primary):
+        """
+        选择一个状态正常的提供者(用于流式调用，不做对冲和试探)
+
+        :return: 提供者名称，没有正常的提供者时返回首选提供者
+        """
+        options = cls.options()
+        if not options['enabled']:
+            return primary
+        with cls._lock:
+            closed = {
+                name for name in providers
+                if cls._get_health(name, options).state == _ProviderHealth.STATE_CLOSED
+            }
+        for name in cls.candidates(providers, primary, options):
+            if name in closed:
+                return name
+        return primary
+
+    @classmethod
+    def _acquire(cls, provider_name, options):
+        with cls._lock:
+            return cls._get_health(provider_name, options).acquire(time.monotonic(), options['reset_timeout'])
+
+    @classmethod
+    def _release(cls, provider_name, options):
+        with cls._lock:
+            cls._get_health(provider_name, options).release()
+
+    @classmethod
+    def _hedge_delay(cls, provider_name, options):
+        """首选提供者的对冲等待时间(其p95耗时)，样本不足时不对冲"""
+        with cls._lock:
+            health = cls._get_health(provider_name, options)
+            if health.success_count() < options['hedge_min_samples']:
+                return None
+            p95 = health.latency_percentile(0.95)
+        return max(p95, options['hedge_min_delay'])
+
+    @staticmethod
+    def _is_valid(completion, params):
+        """响应是否有效：内容非空，要求JSON格式时能被解析"""
+        content = completion.choices[0].message.content if completion.choices else None
+        if not content:
+            return False
+        if (params.get("response_format") or {}).get("type") == "json_object":
+            try:
+                json.loads(content)
+            except ValueError:
+                return False
+        return True
+
+    @staticmethod
+    def _is_provider_failure(error):
+        """
+        异常是否说明提供者本身不可用(计入错误率和熔断)：连接错误、超时、429限流和5xx错误；
+        400、422等请求错误由请求内容导致，不计入
+        """
+        if isinstance(error, (openai.APIConnectionError, httpx.TransportError, asyncio.TimeoutError)):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code == 429 or error.status_code >= 500
+        return False
+
+    @classmethod
+    async def _attempt(cls, providers, provider_name, params, settings, options, trace):
+        """向单个提供者发送请求并记录结果(params为该提供者使用的请求参数)"""
+        provider_params = dict(params, model=providers[provider_name]["model_name"])
+        started = time.monotonic()
+        try:
+            completion = await AsyncLLMClient.acreate(
+                provider_name, providers[provider_name], provider_params, settings, trace
+            )
+        except (asyncio.CancelledError, LLMRateLimitTimeout):
+            # 被取消或本地限流等待超时时请求未到达提供者，不计入统计
+            cls._release(provider_name, options)
+            raise
+        except Exception as e:
+            if cls._is_provider_failure(e):
+                cls.record(provider_name, time.monotonic() - started, False, options)
+            else:
+                cls._release(provider_name, options)
+            raise
+
+        if not cls._is_valid(completion, params):
+            # 提供者正常应答但内容无效(为空或不是要求的JSON)，切换到备选提供者，不计入熔断
+            cls._release(provider_name, options)
+            raise ValueError(f"{provider_name}返回的响应无效")
+
+        cls.record(provider_name, time.monotonic() - started, True, options)
+        return completion
+
+    @classmethod
+    async def acreate(cls, providers, primary, params, settings_by_provider, options, trace=None, inline_params=None):
+        """
+        路由并发送非流式请求
+
+        :param providers: 提供者配置(LLMService.PROVIDERS)
+        :param primary: 首选提供者名称
+        :param params: 请求参数(model字段按实际提供者替换)
+        :param settings_by_provider: 各提供者的 AsyncLLMClient.settings()
+        :param options: options() 的结果
+        :param trace: LLMTelemetry.trace() 的结果
+        :param inline_params: params引用了首选提供者的上下文缓存时，发给其他提供者的完整请求参数
+        :return: (实际应答的提供者名称, completion对象)，切换或对冲后应答的可能不是首选提供者
+        """
+        candidates = cls.candidates(providers, primary, options)
+        if not candidates:
+            raise RuntimeError("所有大模型提供者均处于熔断状态")
+
+        tasks = {}
+        remaining = list(candidates)
+
+        def start_next():
+            """向下一个可用的提供者发送请求，没有可用提供者时返回False"""
+            while remaining:
+                provider_name = remaining.pop(0)
+                if not cls._acquire(provider_name, options):
+                    continue
+                attempt_params = params if provider_name == primary or inline_params is None else inline_params
+                task = asyncio.ensure_future(
+                    cls._attempt(providers, provider_name, attempt_params, settings_by_provider[provider_name], options, trace)
+                )
+                tasks[task] = provider_name
+                return True
+            return False
+
+        if not start_next():
+            raise RuntimeError("所有大模型提供者均处于熔断状态")
+        first_provider = next(iter(tasks.values()))
+        hedge_delay = cls._hedge_delay(first_provider, options) if options['hedge_enabled'] else None
+        last_error = None
+
+        try:
+            while tasks:
+                # 只对首选提供者做一次对冲，之后等待任一请求完成
+                timeout = hedge_delay if remaining and len(tasks) == 1 and hedge_delay is not None else None
+                done, _ = await asyncio.wait(tasks.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # 首选提供者超过p95仍未返回，发送对冲请求
+                    hedge_delay = None
+                    start_next()
+                    continue
+
+                for task in done:
+                    provider_name = tasks.pop(task)
+                    if task.exception() is None:
+                        return provider_name, task.result()
+                    last_error = task.exception()
+
+                # 请求失败且没有进行中的请求时切换到下一个提供者
+                if not tasks:
+                    hedge_delay = None
+                    start_next()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        raise last_error
+
+    @classmethod
+    def create(cls, providers, primary, params, trace=None, inline_params=None):
+        """
+        同步调用入口(非流式)
+
+        :return: (实际应答的提供者名称, completion对象)
+        """
+        options = cls.options()
+        settings_by_provider = {name: AsyncLLMClient.settings(name) for name in providers}
+        return AsyncLLMClient.run(
+            cls.acreate(providers, primary, params, settings_by_provider, options, trace, inline_params)
+        )
+
+    @classmethod
+    def status(cls):
+        """
+        各提供者的路由统计
+
+        :return: 字典 {提供者名称: 统计信息}
+        """
+        with cls._lock:
+            return {
+                name: {
+                    'state': health.state,
+                    'consecutive_failures': health.consecutive_failures,
+                    'samples': len(health.samples),
+                    'error_rate': round(health.error_rate(), 4),
+                    'p50': health.latency_percentile(0.5),
+                    'p95': health.latency_percentile(0.95),
+                }
+                for name, health in cls._health.items()
+            }
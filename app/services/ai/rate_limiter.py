@@ -0,0 +1,348 @@
+# app/services/ai/rate_limiter.py
+import time
+import uuid
+import random
+import asyncio
+import functools
+from flask import current_app
+from prometheus_client import Counter, Gauge, Histogram
+from app.extensions import cache
+from app.services.ai.llm_priority import LLMPriority
+
+
+class LLMRateLimitTimeout(Exception):
+    """等待提供者限流令牌超过最长等待时间"""
+
+    def __init__(self, provider_name, waited):
+        super().__init__(f"{provider_name}调用限流等待超时({waited:.1f}秒)")
+        self.provider_name = provider_name
+        self.waited = waited
+
+
+class LLMRateLimiter:
+    """
+    大模型调用的集群级限流(Redis令牌桶)
+
+    每个提供者有两个令牌桶：每分钟请求数(rpm)和每分钟token数(tpm)，存放在Redis中，
+    所有Web进程和Celery worker共用。发送请求前按消息长度预估token数扣减令牌，
+    令牌不足时按缺口计算等待时间后重试，超过最长等待时间抛出 LLMRateLimitTimeout；
+    响应返回后按usage中的实际token数多退少补。
+    Redis不可用时直接放行，限流不影响调用本身。
+
+    优先级(见 LLMPriority)：
+    - 交互式调用可以用尽全部令牌，后台调用不能使用预留给交互式调用的部分，且有交互式调用在等待时让行；
+    - 后台额度按最近有后台调用的机构数平分，每个机构另有一组令牌桶，避免单个机构批量生成方案时占满额度。
+
+    协程在 AsyncLLMClient 的事件循环中运行，Redis操作放到线程池执行，避免阻塞事件循环。
+    """
+
+    # Redis键前缀(花括号内为集群哈希标签，同一提供者的所有键落在同一分片)
+    KEY_PREFIX = "llm_rate"
+    # 令牌桶键的过期时间(秒)，桶在一分钟内即可回满，过期即视为满桶
+    KEY_TTL = 120
+    # 预估token数：每个token约对应的字符数(中文为主)
+    CHARS_PER_TOKEN = 2
+    # 后台调用因交互式调用等待而让行时的重试间隔(秒)
+    YIELD_INTERVAL = 0.5
+
+    # 默认配置
+    DEFAULT_MAX_WAIT = 60
+    DEFAULT_COMPLETION_TOKENS = 1500
+    DEFAULT_INTERACTIVE_RESERVE = 0.2
+
+    # 检查令牌桶并扣减，令牌不足时不扣减，返回需要等待的秒数(字符串，避免Lua数字被截断为整数)
+    # KEYS: 请求桶, token桶, 交互式等待者集合, 活跃机构集合, 机构请求桶, 机构token桶
+    # ARGV: rpm, tpm, 预估token数, 键过期时间, 是否后台调用, 交互式预留比例, 等待者/机构标识, 租约秒数, 让行重试间隔
+    _ACQUIRE_SCRIPT = """
+    local now_parts = redis.call('TIME')
+    local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+    local function level(key, capacity)
+        local state = redis.call('HMGET', key, 'tokens', 'ts')
+        local tokens = tonumber(state[1]) or capacity
+        local ts = tonumber(state[2]) or now
+        return math.min(capacity, tokens + math.max(0, now - ts) * capacity / 60)
+    end
+
+    local rpm = tonumber(ARGV[1])
+    local tpm = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local ttl = tonumber(ARGV[4])
+    local background = ARGV[5] == '1'
+    local reserve = background and tonumber(ARGV[6]) or 0
+    local member = ARGV[7]
+    local lease = tonumber(ARGV[8])
+
+    -- 清理租约已过期的等待者和机构(进程异常退出时不会残留)
+    redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', now)
+    redis.call('ZREMRANGEBYSCORE', KEYS[4], '-inf', now)
+
+    if background then
+        redis.call('ZADD', KEYS[4], now + lease, member)
+        redis.call('EXPIRE', KEYS[4], ttl)
+        -- 有交互式调用在等待时后台调用让行
+        if redis.call('ZCARD', KEYS[3]) > 0 then
+            return ARGV[9]
+        end
+    end
+
+    local wait = 0
+    local updates = {}
+    local function check(key, capacity, need, floor)
+        local tokens = level(key, capacity)
+        if tokens - need < floor then
+            wait = math.max(wait, (need + floor - tokens) * 60 / capacity)
+        end
+        table.insert(updates, {key, tokens - need})
+    end
+
+    if rpm > 0 then
+        check(KEYS[1], rpm, 1, rpm * reserve)
+    end
+    if tpm > 0 then
+        cost = math.min(cost, tpm * (1 - reserve))
+        check(KEYS[2], tpm, cost, tpm * reserve)
+    end
+    if background then
+        -- 后台额度按活跃机构数平分
+        local share = (1 - tonumber(ARGV[6])) / redis.call('ZCARD', KEYS[4])
+        if rpm > 0 then
+            check(KEYS[5], math.max(1, rpm * share), 1, 0)
+        end
+        if tpm > 0 then
+            check(KEYS[6], math.max(cost, tpm * share), cost, 0)
+        end
+    end
+
+    if wait > 0 then
+        if not background then
+            redis.call('ZADD', KEYS[3], now + lease, member)
+            redis.call('EXPIRE', KEYS[3], ttl)
+        end
+        return tostring(wait)
+    end
+
+    for _, update in ipairs(updates) do
+        redis.call('HSET', update[1], 'tokens', update[2], 'ts', now)
+        redis.call('EXPIRE', update[1], ttl)
+    end
+    if not background then
+        redis.call('ZREM', KEYS[3], member)
+    end
+    return '0'
+    """
+
+    # 按实际用量修正token桶(delta为正表示补扣，为负表示退还)，后台调用同时修正所属机构的token桶
+    # KEYS: token桶, 活跃机构集合, 机构token桶(后两个仅后台调用)
+    # ARGV: tpm, delta, 键过期时间, 交互式预留比例, 预估token数
+    _ADJUST_SCRIPT = """
+    local now_parts = redis.call('TIME')
+    local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+    local delta = tonumber(ARGV[2])
+    local function adjust(key, capacity)
+        local state = redis.call('HMGET', key, 'tokens', 'ts')
+        local tokens = tonumber(state[1]) or capacity
+        local ts = tonumber(state[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - ts) * capacity / 60)
+        tokens = math.max(-capacity, math.min(capacity, tokens - delta))
+        redis.call('HSET', key, 'tokens', tokens, 'ts', now)
+        redis.call('EXPIRE', key, ARGV[3])
+    end
+
+    local tpm = tonumber(ARGV[1])
+    adjust(KEYS[1], tpm)
+    if #KEYS > 1 then
+        -- 机构token桶的容量与 _ACQUIRE_SCRIPT 一致：后台额度按活跃机构数平分
+        local share = (1 - tonumber(ARGV[4])) / math.max(1, redis.call('ZCARD', KEYS[2]))
+        adjust(KEYS[3], math.max(tonumber(ARGV[5]), tpm * share))
+    end
+    return 1
+    """
+
+    WAITING = Gauge(
+        'llm_rate_limit_waiting', '正在等待限流令牌的大模型请求数',
+        ['provider', 'priority'], multiprocess_mode='livesum'
+    )
+    WAIT_SECONDS = Histogram(
+        'llm_rate_limit_wait_seconds', '等待限流令牌的时间(秒)',
+        ['provider', 'priority'],
+        buckets=(0.1, 0.5, 1, 2, 5, 10, 20, 30, 60)
+    )
+    TIMEOUTS = Counter(
+        'llm_rate_limit_timeouts_total', '等待限流令牌超时的请求数',
+        ['provider', 'priority']
+    )
+    ERRORS = Counter(
+        'llm_rate_limit_errors_total', '限流器访问Redis失败(已放行)的次数',
+        ['provider']
+    )
+
+    @staticmethod
+    def settings(provider_name):
+        """
+        读取提供者的限流配置和当前线程的调用优先级(需要在调用线程的应用上下文中调用)
+
+        :param provider_name: 提供者名称
+        :return: 配置字典，rpm/tpm为0表示不限制
+        """
+        config = current_app.config
+        limits = config.get('LLM_RATE_LIMITS', {}).get(provider_name, {})
+        enabled = config.get('LLM_RATE_LIMIT_ENABLED', True)
+        priority, institution = LLMPriority.current()
+        return {
+            'priority': priority,
+            'institution': institution,
+            'interactive_reserve': config.get(
+                'LLM_RATE_LIMIT_INTERACTIVE_RESERVE', LLMRateLimiter.DEFAULT_INTERACTIVE_RESERVE
+            ),
+            'rpm': limits.get('rpm', 0) if enabled else 0,
+            'tpm': limits.get('tpm', 0) if enabled else 0,
+            'max_wait': config.get('LLM_RATE_LIMIT_MAX_WAIT', LLMRateLimiter.DEFAULT_MAX_WAIT),
+            'completion_tokens': config.get(
+                'LLM_RATE_LIMIT_COMPLETION_TOKENS', LLMRateLimiter.DEFAULT_COMPLETION_TOKENS
+            ),
+            'client': cache.cache._write_client,
+        }
+
+    @staticmethod
+    def _keys(provider_name, institution=None):
+        """
+        提供者的Redis键
+
+        :return: (请求桶, token桶, 交互式等待者集合, 活跃机构集合, 机构请求桶, 机构token桶)
+        """
+        prefix = f"{LLMRateLimiter.KEY_PREFIX}:{{{provider_name}}}"
+        return (
+            f"{prefix}:rpm",
+            f"{prefix}:tpm",
+            f"{prefix}:interactive_waiters",
+            f"{prefix}:institutions",
+            f"{prefix}:institution:{institution}:rpm",
+            f"{prefix}:institution:{institution}:tpm",
+        )
+
+    @staticmethod
+    def estimate_tokens(params, limits):
+        """
+        预估请求消耗的token数(输入按字符数估算，输出取max_tokens或配置的预估值)
+
+        :param params: 请求参数
+        :param limits: settings() 的结果
+        :return: token数
+        """
+        chars = 0
+        for message in params.get("messages", []):
+            content = message.get("content") if isinstance(message, dict) else getattr(message, "content", None)
+            chars += len(str(content or ""))
+        if params.get("tools"):
+            chars += len(str(params["tools"]))
+        completion_tokens = params.get("max_tokens") or limits['completion_tokens']
+        return chars // LLMRateLimiter.CHARS_PER_TOKEN + completion_tokens
+
+    @staticmethod
+    async def _run_script(client, script, keys, args):
+        """在线程池中执行Lua脚本"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(client.eval, script, len(keys), *keys, *args)
+        )
+
+    @classmethod
+    async def acquire(cls, provider_name, params, limits):
+        """
+        获取一次调用的令牌，不足时等待(在事件循环中调用)
+
+        :param provider_name: 提供者名称
+        :param params: 请求参数
+        :param limits: settings() 的结果
+        :return: 已扣减的预估token数，未限流时为0
+        """
+        rpm, tpm = limits['rpm'], limits['tpm']
+        if not rpm and not tpm:
+            return 0
+
+        priority = limits['priority']
+        background = priority == LLMPriority.BACKGROUND
+        reserve = limits['interactive_reserve'] if background else 0
+        cost = cls.estimate_tokens(params, limits) if tpm else 0
+        keys = cls._keys(provider_name, limits['institution'])
+        # 后台调用以机构为标识登记活跃机构，交互式调用以本次请求为标识登记等待者
+        member = limits['institution'] if background else uuid.uuid4().hex
+        lease = limits['max_wait'] + cls.KEY_TTL
+        started = time.monotonic()
+        waiting = False
+        try:
+            while True:
+                try:
+                    wait = float(await cls._run_script(
+                        limits['client'], cls._ACQUIRE_SCRIPT, keys,
+                        (rpm, tpm, cost, cls.KEY_TTL, 1 if background else 0,
+                         limits['interactive_reserve'], member, lease, cls.YIELD_INTERVAL)
+                    ))
+                except Exception:
+                    cls.ERRORS.labels(provider_name).inc()
+                    return 0
+                if wait <= 0:
+                    return min(cost, tpm * (1 - reserve)) if tpm else 0
+
+                remaining = limits['max_wait'] - (time.monotonic() - started)
+                if remaining <= 0:
+                    cls.TIMEOUTS.labels(provider_name, priority).inc()
+                    if not background:
+                        await cls._leave_waiters(limits['client'], keys[2], member)
+                    raise LLMRateLimitTimeout(provider_name, time.monotonic() - started)
+                if not waiting:
+                    cls.WAITING.labels(provider_name, priority).inc()
+                    waiting = True
+                # 加入随机抖动，避免大量等待者同时重试
+                await asyncio.sleep(min(wait * random.uniform(1, 1.2), remaining))
+        except asyncio.CancelledError:
+            if not background:
+                await asyncio.shield(cls._leave_waiters(limits['client'], keys[2], member))
+            raise
+        finally:
+            if waiting:
+                cls.WAITING.labels(provider_name, priority).dec()
+                cls.WAIT_SECONDS.labels(provider_name, priority).observe(time.monotonic() - started)
+
+    @staticmethod
+    async def _leave_waiters(client, waiters_key, member):
+        """交互式调用放弃等待时移出等待者集合，后台调用不再为其让行"""
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, client.zrem, waiters_key, member)
+        except Exception:
+            pass
+
+    @classmethod
+    async def reconcile(cls, provider_name, reserved_tokens, usage, limits):
+        """
+        按实际用量修正token桶，后台调用同时修正所属机构的token桶(在事件循环中调用)
+
+        :param provider_name: 提供者名称
+        :param reserved_tokens: acquire() 扣减的预估token数
+        :param usage: 响应中的usage，为None时不修正
+        :param limits: settings() 的结果
+        """
+        if not limits['tpm'] or not reserved_tokens or usage is None:
+            return
+        total_tokens = getattr(usage, 'total_tokens', None)
+        if isinstance(usage, dict):
+            total_tokens = usage.get('total_tokens')
+        if not total_tokens:
+            return
+
+        delta = total_tokens - reserved_tokens
+        if delta == 0:
+            return
+        keys = cls._keys(provider_name, limits['institution'])
+        if limits['priority'] == LLMPriority.BACKGROUND:
+            keys = (keys[1], keys[3], keys[5])
+        else:
+            keys = (keys[1],)
+        try:
+            await cls._run_script(
+                limits['client'], cls._ADJUST_SCRIPT, keys,
+                (limits['tpm'], delta, cls.KEY_TTL, limits['interactive_reserve'], reserved_tokens)
+            )
+        except Exception:
+            cls.ERRORS.labels(provider_name).inc()
@@ -0,0 +1,146 @@
+# app/services/ai/response_cache.py
+import json
+import time
+import zlib
+import hashlib
+from flask import current_app
+from app.extensions import cache
+
+
+class LLMResponseCache:
+    """
+    大模型响应缓存(按需启用)
+
+    分析类调用在输入不变时结果可以复用(如学生档案未变时重新生成、重复点击分析)，
+    以 (提供者, 模型, 消息, 温度, 响应格式, 工具) 的哈希为键，把响应内容压缩后存入Redis。
+    缓存设置过期时间，并用有序集合记录写入时间，条目数超过上限时淘汰最早写入的条目。
+    命中/未命中次数按调用名称累计在Redis哈希中，所有进程共享。
+    """
+
+    # Redis键前缀
+    KEY_PREFIX = "llm_resp"
+    INDEX_KEY = "llm_resp:index"
+    STATS_KEY = "llm_resp:stats"
+    # zlib压缩级别
+    COMPRESS_LEVEL = 6
+
+    # 默认配置
+    DEFAULT_TTL = 60 * 60 * 24 * 3
+    DEFAULT_MAX_ENTRIES = 5000
+    DEFAULT_MAX_BYTES = 256 * 1024
+
+    # 参与缓存键计算的请求参数
+    KEY_PARAMS = ("model", "messages", "temperature", "response_format", "tools")
+
+    @staticmethod
+    def enabled():
+        """是否启用响应缓存"""
+        return current_app.config.get('LLM_RESPONSE_CACHE_ENABLED', False)
+
+    @staticmethod
+    def make_key(provider_name, params):
+        """
+        计算请求的缓存键
+
+        :param provider_name: 提供者名称
+        :param params: 请求参数
+        :return: 缓存键
+        """
+        payload = {"provider": provider_name}
+        payload.update({name: params.get(name) for name in LLMResponseCache.KEY_PARAMS})
+        digest = hashlib.sha256(
+            json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+        return f"{LLMResponseCache.KEY_PREFIX}:{digest}"
+
+    @staticmethod
+    def _record(call_name, outcome):
+        """累计命中/未命中次数"""
+        try:
+            cache.cache._write_client.hincrby(LLMResponseCache.STATS_KEY, f"{call_name or 'unknown'}:{outcome}", 1)
+        except Exception as e:
+            current_app.logger.error(f"记录大模型响应缓存统计失败: {str(e)}")
+
+    @staticmethod
+    def get(key, call_name=None):
+        """
+        读取缓存的响应内容
+
+        :param key: make_key() 的结果
+        :param call_name: 调用名称，用于统计
+        :return: 响应内容，未命中时返回None
+        """
+        try:
+            data = cache.cache._read_client.get(key)
+        except Exception as e:
+            current_app.logger.error(f"读取大模型响应缓存失败: {str(e)}")
+            return None
+
+        if data is None:
+            LLMResponseCache._record(call_name, "miss")
+            return None
+
+        LLMResponseCache._record(call_name, "hit")
+        current_app.logger.info(f"大模型响应缓存命中: {call_name}")
+        return zlib.decompress(data).decode('utf-8')
+
+    @staticmethod
+    def set(key, content):
+        """
+        写入响应内容，超出条目上限时淘汰最早写入的条目
+
+        :param key: make_key() 的结果
+        :param content: 响应内容
+        """
+        if not content:
+            return
+
+        config = current_app.config
+        data = zlib.compress(content.encode('utf-8'), LLMResponseCache.COMPRESS_LEVEL)
+        if len(data) > config.get('LLM_RESPONSE_CACHE_MAX_BYTES', LLMResponseCache.DEFAULT_MAX_BYTES):
+            return
+
+        ttl = config.get('LLM_RESPONSE_CACHE_TTL', LLMResponseCache.DEFAULT_TTL)
+        max_entries = config.get('LLM_RESPONSE_CACHE_MAX_ENTRIES', LLMResponseCache.DEFAULT_MAX_ENTRIES)
+        try:
+            redis_client = cache.cache._write_client
+            pipe = redis_client.pipeline()
+            pipe.set(key, data, ex=ttl)
+            pipe.zadd(LLMResponseCache.INDEX_KEY, {key: time.time()})
+            # 已过期的条目从索引中移除
+            pipe.zremrangebyscore(LLMResponseCache.INDEX_KEY, 0, time.time() - ttl)
+            pipe.zcard(LLMResponseCache.INDEX_KEY)
+            entry_count = pipe.execute()[-1]
+
+            if entry_count > max_entries:
+                evicted = redis_client.zpopmin(LLMResponseCache.INDEX_KEY, entry_count - max_entries)
+                if evicted:
+                    redis_client.delete(*[member for member, _ in evicted])
+        except Exception as e:
+            current_app.logger.error(f"写入大模型响应缓存失败: {str(e)}")
+
+    @staticmethod
+    def stats():
+        """
+        获取各调用的命中统计
+
+        :return: 字典 {'entry_count': 缓存条目数, 'calls': {调用名称: {'hit': 命中次数, 'miss': 未命中次数, 'hit_rate': 命中率}}}
+        """
+        try:
+            raw_stats = cache.cache._read_client.hgetall(LLMResponseCache.STATS_KEY)
+            entry_count = cache.cache._read_client.zcard(LLMResponseCache.INDEX_KEY)
+        except Exception as e:
+            current_app.logger.error(f"读取大模型响应缓存统计失败: {str(e)}")
+            return {}
+
+        calls = {}
+        for field, value in raw_stats.items():
+            field = field.decode('utf-8') if isinstance(field, bytes) else field
+            call_name, outcome = field.rsplit(":", 1)
+            calls.setdefault(call_name, {'hit': 0, 'miss': 0})[outcome] = int(value)
+
+        for counts in calls.values():
+            total = counts['hit'] + counts['miss']
+            counts['hit_rate'] = round(counts['hit'] / total, 4) if total else 0
+
+        return {'entry_count': entry_count, 'calls': calls}
@@ -0,0 +1,299 @@
+# app/services/ai/stub_provider.py
+import os
+import re
+import json
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import httpx
+from flask import current_app
+
+
+class LLMCassette:
+    """
+    大模型响应录制/回放
+
+    record 模式下真实提供者的每个响应按请求内容(消息、温度、响应格式、工具，不含模型)写入录制目录，
+    replay 模式下桩提供者优先回放录制的响应，没有录制时再生成桩响应。
+    """
+
+    MODE_RECORD = 'record'
+    MODE_REPLAY = 'replay'
+
+    # 参与匹配的请求参数
+    KEY_PARAMS = ("messages", "temperature", "response_format", "tools")
+
+    @staticmethod
+    def settings():
+        """读取录制配置(需要在应用上下文中调用)"""
+        config = current_app.config
+        return {
+            'mode': config.get('LLM_CASSETTE_MODE') or None,
+            'directory': config.get('LLM_CASSETTE_DIR'),
+        }
+
+    @staticmethod
+    def key(params):
+        """请求的录制键"""
+        payload = {name: params.get(name) for name in LLMCassette.KEY_PARAMS}
+        return hashlib.sha256(
+            json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+
+    @staticmethod
+    def _path(directory, params):
+        return os.path.join(directory, f"{LLMCassette.key(params)}.json")
+
+    @staticmethod
+    def load(directory, params):
+        """
+        读取录制的响应
+
+        :return: 字典 {'content', 'usage', ...}，没有录制时返回None
+        """
+        path = LLMCassette._path(directory, params)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def save(directory, provider_name, params, content, usage=None):
+        """写入一条录制(在线程池中调用)"""
+        if content is None:
+            return
+        os.makedirs(directory, exist_ok=True)
+        if usage is not None and not isinstance(usage, dict):
+            usage = usage.model_dump() if hasattr(usage, 'model_dump') else None
+        record = {
+            'provider': provider_name,
+            'model': params.get('model'),
+            'recorded_at': int(time.time()),
+            'content': content,
+            'usage': usage,
+        }
+        # 先写临时文件再替换，避免并发回放读到不完整的文件
+        path = LLMCassette._path(directory, params)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    @classmethod
+    async def arecord(cls, cassette, provider_name, params, content, usage=None):
+        """record 模式下写入录制(在事件循环中调用，写文件放到线程池执行)"""
+        if not cassette or cassette['mode'] != cls.MODE_RECORD or not cassette['directory']:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(
+                None, cls.save, cassette['directory'], provider_name, params, content, usage
+            )
+        except Exception:
+            pass
+
+
+class _StubStream(httpx.AsyncByteStream):
+    """按延迟配置逐块输出SSE数据"""
+
+    def __init__(self, events, time_to_first_token, chunk_interval):
+        self._events = events
+        self._time_to_first_token = time_to_first_token
+        self._chunk_interval = chunk_interval
+
+    async def __aiter__(self):
+        await asyncio.sleep(self._time_to_first_token)
+        for index, event in enumerate(self._events):
+            if index and self._chunk_interval:
+                await asyncio.sleep(self._chunk_interval)
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8')
+        yield b"data: [DONE]\n\n"
+
+
+class StubTransport(httpx.AsyncBaseTransport):
+    """
+    进程内的桩大模型(OpenAI兼容的 /chat/completions)
+
+    作为 AsyncOpenAI 底层 httpx 客户端的传输层，请求仍经过 SDK、路由、限流、遥测等完整调用链，
+    只是不访问网络：
+    - 要求JSON响应时生成结构正确的JSON(院校筛选按备选院校返回院校专业组ID和专业ID，其余按提示词中的JSON结构)；
+    - 流式调用按首个分块耗时和每秒token数逐块输出；
+    - 回放模式下优先返回录制的真实响应；可按比例注入429/500错误，用于测试路由和熔断。
+    """
+
+    # 每个分块的字符数(约一个token)
+    CHUNK_CHARS = 2
+    # 预估输入token：每个token约对应的字符数
+    CHARS_PER_TOKEN = 2
+    # 普通文本响应使用的内容
+    STUB_TEXT = "这是桩模型生成的模拟回复，用于在没有网络和模型额度的环境中进行压力测试和功能验证。"
+
+    def __init__(self, profile, cassette=None):
+        """
+        :param profile: StubTransport.settings() 的结果
+        :param cassette: LLMCassette.settings() 的结果
+        """
+        self.profile = profile
+        self.cassette = cassette
+
+    # 延迟配置预设：首个分块耗时(秒)、每秒输出token数(0表示不限制)
+    PROFILES = {
+        'instant': {'time_to_first_token': 0, 'tokens_per_second': 0},
+        'fast': {'time_to_first_token': 0.2, 'tokens_per_second': 200},
+        'realistic': {'time_to_first_token': 1.0, 'tokens_per_second': 40},
+        'slow': {'time_to_first_token': 3.0, 'tokens_per_second': 15},
+    }
+
+    @staticmethod
+    def settings():
+        """读取桩提供者配置(需要在应用上下文中调用)，单独配置的首个分块耗时和速度覆盖预设"""
+        config = current_app.config
+        profile = dict(StubTransport.PROFILES.get(config.get('LLM_STUB_PROFILE'), StubTransport.PROFILES['realistic']))
+        if config.get('LLM_STUB_TTFT') is not None:
+            profile['time_to_first_token'] = config['LLM_STUB_TTFT']
+        if config.get('LLM_STUB_TOKENS_PER_SECOND') is not None:
+            profile['tokens_per_second'] = config['LLM_STUB_TOKENS_PER_SECOND']
+        profile['error_rate'] = config.get('LLM_STUB_ERROR_RATE', 0)
+        profile['response_chars'] = config.get('LLM_STUB_RESPONSE_CHARS', 400)
+        return profile
+
+    async def handle_async_request(self, request):
+        await request.aread()
+        body = json.loads(request.content or b"{}")
+
+        if self.profile['error_rate'] and random.random() < self.profile['error_rate']:
+            await asyncio.sleep(self.profile['time_to_first_token'])
+            status_code = random.choice((429, 500))
+            return httpx.Response(status_code, json={"error": {"message": "桩模型注入的错误", "type": "stub_error"}})
+
+        content, usage = self._respond(body)
+        pieces = [content[i:i + self.CHUNK_CHARS] for i in range(0, len(content), self.CHUNK_CHARS)] or [""]
+        tokens_per_second = self.profile['tokens_per_second']
+        chunk_interval = 1 / tokens_per_second if tokens_per_second else 0
+        completion_id = f"stub-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = body.get("model", "stub")
+
+        if body.get("stream"):
+            events = []
+            for index, piece in enumerate(pieces):
+                delta = {"content": piece}
+                if index == 0:
+                    delta["role"] = "assistant"
+                events.append({
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": None}]
+                })
+            # 与OpenAI兼容接口一致：设置 stream_options.include_usage 时usage在最后一个没有choice的分块中返回，
+            # 否则随结束分块返回(如moonshot)
+            if (body.get("stream_options") or {}).get("include_usage"):
+                events.append({
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+                })
+                events.append({
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [], "usage": usage
+                })
+            else:
+                events.append({
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                    "usage": usage
+                })
+            return httpx.Response(
+                200,
+                headers={"content-type": "text/event-stream"},
+                stream=_StubStream(events, self.profile['time_to_first_token'], chunk_interval)
+            )
+
+        await asyncio.sleep(self.profile['time_to_first_token'] + chunk_interval * len(pieces))
+        return httpx.Response(200, json={
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": usage
+        })
+
+    def _respond(self, body):
+        """生成响应内容和usage，回放模式下优先使用录制的响应"""
+        content = None
+        cassette = self.cassette
+        if cassette and cassette['mode'] == LLMCassette.MODE_REPLAY and cassette['directory']:
+            record = LLMCassette.load(cassette['directory'], body)
+            if record:
+                content = record['content']
+
+        if content is None:
+            content = self._generate(body)
+
+        prompt_chars = sum(len(str(message.get("content") or "")) for message in body.get("messages", []))
+        prompt_tokens = prompt_chars // self.CHARS_PER_TOKEN
+        completion_tokens = max(1, len(content) // self.CHUNK_CHARS)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+        return content, usage
+
+    def _generate(self, body):
+        """生成桩响应内容"""
+        messages = body.get("messages", [])
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            selection = self._college_selection(messages)
+            if selection is not None:
+                return json.dumps(selection, ensure_ascii=False)
+            template = self._json_template(messages)
+            return json.dumps(template if template is not None else {"分析": self.STUB_TEXT}, ensure_ascii=False)
+
+        length = self.profile['response_chars']
+        return (self.STUB_TEXT * (length // len(self.STUB_TEXT) + 1))[:length]
+
+    @staticmethod
+    def _college_selection(messages):
+        """院校筛选：从备选院校中选前4个院校专业组，每组前6个专业"""
+        for message in messages:
+            for block in re.findall(r"```(.*?)```", str(message.get("content") or ""), re.S):
+                try:
+                    candidates = json.loads(block)
+                except ValueError:
+                    continue
+                if isinstance(candidates, list) and candidates \
+                        and all(isinstance(item, dict) and 'cgid' in item for item in candidates):
+                    return {
+                        str(college['cgid']): [str(specialty['spid']) for specialty in college.get('specialties', [])[:6]]
+                        for college in candidates[:4]
+                    }
+        return None
+
+    @staticmethod
+    def _json_template(messages):
+        """取系统提示词中给出的第一个JSON结构作为响应(字段说明即为模拟内容)"""
+        for message in messages:
+            if message.get("role") != "system":
+                continue
+            text = str(message.get("content") or "").replace("{{", "{").replace("}}", "}")
+            start = text.find("{")
+            while start != -1:
+                depth = 0
+                for end in range(start, len(text)):
+                    if text[end] == "{":
+                        depth += 1
+                    elif text[end] == "}":
+                        depth -= 1
+                        if depth == 0:
+                            try:
+                                return json.loads(text[start:end + 1])
+                            except ValueError:
+                                break
+                start = text.find("{", start + 1)
+        return None
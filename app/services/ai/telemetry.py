@@ -0,0 +1,218 @@
+# app/services/ai/telemetry.py
+import os
+import asyncio
+import threading
+from contextlib import contextmanager
+import openai
+from prometheus_client import (
+    Counter, Histogram, CollectorRegistry, REGISTRY, generate_latest, start_http_server, multiprocess
+)
+from app.services.ai.rate_limiter import LLMRateLimitTimeout
+
+
+class LLMUsageCollector:
+    """收集一段执行过程(如一个Celery任务)中的大模型调用记录"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records = []
+
+    def add(self, record):
+        # 记录可能由事件循环线程写入
+        with self._lock:
+            self.records.append(record)
+
+    def summary(self):
+        """
+        汇总调用记录
+
+        :return: 字典 {'calls', 'prompt_tokens', 'completion_tokens', 'latency_seconds', 'outcomes', 'by_call'}
+        """
+        with self._lock:
+            records = list(self.records)
+
+        summary = {
+            'calls': len(records),
+            'prompt_tokens': 0,
+            'completion_tokens': 0,
+            'latency_seconds': 0.0,
+            'outcomes': {},
+            'by_call': {}
+        }
+        for record in records:
+            by_call = summary['by_call'].setdefault(record['call_name'], {
+                'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'latency_seconds': 0.0, 'providers': {}
+            })
+            for item in (summary, by_call):
+                item['prompt_tokens'] += record['prompt_tokens']
+                item['completion_tokens'] += record['completion_tokens']
+                item['latency_seconds'] += record['latency']
+            by_call['calls'] += 1
+            by_call['providers'][record['provider']] = by_call['providers'].get(record['provider'], 0) + 1
+            summary['outcomes'][record['outcome']] = summary['outcomes'].get(record['outcome'], 0) + 1
+
+        summary['latency_seconds'] = round(summary['latency_seconds'], 3)
+        for by_call in summary['by_call'].values():
+            by_call['latency_seconds'] = round(by_call['latency_seconds'], 3)
+        return summary
+
+
+class LLMTelemetry:
+    """
+    大模型调用遥测
+
+    每次实际发送的请求(含路由切换、对冲产生的请求)在 AsyncLLMClient 中记录：
+    总耗时(含等待限流令牌和并发名额)、流式调用的首个分块耗时、usage中的输入/输出token数、提供者、调用名称和结果，
+    导出为Prometheus指标；命中响应缓存的调用记为 cache_hit。
+    调用线程通过 collect() 开启收集后，本线程发起的调用记录同时汇总到收集器中(Celery任务结果附带该汇总)。
+
+    多进程部署(gunicorn、Celery prefork)需设置 PROMETHEUS_MULTIPROC_DIR，由 registry() 汇总各进程的指标。
+    """
+
+    # 调用结果
+    OUTCOME_SUCCESS = 'success'
+    OUTCOME_ERROR = 'error'
+    OUTCOME_TIMEOUT = 'timeout'
+    OUTCOME_RATE_LIMITED = 'rate_limited'  # 提供者返回429
+    OUTCOME_THROTTLED = 'throttled'        # 本地限流等待超时，未发送
+    OUTCOME_CANCELLED = 'cancelled'
+    OUTCOME_CACHE_HIT = 'cache_hit'
+
+    # 未指定调用名称时使用的标签
+    UNKNOWN_CALL = 'unknown'
+
+    CALLS = Counter(
+        'llm_calls_total', '大模型调用次数',
+        ['provider', 'call_name', 'outcome']
+    )
+    LATENCY = Histogram(
+        'llm_call_latency_seconds', '大模型调用总耗时(秒)',
+        ['provider', 'call_name', 'outcome'],
+        buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+    )
+    TIME_TO_FIRST_TOKEN = Histogram(
+        'llm_time_to_first_token_seconds', '流式调用首个分块耗时(秒)',
+        ['provider', 'call_name'],
+        buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+    )
+    TOKENS = Counter(
+        'llm_tokens_total', '大模型消耗的token数',
+        ['provider', 'call_name', 'kind']
+    )
+
+    _local = threading.local()
+
+    @classmethod
+    @contextmanager
+    def collect(cls):
+        """
+        在当前线程中收集大模型调用记录(可嵌套，内层结束后恢复外层)
+
+        :return: LLMUsageCollector
+        """
+        previous = getattr(cls._local, 'collector', None)
+        collector = LLMUsageCollector()
+        cls._local.collector = collector
+        try:
+            yield collector
+        finally:
+            cls._local.collector = previous
+
+    @classmethod
+    def trace(cls, call_name):
+        """
+        在调用线程中创建调用上下文，随请求传入事件循环
+
+        :param call_name: 调用名称
+        :return: 字典 {'call_name', 'collector'}
+        """
+        return {
+            'call_name': call_name or cls.UNKNOWN_CALL,
+            'collector': getattr(cls._local, 'collector', None)
+        }
+
+    @classmethod
+    def outcome_of(cls, error):
+        """根据异常类型判断调用结果"""
+        if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            return cls.OUTCOME_CANCELLED
+        if isinstance(error, (asyncio.TimeoutError, openai.APITimeoutError)):
+            return cls.OUTCOME_TIMEOUT
+        if isinstance(error, openai.RateLimitError):
+            return cls.OUTCOME_RATE_LIMITED
+        if isinstance(error, LLMRateLimitTimeout):
+            return cls.OUTCOME_THROTTLED
+        return cls.OUTCOME_ERROR
+
+    @staticmethod
+    def chunk_usage(chunk):
+        """读取流式分块中的usage(部分提供者只在最后一个分块的choice中返回)"""
+        usage = getattr(chunk, 'usage', None)
+        if usage is None and chunk.choices:
+            usage = getattr(chunk.choices[0], 'usage', None)
+        return usage
+
+    @staticmethod
+    def _usage_tokens(usage):
+        """从usage中取出(输入token数, 输出token数)，兼容对象和字典"""
+        if usage is None:
+            return 0, 0
+        if isinstance(usage, dict):
+            return usage.get('prompt_tokens') or 0, usage.get('completion_tokens') or 0
+        return getattr(usage, 'prompt_tokens', 0) or 0, getattr(usage, 'completion_tokens', 0) or 0
+
+    @classmethod
+    def observe(cls, provider_name, trace, outcome, latency, usage=None, time_to_first_token=None):
+        """
+        记录一次调用
+
+        :param provider_name: 提供者名称
+        :param trace: trace() 的结果，None表示未知调用
+        :param outcome: 调用结果
+        :param latency: 总耗时(秒)
+        :param usage: 响应中的usage
+        :param time_to_first_token: 首个分块耗时(秒)，仅流式调用
+        """
+        trace = trace or cls.trace(None)
+        call_name = trace['call_name']
+        prompt_tokens, completion_tokens = cls._usage_tokens(usage)
+
+        cls.CALLS.labels(provider_name, call_name, outcome).inc()
+        if outcome != cls.OUTCOME_CACHE_HIT:
+            cls.LATENCY.labels(provider_name, call_name, outcome).observe(latency)
+        if time_to_first_token is not None:
+            cls.TIME_TO_FIRST_TOKEN.labels(provider_name, call_name).observe(time_to_first_token)
+        if prompt_tokens:
+            cls.TOKENS.labels(provider_name, call_name, 'prompt').inc(prompt_tokens)
+        if completion_tokens:
+            cls.TOKENS.labels(provider_name, call_name, 'completion').inc(completion_tokens)
+
+        if trace['collector'] is not None:
+            trace['collector'].add({
+                'provider': provider_name,
+                'call_name': call_name,
+                'outcome': outcome,
+                'latency': latency,
+                'time_to_first_token': time_to_first_token,
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens
+            })
+
+    @staticmethod
+    def registry():
+        """导出指标使用的注册表(设置了 PROMETHEUS_MULTIPROC_DIR 时汇总所有进程)"""
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            return registry
+        return REGISTRY
+
+    @classmethod
+    def render(cls):
+        """生成Prometheus文本格式的指标"""
+        return generate_latest(cls.registry())
+
+    @classmethod
+    def start_server(cls, port):
+        """启动独立的指标HTTP服务(用于没有Web接口的Celery worker)"""
+        start_http_server(port, registry=cls.registry())
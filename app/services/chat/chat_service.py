@@ -5,7 +5,7 @@ from app.extensions import db
 from app.models.conversations import Conversation
 from app.models.messages import Message
 from app.models.user import User
-from app.services.ai.llm_service import LLMService
+from app.services.ai.llm_service import LLMService, ToolProgress
 from datetime import datetime
 import json
 import time
@@ -325,7 +325,10 @@ class ChatService:
             # 处理AI流式响应
             full_content = ""
             for chunk in ai_stream:
-                if chunk:
+                # 工具执行进度单独推送，不写入消息内容
+                if isinstance(chunk, ToolProgress):
+                    yield json.dumps({"type": "progress", "content": chunk})
+                elif chunk:
                     full_content += chunk
                     yield json.dumps({"type": "chunk", "content": chunk})
             
@@ -373,4 +373,159 @@ class RecommendationService:
                 query = query.filter(db.or_(*tuition_conditions))
         
         # 执行查询并直接返回数量
-        return query.scalar()
\ No newline at end of file
+        return query.scalar()
+    @staticmethod
+    def _build_query_params(recommendation_data):
+        """
+        将学生推荐数据转换为候选集查询参数
+        
+        :param recommendation_data: StudentDataService.extract_college_recommendation_data 的结果
+        :return: 查询参数字典
+        """
+        student_score = int(recommendation_data.get('student_score') or 0)
+        mock_exam_score = int(recommendation_data.get('mock_exam_score') or 0)
+        area_ids = recommendation_data.get('area_ids') or []
+        specialty_types = recommendation_data.get('specialty_types') or []
+
+        return {
+            'student_score': student_score > 0 and student_score or mock_exam_score,
+            'subject_type': int(recommendation_data.get('subject_type') or 1),
+            'education_level': int(recommendation_data.get('education_level') or 11),
+            'student_subjects': recommendation_data.get('student_subjects'),
+            # 确保area_ids和specialty_types是可迭代的且包含有效整数
+            'area_ids': [int(aid) for aid in area_ids if aid and str(aid).isdigit()],
+            'specialty_types': [int(st) for st in specialty_types if st and str(st).isdigit()],
+            'tuition_ranges': recommendation_data.get('tuition_ranges') or [],
+        }
+
+    @staticmethod
+    def get_segment_candidates(recommendation_data, category_id, group_id, per_page=100, user_data_hash=None):
+        """
+        获取某个志愿段的候选院校专业组，优先读取缓存
+        
+        缓存键包含学生数据哈希，学生数据变化后自动失效
+        
+        :param recommendation_data: 学生推荐数据
+        :param category_id: 类别ID（1-冲，2-稳，3-保）
+        :param group_id: 志愿段ID（1-12）
+        :param per_page: 候选集数量上限
+        :param user_data_hash: 学生数据哈希，不传时根据recommendation_data计算
+        :return: 候选院校专业组列表
+        """
+        from app.extensions import cache
+        from app.utils.user_hash import calculate_user_data_hash
+
+        user_data_hash = user_data_hash or calculate_user_data_hash(recommendation_data)
+        cache_key = f"candidate_pool:{recommendation_data['student_id']}:{user_data_hash}:{group_id}:{per_page}"
+
+        cached_colleges = cache.get(cache_key)
+        if cached_colleges is not None:
+            return cached_colleges
+
+        colleges, _ = RecommendationService.get_colleges_by_category_and_group(
+            category_id=category_id,
+            group_id=group_id,
+            page=1,
+            per_page=per_page,
+            **RecommendationService._build_query_params(recommendation_data)
+        )
+        cache.set(cache_key, colleges, timeout=86400)  # 一天
+        return colleges
+
+    @staticmethod
+    def get_college_stats(recommendation_data, mode='smart', user_data_hash=None):
+        """
+        获取冲稳保各类别及志愿段的院校数量统计，优先读取缓存
+        
+        :param recommendation_data: 学生推荐数据
+        :param mode: 分类模式（'smart','professional','free'）
+        :param user_data_hash: 学生数据哈希，不传时根据recommendation_data计算
+        :return: (统计结果, 是否来自缓存)
+        """
+        from app.extensions import cache
+        from app.utils.user_hash import calculate_user_data_hash
+        from app.utils.cache_utils import delete_old_cache_for_student
+
+        student_id = recommendation_data['student_id']
+        user_data_hash = user_data_hash or calculate_user_data_hash(recommendation_data)
+
+        # 为统计使用特定的缓存键，包含哈希值，确保数据变化时自动失效
+        cache_key = f"college_stats:{student_id}:{user_data_hash}"
+        cached_result = cache.get(cache_key)
+        if cached_result:
+            return cached_result, True
+
+        # 删除旧缓存
+        delete_old_cache_for_student(student_id, user_data_hash)
+
+        result = {
+            'categories': [],
+            'total_colleges': 0
+        }
+        category_names = {
+            1: "冲",
+            2: "稳",
+            3: "保"
+        }
+        query_params = RecommendationService._build_query_params(recommendation_data)
+
+        # 遍历三个类别（冲、稳、保）
+        for category_id in [1, 2, 3]:
+            category_data = {
+                'category_id': category_id,
+                'category_name': category_names[category_id],
+                'total_colleges': 0,
+                'groups': []
+            }
+
+            # 每个类别有4个志愿段
+            start_group_id = (category_id - 1) * 4 + 1
+            for group_id in range(start_group_id, start_group_id + 4):
+                group_college_count = RecommendationService.get_college_count_by_category_and_group(
+                    category_id=category_id,
+                    group_id=group_id,
+                    mode=mode,
+                    tese_types=recommendation_data.get('tese_types'),
+                    leixing_types=recommendation_data.get('leixing_types'),
+                    teshu_types=recommendation_data.get('teshu_types'),
+                    **query_params
+                )
+                category_data['groups'].append({
+                    'group_id': group_id,
+                    'total_colleges': group_college_count
+                })
+                category_data['total_colleges'] += group_college_count
+
+            result['categories'].append(category_data)
+            result['total_colleges'] += category_data['total_colleges']
+
+        # 将结果存入缓存，有效期1天
+        cache.set(cache_key, result, timeout=86400)  # 一天
+        return result, False
+
+    @staticmethod
+    def precompute_student_candidates(student_id):
+        """
+        预计算学生的院校统计和12个志愿段的候选集并写入缓存，
+        使后续的生成方案和统计请求直接命中缓存
+        
+        :param student_id: 学生ID
+        :return: 学生数据哈希
+        """
+        from app.services.student.student_data_service import StudentDataService
+        from app.utils.user_hash import calculate_user_data_hash
+
+        recommendation_data = StudentDataService.extract_college_recommendation_data(student_id)
+        user_data_hash = calculate_user_data_hash(recommendation_data)
+
+        RecommendationService.get_college_stats(recommendation_data, user_data_hash=user_data_hash)
+        for category_id in [1, 2, 3]:
+            for group_id in range(1, 5):
+                RecommendationService.get_segment_candidates(
+                    recommendation_data,
+                    category_id=category_id,
+                    group_id=(category_id - 1) * 4 + group_id,
+                    user_data_hash=user_data_hash
+                )
+
+        return user_data_hash
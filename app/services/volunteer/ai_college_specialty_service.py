@@ -1,12 +1,14 @@
 # app/services/volunteer/ai_college_specialty_service.py
 from flask import current_app
 from app.extensions import db, celery
-from app.models.student_volunteer_plan import StudentVolunteerPlan, VolunteerCollege, VolunteerSpecialty
+from app.models.student_volunteer_plan import StudentVolunteerPlan, VolunteerCollege, VolunteerSpecialty, DEFERRED_GROUP_AI_ANALYSIS
 from app.models.user import User
 from app.services.student.student_data_service import StudentDataService
 from sqlalchemy.exc import SQLAlchemyError
 import json
 from app.services.ai.llm_service import LLMService
+from app.services.volunteer.plan_document_cache import PlanDocumentCache
+from app.services.volunteer.plan_service import VolunteerPlanService
 from datetime import datetime, timezone
 
 class AICollegeSpecialtyAnalysisService:
@@ -101,6 +103,8 @@ class AICollegeSpecialtyAnalysisService:
         # 获取专业信息
         specialties = VolunteerSpecialty.query.filter_by(
             volunteer_college_id=volunteer_college_id
+        ).options(
+            db.undefer_group(DEFERRED_GROUP_AI_ANALYSIS)
         ).order_by(VolunteerSpecialty.specialty_index).all()
         
         # 构建完整信息
@@ -136,97 +140,196 @@ class AICollegeSpecialtyAnalysisService:
         return result
     
     @classmethod
-    def analyzing_college(cls, user_info, college_json, temperature=0.3):
+    def analyzing_college(cls, user_info, college_json, temperature=0.3, use_cache=True):
         """
         获取AI对院校的分析响应
         
         :param user_info: 用户信息
         :param college_json: 院校信息JSON
         :param temperature: 控制输出的随机性
+        :param use_cache: 为False时跳过响应缓存重新分析
         :return: AI的分析内容
         """
         
         # 实际调用AI分析
         res = LLMService.analyzing_college(
             user_info=user_info,
-            college_json=college_json
+            college_json=college_json,
+            use_cache=use_cache
         )
         
         return res
     
     @classmethod
-    def analyzing_specialty(cls, user_info, specialty_json, temperature=0.3):
+    def analyzing_specialty(cls, user_info, specialty_json, temperature=0.3, use_cache=True):
         """
         获取AI对专业的分析响应
         
         :param user_info: 用户信息
         :param specialty_json: 专业信息JSON，包含院校上下文
         :param temperature: 控制输出的随机性
+        :param use_cache: 为False时跳过响应缓存重新分析
         :return: AI的分析内容
         """
         # 这里调用MoonshotAI进行专业分析
         # 实际调用AI分析
         res = LLMService.analyzing_specialty(
             user_info=user_info,
-            specialty_json=specialty_json
+            specialty_json=specialty_json,
+            use_cache=use_cache
         )
         
         return res
     
     @staticmethod
-    def update_college_analysis(volunteer_college_id, analysis_content):
+    def _detach_college(college, plan_id=None):
+        """
+        写时复制院校志愿(不提交事务)，保证分析结果只写入发起分析的方案版本
+
+        :param college: 志愿院校
+        :param plan_id: 发起分析的志愿方案ID，默认为学生当前版本中包含该院校的方案
+        :return: (志愿方案ID, 本方案独占的志愿院校)
+        """
+        plan_id = plan_id or VolunteerPlanService.resolve_volunteer_plan_id(college)
+        return plan_id, VolunteerPlanService.detach_shared_volunteer(plan_id, college)
+    
+    @staticmethod
+    def _invalidate_documents(college, original):
+        """写入后清除院校所在方案(写时复制时包括原记录所在方案)的文档缓存"""
+        PlanDocumentCache.invalidate_volunteer(college)
+        if college is not original:
+            PlanDocumentCache.invalidate_volunteer(original)
+    
+    @staticmethod
+    def prepare_college_analysis(volunteer_college_id, plan_id=None):
+        """
+        提交院校分析任务前调用：院校被多个方案版本共享时先写时复制并提交，
+        接口据此返回分析结果将写入的院校ID
+        
+        :param volunteer_college_id: 志愿院校ID
+        :param plan_id: 发起分析的志愿方案ID，默认为学生当前版本中包含该院校的方案
+        :return: (志愿方案ID, 分析结果将写入的志愿院校ID)，失败返回(None, None)
+        """
+        try:
+            original = VolunteerCollege.query.get(volunteer_college_id)
+            if not original:
+                return None, None
+            
+            plan_id, college = AICollegeSpecialtyAnalysisService._detach_college(original, plan_id)
+            db.session.commit()
+            AICollegeSpecialtyAnalysisService._invalidate_documents(college, original)
+            
+            return plan_id, college.id
+        except (SQLAlchemyError, ValueError) as e:
+            db.session.rollback()
+            current_app.logger.error(f"准备院校分析失败: {str(e)}")
+            return None, None
+    
+    @staticmethod
+    def prepare_specialty_analysis(specialty_id, plan_id=None):
+        """
+        提交专业分析任务前调用：所属院校被多个方案版本共享时先写时复制并提交，
+        接口据此返回分析结果将写入的专业ID
+        
+        :param specialty_id: 志愿专业ID
+        :param plan_id: 发起分析的志愿方案ID，默认为学生当前版本中包含所属院校的方案
+        :return: (志愿方案ID, 分析结果将写入的志愿专业ID)，失败返回(None, None)
+        """
+        try:
+            specialty = VolunteerSpecialty.query.get(specialty_id)
+            if not specialty:
+                return None, None
+            
+            original = specialty.volunteer
+            plan_id, college = AICollegeSpecialtyAnalysisService._detach_college(original, plan_id)
+            specialty = AICollegeSpecialtyAnalysisService._specialty_of(college, original, specialty)
+            db.session.commit()
+            AICollegeSpecialtyAnalysisService._invalidate_documents(college, original)
+            
+            return plan_id, specialty.id
+        except (SQLAlchemyError, ValueError) as e:
+            db.session.rollback()
+            current_app.logger.error(f"准备专业分析失败: {str(e)}")
+            return None, None
+    
+    @staticmethod
+    def _specialty_of(college, original, specialty):
+        """写时复制后克隆院校中与原专业对应的专业(未复制时为原专业)"""
+        if college is original:
+            return specialty
+        return VolunteerSpecialty.query.filter_by(
+            volunteer_college_id=college.id,
+            specialty_index=specialty.specialty_index
+        ).first()
+    
+    @staticmethod
+    def update_college_analysis(volunteer_college_id, analysis_content, plan_id=None):
         """
         更新院校的AI分析结果
+
+        院校被多个方案版本共享时先写时复制，分析结果只写入发起分析的方案版本
         
         :param volunteer_college_id: 志愿院校ID
         :param analysis_content: 分析内容
-        :return: 是否成功
+        :param plan_id: 发起分析的志愿方案ID，默认为学生当前版本中包含该院校的方案
+        :return: 写入分析结果的志愿院校ID(写时复制后为新记录的ID)，失败返回None
         """
         try:
-            college = VolunteerCollege.query.get(volunteer_college_id)
-            if not college:
-                return False
-                
+            original = VolunteerCollege.query.get(volunteer_college_id)
+            if not original:
+                return None
+            
+            plan_id, college = AICollegeSpecialtyAnalysisService._detach_college(original, plan_id)
             college.ai_analysis = analysis_content
             college.updated_at = datetime.now(timezone.utc)
             db.session.commit()
+            AICollegeSpecialtyAnalysisService._invalidate_documents(college, original)
             
-            return True
-        except SQLAlchemyError as e:
+            return college.id
+        except (SQLAlchemyError, ValueError) as e:
             db.session.rollback()
             current_app.logger.error(f"更新院校分析结果失败: {str(e)}")
-            return False
+            return None
     
     @staticmethod
-    def update_specialty_analysis(specialty_id, analysis_content):
+    def update_specialty_analysis(specialty_id, analysis_content, plan_id=None):
         """
         更新专业的AI分析结果
+
+        所属院校被多个方案版本共享时先写时复制，分析结果只写入发起分析的方案版本
         
         :param specialty_id: 志愿专业ID
         :param analysis_content: 分析内容
-        :return: 是否成功
+        :param plan_id: 发起分析的志愿方案ID，默认为学生当前版本中包含所属院校的方案
+        :return: 写入分析结果的志愿专业ID(写时复制后为新记录的ID)，失败返回None
         """
         try:
             specialty = VolunteerSpecialty.query.get(specialty_id)
             if not specialty:
-                return False
-                
+                return None
+            
+            original = specialty.volunteer
+            plan_id, college = AICollegeSpecialtyAnalysisService._detach_college(original, plan_id)
+            specialty = AICollegeSpecialtyAnalysisService._specialty_of(college, original, specialty)
             specialty.ai_analysis = analysis_content
             specialty.updated_at = datetime.now(timezone.utc)
             db.session.commit()
+            AICollegeSpecialtyAnalysisService._invalidate_documents(college, original)
             
-            return True
-        except SQLAlchemyError as e:
+            return specialty.id
+        except (SQLAlchemyError, ValueError) as e:
             db.session.rollback()
             current_app.logger.error(f"更新专业分析结果失败: {str(e)}")
-            return False
+            return None
     
     @staticmethod
-    def perform_college_analysis(volunteer_college_id):
+    def perform_college_analysis(volunteer_college_id, plan_id=None, refresh=False):
         """
         执行院校分析的业务逻辑
         
         :param volunteer_college_id: 志愿院校ID
+        :param plan_id: 发起分析的志愿方案ID，默认为学生当前版本中包含该院校的方案
+        :param refresh: 是否跳过响应缓存重新分析
         :return: 分析结果
         """
         try:
@@ -239,7 +342,7 @@ class AICollegeSpecialtyAnalysisService:
                 }
             
             # 2. 获取学生信息
-            plan_id = college_data.get('plan_id')
+            plan_id = plan_id or college_data.get('plan_id')
             student_id = StudentVolunteerPlan.query.get(plan_id).student_id
             user_info = StudentDataService.generate_student_profile_text(student_id)
             
@@ -250,16 +353,18 @@ class AICollegeSpecialtyAnalysisService:
             # 4. 调用AI分析
             analysis_result = AICollegeSpecialtyAnalysisService.analyzing_college(
                 user_info=user_info,
-                college_json=college_json
+                college_json=college_json,
+                use_cache=not refresh
             )
             
             # 5. 存储分析结果
-            success = AICollegeSpecialtyAnalysisService.update_college_analysis(
+            stored_id = AICollegeSpecialtyAnalysisService.update_college_analysis(
                 volunteer_college_id=volunteer_college_id,
-                analysis_content=analysis_result
+                analysis_content=analysis_result,
+                plan_id=plan_id
             )
             
-            if not success:
+            if not stored_id:
                 return {
                     "status": "error",
                     "message": "存储院校分析结果失败"
@@ -269,7 +374,7 @@ class AICollegeSpecialtyAnalysisService:
             return {
                 "status": "success",
                 "message": "院校分析完成",
-                "volunteer_college_id": volunteer_college_id,
+                "volunteer_college_id": stored_id,
                 "analysis": analysis_result
             }
             
@@ -285,11 +390,13 @@ class AICollegeSpecialtyAnalysisService:
             }
     
     @staticmethod
-    def perform_specialty_analysis(specialty_id):
+    def perform_specialty_analysis(specialty_id, plan_id=None, refresh=False):
         """
         执行专业分析的业务逻辑
         
         :param specialty_id: 志愿专业ID
+        :param plan_id: 发起分析的志愿方案ID，默认为学生当前版本中包含所属院校的方案
+        :param refresh: 是否跳过响应缓存重新分析
         :return: 分析结果
         """
         try:
@@ -305,7 +412,7 @@ class AICollegeSpecialtyAnalysisService:
             college_data = data.get('college')
             
             # 2. 获取学生信息
-            plan_id = college_data.get('plan_id')
+            plan_id = plan_id or college_data.get('plan_id')
             student_id = StudentVolunteerPlan.query.get(plan_id).student_id
             user_info = StudentDataService.generate_student_profile_text(student_id)
             
@@ -319,16 +426,18 @@ class AICollegeSpecialtyAnalysisService:
             # 4. 调用AI分析
             analysis_result = AICollegeSpecialtyAnalysisService.analyzing_specialty(
                 user_info=user_info,
-                specialty_json=specialty_json
+                specialty_json=specialty_json,
+                use_cache=not refresh
             )
             
             # 5. 存储分析结果
-            success = AICollegeSpecialtyAnalysisService.update_specialty_analysis(
+            stored_id = AICollegeSpecialtyAnalysisService.update_specialty_analysis(
                 specialty_id=specialty_id,
-                analysis_content=analysis_result
+                analysis_content=analysis_result,
+                plan_id=plan_id
             )
             
-            if not success:
+            if not stored_id:
                 return {
                     "status": "error",
                     "message": "存储专业分析结果失败"
@@ -338,7 +447,7 @@ class AICollegeSpecialtyAnalysisService:
             return {
                 "status": "success",
                 "message": "专业分析完成",
-                "specialty_id": specialty_id,
+                "specialty_id": stored_id,
                 "analysis": analysis_result
             }
             
@@ -351,4 +460,132 @@ class AICollegeSpecialtyAnalysisService:
                 "status": "error",
                 "message": f"分析过程出错: {str(e)}",
                 "error_detail": error_trace
-            }
\ No newline at end of file
+            }
+    
+    @staticmethod
+    def _profile_text_for_plan(plan_id, profile_cache):
+        """获取方案所属学生的档案文本，同一批次内按学生缓存"""
+        student_id = StudentVolunteerPlan.query.get(plan_id).student_id
+        if student_id not in profile_cache:
+            profile_cache[student_id] = StudentDataService.generate_student_profile_text(student_id)
+        return profile_cache[student_id]
+    
+    @staticmethod
+    def perform_batch_college_analysis(volunteer_college_ids, plan_id=None, refresh=False):
+        """
+        批量执行院校分析，所有院校的大模型调用在同一个worker内并发发送
+        
+        :param volunteer_college_ids: 志愿院校ID列表
+        :param plan_id: 发起分析的志愿方案ID，默认为学生当前版本中包含各院校的方案
+        :param refresh: 是否跳过响应缓存重新分析
+        :return: 分析结果汇总，stored_ids 为写时复制后实际写入的院校ID
+        """
+        profile_cache = {}
+        college_ids = []
+        calls = []
+        failed = []
+        
+        # 1. 依次准备每个院校的分析请求
+        for volunteer_college_id in volunteer_college_ids:
+            college_data = AICollegeSpecialtyAnalysisService.get_college_by_id(volunteer_college_id)
+            if not college_data:
+                failed.append({"volunteer_college_id": volunteer_college_id, "message": "未找到院校信息"})
+                continue
+            
+            user_info = AICollegeSpecialtyAnalysisService._profile_text_for_plan(
+                plan_id or college_data.get('plan_id'), profile_cache
+            )
+            simplified_college = AICollegeSpecialtyAnalysisService._simplify_college_for_ai(college_data)
+            college_ids.append(volunteer_college_id)
+            calls.append((LLMService.analyzing_college, {
+                "user_info": user_info,
+                "college_json": json.dumps(simplified_college, ensure_ascii=False),
+                "use_cache": not refresh
+            }))
+        
+        # 2. 并发调用AI分析并存储结果
+        results = LLMService.run_concurrently(calls) if calls else []
+        succeeded = []
+        stored_ids = {}
+        for volunteer_college_id, analysis_result in zip(college_ids, results):
+            if isinstance(analysis_result, Exception):
+                failed.append({"volunteer_college_id": volunteer_college_id, "message": str(analysis_result)})
+                continue
+            stored_id = AICollegeSpecialtyAnalysisService.update_college_analysis(
+                volunteer_college_id, analysis_result, plan_id=plan_id
+            )
+            if stored_id:
+                succeeded.append(volunteer_college_id)
+                stored_ids[volunteer_college_id] = stored_id
+            else:
+                failed.append({"volunteer_college_id": volunteer_college_id, "message": "存储院校分析结果失败"})
+        
+        return {
+            "status": "success" if not failed else "partial",
+            "message": f"院校分析完成，成功{len(succeeded)}个，失败{len(failed)}个",
+            "succeeded": succeeded,
+            "stored_ids": stored_ids,
+            "failed": failed
+        }
+    
+    @staticmethod
+    def perform_batch_specialty_analysis(specialty_ids, plan_id=None, refresh=False):
+        """
+        批量执行专业分析，所有专业的大模型调用在同一个worker内并发发送
+        
+        :param specialty_ids: 志愿专业ID列表
+        :param plan_id: 发起分析的志愿方案ID，默认为学生当前版本中包含各专业所属院校的方案
+        :param refresh: 是否跳过响应缓存重新分析
+        :return: 分析结果汇总，stored_ids 为写时复制后实际写入的专业ID
+        """
+        profile_cache = {}
+        prepared_ids = []
+        calls = []
+        failed = []
+        
+        # 1. 依次准备每个专业的分析请求
+        for specialty_id in specialty_ids:
+            data = AICollegeSpecialtyAnalysisService.get_specialty_by_id(specialty_id)
+            if not data:
+                failed.append({"specialty_id": specialty_id, "message": "未找到专业信息"})
+                continue
+            
+            college_data = data.get('college')
+            user_info = AICollegeSpecialtyAnalysisService._profile_text_for_plan(
+                plan_id or college_data.get('plan_id'), profile_cache
+            )
+            simplified_specialty = AICollegeSpecialtyAnalysisService._simplify_specialty_for_ai(
+                data.get('specialty'),
+                college_data
+            )
+            prepared_ids.append(specialty_id)
+            calls.append((LLMService.analyzing_specialty, {
+                "user_info": user_info,
+                "specialty_json": json.dumps(simplified_specialty, ensure_ascii=False),
+                "use_cache": not refresh
+            }))
+        
+        # 2. 并发调用AI分析并存储结果
+        results = LLMService.run_concurrently(calls) if calls else []
+        succeeded = []
+        stored_ids = {}
+        for specialty_id, analysis_result in zip(prepared_ids, results):
+            if isinstance(analysis_result, Exception):
+                failed.append({"specialty_id": specialty_id, "message": str(analysis_result)})
+                continue
+            stored_id = AICollegeSpecialtyAnalysisService.update_specialty_analysis(
+                specialty_id, analysis_result, plan_id=plan_id
+            )
+            if stored_id:
+                succeeded.append(specialty_id)
+                stored_ids[specialty_id] = stored_id
+            else:
+                failed.append({"specialty_id": specialty_id, "message": "存储专业分析结果失败"})
+        
+        return {
+            "status": "success" if not failed else "partial",
+            "message": f"专业分析完成，成功{len(succeeded)}个，失败{len(failed)}个",
+            "succeeded": succeeded,
+            "stored_ids": stored_ids,
+            "failed": failed
+        }
@@ -0,0 +1,178 @@
+# app/services/volunteer/plan_archive_service.py
+from flask import current_app
+from app.extensions import db
+from app.models.student_volunteer_plan import (
+    StudentVolunteerPlan, VolunteerCollege, VolunteerSpecialty, VolunteerCategoryAnalysis, PlanVolunteerLink
+)
+from app.models.volunteer_plan_archive import VolunteerPlanArchive
+from app.services.volunteer.plan_service import VolunteerPlanService
+from app.services.volunteer.plan_document_cache import PlanDocumentCache
+
+
+class PlanArchiveService:
+    """
+    志愿方案冷热分层服务
+
+    每个学生保留当前版本和最近N个历史版本为热数据，更早的版本把院校志愿、专业志愿和类别分析
+    组装成方案文档压缩写入归档表，并从明细表中删除；方案记录本身保留(标记为已归档)，
+    历史列表不受影响，查看详情时由 VolunteerPlanService.get_volunteer_plan 透明读取归档。
+    """
+
+    # 默认保留的历史版本数量(不含当前版本)
+    DEFAULT_HOT_VERSIONS = 5
+
+    @staticmethod
+    def hot_versions():
+        """保留为热数据的历史版本数量"""
+        return current_app.config.get('PLAN_HOT_VERSIONS', PlanArchiveService.DEFAULT_HOT_VERSIONS)
+
+    @staticmethod
+    def archivable_plan_ids(student_id, keep_versions=None):
+        """
+        获取学生超出保留数量、可以归档的方案ID(只归档已生成完成的非当前版本)
+
+        :param student_id: 学生ID
+        :param keep_versions: 保留的历史版本数量，默认读取配置
+        :return: 方案ID列表
+        """
+        if keep_versions is None:
+            keep_versions = PlanArchiveService.hot_versions()
+
+        plans = db.session.query(
+            StudentVolunteerPlan.id,
+            StudentVolunteerPlan.generation_status
+        ).filter(
+            StudentVolunteerPlan.student_id == student_id,
+            StudentVolunteerPlan.is_current == False,
+            StudentVolunteerPlan.is_archived == False
+        ).order_by(
+            StudentVolunteerPlan.version.desc(),
+            StudentVolunteerPlan.id.desc()
+        ).all()
+
+        finished_statuses = (
+            StudentVolunteerPlan.GENERATION_STATUS_SUCCESS,
+            StudentVolunteerPlan.GENERATION_STATUS_FAILED
+        )
+        return [
+            plan.id for plan in plans[keep_versions:]
+            if plan.generation_status in finished_statuses
+        ]
+
+    @staticmethod
+    def archive_plan(plan_id):
+        """
+        归档单个方案版本
+
+        方案自有的院校志愿如果仍被其他(热)版本共享，则把该院校记录转交给最早引用它的版本，
+        并删除该版本对应的共享记录，其余共享方继续引用；没有被共享的院校及其专业直接删除。
+        从任意版本修改方案时，新版本都可能共享该版本的院校：归档全程持有方案行锁，
+        VolunteerPlanService.update_volunteer_plan 写入共享记录前锁定同一行并复核是否已归档，
+        因此归档期间不会新增对待归档方案院校的引用，方案文档也在行锁下组装。
+
+        :param plan_id: 志愿方案ID
+        :return: 是否完成归档
+        """
+        try:
+            plan = StudentVolunteerPlan.query.filter_by(id=plan_id).with_for_update().first()
+            if not plan or plan.is_current or plan.is_archived:
+                db.session.rollback()
+                return False
+
+            # 按原逻辑组装完整方案文档(含历年数据)，归档后查看详情与归档前一致
+            document = VolunteerPlanService.get_volunteer_plan(plan_id)
+            archived_document = {
+                'category_analyses': document.get('category_analyses', []),
+                'colleges': document.get('colleges', [])
+            }
+            text = current_app.json.dumps(archived_document)
+
+            owned_ids = [
+                college_id for (college_id,) in db.session.query(VolunteerCollege.id).filter(
+                    VolunteerCollege.plan_id == plan_id
+                )
+            ]
+
+            # 仍被共享的院校转交给最早引用它的版本
+            adopters = VolunteerPlanService.transfer_shared_volunteers(plan_id, owned_ids)
+
+            # 删除没有被共享的院校及其专业
+            removed_ids = [college_id for college_id in owned_ids if college_id not in adopters]
+            if removed_ids:
+                db.session.query(VolunteerSpecialty).filter(
+                    VolunteerSpecialty.volunteer_college_id.in_(removed_ids)
+                ).delete(synchronize_session=False)
+                db.session.query(VolunteerCollege).filter(
+                    VolunteerCollege.id.in_(removed_ids)
+                ).delete(synchronize_session=False)
+
+            # 删除本方案对其他版本院校的共享记录和类别分析
+            db.session.query(PlanVolunteerLink).filter(
+                PlanVolunteerLink.plan_id == plan_id
+            ).delete(synchronize_session=False)
+            db.session.query(VolunteerCategoryAnalysis).filter(
+                VolunteerCategoryAnalysis.plan_id == plan_id
+            ).delete(synchronize_session=False)
+
+            db.session.add(VolunteerPlanArchive.from_text(
+                plan_id, text, college_count=len(archived_document['colleges'])
+            ))
+            plan.is_archived = True
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"归档志愿方案失败, 方案ID: {plan_id}, 错误: {str(e)}")
+            raise
+
+        PlanDocumentCache.invalidate(plan_id)
+        current_app.logger.info(
+            f"志愿方案{plan_id}已归档: 院校{len(archived_document['colleges'])}个，"
+            f"转交共享院校{len(adopters)}个，删除院校{len(removed_ids)}个"
+        )
+        return True
+
+    @staticmethod
+    def compact_student_plans(student_id, keep_versions=None):
+        """
+        归档学生超出保留数量的旧方案版本
+
+        :param student_id: 学生ID
+        :param keep_versions: 保留的历史版本数量，默认读取配置
+        :return: 已归档的方案ID列表
+        """
+        archived_ids = []
+        # 从最旧的版本开始归档，共享院校逐步转交给更新的版本
+        for plan_id in reversed(PlanArchiveService.archivable_plan_ids(student_id, keep_versions)):
+            if PlanArchiveService.archive_plan(plan_id):
+                archived_ids.append(plan_id)
+        return archived_ids
+
+    @staticmethod
+    def compact_all_plans(keep_versions=None):
+        """
+        归档所有学生超出保留数量的旧方案版本
+
+        :param keep_versions: 保留的历史版本数量，默认读取配置
+        :return: 归档的方案数量
+        """
+        if keep_versions is None:
+            keep_versions = PlanArchiveService.hot_versions()
+
+        # 未归档版本数超过"当前版本 + 保留数量"的学生
+        student_ids = [
+            student_id for (student_id,) in db.session.query(StudentVolunteerPlan.student_id).filter(
+                StudentVolunteerPlan.is_archived == False
+            ).group_by(
+                StudentVolunteerPlan.student_id
+            ).having(
+                db.func.count(StudentVolunteerPlan.id) > keep_versions + 1
+            )
+        ]
+
+        archived_count = 0
+        for student_id in student_ids:
+            try:
+                archived_count += len(PlanArchiveService.compact_student_plans(student_id, keep_versions))
+            except Exception as e:
+                current_app.logger.error(f"归档学生{student_id}的旧方案版本失败: {str(e)}")
+        return archived_count
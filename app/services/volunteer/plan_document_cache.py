@@ -0,0 +1,131 @@
+# app/services/volunteer/plan_document_cache.py
+import hashlib
+from flask import current_app
+from app.extensions import cache, db
+from app.models.student_volunteer_plan import StudentVolunteerPlan, PlanVolunteerLink
+
+
+class PlanDocumentCache:
+    """
+    志愿方案文档缓存
+
+    方案版本生成后基本不再变化(修改方案会创建新版本)，因此把组装好的方案JSON预先序列化为字节，
+    按 (plan_id, updated_at, 修订号, 查询参数) 缓存在Redis中，并据此生成ETag。
+    分析结果或AI解读写入后调用 invalidate 使缓存和ETag同时失效。
+    生成中的方案进度仍在变化，不做缓存。
+    """
+
+    # Redis键前缀：方案文档(哈希，字段为版本+查询参数)、方案修订号
+    DOC_KEY_PREFIX = "plan_doc"
+    REVISION_KEY_PREFIX = "plan_doc_rev"
+    # 方案文档缓存过期时间(秒)
+    DOC_EXPIRE = 60 * 60 * 24
+
+    @staticmethod
+    def _doc_key(plan_id):
+        return f"{PlanDocumentCache.DOC_KEY_PREFIX}:{plan_id}"
+
+    @staticmethod
+    def _revision_key(plan_id):
+        return f"{PlanDocumentCache.REVISION_KEY_PREFIX}:{plan_id}"
+
+    @staticmethod
+    def is_cacheable(plan):
+        """只缓存已生成完成的方案"""
+        return plan.generation_status in (
+            StudentVolunteerPlan.GENERATION_STATUS_SUCCESS,
+            StudentVolunteerPlan.GENERATION_STATUS_FAILED
+        )
+
+    @staticmethod
+    def _revision(plan_id):
+        try:
+            value = cache.cache._read_client.get(PlanDocumentCache._revision_key(plan_id))
+        except Exception as e:
+            current_app.logger.error(f"读取方案修订号失败: {str(e)}")
+            return 0
+        return int(value) if value else 0
+
+    @staticmethod
+    def version_field(plan, include_details=True, category_id=None, group_id=None, volunteer_index=None):
+        """
+        方案文档的版本标识，同时作为缓存字段名和ETag的来源
+
+        :return: 版本标识字符串
+        """
+        updated_at = plan.updated_at.timestamp() if plan.updated_at else 0
+        return (
+            f"{updated_at}:{PlanDocumentCache._revision(plan.id)}:"
+            f"{int(bool(include_details))}:{category_id}:{group_id}:{volunteer_index}"
+        )
+
+    @staticmethod
+    def etag(plan_id, version_field):
+        """根据版本标识生成ETag(不含引号)"""
+        return hashlib.sha1(f"{plan_id}:{version_field}".encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def get_document(plan, version_field, builder):
+        """
+        获取预序列化的方案文档，未命中时调用builder组装并写入缓存
+
+        :param plan: 志愿方案对象
+        :param version_field: version_field() 的结果
+        :param builder: 无参函数，返回方案文档字典
+        :return: JSON字节串
+        """
+        doc_key = PlanDocumentCache._doc_key(plan.id)
+        try:
+            cached = cache.cache._read_client.hget(doc_key, version_field)
+            if cached:
+                return cached
+        except Exception as e:
+            current_app.logger.error(f"读取方案文档缓存失败: {str(e)}")
+
+        document = current_app.json.dumps(builder()).encode('utf-8')
+
+        if PlanDocumentCache.is_cacheable(plan):
+            try:
+                redis_client = cache.cache._write_client
+                pipe = redis_client.pipeline()
+                pipe.hset(doc_key, version_field, document)
+                pipe.expire(doc_key, PlanDocumentCache.DOC_EXPIRE)
+                pipe.execute()
+            except Exception as e:
+                current_app.logger.error(f"写入方案文档缓存失败: {str(e)}")
+
+        return document
+
+    @staticmethod
+    def invalidate(plan_id):
+        """
+        方案的分析结果或AI解读变化后调用，使缓存文档和ETag失效
+
+        :param plan_id: 志愿方案ID
+        """
+        if not plan_id:
+            return
+        try:
+            redis_client = cache.cache._write_client
+            pipe = redis_client.pipeline()
+            pipe.incr(PlanDocumentCache._revision_key(plan_id))
+            pipe.delete(PlanDocumentCache._doc_key(plan_id))
+            pipe.execute()
+        except Exception as e:
+            current_app.logger.error(f"清除方案文档缓存失败: {str(e)}")
+
+    @staticmethod
+    def invalidate_volunteer(volunteer_college):
+        """
+        院校志愿(或其专业)变化后调用，使写入该院校的方案及所有共享该院校的方案缓存失效
+
+        :param volunteer_college: 院校志愿对象
+        """
+        plan_ids = {volunteer_college.plan_id}
+        plan_ids.update(
+            plan_id for (plan_id,) in db.session.query(PlanVolunteerLink.plan_id).filter(
+                PlanVolunteerLink.volunteer_college_id == volunteer_college.id
+            )
+        )
+        for plan_id in plan_ids:
+            PlanDocumentCache.invalidate(plan_id)
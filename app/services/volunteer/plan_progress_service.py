@@ -0,0 +1,91 @@
+# app/services/volunteer/plan_progress_service.py
+import json
+from datetime import datetime, timezone
+from flask import current_app
+from app.extensions import cache, socketio
+
+
+class PlanProgressService:
+    """
+    志愿方案生成进度服务
+
+    生成过程中的进度只写入Redis并通过Socket.IO推送到方案房间，
+    数据库中的方案记录只在开始和结束时写入，避免轮询和进度写入都压到主库上。
+    """
+
+    # Redis键前缀与过期时间(秒)
+    KEY_PREFIX = "plan_progress"
+    KEY_EXPIRE = 60 * 60 * 24
+
+    # Socket.IO事件名
+    EVENT_PROGRESS = 'plan_progress'
+
+    @staticmethod
+    def _key(plan_id):
+        return f"{PlanProgressService.KEY_PREFIX}:{plan_id}"
+
+    @staticmethod
+    def room(plan_id):
+        """方案对应的Socket.IO房间名"""
+        return f"plan_{plan_id}"
+
+    @staticmethod
+    def update(plan_id, status, progress, message):
+        """
+        更新方案生成进度并推送给订阅该方案的客户端
+
+        :param plan_id: 志愿方案ID
+        :param status: 生成状态
+        :param progress: 生成进度(0-100)
+        :param message: 进度说明
+        :return: 进度数据
+        """
+        payload = {
+            'plan_id': plan_id,
+            'generation_status': status,
+            'generation_progress': progress,
+            'generation_message': message,
+            'updated_at': datetime.now(timezone.utc).isoformat()
+        }
+
+        try:
+            redis_client = cache.cache._write_client
+            redis_client.set(
+                PlanProgressService._key(plan_id),
+                json.dumps(payload, ensure_ascii=False),
+                ex=PlanProgressService.KEY_EXPIRE
+            )
+        except Exception as e:
+            current_app.logger.error(f"写入方案进度失败: {str(e)}")
+
+        try:
+            socketio.emit(
+                PlanProgressService.EVENT_PROGRESS,
+                payload,
+                to=PlanProgressService.room(plan_id)
+            )
+        except Exception as e:
+            current_app.logger.error(f"推送方案进度失败: {str(e)}")
+
+        return payload
+
+    @staticmethod
+    def get(plan_id):
+        """
+        获取方案生成进度
+
+        :param plan_id: 志愿方案ID
+        :return: 进度数据，不存在时返回None
+        """
+        try:
+            redis_client = cache.cache._read_client
+            value = redis_client.get(PlanProgressService._key(plan_id))
+        except Exception as e:
+            current_app.logger.error(f"读取方案进度失败: {str(e)}")
+            return None
+
+        if not value:
+            return None
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return json.loads(value)
@@ -1,16 +1,43 @@
 # app/services/volunteer/plan_service.py
 from flask import current_app
-from sqlalchemy.exc import SQLAlchemyError
-from app.extensions import db
-from app.models.student_volunteer_plan import StudentVolunteerPlan, VolunteerCollege, VolunteerSpecialty, VolunteerCategoryAnalysis
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from app.extensions import db, cache
+from app.models.student_volunteer_plan import (
+    StudentVolunteerPlan, VolunteerCollege, VolunteerSpecialty, VolunteerCategoryAnalysis, PlanVolunteerLink,
+    DEFERRED_GROUP_AI_ANALYSIS
+)
+from app.models.volunteer_plan_archive import VolunteerPlanArchive
 from app.services.college.recommendation_service import RecommendationService
 from app.services.ai.llm_service import LLMService
 from app.services.ai.ollama import OllamaAPI
 import json
+import hashlib
+from collections import Counter
+from datetime import datetime, timezone
 from app.services.student.student_data_service import StudentDataService
 from app.utils.helpers import convert_utc_to_beijing
 from app.core.recommendation.repository import CollegeRepository
 from app.models.zwh_xgk_fenzu_2025 import ZwhXgkFenzu2025
+from app.core.recommendation.plan_solver import PlanSolver, LLMCallBudget
+from app.services.volunteer.plan_progress_service import PlanProgressService
+from app.services.volunteer.plan_document_cache import PlanDocumentCache
+
+# 志愿方案生成模式
+GENERATION_MODE_AI = 'ai'          # AI选择院校，大模型预算耗尽或调用失败时自动切换本地求解
+GENERATION_MODE_SOLVER = 'solver'  # 仅使用本地求解器，不调用大模型
+
+# 志愿段选择结果的来源，记录在方案的 segment_fingerprints 中
+SEGMENT_SOURCE_AI = 'ai'        # 大模型选择
+SEGMENT_SOURCE_LOCAL = 'local'  # 本地求解器或备选推荐(首次生成、预算耗尽、大模型调用失败)
+
+
+class PlanVersionConflictError(Exception):
+    """修改志愿方案时基准版本已不是最新版本(其他人已保存了新版本)"""
+
+    def __init__(self, latest_plan_id, latest_version):
+        super().__init__(f"志愿方案已被修改，最新版本为{latest_version}")
+        self.latest_plan_id = latest_plan_id
+        self.latest_version = latest_version
 
 class VolunteerPlanService:
     """志愿方案服务类，处理学生志愿方案相关业务逻辑"""
@@ -27,9 +54,24 @@ class VolunteerPlanService:
         :param volunteer_index: 按志愿序号过滤(1-48)
         :return: 志愿方案详情
         """
-        # 首先获取基本数据和分析信息
-        plan = StudentVolunteerPlan.query.get_or_404(plan_id)
+        # 首先获取基本数据和分析信息(详情需要快照，一次性加载延迟字段)
+        plan = StudentVolunteerPlan.query.options(
+            db.joinedload(StudentVolunteerPlan.snapshot)
+        ).get_or_404(plan_id)
         result = plan.to_dict()
+
+        # 生成中的方案进度以Redis中的实时进度为准
+        if plan.generation_status == StudentVolunteerPlan.GENERATION_STATUS_PROCESSING:
+            progress_data = PlanProgressService.get(plan_id)
+            if progress_data:
+                result['generation_progress'] = progress_data['generation_progress']
+                result['generation_message'] = progress_data['generation_message']
+        
+        # 已归档的历史版本从归档表读取
+        if plan.is_archived:
+            return VolunteerPlanService._archived_plan_document(
+                result, plan_id, include_details, category_id, group_id, volunteer_index
+            )
         
         # 获取志愿类别分析信息
         analyses_query = VolunteerCategoryAnalysis.query.filter_by(plan_id=plan_id)
@@ -51,7 +93,9 @@ class VolunteerPlanService:
             ZwhXgkFenzu2025, 
             VolunteerCollege.college_group_id == ZwhXgkFenzu2025.cgid
         ).filter(
-            VolunteerCollege.plan_id == plan_id
+            VolunteerCollege.plan_filter(plan_id)
+        ).options(
+            db.undefer_group(DEFERRED_GROUP_AI_ANALYSIS)
         ).order_by(
             VolunteerCollege.volunteer_index
         )
@@ -125,6 +169,8 @@ class VolunteerPlanService:
         if college_ids:
             specialties = VolunteerSpecialty.query.filter(
                 VolunteerSpecialty.volunteer_college_id.in_(college_ids)
+            ).options(
+                db.undefer_group(DEFERRED_GROUP_AI_ANALYSIS)
             ).all()
             
             # 按院校ID分组专业
@@ -138,6 +184,7 @@ class VolunteerPlanService:
         volunteer_colleges = []
         for college in colleges:
             college_dict = college.to_dict()
+            college_dict['plan_id'] = plan_id  # 共享自上一版本的院校也归属于当前方案展示
             college_dict['specialties'] = all_specialties.get(college.id, [])
             
             # 添加历史数据
@@ -172,14 +219,247 @@ class VolunteerPlanService:
         
         return result
 
+    @staticmethod
+    def _archived_plan_document(result, plan_id, include_details=True, category_id=None, group_id=None, volunteer_index=None):
+        """
+        从归档表组装已归档方案的详情，过滤条件与 get_volunteer_plan 一致
+        
+        :param result: 方案基本信息字典
+        :return: 志愿方案详情
+        """
+        document = VolunteerPlanArchive.load_document(plan_id)
+        
+        result['category_analyses'] = [
+            analysis for analysis in document['category_analyses']
+            if category_id is None or analysis['category_id'] == category_id
+        ]
+        if not include_details:
+            return result
+        
+        result['colleges'] = [
+            college for college in document['colleges']
+            if (category_id is None or college['category_id'] == category_id)
+            and (group_id is None or college['group_id'] == group_id)
+            and (volunteer_index is None or college['volunteer_index'] == volunteer_index)
+        ]
+        return result
+
+    @staticmethod
+    def _resolve_submitted_volunteer_details(student_id, colleges):
+        """
+        查询前端提交院校和专业的补充信息(院校组详情、专业分数线信息)，只读不写
+        
+        :param student_id: 学生ID
+        :param colleges: 前端提交的院校志愿列表
+        :return: (院校组详情字典 {cgid: 信息}, 专业详情字典 {(cgid, spid): 信息})
+        """
+        # 导入必要的类
+        from app.core.recommendation.repository import CollegeRepository
+        from app.services.student.student_data_service import StudentDataService
+        from app.models.zwh_xgk_fenzu_2025 import ZwhXgkFenzu2025
+        from app.models.zwh_xgk_yuanxiao_2025 import ZwhXgkYuanxiao2025
+        from app.models.zwh_xgk_fenshuxian_2025 import ZwhXgkFenshuxian2025
+        from app.models.zwh_areas import ZwhAreas
+        
+        # 获取推荐信息用于查询完整数据
+        student_data = StudentDataService.extract_college_recommendation_data(student_id)
+        subject_type = int(student_data.get('subject_type') or 1)
+        education_level = int(student_data.get('education_level') or 11)
+        student_subjects = student_data.get('student_subjects', {})  # 获取学生选科情况
+        
+        # 收集需要查询的ID
+        college_group_ids = []
+        
+        for college in colleges:
+            college_group_ids.append(college.get('college_group_id'))
+        
+        # 查询院校组详细信息
+        college_group_details = {}
+        if college_group_ids:
+            # 查询院校详细信息和投档线信息
+            college_groups = db.session.query(
+                ZwhXgkFenzu2025.cgid,
+                ZwhXgkFenzu2025.minxuefei,
+                ZwhXgkFenzu2025.maxxuefei,
+                ZwhXgkFenzu2025.cgname,
+                ZwhXgkYuanxiao2025.tese,
+                ZwhXgkYuanxiao2025.leixing,
+                ZwhXgkYuanxiao2025.xingzhi,
+                ZwhXgkYuanxiao2025.teshu,
+                ZwhXgkYuanxiao2025.uncode,
+                ZwhAreas.aname.label('area_name'),
+                ZwhAreas.aid.label('area_id'),  # 添加地区ID用于获取完整路径
+                ZwhXgkFenshuxian2025.yuce.label('prediction_score'),
+                ZwhXgkFenshuxian2025.csbplannum.label('plan_number'),
+            ).join(
+                ZwhXgkYuanxiao2025,
+                ZwhXgkFenzu2025.newcid == ZwhXgkYuanxiao2025.cid
+            ).join(
+                ZwhAreas,
+                ZwhXgkYuanxiao2025.aid == ZwhAreas.aid
+            ).outerjoin(
+                ZwhXgkFenshuxian2025,
+                db.and_(
+                    ZwhXgkFenshuxian2025.cgid == ZwhXgkFenzu2025.cgid,
+                    ZwhXgkFenshuxian2025.spid == 32767,
+                    ZwhXgkFenshuxian2025.suid == subject_type,
+                    ZwhXgkFenshuxian2025.newbid == education_level
+                )
+            ).filter(
+                ZwhXgkFenzu2025.cgid.in_(college_group_ids)
+            ).all()
+            
+            # 批量获取完整地区路径
+            area_paths = CollegeRepository.get_complete_area_paths(
+                [group.area_id for group in college_groups]
+            )
+            
+            # 处理院校类型、特色等文本
+            for group in college_groups:
+                tese_text = CollegeRepository.convert_code_to_text(group.tese, 'tese')
+                leixing_text = CollegeRepository.convert_code_to_text(group.leixing, 'leixing')
+                teshu_text = CollegeRepository.convert_code_to_text(group.teshu, 'teshu')
+                
+                # 获取完整地区路径
+                area_path = area_paths.get(group.area_id, [])
+                complete_area_name = ''.join([area['aname'] for area in area_path[1:]]) if len(area_path) > 1 else group.area_name
+                
+                # xingzhi为1表示公办，否则为民办
+                nature = '公办' if group.xingzhi == 1 else '民办'
+                
+                college_group_details[group.cgid] = {
+                    'min_tuition': group.minxuefei,
+                    'max_tuition': group.maxxuefei,
+                    'group_name': group.cgname,
+                    'area_name': complete_area_name,  # 使用完整地区名称
+                    'tese_text': tese_text,
+                    'leixing_text': leixing_text[0] if leixing_text else '',
+                    'teshu_text': teshu_text,
+                    'uncode': group.uncode,
+                    'nature': nature,  # 使用正确的学校性质
+                    'subject_requirements': student_subjects,  # 使用学生选科情况
+                    'prediction_score': group.prediction_score,
+                    'plan_number': group.plan_number
+                }
+        
+        # 处理专业详细信息 - 按(cgid, spid)组合一次性批量查询
+        specialty_details = {}
+        cgid_spid_keys = {
+            (int(college.get('college_group_id', 0)), int(specialty_data.get('specialty_id', 0)))
+            for college in colleges
+            for specialty_data in college.get('specialties', [])
+        }
+        
+        if cgid_spid_keys:
+            specialties = db.session.query(
+                ZwhXgkFenshuxian2025.id.label('fenshuxian_id'),
+                ZwhXgkFenshuxian2025.cgid,
+                ZwhXgkFenshuxian2025.spid,
+                ZwhXgkFenshuxian2025.tuitions,
+                ZwhXgkFenshuxian2025.yuce,
+                ZwhXgkFenshuxian2025.csbplannum
+            ).filter(
+                db.tuple_(ZwhXgkFenshuxian2025.cgid, ZwhXgkFenshuxian2025.spid).in_(list(cgid_spid_keys)),
+                ZwhXgkFenshuxian2025.suid == subject_type,
+                ZwhXgkFenshuxian2025.newbid == education_level
+            ).all()
+            
+            for specialty in specialties:
+                key = (specialty.cgid, specialty.spid)
+                if key in specialty_details:
+                    continue
+                specialty_details[key] = {
+                    'fenshuxian_id': specialty.fenshuxian_id,
+                    'tuition': specialty.tuitions,
+                    'prediction_score': specialty.yuce,
+                    'plan_number': specialty.csbplannum
+                }
+        
+        return college_group_details, specialty_details
+
+    @staticmethod
+    def _version_conflict(student_id):
+        """回滚当前事务并返回包含学生最新版本的 PlanVersionConflictError"""
+        db.session.rollback()
+        latest_plan = StudentVolunteerPlan.query.filter_by(
+            student_id=student_id
+        ).order_by(StudentVolunteerPlan.version.desc()).first()
+        if not latest_plan:
+            return PlanVersionConflictError(None, 0)
+        return PlanVersionConflictError(latest_plan.id, latest_plan.version)
+
+    @staticmethod
+    def _add_plan_version(plan, base_version):
+        """
+        写入新的方案版本(不提交事务)：先比较并交换，把基准版本的当前标记置为否，再插入版本号为 base_version + 1 的方案
+
+        基准版本已不是当前版本时交换失败；并发写入同一版本号时唯一约束(student_id, version)使后插入者失败，
+        两种情况都回滚事务并抛出 PlanVersionConflictError
+
+        :param plan: 新方案对象(版本号和当前标记由本方法设置)
+        :param base_version: 基准版本号，学生还没有方案时为0
+        :raises PlanVersionConflictError: 基准版本已不是最新版本
+        """
+        student_id = plan.student_id
+        if base_version:
+            swapped = db.session.query(StudentVolunteerPlan).filter(
+                StudentVolunteerPlan.student_id == student_id,
+                StudentVolunteerPlan.version == base_version,
+                StudentVolunteerPlan.is_current == True
+            ).update({"is_current": False}, synchronize_session=False)
+            if not swapped:
+                raise VolunteerPlanService._version_conflict(student_id)
+
+        plan.version = base_version + 1
+        plan.is_current = True
+        db.session.add(plan)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            raise VolunteerPlanService._version_conflict(student_id)
+
+    @staticmethod
+    def _restore_archived_volunteers(plan_id, archived_colleges):
+        """
+        把归档文档中的院校志愿及专业恢复为方案自有的记录(不提交事务)
+        
+        :param plan_id: 志愿方案ID
+        :param archived_colleges: 归档文档中的院校志愿列表(含专业)
+        """
+        excluded = {'id', 'plan_id', 'volunteer_college_id', 'created_at', 'updated_at'}
+        college_columns = {column.key for column in VolunteerCollege.__table__.columns} - excluded
+        specialty_columns = {column.key for column in VolunteerSpecialty.__table__.columns} - excluded
+        
+        colleges = [
+            VolunteerCollege(plan_id=plan_id, **{
+                key: value for key, value in archived.items() if key in college_columns
+            })
+            for archived in archived_colleges
+        ]
+        db.session.add_all(colleges)
+        db.session.flush()
+        
+        db.session.add_all([
+            VolunteerSpecialty(volunteer_college_id=college.id, **{
+                key: value for key, value in specialty.items() if key in specialty_columns
+            })
+            for college, archived in zip(colleges, archived_colleges)
+            for specialty in archived.get('specialties', [])
+        ])
+        db.session.flush()
+
     @staticmethod
     def update_volunteer_plan(plan_id, update_data):
         """
         修改学生志愿方案（创建新版本）
         
+        使用乐观并发控制：补充信息的查询全部在写入前完成且不加锁，
+        写入时以"基准版本仍是当前版本"为条件比较并交换，失败时抛出 PlanVersionConflictError
+        
         :param plan_id: 当前志愿方案ID
-        :param update_data: 更新数据，包含修改的院校和专业信息
+        :param update_data: 更新数据，包含修改的院校和专业信息，可选base_version为客户端所基于的版本号
         :return: 新的志愿方案
+        :raises PlanVersionConflictError: 基准版本已不是最新版本
         """
         try:
             # 1. 获取当前方案和学生信息
@@ -187,250 +467,105 @@ class VolunteerPlanService:
             student_id = current_plan.student_id
             planner_id = current_plan.planner_id
             
-            # 使用 with_for_update() 锁定查询，防止并发问题
-            latest_plan = db.session.query(StudentVolunteerPlan).filter(
-                StudentVolunteerPlan.student_id == student_id
-            ).order_by(StudentVolunteerPlan.version.desc()).with_for_update().first()
+            # 读取最新版本(不加锁)，客户端提供了基准版本时先做一次版本校验
+            latest_plan = StudentVolunteerPlan.query.filter_by(
+                student_id=student_id
+            ).order_by(StudentVolunteerPlan.version.desc()).first()
+            base_version = update_data.get('base_version')
+            if base_version is None:
+                base_version = latest_plan.version
+            elif base_version != latest_plan.version:
+                raise PlanVersionConflictError(latest_plan.id, latest_plan.version)
             
-            new_version = latest_plan.version + 1 if latest_plan else 1
-
-            # 2. 将所有当前版本设为非当前版本
-            db.session.query(StudentVolunteerPlan).filter(
-                StudentVolunteerPlan.student_id == student_id,
-                StudentVolunteerPlan.is_current == True
-            ).update({"is_current": False}, synchronize_session=False)
+            # 2. 识别前端修改了哪些批次(category_id和group_id组合)以及志愿组合键
+            modified_batches = set()
+            modified_combined_keys = set()
+            for college in update_data.get('colleges', []):
+                batch_key = (college.get('category_id'), college.get('group_id'))
+                modified_batches.add(batch_key)
+                combined_key = (college.get('group_id'), college.get('volunteer_index'))
+                modified_combined_keys.add(combined_key)
+            
+            # 3. 只读阶段 - 查询未修改批次需要共享的院校，以及修改批次的补充信息
+            def unmodified(category_id, group_id, volunteer_index):
+                return (category_id, group_id) not in modified_batches \
+                    and (group_id, volunteer_index) not in modified_combined_keys
+            
+            def unmodified_archived_colleges():
+                # 已归档版本的院校明细只在归档文档中，未修改的院校从归档文档恢复为新版本自有的记录
+                return [
+                    college for college in VolunteerPlanArchive.load_document(current_plan.id)['colleges']
+                    if unmodified(college['category_id'], college['group_id'], college['volunteer_index'])
+                ]
+            
+            shared_colleges = []
+            archived_colleges = []
+            if modified_batches and current_plan.is_archived:
+                archived_colleges = unmodified_archived_colleges()
+            elif modified_batches:
+                shared_colleges = [
+                    college for college in VolunteerCollege.query_for_plan(current_plan.id).all()
+                    if unmodified(college.category_id, college.group_id, college.volunteer_index)
+                ]
+            
+            college_group_details, specialty_details = {}, {}
+            if update_data.get('colleges'):
+                college_group_details, specialty_details = VolunteerPlanService._resolve_submitted_volunteer_details(
+                    student_id, update_data['colleges']
+                )
             
-            # 3. 创建新版本的方案
+            # 4. 创建新版本的方案
             new_plan = StudentVolunteerPlan(
                 student_id=student_id,
                 planner_id=planner_id,
-                version=new_version,
-                is_current=True,
                 remarks=update_data.get('remarks', f"从版本{current_plan.version}修改"),
                 generation_status=StudentVolunteerPlan.GENERATION_STATUS_SUCCESS,
                 generation_progress=100,
                 generation_message="手动修改志愿方案",
                 user_data_hash=current_plan.user_data_hash,
-                student_data_snapshot=current_plan.student_data_snapshot
+                snapshot_id=current_plan.snapshot_id,
+                parent_plan_id=current_plan.id
             )
-            db.session.add(new_plan)
-            db.session.flush()  # 刷新以获取新ID
-            new_plan_id = new_plan.id
             
-            # 4. 识别前端修改了哪些批次(category_id和group_id组合)以及志愿组合键
-            modified_batches = set()
-            modified_combined_keys = set()
-            for college in update_data.get('colleges', []):
-                batch_key = (college.get('category_id'), college.get('group_id'))
-                modified_batches.add(batch_key)
-                combined_key = (college.get('group_id'), college.get('volunteer_index'))
-                modified_combined_keys.add(combined_key)
+            # 保留未修改志愿段的候选集指纹，规划师修改过的志愿段下次生成时不再复用
+            if current_plan.segment_fingerprints:
+                modified_group_ids = {str(group_id) for _, group_id in modified_batches}
+                new_plan.segment_fingerprints = {
+                    group_id: fingerprint
+                    for group_id, fingerprint in current_plan.segment_fingerprints.items()
+                    if group_id not in modified_group_ids
+                }
             
-            # 5. 处理未修改的批次 - 直接从当前版本复制
-            if modified_batches:
-                # 获取当前版本中所有院校数据
-                current_colleges = VolunteerCollege.query.filter_by(plan_id=current_plan.id).all()
-                
-                # 找出未修改的批次的院校，且不在修改的组合键中
-                colleges_to_copy = []
-                for college in current_colleges:
-                    combined_key = (college.group_id, college.volunteer_index)
-                    if (college.category_id, college.group_id) not in modified_batches and combined_key not in modified_combined_keys:
-                        # 复制院校数据
-                        new_college = VolunteerCollege(
-                            plan_id=new_plan_id,
-                            category_id=college.category_id,
-                            group_id=college.group_id,
-                            volunteer_index=college.volunteer_index,
-                            college_id=college.college_id,
-                            college_name=college.college_name,
-                            college_group_id=college.college_group_id,
-                            score_diff=college.score_diff,
-                            prediction_score=college.prediction_score,
-                            recommend_type=college.recommend_type,
-                            ai_analysis=college.ai_analysis,
-                            area_name=college.area_name,
-                            group_name=college.group_name,
-                            min_tuition=college.min_tuition,
-                            max_tuition=college.max_tuition,
-                            min_score=college.min_score,
-                            plan_number=college.plan_number,
-                            school_type_text=college.school_type_text,
-                            subject_requirements=college.subject_requirements,
-                            tese_text=college.tese_text,
-                            teshu_text=college.teshu_text,
-                            uncode=college.uncode,
-                            nature=college.nature
-                        )
-                        colleges_to_copy.append(new_college)
-                
-                # 批量添加未修改的院校
-                if colleges_to_copy:
-                    db.session.bulk_save_objects(colleges_to_copy)
-                    db.session.flush()
-                    
-                    # 为复制的院校添加专业
-                    original_college_ids = [c.id for c in current_colleges 
-                                        if (c.category_id, c.group_id) not in modified_batches
-                                        and (c.group_id, c.volunteer_index) not in modified_combined_keys]
-                    
-                    # 使用组合键作为映射
-                    new_college_map = {(c.group_id, c.volunteer_index): c.id for c in VolunteerCollege.query.filter_by(plan_id=new_plan_id).all()}
-                    
-                    if original_college_ids:
-                        # 获取原院校的所有专业
-                        original_specialties = VolunteerSpecialty.query.filter(
-                            VolunteerSpecialty.volunteer_college_id.in_(original_college_ids)
-                        ).all()
-                        
-                        # 准备复制的专业数据
-                        specialties_to_copy = []
-                        for specialty in original_specialties:
-                            # 找到对应的新院校ID
-                            original_college = next((c for c in current_colleges if c.id == specialty.volunteer_college_id), None)
-                            if original_college:
-                                combined_key = (original_college.group_id, original_college.volunteer_index)
-                                if combined_key in new_college_map:
-                                    new_college_id = new_college_map[combined_key]
-                                    
-                                    # 复制专业数据
-                                    new_specialty = VolunteerSpecialty(
-                                        volunteer_college_id=new_college_id,
-                                        specialty_id=specialty.specialty_id,
-                                        specialty_code=specialty.specialty_code,
-                                        specialty_name=specialty.specialty_name,
-                                        specialty_index=specialty.specialty_index,
-                                        prediction_score=specialty.prediction_score,
-                                        plan_number=specialty.plan_number,
-                                        tuition=specialty.tuition,
-                                        remarks=specialty.remarks,
-                                        ai_analysis=specialty.ai_analysis,
-                                        fenshuxian_id=specialty.fenshuxian_id
-                                    )
-                                    specialties_to_copy.append(new_specialty)
-                        
-                        # 批量添加复制的专业
-                        if specialties_to_copy:
-                            db.session.bulk_save_objects(specialties_to_copy)
-                            db.session.flush()
+            # 5. 比较并交换当前版本并写入新版本，基准版本已被其他修改取代时抛出版本冲突
+            VolunteerPlanService._add_plan_version(new_plan, base_version)
+            new_plan_id = new_plan.id
+            
+            # 6. 处理未修改的批次 - 新版本直接引用当前版本的院校记录(写时复制)，不再复制院校和专业。
+            # 只读阶段之后源版本可能已被归档(院校已转交或删除)：锁定源版本行(与归档互斥)后复核，
+            # 已归档时改为从归档文档恢复
+            if shared_colleges:
+                source_archived = db.session.query(StudentVolunteerPlan.is_archived).filter(
+                    StudentVolunteerPlan.id == current_plan.id
+                ).with_for_update().scalar()
+                if source_archived:
+                    shared_colleges = []
+                    archived_colleges = unmodified_archived_colleges()
+            if shared_colleges:
+                db.session.bulk_save_objects([
+                    PlanVolunteerLink(
+                        plan_id=new_plan_id,
+                        volunteer_college_id=college.id,
+                        group_id=college.group_id,
+                        volunteer_index=college.volunteer_index
+                    )
+                    for college in shared_colleges
+                ])
+                db.session.flush()
+            if archived_colleges:
+                VolunteerPlanService._restore_archived_volunteers(new_plan_id, archived_colleges)
             
-            # 6. 处理修改的批次 - 使用前端数据并补充完整信息
+            # 7. 处理修改的批次 - 使用前端数据并补充完整信息
             if update_data.get('colleges'):
-                # 导入必要的类
-                from app.core.recommendation.repository import CollegeRepository
-                from app.services.student.student_data_service import StudentDataService
-                from app.models.zwh_xgk_fenzu_2025 import ZwhXgkFenzu2025
-                from app.models.zwh_xgk_yuanxiao_2025 import ZwhXgkYuanxiao2025
-                from app.models.zwh_xgk_fenshuxian_2025 import ZwhXgkFenshuxian2025
-                from app.models.zwh_areas import ZwhAreas
-                
-                # 获取推荐信息用于查询完整数据
-                student_data = StudentDataService.extract_college_recommendation_data(student_id)
-                subject_type = int(student_data.get('subject_type') or 1)
-                education_level = int(student_data.get('education_level') or 11)
-                student_subjects = student_data.get('student_subjects', {})  # 获取学生选科情况
-                
-                # 收集需要查询的ID
-                college_group_ids = []
-                
-                for college in update_data['colleges']:
-                    college_group_ids.append(college.get('college_group_id'))
-                
-                # 查询院校组详细信息
-                college_group_details = {}
-                if college_group_ids:
-                    # 查询院校详细信息和投档线信息
-                    college_groups = db.session.query(
-                        ZwhXgkFenzu2025.cgid,
-                        ZwhXgkFenzu2025.minxuefei,
-                        ZwhXgkFenzu2025.maxxuefei,
-                        ZwhXgkFenzu2025.cgname,
-                        ZwhXgkYuanxiao2025.tese,
-                        ZwhXgkYuanxiao2025.leixing,
-                        ZwhXgkYuanxiao2025.xingzhi,
-                        ZwhXgkYuanxiao2025.teshu,
-                        ZwhXgkYuanxiao2025.uncode,
-                        ZwhAreas.aname.label('area_name'),
-                        ZwhAreas.aid.label('area_id'),  # 添加地区ID用于获取完整路径
-                        ZwhXgkFenshuxian2025.yuce.label('prediction_score'),
-                        ZwhXgkFenshuxian2025.csbplannum.label('plan_number'),
-                    ).join(
-                        ZwhXgkYuanxiao2025,
-                        ZwhXgkFenzu2025.newcid == ZwhXgkYuanxiao2025.cid
-                    ).join(
-                        ZwhAreas,
-                        ZwhXgkYuanxiao2025.aid == ZwhAreas.aid
-                    ).outerjoin(
-                        ZwhXgkFenshuxian2025,
-                        db.and_(
-                            ZwhXgkFenshuxian2025.cgid == ZwhXgkFenzu2025.cgid,
-                            ZwhXgkFenshuxian2025.spid == 32767,
-                            ZwhXgkFenshuxian2025.suid == subject_type,
-                            ZwhXgkFenshuxian2025.newbid == education_level
-                        )
-                    ).filter(
-                        ZwhXgkFenzu2025.cgid.in_(college_group_ids)
-                    ).all()
-                    
-                    # 处理院校类型、特色等文本
-                    for group in college_groups:
-                        tese_text = CollegeRepository.convert_code_to_text(group.tese, 'tese')
-                        leixing_text = CollegeRepository.convert_code_to_text(group.leixing, 'leixing')
-                        teshu_text = CollegeRepository.convert_code_to_text(group.teshu, 'teshu')
-                        
-                        # 获取完整地区路径
-                        area_path = CollegeRepository.get_complete_area_path(group.area_id)
-                        complete_area_name = ''.join([area['aname'] for area in area_path[1:]]) if len(area_path) > 1 else group.area_name
-                        
-                        # xingzhi为1表示公办，否则为民办
-                        nature = '公办' if group.xingzhi == 1 else '民办'
-                        
-                        college_group_details[group.cgid] = {
-                            'min_tuition': group.minxuefei,
-                            'max_tuition': group.maxxuefei,
-                            'group_name': group.cgname,
-                            'area_name': complete_area_name,  # 使用完整地区名称
-                            'tese_text': tese_text,
-                            'leixing_text': leixing_text[0] if leixing_text else '',
-                            'teshu_text': teshu_text,
-                            'uncode': group.uncode,
-                            'nature': nature,  # 使用正确的学校性质
-                            'subject_requirements': student_subjects,  # 使用学生选科情况
-                            'prediction_score': group.prediction_score,
-                            'plan_number': group.plan_number
-                        }
-                
-                # 处理专业详细信息 - 按(cgid, spid)组合查询
-                specialty_details = {}
-                
-                # 对每个院校和专业组合进行查询
-                for college in update_data['colleges']:
-                    college_group_id = int(college.get('college_group_id', 0))
-                    for specialty_data in college.get('specialties', []):
-                        specialty_id = int(specialty_data.get('specialty_id', 0))
-                        
-                        # 查询此专业在此院校组的信息
-                        specialty = db.session.query(
-                            ZwhXgkFenshuxian2025.id.label('fenshuxian_id'),
-                            ZwhXgkFenshuxian2025.tuitions,
-                            ZwhXgkFenshuxian2025.yuce,
-                            ZwhXgkFenshuxian2025.csbplannum
-                        ).filter(
-                            ZwhXgkFenshuxian2025.cgid == college_group_id,
-                            ZwhXgkFenshuxian2025.spid == specialty_id,
-                            ZwhXgkFenshuxian2025.suid == subject_type,
-                            ZwhXgkFenshuxian2025.newbid == education_level
-                        ).first()
-                        
-                        if specialty:
-                            key = (college_group_id, specialty_id)
-                            specialty_details[key] = {
-                                'fenshuxian_id': specialty.fenshuxian_id,
-                                'tuition': specialty.tuitions,
-                                'prediction_score': specialty.yuce,
-                                'plan_number': specialty.csbplannum
-                            }
-                
                 # 处理修改的院校数据
                 colleges_to_add = []
                 
@@ -502,12 +637,7 @@ class VolunteerPlanService:
                             college_id = college_id_map[volunteer_key]
                             current_app.logger.info(f"找到对应院校ID: {college_id}")
                             
-                            # 先删除该院校下所有现有专业
-                            db.session.query(VolunteerSpecialty).filter(
-                                VolunteerSpecialty.volunteer_college_id == college_id
-                            ).delete(synchronize_session=False)
-                            db.session.flush()
-                            
+                            # 院校均为本次新建，尚无专业记录，无需逐个删除旧专业
                             for specialty_data in college_data.get('specialties', []):
                                 specialty_id = int(specialty_data.get('specialty_id', 0))
                                 specialty_index = int(specialty_data.get('specialty_index', 1))
@@ -547,12 +677,19 @@ class VolunteerPlanService:
                         db.session.bulk_save_objects(specialties_to_add)
                         db.session.flush()
                 
-            # 7. 提交事务 - 只在所有操作完成后执行一次
+            # 8. 提交事务 - 只在所有操作完成后执行一次
             db.session.commit()
             
-            # 8. 返回新版本的方案
+            # 9. 复用内容未变化类别的AI分析，变化的类别重新提交分析任务；超出保留数量的旧版本投递归档任务
+            from app.tasks.volunteer_tasks import refresh_plan_analyses, schedule_plan_compaction
+            refresh_plan_analyses(current_plan.id, new_plan_id)
+            schedule_plan_compaction(student_id)
+            
+            # 10. 返回新版本的方案
             return VolunteerPlanService.get_volunteer_plan(new_plan_id)
             
+        except PlanVersionConflictError:
+            raise
         except Exception as e:
             # 任何异常都回滚事务
             db.session.rollback()
@@ -562,9 +699,9 @@ class VolunteerPlanService:
     @staticmethod
     def create_empty_plan(student_id, planner_id, remarks, user_data_hash=None, 
                         generation_status='pending', generation_progress=0, 
-                        generation_message=None,student_data_snapshot=None):
+                        generation_message=None,student_data_snapshot=None, base_version=None):
         """
-        创建空的志愿方案
+        创建空的志愿方案(新版本)，与修改方案使用相同的版本写入方式(见 _add_plan_version)
         
         :param student_id: 学生ID
         :param planner_id: 规划师ID
@@ -573,30 +710,21 @@ class VolunteerPlanService:
         :param generation_status: 生成状态
         :param generation_progress: 生成进度
         :param generation_message: 生成消息
+        :param base_version: 基准版本号(学生还没有方案时为0)，默认为当前最新版本
         :return: 创建的志愿方案
+        :raises PlanVersionConflictError: 基准版本已不是最新版本
         """
         try:
-            # 获取最新版本号
-            latest_plan = StudentVolunteerPlan.query.filter_by(
-                student_id=student_id
-            ).order_by(StudentVolunteerPlan.version.desc()).first()
-            
-            new_version = 1
-            if latest_plan:
-                new_version = latest_plan.version + 1
-                
-                # 将所有之前的方案设置为非当前版本
-                db.session.query(StudentVolunteerPlan).filter(
-                    StudentVolunteerPlan.student_id == student_id,
-                    StudentVolunteerPlan.is_current == True
-                ).update({"is_current": False}, synchronize_session=False)
+            if base_version is None:
+                latest_plan = StudentVolunteerPlan.query.filter_by(
+                    student_id=student_id
+                ).order_by(StudentVolunteerPlan.version.desc()).first()
+                base_version = latest_plan.version if latest_plan else 0
             
             # 创建新的志愿方案
             plan = StudentVolunteerPlan(
                 student_id=student_id,
                 planner_id=planner_id,
-                version=new_version,
-                is_current=True,
                 remarks=remarks,
                 user_data_hash=user_data_hash,
                 generation_status=generation_status,
@@ -605,7 +733,7 @@ class VolunteerPlanService:
                 student_data_snapshot=student_data_snapshot
             )
             
-            db.session.add(plan)
+            VolunteerPlanService._add_plan_version(plan, base_version)
             db.session.commit()
             
             return plan.to_dict()
@@ -614,6 +742,435 @@ class VolunteerPlanService:
             current_app.logger.error(f"创建空志愿方案失败: {str(e)}")
             raise
 
+    @staticmethod
+    def copy_plan_segment(source_plan_id, target_plan_id, group_id, exclude_group_ids=None):
+        """
+        将源方案中某个志愿段的院校及专业共享给目标方案(只写入引用，不复制院校和专业)
+        
+        :param source_plan_id: 源志愿方案ID
+        :param target_plan_id: 目标志愿方案ID
+        :param group_id: 志愿段ID(1-12)
+        :param exclude_group_ids: 目标方案中已使用的院校专业组ID，与之冲突时放弃复用
+        :return: 复用的院校专业组ID列表，未复用时返回空列表
+        """
+        source_colleges = VolunteerCollege.query_for_plan(source_plan_id).filter(
+            VolunteerCollege.group_id == group_id
+        ).order_by(VolunteerCollege.volunteer_index).all()
+        if not source_colleges:
+            return []
+
+        if exclude_group_ids and any(c.college_group_id in exclude_group_ids for c in source_colleges):
+            return []
+
+        try:
+            db.session.bulk_save_objects([
+                PlanVolunteerLink(
+                    plan_id=target_plan_id,
+                    volunteer_college_id=college.id,
+                    group_id=college.group_id,
+                    volunteer_index=college.volunteer_index
+                )
+                for college in source_colleges
+            ])
+            db.session.commit()
+            return [college.college_group_id for college in source_colleges]
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            current_app.logger.error(f"复用志愿段失败: {str(e)}")
+            return []
+
+    @staticmethod
+    def _column_values(row, excluded=('id', 'created_at', 'updated_at')):
+        """复制记录时使用的字段值(不含主键和时间戳)"""
+        return {
+            column.key: getattr(row, column.key)
+            for column in row.__table__.columns
+            if column.key not in excluded
+        }
+
+    @staticmethod
+    def transfer_shared_volunteers(plan_id, college_ids):
+        """
+        把方案自有、仍被其他版本共享的院校志愿转交给最早引用它的版本，并删除该版本对应的共享记录，
+        其余共享方继续引用(不提交事务)
+
+        :param plan_id: 原所属志愿方案ID
+        :param college_ids: 原所属方案的院校志愿ID列表
+        :return: 字典 {院校志愿ID: 接收的志愿方案ID}
+        """
+        if not college_ids:
+            return {}
+
+        adopters = {}
+        links = PlanVolunteerLink.query.filter(
+            PlanVolunteerLink.volunteer_college_id.in_(college_ids),
+            PlanVolunteerLink.plan_id != plan_id
+        ).order_by(PlanVolunteerLink.plan_id).all()
+        for link in links:
+            adopters.setdefault(link.volunteer_college_id, link)
+
+        for college_id, link in adopters.items():
+            db.session.query(VolunteerCollege).filter(
+                VolunteerCollege.id == college_id
+            ).update({'plan_id': link.plan_id})
+            db.session.delete(link)
+
+        return {college_id: link.plan_id for college_id, link in adopters.items()}
+
+    @staticmethod
+    def resolve_volunteer_plan_id(college):
+        """
+        院校志愿默认所属的方案版本(未指定发起修改的方案时使用)：
+
+        院校可能属于旧版本并共享给后续版本，默认取包含该院校的学生当前版本，
+        当前版本不包含该院校时取包含它的最新版本
+
+        :param college: 院校志愿
+        :return: 志愿方案ID
+        """
+        plan_ids = {college.plan_id} | {
+            plan_id for (plan_id,) in db.session.query(PlanVolunteerLink.plan_id).filter(
+                PlanVolunteerLink.volunteer_college_id == college.id
+            )
+        }
+        if len(plan_ids) == 1:
+            return college.plan_id
+        plans = StudentVolunteerPlan.query.filter(StudentVolunteerPlan.id.in_(plan_ids)).all()
+        return max(plans, key=lambda plan: (plan.is_current, plan.version)).id
+
+    @staticmethod
+    def detach_shared_volunteer(plan_id, college):
+        """
+        写时复制：修改院校志愿或其专业(如写入AI解析)前调用，保证修改只作用于指定的方案版本(不提交事务)
+
+        - 院校为其他版本共享给本方案的：为本方案克隆院校及专业，删除本方案的共享记录；
+        - 院校为本方案自有且仍被其他版本共享的：原记录转交给最早引用它的版本，本方案改用克隆；
+        - 院校未被共享的：直接返回原记录。
+
+        :param plan_id: 发起修改的志愿方案ID
+        :param college: 方案实际生效的院校志愿
+        :return: 本方案独占的院校志愿(可能是新记录)
+        """
+        if college.plan_id == plan_id:
+            shared = db.session.query(PlanVolunteerLink.id).filter(
+                PlanVolunteerLink.volunteer_college_id == college.id
+            ).first()
+            if not shared:
+                return college
+            VolunteerPlanService.transfer_shared_volunteers(plan_id, [college.id])
+        else:
+            link = PlanVolunteerLink.query.filter_by(plan_id=plan_id, volunteer_college_id=college.id).first()
+            if not link:
+                raise ValueError(f"院校志愿{college.id}不属于志愿方案{plan_id}")
+            db.session.delete(link)
+
+        values = VolunteerPlanService._column_values(college, excluded=('id', 'plan_id', 'created_at', 'updated_at'))
+        clone = VolunteerCollege(plan_id=plan_id, **values)
+        db.session.add(clone)
+        db.session.flush()
+
+        specialties = VolunteerSpecialty.query.filter_by(volunteer_college_id=college.id).options(
+            db.undefer_group(DEFERRED_GROUP_AI_ANALYSIS)
+        ).all()
+        db.session.add_all([
+            VolunteerSpecialty(**dict(
+                VolunteerPlanService._column_values(specialty), volunteer_college_id=clone.id
+            ))
+            for specialty in specialties
+        ])
+        db.session.flush()
+        return clone
+
+    @staticmethod
+    def delete_volunteer_plan(plan_id):
+        """
+        删除志愿方案历史版本
+
+        方案自有的院校志愿仍被其他版本共享的，先转交给最早引用它的版本，避免级联删除使这些版本丢失志愿；
+        其余院校、专业、共享记录、类别分析和归档随方案删除。当前版本不能删除。
+
+        :param plan_id: 志愿方案ID
+        :return: 是否已删除
+        """
+        try:
+            plan = StudentVolunteerPlan.query.filter_by(id=plan_id).with_for_update().first()
+            if not plan or plan.is_current:
+                db.session.rollback()
+                return False
+
+            owned_ids = [
+                college_id for (college_id,) in db.session.query(VolunteerCollege.id).filter(
+                    VolunteerCollege.plan_id == plan_id
+                )
+            ]
+            adopters = VolunteerPlanService.transfer_shared_volunteers(plan_id, owned_ids)
+
+            removed_ids = [college_id for college_id in owned_ids if college_id not in adopters]
+            if removed_ids:
+                db.session.query(VolunteerSpecialty).filter(
+                    VolunteerSpecialty.volunteer_college_id.in_(removed_ids)
+                ).delete(synchronize_session=False)
+                db.session.query(VolunteerCollege).filter(
+                    VolunteerCollege.id.in_(removed_ids)
+                ).delete(synchronize_session=False)
+            db.session.query(PlanVolunteerLink).filter(
+                PlanVolunteerLink.plan_id == plan_id
+            ).delete(synchronize_session=False)
+            db.session.query(VolunteerCategoryAnalysis).filter(
+                VolunteerCategoryAnalysis.plan_id == plan_id
+            ).delete(synchronize_session=False)
+            db.session.query(VolunteerPlanArchive).filter(
+                VolunteerPlanArchive.plan_id == plan_id
+            ).delete(synchronize_session=False)
+
+            db.session.delete(plan)
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            current_app.logger.error(f"删除志愿方案失败, 方案ID: {plan_id}, 错误: {str(e)}")
+            raise
+
+        for affected_plan_id in {plan_id, *adopters.values()}:
+            PlanDocumentCache.invalidate(affected_plan_id)
+        return True
+
+    @staticmethod
+    def _plan_diff_projection(plan):
+        """
+        获取用于版本对比的方案投影数据(不加载AI解析、快照等大字段)
+        
+        :param plan: 志愿方案对象
+        :return: 字典 {(志愿段ID, 志愿序号): 志愿信息}，不同志愿段可以使用相同的志愿序号
+        """
+        if plan.is_archived:
+            return VolunteerPlanService._archived_diff_projection(plan.id)
+        
+        plan_id = plan.id
+        colleges = db.session.query(
+            VolunteerCollege.id,
+            VolunteerCollege.category_id,
+            VolunteerCollege.group_id,
+            VolunteerCollege.volunteer_index,
+            VolunteerCollege.college_id,
+            VolunteerCollege.college_name,
+            VolunteerCollege.college_group_id,
+            VolunteerCollege.group_name,
+            VolunteerCollege.score_diff,
+            VolunteerCollege.recommend_type
+        ).filter(
+            VolunteerCollege.plan_filter(plan_id)
+        ).all()
+        
+        specialties_by_college = {}
+        if colleges:
+            specialties = db.session.query(
+                VolunteerSpecialty.volunteer_college_id,
+                VolunteerSpecialty.specialty_id,
+                VolunteerSpecialty.specialty_name,
+                VolunteerSpecialty.specialty_index
+            ).filter(
+                VolunteerSpecialty.volunteer_college_id.in_([college.id for college in colleges])
+            ).all()
+            for specialty in specialties:
+                specialties_by_college.setdefault(specialty.volunteer_college_id, []).append(specialty)
+        
+        volunteers = {}
+        for college in colleges:
+            specialties = sorted(
+                specialties_by_college.get(college.id, []),
+                key=lambda specialty: specialty.specialty_index
+            )
+            volunteers[(college.group_id, college.volunteer_index)] = {
+                'category_id': college.category_id,
+                'group_id': college.group_id,
+                'volunteer_index': college.volunteer_index,
+                'college_id': college.college_id,
+                'college_name': college.college_name,
+                'college_group_id': college.college_group_id,
+                'group_name': college.group_name,
+                'score_diff': college.score_diff,
+                'recommend_type': college.recommend_type,
+                'specialties': [
+                    {
+                        'specialty_id': specialty.specialty_id,
+                        'specialty_name': specialty.specialty_name,
+                        'specialty_index': specialty.specialty_index
+                    }
+                    for specialty in specialties
+                ]
+            }
+        return volunteers
+    
+    @staticmethod
+    def _archived_diff_projection(plan_id):
+        """
+        已归档方案的版本对比投影数据，字段与 _plan_diff_projection 一致
+        
+        :param plan_id: 志愿方案ID
+        :return: 字典 {(志愿段ID, 志愿序号): 志愿信息}
+        """
+        volunteers = {}
+        for college in VolunteerPlanArchive.load_document(plan_id)['colleges']:
+            specialties = sorted(college.get('specialties', []), key=lambda specialty: specialty['specialty_index'])
+            volunteers[(college['group_id'], college['volunteer_index'])] = {
+                'category_id': college['category_id'],
+                'group_id': college['group_id'],
+                'volunteer_index': college['volunteer_index'],
+                'college_id': college['college_id'],
+                'college_name': college['college_name'],
+                'college_group_id': college['college_group_id'],
+                'group_name': college['group_name'],
+                'score_diff': college['score_diff'],
+                'recommend_type': college['recommend_type'],
+                'specialties': [
+                    {
+                        'specialty_id': specialty['specialty_id'],
+                        'specialty_name': specialty['specialty_name'],
+                        'specialty_index': specialty['specialty_index']
+                    }
+                    for specialty in specialties
+                ]
+            }
+        return volunteers
+    
+    @staticmethod
+    def _diff_specialties(old_specialties, new_specialties):
+        """
+        对比同一志愿下的专业变化
+        
+        :return: 变化字典，无变化时返回None
+        """
+        old_map = {specialty['specialty_id']: specialty for specialty in old_specialties}
+        new_map = {specialty['specialty_id']: specialty for specialty in new_specialties}
+        
+        added = [specialty for specialty_id, specialty in new_map.items() if specialty_id not in old_map]
+        removed = [specialty for specialty_id, specialty in old_map.items() if specialty_id not in new_map]
+        moved = [
+            {
+                'specialty_id': specialty_id,
+                'specialty_name': specialty['specialty_name'],
+                'from_index': old_map[specialty_id]['specialty_index'],
+                'to_index': specialty['specialty_index']
+            }
+            for specialty_id, specialty in new_map.items()
+            if specialty_id in old_map and old_map[specialty_id]['specialty_index'] != specialty['specialty_index']
+        ]
+        
+        if not (added or removed or moved):
+            return None
+        return {'added': added, 'removed': removed, 'moved': moved}
+    
+    @staticmethod
+    def diff_volunteer_plans(plan_id, other_plan_id):
+        """
+        对比两个志愿方案版本的差异
+        
+        两个版本的志愿按(志愿段, 志愿序号)取出，并各建立一次院校专业组ID到志愿位置的索引，一次遍历得出：
+        新增(added)、删除(removed)、位置变化(moved)和专业变化(changed)。
+        院校专业组在两个版本中都只出现一次时按院校专业组对应，位置不同即为位置变化；
+        在任一版本中出现多次(如不同志愿段填报同一专业组)时只按相同位置对应，不判断位置变化。
+        两个版本都已生成完成时结果不再变化，缓存一天。
+        
+        :param plan_id: 基准志愿方案ID
+        :param other_plan_id: 对比的志愿方案ID
+        :return: 差异字典
+        :raises ValueError: 两个方案不属于同一学生
+        """
+        base_plan = StudentVolunteerPlan.query.get_or_404(plan_id)
+        other_plan = StudentVolunteerPlan.query.get_or_404(other_plan_id)
+        if base_plan.student_id != other_plan.student_id:
+            raise ValueError("只能对比同一学生的志愿方案")
+        
+        finished_statuses = (
+            StudentVolunteerPlan.GENERATION_STATUS_SUCCESS,
+            StudentVolunteerPlan.GENERATION_STATUS_FAILED
+        )
+        cacheable = (
+            base_plan.generation_status in finished_statuses
+            and other_plan.generation_status in finished_statuses
+        )
+        cache_key = f"plan_diff:{plan_id}:{other_plan_id}"
+        if cacheable:
+            cached_result = cache.get(cache_key)
+            if cached_result:
+                return cached_result
+        
+        old_volunteers = VolunteerPlanService._plan_diff_projection(base_plan)
+        new_volunteers = VolunteerPlanService._plan_diff_projection(other_plan)
+        
+        old_cgid_counts = Counter(volunteer['college_group_id'] for volunteer in old_volunteers.values())
+        new_cgid_counts = Counter(volunteer['college_group_id'] for volunteer in new_volunteers.values())
+        old_position_by_cgid = {
+            volunteer['college_group_id']: position for position, volunteer in old_volunteers.items()
+            if old_cgid_counts[volunteer['college_group_id']] == 1
+        }
+        
+        added = []
+        moved = []
+        changed = []
+        matched_positions = set()
+        unchanged_count = 0
+        for position, volunteer in new_volunteers.items():
+            cgid = volunteer['college_group_id']
+            if new_cgid_counts[cgid] == 1 and cgid in old_position_by_cgid:
+                old_key = old_position_by_cgid[cgid]
+            elif old_volunteers.get(position, {}).get('college_group_id') == cgid:
+                old_key = position
+            else:
+                added.append(volunteer)
+                continue
+            
+            matched_positions.add(old_key)
+            old_volunteer = old_volunteers[old_key]
+            old_position = (old_volunteer['category_id'], old_volunteer['group_id'], old_volunteer['volunteer_index'])
+            new_position = (volunteer['category_id'], volunteer['group_id'], volunteer['volunteer_index'])
+            position_changed = old_position != new_position
+            if position_changed:
+                moved.append({
+                    'college_group_id': cgid,
+                    'college_name': volunteer['college_name'],
+                    'from': dict(zip(('category_id', 'group_id', 'volunteer_index'), old_position)),
+                    'to': dict(zip(('category_id', 'group_id', 'volunteer_index'), new_position))
+                })
+            
+            specialty_changes = VolunteerPlanService._diff_specialties(
+                old_volunteer['specialties'], volunteer['specialties']
+            )
+            if specialty_changes:
+                changed.append({
+                    'college_group_id': cgid,
+                    'college_name': volunteer['college_name'],
+                    'group_id': volunteer['group_id'],
+                    'volunteer_index': volunteer['volunteer_index'],
+                    'specialties': specialty_changes
+                })
+            elif not position_changed:
+                unchanged_count += 1
+        
+        removed = [
+            volunteer for position, volunteer in old_volunteers.items() if position not in matched_positions
+        ]
+        
+        def position_of(volunteer):
+            return (volunteer['group_id'], volunteer['volunteer_index'])
+        
+        result = {
+            'plan_id': plan_id,
+            'other_plan_id': other_plan_id,
+            'version': base_plan.version,
+            'other_version': other_plan.version,
+            'added': sorted(added, key=position_of),
+            'removed': sorted(removed, key=position_of),
+            'moved': sorted(moved, key=lambda v: position_of(v['to'])),
+            'changed': sorted(changed, key=position_of),
+            'unchanged_count': unchanged_count
+        }
+        
+        if cacheable:
+            cache.set(cache_key, result, timeout=86400)  # 一天
+        
+        return result
+
     @staticmethod
     def add_volunteer_college(plan_id, college_data):
         """
@@ -728,10 +1285,86 @@ class VolunteerPlanService:
             current_app.logger.error(f"添加专业志愿失败: {str(e)}")
             raise
 
+    @staticmethod
+    def _upsert_rows(model, rows, conflict_columns, update_columns):
+        """
+        批量插入或更新(单条语句)，MySQL使用 INSERT ... ON DUPLICATE KEY UPDATE，
+        SQLite、PostgreSQL使用 INSERT ... ON CONFLICT DO UPDATE，其他数据库使用 _upsert_rows_generic
+        
+        :param model: 模型类
+        :param rows: 行数据字典列表
+        :param conflict_columns: 唯一键列名(SQLite需要显式指定冲突列)
+        :param update_columns: 冲突时需要更新的列名
+        :return: 受影响的行数
+        """
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'mysql':
+            from sqlalchemy.dialects.mysql import insert
+            stmt = insert(model.__table__).values(rows)
+            stmt = stmt.on_duplicate_key_update({
+                column: stmt.inserted[column] for column in update_columns
+            })
+        elif dialect in ('sqlite', 'postgresql'):
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            stmt = insert(model.__table__).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=conflict_columns,
+                set_={column: stmt.excluded[column] for column in update_columns}
+            )
+        else:
+            return VolunteerPlanService._upsert_rows_generic(model, rows, conflict_columns, update_columns)
+        
+        result = db.session.execute(stmt)
+        return result.rowcount
+
+    @staticmethod
+    def _upsert_rows_generic(model, rows, conflict_columns, update_columns):
+        """
+        不支持插入冲突更新语法的数据库使用的批量插入或更新：在当前事务中先按唯一键查出已存在的行，
+        再分别批量更新和批量插入(共三次数据库往返)，同一唯一键出现多次时以最后一行为准
+        
+        参数与返回值同 _upsert_rows
+        """
+        table = model.__table__
+        rows_by_key = {tuple(row[column] for column in conflict_columns): row for row in rows}
+        
+        # 按唯一键的第一列缩小范围，再在内存中按完整唯一键匹配
+        first_column = conflict_columns[0]
+        existing_ids = {}
+        existing_rows = db.session.execute(
+            db.select(table.c.id, *[table.c[column] for column in conflict_columns]).where(
+                table.c[first_column].in_({key[0] for key in rows_by_key})
+            ).with_for_update()
+        )
+        for existing in existing_rows:
+            key = tuple(existing._mapping[column] for column in conflict_columns)
+            if key in rows_by_key:
+                existing_ids[key] = existing.id
+        
+        updates = [
+            dict({f"new_{column}": row[column] for column in update_columns}, target_id=existing_ids[key])
+            for key, row in rows_by_key.items() if key in existing_ids
+        ]
+        inserts = [row for key, row in rows_by_key.items() if key not in existing_ids]
+        
+        if updates:
+            db.session.execute(
+                table.update().where(table.c.id == db.bindparam('target_id')).values({
+                    column: db.bindparam(f"new_{column}") for column in update_columns
+                }),
+                updates
+            )
+        if inserts:
+            db.session.execute(table.insert(), inserts)
+        return len(updates) + len(inserts)
+
     @staticmethod
     def batch_add_volunteer_colleges(plan_id, colleges_data):
         """
-        批量添加院校志愿
+        批量添加院校志愿，已存在的志愿(同一志愿段同一序号)直接覆盖，一次数据库往返完成
         
         :param plan_id: 志愿方案ID
         :param colleges_data: 院校志愿数据列表
@@ -739,101 +1372,58 @@ class VolunteerPlanService:
         """
         try:
             current_app.logger.info(f"批量添加院校志愿, {len(colleges_data)} 个院校")
+            if not colleges_data:
+                return {'plan_id': plan_id, 'affected_rows': 0, 'total_count': 0}
             
-            # 获取现有院校志愿的序号
-            existing_indexes = {c.volunteer_index for c in 
-                            VolunteerCollege.query.filter_by(plan_id=plan_id).all()}
-            
-            colleges_to_add = []
-            colleges_to_update = []
-            
-            # 分类需要添加和更新的院校志愿
+            now = datetime.now(timezone.utc)
+            rows = []
             for college_data in colleges_data:
                 # 确保所有数值字段都为有效的整数
-                volunteer_index = int(college_data.get('volunteer_index', 0) or 0)
-                category_id = int(college_data.get('category_id', 0) or 0)
-                group_id = int(college_data.get('group_id', 0) or 0)
-                college_id = int(college_data.get('college_id', 0) or 0)
-                college_group_id = int(college_data.get('college_group_id', 0) or 0)
-                score_diff = int(college_data.get('score_diff', 0) or 0)
-                prediction_score = int(college_data.get('prediction_score', 0) or 0)
-                
-                if volunteer_index in existing_indexes:
-                    # 获取现有院校志愿进行更新
-                    college = VolunteerCollege.query.filter_by(
-                        plan_id=plan_id, 
-                        volunteer_index=volunteer_index
-                    ).first()
-                    
-                    # 更新字段
-                    college.category_id = category_id
-                    college.group_id = group_id
-                    college.college_id = college_id
-                    college.college_name = college_data.get('college_name', '')
-                    college.college_group_id = college_group_id
-                    college.score_diff = score_diff
-                    college.prediction_score = prediction_score
-                    college.recommend_type = college_data.get('recommend_type', VolunteerCollege.RECOMMEND_AI)
-                    college.ai_analysis = college_data.get('ai_analysis', ''),
-                    college.area_name=college_data.get('area_name'),
-                    college.group_name=college_data.get('group_name'),
-                    college.min_tuition=college_data.get('min_tuition'),
-                    college.max_tuition=college_data.get('max_tuition'),
-                    college.min_score=college_data.get('min_score'),
-                    college.plan_number=college_data.get('plan_number'),
-                    college.school_type_text=college_data.get('school_type_text'),
-                    college.subject_requirements=college_data.get('subject_requirements'),
-                    college.tese_text=college_data.get('tese_text'),
-                    college.teshu_text=college_data.get('teshu_text'),
-                    college.uncode=college_data.get('uncode'),
-                    college.nature=college_data.get('nature'),
-                    
-                    colleges_to_update.append(college)
-                else:
-                    # 创建新的院校志愿
-                    college = VolunteerCollege(
-                        plan_id=plan_id,
-                        category_id=category_id,
-                        group_id=group_id,
-                        volunteer_index=volunteer_index,
-                        college_id=college_id,
-                        college_name=college_data.get('college_name', ''),
-                        college_group_id=college_group_id,
-                        score_diff=score_diff,
-                        prediction_score=prediction_score,
-                        recommend_type=college_data.get('recommend_type', VolunteerCollege.RECOMMEND_AI),
-                        ai_analysis=college_data.get('ai_analysis'),
-                        area_name=college_data.get('area_name'),
-                        group_name=college_data.get('group_name'),
-                        min_tuition=college_data.get('min_tuition'),
-                        max_tuition=college_data.get('max_tuition'),
-                        min_score=college_data.get('min_score'),
-                        plan_number=college_data.get('plan_number'),
-                        school_type_text=college_data.get('school_type_text'),
-                        subject_requirements=college_data.get('subject_requirements'),
-                        tese_text=college_data.get('tese_text'),
-                        teshu_text=college_data.get('teshu_text'),
-                        uncode=college_data.get('uncode'),
-                        nature=college_data.get('nature'),
-                    )
-                    colleges_to_add.append(college)
-            
-            # 批量添加新院校志愿
-            if colleges_to_add:
-                db.session.bulk_save_objects(colleges_to_add)
-            
-            # 批量更新现有院校志愿
-            if colleges_to_update:
-                for college in colleges_to_update:
-                    db.session.add(college)
+                rows.append({
+                    'plan_id': plan_id,
+                    'category_id': int(college_data.get('category_id', 0) or 0),
+                    'group_id': int(college_data.get('group_id', 0) or 0),
+                    'volunteer_index': int(college_data.get('volunteer_index', 0) or 0),
+                    'college_id': int(college_data.get('college_id', 0) or 0),
+                    'college_name': college_data.get('college_name', ''),
+                    'college_group_id': int(college_data.get('college_group_id', 0) or 0),
+                    'score_diff': int(college_data.get('score_diff', 0) or 0),
+                    'prediction_score': int(college_data.get('prediction_score', 0) or 0),
+                    'recommend_type': college_data.get('recommend_type', VolunteerCollege.RECOMMEND_AI),
+                    'ai_analysis': college_data.get('ai_analysis'),
+                    'area_name': college_data.get('area_name'),
+                    'group_name': college_data.get('group_name'),
+                    'min_tuition': college_data.get('min_tuition'),
+                    'max_tuition': college_data.get('max_tuition'),
+                    'min_score': college_data.get('min_score'),
+                    'plan_number': college_data.get('plan_number'),
+                    'school_type_text': college_data.get('school_type_text'),
+                    'subject_requirements': college_data.get('subject_requirements'),
+                    'tese_text': college_data.get('tese_text'),
+                    'teshu_text': college_data.get('teshu_text'),
+                    'uncode': college_data.get('uncode'),
+                    'nature': college_data.get('nature'),
+                    'created_at': now,
+                    'updated_at': now
+                })
             
+            # 唯一键(plan_id, group_id, volunteer_index)冲突时只更新传入数据中出现的字段，
+            # 未传入的字段(如已有的AI解析)保持不变
+            conflict_columns = ['plan_id', 'group_id', 'volunteer_index']
+            provided_columns = {key for college_data in colleges_data for key in college_data.keys()}
+            update_columns = [
+                column for column in rows[0].keys()
+                if column in provided_columns and column not in conflict_columns and column != 'created_at'
+            ] + ['updated_at']
+            affected_rows = VolunteerPlanService._upsert_rows(
+                VolunteerCollege, rows, conflict_columns, update_columns
+            )
             db.session.commit()
             
             return {
                 'plan_id': plan_id,
-                'added_count': len(colleges_to_add),
-                'updated_count': len(colleges_to_update),
-                'total_count': len(colleges_to_add) + len(colleges_to_update)
+                'affected_rows': affected_rows,
+                'total_count': len(rows)
             }
             
         except Exception as e:
@@ -844,71 +1434,52 @@ class VolunteerPlanService:
     @staticmethod
     def batch_add_volunteer_specialties(volunteer_college_id, specialties_data):
         """
-        批量添加专业志愿
+        批量添加专业志愿，已存在的专业(同一志愿同一专业序号)直接覆盖，一次数据库往返完成
         
         :param volunteer_college_id: 院校志愿ID
         :param specialties_data: 专业志愿数据列表
         :return: 批量添加结果
         """
         try:
-            # 检查院校志愿是否存在
-            # college = VolunteerCollege.query.get_or_404(volunteer_college_id)
-            
-            # 获取现有专业志愿的序号
-            existing_indexes = {s.specialty_index for s in 
-                              VolunteerSpecialty.query.filter_by(volunteer_college_id=volunteer_college_id).all()}
-            
-            specialties_to_add = []
-            specialties_to_update = []
-            
-            # 分类需要添加和更新的专业志愿
-            for specialty_data in specialties_data:
-                index = specialty_data.get('specialty_index')
-                if index in existing_indexes:
-                    # 获取现有专业志愿进行更新
-                    specialty = VolunteerSpecialty.query.filter_by(
-                        volunteer_college_id=volunteer_college_id, 
-                        specialty_index=index
-                    ).first()
-                    
-                    for key, value in specialty_data.items():
-                        if hasattr(specialty, key):
-                            setattr(specialty, key, value)
-                    
-                    specialties_to_update.append(specialty)
-                else:
-                    # 创建新的专业志愿
-                    specialty = VolunteerSpecialty(
-                        volunteer_college_id=volunteer_college_id,
-                        specialty_id=specialty_data.get('specialty_id'),
-                        specialty_code=specialty_data.get('specialty_code'),
-                        specialty_name=specialty_data.get('specialty_name'),
-                        specialty_index=index,
-                        prediction_score=specialty_data.get('prediction_score'),
-                        plan_number=specialty_data.get('plan_number'),
-                        tuition=specialty_data.get('tuition'),
-                        remarks=specialty_data.get('remarks', ''),
-                        ai_analysis=specialty_data.get('ai_analysis', ''),
-                        fenshuxian_id=specialty_data.get('fenshuxian_id')
-                    )
-                    specialties_to_add.append(specialty)
+            if not specialties_data:
+                return {'volunteer_college_id': volunteer_college_id, 'affected_rows': 0, 'total_count': 0}
             
-            # 批量添加新专业志愿
-            if specialties_to_add:
-                db.session.bulk_save_objects(specialties_to_add)
-            
-            # 批量更新现有专业志愿
-            if specialties_to_update:
-                for specialty in specialties_to_update:
-                    db.session.add(specialty)
+            now = datetime.now(timezone.utc)
+            rows = [
+                {
+                    'volunteer_college_id': volunteer_college_id,
+                    'specialty_id': specialty_data.get('specialty_id'),
+                    'specialty_code': specialty_data.get('specialty_code'),
+                    'specialty_name': specialty_data.get('specialty_name'),
+                    'specialty_index': specialty_data.get('specialty_index'),
+                    'prediction_score': specialty_data.get('prediction_score'),
+                    'plan_number': specialty_data.get('plan_number'),
+                    'tuition': specialty_data.get('tuition'),
+                    'remarks': specialty_data.get('remarks', ''),
+                    'ai_analysis': specialty_data.get('ai_analysis', ''),
+                    'fenshuxian_id': specialty_data.get('fenshuxian_id'),
+                    'created_at': now,
+                    'updated_at': now
+                }
+                for specialty_data in specialties_data
+            ]
             
+            # 唯一键(volunteer_college_id, specialty_index)冲突时只更新传入数据中出现的字段
+            conflict_columns = ['volunteer_college_id', 'specialty_index']
+            provided_columns = {key for specialty_data in specialties_data for key in specialty_data.keys()}
+            update_columns = [
+                column for column in rows[0].keys()
+                if column in provided_columns and column not in conflict_columns and column != 'created_at'
+            ] + ['updated_at']
+            affected_rows = VolunteerPlanService._upsert_rows(
+                VolunteerSpecialty, rows, conflict_columns, update_columns
+            )
             db.session.commit()
             
             return {
                 'volunteer_college_id': volunteer_college_id,
-                'added_count': len(specialties_to_add),
-                'updated_count': len(specialties_to_update),
-                'total_count': len(specialties_to_add) + len(specialties_to_update)
+                'affected_rows': affected_rows,
+                'total_count': len(rows)
             }
             
         except SQLAlchemyError as e:
@@ -1588,15 +2159,23 @@ class VolunteerPlanService:
     #         }
 
 
-def ai_select_college_ids(filtered_colleges, user_info, recommendation_data, is_first=False):
+def ai_select_college_ids(filtered_colleges, user_info, recommendation_data, is_first=False,
+                          solver=None, llm_budget=None):
     """
     AI选择院校ID，基于学生成绩类型选择不同的推荐策略
     
     :param filtered_colleges: 筛选出的院校列表(包含简化数据)
     :param user_info: 用户信息文本
     :param recommendation_data: 学生推荐数据，包含各类成绩信息
-    :return: 选择的院校ID列表
+    :param solver: 本地求解器(PlanSolver)，提供时不调用AI的场景均使用本地求解
+    :param llm_budget: 大模型调用预算(LLMCallBudget)，为None时不限制
+    :return: (选择结果 {cgid: [spid, ...]}, 选择来源 SEGMENT_SOURCE_AI/SEGMENT_SOURCE_LOCAL)
     """
+    def local_recommendation():
+        if solver is not None:
+            return solver.solve(filtered_colleges), SEGMENT_SOURCE_LOCAL
+        return fallback_recommendation(filtered_colleges), SEGMENT_SOURCE_LOCAL
+
     try:
 
         # 检查学生是否有高考成绩
@@ -1605,25 +2184,37 @@ def ai_select_college_ids(filtered_colleges, user_info, recommendation_data, is_
         # 检查学生是否有模考成绩
         latest_mock_score = recommendation_data.get('mock_exam_score', 0) > 0
         if is_first:
-            return fallback_recommendation(filtered_colleges)
+            return local_recommendation()
+
+        # 大模型调用预算耗尽，使用本地求解
+        if llm_budget is not None and not llm_budget.available:
+            current_app.logger.info("大模型调用预算已耗尽，使用本地求解")
+            return local_recommendation()
 
         # 基于成绩类型选择推荐策略
         if has_gaokao_score:
             # 有高考成绩且不是第一次生成方案，使用AI推荐
             current_app.logger.info("学生有高考成绩，使用AI推荐")
-            return ai_recommend_with_score(filtered_colleges, user_info)
+            if llm_budget is not None:
+                llm_budget.consume()
+            selection = ai_recommend_with_score(filtered_colleges, user_info)
+            if solver is not None:
+                solver.register(filtered_colleges, selection)
+            return selection, SEGMENT_SOURCE_AI
         elif latest_mock_score:
 
-            return fallback_recommendation(filtered_colleges)
+            return local_recommendation()
         else:
             # 没有任何成绩，使用备选方案
             current_app.logger.info("学生没有可用成绩，使用备选推荐方案")
-            return fallback_recommendation(filtered_colleges)
+            return local_recommendation()
         
     except Exception as e:
-        # 任何错误时使用备选方案
+        # 任何错误时使用备选方案，并停止后续批次的大模型调用
         current_app.logger.error(f"AI选择院校ID过程中发生错误: {str(e)}")
-        return fallback_recommendation(filtered_colleges)
+        if llm_budget is not None:
+            llm_budget.exhaust()
+        return local_recommendation()
 
 def ai_recommend_with_score(filtered_colleges, user_info):
     """使用AI基于高考成绩推荐院校"""
@@ -1675,7 +2266,58 @@ def fallback_recommendation(filtered_colleges):
     
     return fallback_result
     
-def process_batch(student_id, planner_id, category_id, group_id, plan_id=None, is_first=False):
+def compute_segment_fingerprint(filtered_colleges):
+    """
+    计算志愿段候选集指纹(院校专业组ID及其专业ID)，候选集不变时指纹不变
+    
+    :param filtered_colleges: 志愿段的候选院校专业组列表
+    :return: 指纹字符串
+    """
+    items = sorted(
+        [college['cgid'], sorted(specialty.get('spid') or 0 for specialty in college.get('specialties', []))]
+        for college in filtered_colleges
+    )
+    return hashlib.sha256(json.dumps(items).encode('utf-8')).hexdigest()
+
+def compute_profile_fingerprint(user_info):
+    """
+    计算发送给大模型的学生档案文本的指纹，档案中任何影响AI选择的内容变化时指纹都会变化
+    
+    :param user_info: 学生档案文本
+    :return: 指纹字符串
+    """
+    return hashlib.sha256((user_info or '').encode('utf-8')).hexdigest()
+
+def is_segment_reusable(previous_segment, fingerprint, profile_fingerprint, generation_mode=GENERATION_MODE_AI):
+    """
+    判断上一版本的志愿段能否直接复用
+    
+    候选集指纹必须相同；AI模式下还要求上一版本该志愿段由大模型选择，且选择时的学生档案文本相同，
+    否则(本地求解的结果、档案已变化)重新选择，避免一次回退后本地结果被一直沿用。
+    
+    :param previous_segment: 上一版本 segment_fingerprints 中该志愿段的记录
+                             (字典 {'fingerprint', 'profile', 'source'}，旧数据为候选集指纹字符串)
+    :param fingerprint: 本次候选集指纹
+    :param profile_fingerprint: 本次学生档案指纹
+    :param generation_mode: 生成模式
+    :return: 是否可以复用
+    """
+    if not previous_segment:
+        return False
+    if isinstance(previous_segment, str):
+        # 旧数据只记录了候选集指纹，选择来源未知
+        previous_segment = {'fingerprint': previous_segment}
+    if previous_segment.get('fingerprint') != fingerprint:
+        return False
+    if generation_mode == GENERATION_MODE_SOLVER:
+        return True
+    return previous_segment.get('source') == SEGMENT_SOURCE_AI \
+        and previous_segment.get('profile') == profile_fingerprint
+
+def process_batch(student_id, planner_id, category_id, group_id, plan_id=None, is_first=False,
+                  solver=None, llm_budget=None, segment_fingerprints=None,
+                  previous_plan_id=None, previous_fingerprints=None, generation_mode=GENERATION_MODE_AI,
+                  recommendation_data=None, user_info=None):
     """
     处理一个批次的志愿
     
@@ -1684,6 +2326,14 @@ def process_batch(student_id, planner_id, category_id, group_id, plan_id=None, i
     :param category_id: 类别ID(1:冲, 2:稳, 3:保)
     :param group_id: 组内ID(1-4)
     :param plan_id: 志愿方案ID，如果已有
+    :param solver: 本地求解器(PlanSolver)，在各批次间共享以保证专业组不重复
+    :param llm_budget: 大模型调用预算(LLMCallBudget)
+    :param segment_fingerprints: 用于收集本次各志愿段候选集指纹、档案指纹和选择来源的字典
+    :param previous_plan_id: 上一版本方案ID，志愿段可复用时(见 is_segment_reusable)复用其该志愿段的选择
+    :param previous_fingerprints: 上一版本方案的 segment_fingerprints
+    :param generation_mode: 生成模式
+    :param recommendation_data: 学生推荐数据，整个方案生成只提取一次，未提供时按学生ID提取
+    :param user_info: 学生档案文本，整个方案生成只生成一次，未提供时按学生ID生成
     :return: 更新后的志愿方案ID和批次处理状态
     """
     
@@ -1693,46 +2343,63 @@ def process_batch(student_id, planner_id, category_id, group_id, plan_id=None, i
 
         current_app.logger.info(f"=====类别ID={category_id}, 分组ID={actual_group_id}, 方案ID={plan_id}=====")
         # 使用StudentDataService获取学生数据
-        recommendation_data = StudentDataService.extract_college_recommendation_data(student_id)
+        if recommendation_data is None:
+            recommendation_data = StudentDataService.extract_college_recommendation_data(student_id)
         # 获取学生的文本信息
-        user_info = StudentDataService.generate_student_profile_text(student_id)
+        if user_info is None:
+            user_info = StudentDataService.generate_student_profile_text(student_id)
 
-        student_score = int(recommendation_data['student_score'] or 0)
-        subject_type = int(recommendation_data['subject_type'] or 1)
-        education_level = int(recommendation_data['education_level'] or 11)
-        student_subjects = recommendation_data['student_subjects']
-        area_ids = recommendation_data.get('area_ids', [])
-        specialty_types = recommendation_data.get('specialty_types', [])
-        tuition_ranges = recommendation_data.get('tuition_ranges', [])
-        mock_exam_score = int(recommendation_data['mock_exam_score'] or 0)
-
-        # 确保area_ids和specialty_types是可迭代的且包含有效整数
-        area_ids = [int(aid) for aid in area_ids if aid and str(aid).isdigit()]
-        specialty_types = [int(st) for st in specialty_types if st and str(st).isdigit()]
-        
-        # 1. 获取筛选结果
-        filtered_colleges, _ = RecommendationService.get_colleges_by_category_and_group(
-            student_score=student_score > 0 and student_score or mock_exam_score,
-            subject_type=subject_type,
-            education_level=education_level,
+        # 1. 获取筛选结果(优先使用保存学生信息时预计算的候选集)
+        filtered_colleges = RecommendationService.get_segment_candidates(
+            recommendation_data,
             category_id=category_id,
             group_id=actual_group_id,
-            student_subjects=student_subjects,
-            area_ids=area_ids,
-            specialty_types=specialty_types,
-            tuition_ranges=tuition_ranges,
-            page=1,
             per_page=100  # 获取足够多的结果供AI选择
         )
         
         current_app.logger.info(f"筛选到的院校数量: {len(filtered_colleges)}")
         
+        # 记录候选集指纹和档案指纹，选择来源在选择完成后补充，供下一次增量生成使用
+        segment_key = str(actual_group_id)
+        segment = {
+            'fingerprint': compute_segment_fingerprint(filtered_colleges),
+            'profile': compute_profile_fingerprint(user_info),
+            'source': None
+        }
+        if segment_fingerprints is not None:
+            segment_fingerprints[segment_key] = segment
+
         # 如果没有筛选到院校，直接返回
         if not filtered_colleges:
             return plan_id, False
+
+        # 候选集(AI模式下还有档案)与上一版本相同，直接复用上一版本该志愿段的选择结果
+        previous_segment = (previous_fingerprints or {}).get(segment_key)
+        if plan_id and previous_plan_id and is_segment_reusable(
+                previous_segment, segment['fingerprint'], segment['profile'], generation_mode):
+            copied_group_ids = VolunteerPlanService.copy_plan_segment(
+                previous_plan_id, plan_id, actual_group_id,
+                exclude_group_ids=solver.used_group_ids if solver is not None else None
+            )
+            if copied_group_ids:
+                current_app.logger.info(f"志愿段{actual_group_id}可以复用，复用方案{previous_plan_id}的选择")
+                if solver is not None:
+                    solver.register(filtered_colleges, {str(cgid): [] for cgid in copied_group_ids})
+                # 复用的志愿段沿用原来的选择来源
+                segment['source'] = previous_segment.get('source') if isinstance(previous_segment, dict) else None
+                return plan_id, True
+
+        # 排除已在前面志愿段中选中的专业组
+        if solver is not None:
+            filtered_colleges = [c for c in filtered_colleges if c['cgid'] not in solver.used_group_ids]
+            if not filtered_colleges:
+                return plan_id, False
         
         # 2. 让AI选择院校及专业，并返回对应ID
-        ai_selection = ai_select_college_ids(filtered_colleges, user_info, recommendation_data, is_first=is_first)
+        ai_selection, segment['source'] = ai_select_college_ids(
+            filtered_colleges, user_info, recommendation_data, is_first=is_first,
+            solver=solver, llm_budget=llm_budget
+        )
 
         # 如果AI没有选择结果，直接返回
         if not ai_selection:
@@ -1849,12 +2516,14 @@ def process_batch(student_id, planner_id, category_id, group_id, plan_id=None, i
         # 重新抛出异常或返回失败状态
         return plan_id, False
     
-def generate_complete_volunteer_plan(student_id, planner_id, user_data_hash, is_first=False):
+def generate_complete_volunteer_plan(student_id, planner_id, user_data_hash, is_first=False,
+                                     generation_mode=GENERATION_MODE_AI):
     """
     生成完整的志愿方案(包含进度跟踪)
     
     :param student_id: 学生ID
     :param planner_id: 规划师ID
+    :param generation_mode: 生成模式，'ai'为AI选择(预算耗尽时自动切换本地求解)，'solver'为仅本地求解
     :return: 生成的志愿方案
     """
     # 获取学生数据快照
@@ -1866,10 +2535,23 @@ def generate_complete_volunteer_plan(student_id, planner_id, user_data_hash, is_
         student_id=student_id,
         is_current=True
     ).order_by(StudentVolunteerPlan.version.desc()).first()
+    latest_version = db.session.query(db.func.max(StudentVolunteerPlan.version)).filter(
+        StudentVolunteerPlan.student_id == student_id
+    ).scalar() or 0
 
     
     previous_snapshot = json.dumps(previous_plan.student_data_snapshot, ensure_ascii=False) if previous_plan else None
 
+    # 增量生成：上一版本生成成功且记录了候选集指纹时，可以复用的志愿段(见 is_segment_reusable)直接复用。
+    # 是否可复用只按各志愿段的候选集指纹判断：院校数据的变化不体现在学生快照中，按快照变化字段跳过检索并不可靠
+    previous_plan_id = None
+    previous_fingerprints = None
+    if previous_plan and not is_first \
+            and previous_plan.generation_status == StudentVolunteerPlan.GENERATION_STATUS_SUCCESS \
+            and previous_plan.segment_fingerprints:
+        previous_plan_id = previous_plan.id
+        previous_fingerprints = previous_plan.segment_fingerprints
+
     # 创建空方案并设置所有初始状态
     plan = VolunteerPlanService.create_empty_plan(
         student_id=student_id,
@@ -1879,18 +2561,38 @@ def generate_complete_volunteer_plan(student_id, planner_id, user_data_hash, is_
         generation_status=StudentVolunteerPlan.GENERATION_STATUS_PROCESSING,
         generation_progress=0,
         generation_message="开始生成志愿方案",
-        student_data_snapshot=current_snapshot
+        student_data_snapshot=current_snapshot,
+        # 以读取上一版本时的最新版本为基准，期间有其他修改或生成时抛出版本冲突
+        base_version=latest_version
     )
     plan_id = plan['id']
+    PlanProgressService.update(
+        plan_id, StudentVolunteerPlan.GENERATION_STATUS_PROCESSING, 0, "开始生成志愿方案"
+    )
 
     # 让AI分析两次学生快照的差异，以直观展示历史方案的差异
     from app.tasks.volunteer_tasks import analyze_student_snapshots_ai
     analyze_student_snapshots_ai.delay(plan_id, current_snapshot, previous_snapshot)
 
     try:
+        # 学生推荐数据和档案文本在生成期间不变，只提取一次供各批次使用
+        recommendation_data = StudentDataService.extract_college_recommendation_data(student_id)
+        user_info = StudentDataService.generate_student_profile_text(student_id)
+        # 本地求解器在各批次间共享，保证整个方案的去重和多样性约束
+        solver = PlanSolver(
+            student_score=recommendation_data.get('student_score') or recommendation_data.get('mock_exam_score'),
+            tuition_ranges=recommendation_data.get('tuition_ranges', []),
+            diversity_cap=current_app.config.get('VOLUNTEER_PLAN_DIVERSITY_CAP', PlanSolver.DEFAULT_DIVERSITY_CAP)
+        )
+        if generation_mode == GENERATION_MODE_SOLVER:
+            llm_budget = LLMCallBudget(0)
+        else:
+            llm_budget = LLMCallBudget(current_app.config.get('VOLUNTEER_PLAN_LLM_BUDGET', 12))
+
         # 处理所有批次
         batch_count = 12
         processed_count = 0
+        segment_fingerprints = {}
         
         # 遍历所有类别和组
         for category_id in [1,2,3]:  # 冲、稳、保
@@ -1902,27 +2604,40 @@ def generate_complete_volunteer_plan(student_id, planner_id, user_data_hash, is_
                     category_id=category_id,
                     group_id=group_id,
                     plan_id=plan_id,
-                    is_first=is_first
+                    is_first=is_first,
+                    solver=solver,
+                    llm_budget=llm_budget,
+                    segment_fingerprints=segment_fingerprints,
+                    previous_plan_id=previous_plan_id,
+                    previous_fingerprints=previous_fingerprints,
+                    generation_mode=generation_mode,
+                    recommendation_data=recommendation_data,
+                    user_info=user_info
                 )
                 
                 # 更新进度
                 processed_count += 1
                 progress = int((processed_count / batch_count) * 100)
                 
-                # 更新方案状态
-                StudentVolunteerPlan.query.filter_by(id=plan_id).update({
-                    'generation_progress': progress,
-                    'generation_message': f"已处理{processed_count}/{batch_count}个批次"
-                })
-                db.session.commit()
+                # 更新进度(仅写入Redis并推送，数据库只在开始和结束时写入)
+                PlanProgressService.update(
+                    plan_id,
+                    StudentVolunteerPlan.GENERATION_STATUS_PROCESSING,
+                    progress,
+                    f"已处理{processed_count}/{batch_count}个批次"
+                )
         
         # 全部处理完成，更新状态
         StudentVolunteerPlan.query.filter_by(id=plan_id).update({
             'generation_status': StudentVolunteerPlan.GENERATION_STATUS_SUCCESS,
             'generation_progress': 100,
-            'generation_message': "志愿方案生成完成"
+            'generation_message': "志愿方案生成完成",
+            'segment_fingerprints': segment_fingerprints
         })
         db.session.commit()
+        PlanProgressService.update(
+            plan_id, StudentVolunteerPlan.GENERATION_STATUS_SUCCESS, 100, "志愿方案生成完成"
+        )
         
         # 自动生成总方案和三个类别的分析
         from app.tasks.volunteer_tasks import analyze_volunteer_plan_task, analyze_volunteer_category_task
@@ -1944,4 +2659,11 @@ def generate_complete_volunteer_plan(student_id, planner_id, user_data_hash, is_
             'generation_message': f"生成失败: {str(e)}"
         })
         db.session.commit()
+        progress_data = PlanProgressService.get(plan_id) or {}
+        PlanProgressService.update(
+            plan_id,
+            StudentVolunteerPlan.GENERATION_STATUS_FAILED,
+            progress_data.get('generation_progress', 0),
+            f"生成失败: {str(e)}"
+        )
         raise
\ No newline at end of file
@@ -1,17 +1,19 @@
 # app/services/volunteer/ai_analysis_service.py
 from flask import current_app
 from app.extensions import db, celery
-from app.models.student_volunteer_plan import StudentVolunteerPlan, VolunteerCollege, VolunteerCategoryAnalysis
+from app.models.student_volunteer_plan import StudentVolunteerPlan, VolunteerCollege, VolunteerCategoryAnalysis, DEFERRED_GROUP_AI_ANALYSIS
 from app.models.user import User
 from app.services.student.student_data_service import StudentDataService
 from sqlalchemy.exc import SQLAlchemyError
 import json
+import hashlib
 from app.services.ai.llm_service import LLMService
 from datetime import datetime, timezone
 from app.models.student_volunteer_plan import VolunteerSpecialty
 from app.models.collegePreference import CollegePreference
 from app.models.studentProfile import Student,AcademicRecord
 from app.services.volunteer.plan_service import VolunteerPlanService
+from app.services.volunteer.plan_document_cache import PlanDocumentCache
 
 class AIVolunteerAnalysisService:
     """AI志愿解读服务类，专门处理所有与志愿填报相关的AI解析功能"""
@@ -85,9 +87,10 @@ class AIVolunteerAnalysisService:
             raise ValueError("无效的类别ID，必须是 1(冲)、2(稳) 或 3(保)")
         
         # 构建查询
-        colleges_query = VolunteerCollege.query.filter_by(
-            plan_id=plan_id,
+        colleges_query = VolunteerCollege.query_for_plan(plan_id).filter_by(
             category_id=category_id
+        ).options(
+            db.undefer_group(DEFERRED_GROUP_AI_ANALYSIS)
         ).order_by(VolunteerCollege.volunteer_index)
         
         # 执行查询获取结果
@@ -104,6 +107,8 @@ class AIVolunteerAnalysisService:
         # 批量获取所有专业
         specialties = VolunteerSpecialty.query.filter(
             VolunteerSpecialty.volunteer_college_id.in_(college_ids)
+        ).options(
+            db.undefer_group(DEFERRED_GROUP_AI_ANALYSIS)
         ).order_by(VolunteerSpecialty.specialty_index).all()
         
         # 按院校ID分组专业
@@ -127,7 +132,7 @@ class AIVolunteerAnalysisService:
         }
     
     @classmethod
-    def analyzing_category(cls, user_info, simplified_colleges_json, category, temperature=0.3):
+    def analyzing_category(cls, user_info, simplified_colleges_json, category, temperature=0.3, use_cache=True):
         """
         获取 AI 的分析响应
         
@@ -135,12 +140,14 @@ class AIVolunteerAnalysisService:
         :param simplified_colleges_json: 简化后的院校信息JSON
         :param category: 类别名称
         :param temperature: 控制输出的随机性，默认为0.3
+        :param use_cache: 为False时跳过响应缓存重新分析
         :return: AI 的分析内容
         """
         res = LLMService.analyzing_category(
             user_info=user_info,
             simplified_colleges_json=simplified_colleges_json,
             category=category,
+            use_cache=use_cache,
         )
         
         return res
@@ -199,6 +206,7 @@ class AIVolunteerAnalysisService:
                 db.session.add(analysis)
             
             db.session.commit()
+            PlanDocumentCache.invalidate(plan_id)
             return True
         except SQLAlchemyError as e:
             db.session.rollback()
@@ -206,12 +214,112 @@ class AIVolunteerAnalysisService:
             return False
         
     @staticmethod
-    def perform_volunteer_category_analysis(plan_id, category_id):
+    def compute_category_fingerprints(plan_id):
+        """
+        计算方案各类别志愿内容的指纹，用于判断分析结果能否在方案版本间复用
+        
+        指纹只包含影响分析内容的字段(志愿序号、院校专业组、分差、专业及其顺序)，
+        院校和专业的AI解析写入不会改变指纹
+        
+        :param plan_id: 志愿方案ID
+        :return: 字典 {类别ID: 指纹}，类别ID为0表示整体方案
+        """
+        colleges = db.session.query(
+            VolunteerCollege.id,
+            VolunteerCollege.category_id,
+            VolunteerCollege.volunteer_index,
+            VolunteerCollege.college_group_id,
+            VolunteerCollege.score_diff
+        ).filter(
+            VolunteerCollege.plan_filter(plan_id)
+        ).order_by(VolunteerCollege.volunteer_index).all()
+        
+        specialties_by_college = {}
+        if colleges:
+            specialties = db.session.query(
+                VolunteerSpecialty.volunteer_college_id,
+                VolunteerSpecialty.specialty_index,
+                VolunteerSpecialty.specialty_id
+            ).filter(
+                VolunteerSpecialty.volunteer_college_id.in_([college.id for college in colleges])
+            ).all()
+            for specialty in specialties:
+                specialties_by_college.setdefault(specialty.volunteer_college_id, []).append(
+                    [specialty.specialty_index, specialty.specialty_id]
+                )
+        
+        content = {category_id: [] for category_id in AIVolunteerAnalysisService.CATEGORY_MAP}
+        for college in colleges:
+            content.setdefault(college.category_id, []).append([
+                college.volunteer_index,
+                college.college_group_id,
+                college.score_diff,
+                sorted(specialties_by_college.get(college.id, []))
+            ])
+        
+        def digest(value):
+            return hashlib.sha256(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+        
+        fingerprints = {category_id: digest(items) for category_id, items in content.items()}
+        fingerprints[0] = digest(sorted(fingerprints.items()))
+        return fingerprints
+    
+    @staticmethod
+    def carry_over_analyses(source_plan_id, target_plan_id):
+        """
+        将源方案中已完成的类别分析和整体分析复制到新版本方案，只复制内容指纹未变化的部分
+        
+        :param source_plan_id: 源志愿方案ID
+        :param target_plan_id: 新版本志愿方案ID
+        :return: 源方案已分析但内容发生变化、需要重新分析的类别ID列表(0表示整体分析)
+        """
+        source_analyses = VolunteerCategoryAnalysis.query.filter_by(
+            plan_id=source_plan_id,
+            status=VolunteerCategoryAnalysis.STATUS_COMPLETED
+        ).all()
+        if not source_analyses:
+            return []
+        
+        source_fingerprints = AIVolunteerAnalysisService.compute_category_fingerprints(source_plan_id)
+        target_fingerprints = AIVolunteerAnalysisService.compute_category_fingerprints(target_plan_id)
+        
+        changed_category_ids = []
+        try:
+            for analysis in source_analyses:
+                category_id = analysis.category_id
+                if source_fingerprints.get(category_id) != target_fingerprints.get(category_id):
+                    changed_category_ids.append(category_id)
+                    continue
+                
+                db.session.add(VolunteerCategoryAnalysis(
+                    plan_id=target_plan_id,
+                    category_id=category_id,
+                    analysis_content=analysis.analysis_content,
+                    status=VolunteerCategoryAnalysis.STATUS_COMPLETED,
+                    analyzed_at=analysis.analyzed_at
+                ))
+            
+            db.session.commit()
+            PlanDocumentCache.invalidate(target_plan_id)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            current_app.logger.error(f"复用志愿分析结果失败: {str(e)}")
+            raise
+        
+        current_app.logger.info(
+            f"方案 {target_plan_id} 复用分析 {len(source_analyses) - len(changed_category_ids)} 项，"
+            f"需重新分析类别: {changed_category_ids}"
+        )
+        return changed_category_ids
+    
+    @staticmethod
+    def perform_volunteer_category_analysis(plan_id, category_id, refresh=False):
         """
         执行志愿类别分析的实际业务逻辑
         
         :param plan_id: 志愿方案ID
         :param category_id: 类别ID
+        :param refresh: 是否跳过响应缓存重新分析
         :return: 分析结果
         """
         try:
@@ -248,7 +356,8 @@ class AIVolunteerAnalysisService:
             analysis_result = AIVolunteerAnalysisService.analyzing_category(
                 user_info=user_info,
                 simplified_colleges_json=simplified_colleges_json,
-                category=category_name
+                category=category_name,
+                use_cache=not refresh
             )
             
             # 7. 存储分析结果
@@ -310,9 +419,7 @@ class AIVolunteerAnalysisService:
         :return: 简化后的志愿方案数据
         """
         # 获取方案中的所有院校
-        colleges = VolunteerCollege.query.filter_by(
-            plan_id=plan_id
-        ).order_by(
+        colleges = VolunteerCollege.query_for_plan(plan_id).order_by(
             VolunteerCollege.category_id,
             VolunteerCollege.volunteer_index
         ).all()
@@ -402,6 +509,7 @@ class AIVolunteerAnalysisService:
                 db.session.add(analysis)
             
             db.session.commit()
+            PlanDocumentCache.invalidate(plan_id)
             return True
         except SQLAlchemyError as e:
             db.session.rollback()
@@ -409,11 +517,12 @@ class AIVolunteerAnalysisService:
             return False
     
     @staticmethod
-    def perform_volunteer_plan_analysis(plan_id):
+    def perform_volunteer_plan_analysis(plan_id, refresh=False):
         """
         执行整体志愿方案分析
         
         :param plan_id: 志愿方案ID
+        :param refresh: 是否跳过响应缓存重新分析
         :return: 分析结果
         """
         try:
@@ -446,7 +555,8 @@ class AIVolunteerAnalysisService:
             # 4. 调用AI分析
             analysis_result = LLMService.analyzing_full_plan(
                 user_info=user_info,
-                volunteer_plan=volunteer_plan
+                volunteer_plan=volunteer_plan,
+                use_cache=not refresh
             )
             
             # 5. 存储分析结果
@@ -1,10 +1,74 @@
+from flask import current_app, request, session
+from flask_jwt_extended import decode_token
+from flask_socketio import join_room, leave_room, emit
 from app.extensions import socketio
+from app.models.user import User
+from app.models.studentProfile import Student
+from app.models.student_volunteer_plan import StudentVolunteerPlan
+from app.services.volunteer.plan_progress_service import PlanProgressService
+
 
-# 示例事件处理
 @socketio.on('connect')
-def handle_connect():
-    print('Client connected')
+def handle_connect(auth=None):
+    """
+    客户端连接，需在auth中携带JWT令牌: {"token": "<access_token>"}
+    """
+    token = (auth or {}).get('token') or request.args.get('token')
+    if not token:
+        raise ConnectionRefusedError('缺少认证令牌')
+
+    try:
+        decoded = decode_token(token)
+    except Exception:
+        raise ConnectionRefusedError('无效的认证令牌')
+
+    session['user_id'] = int(decoded['sub'])
+    current_app.logger.info(f"Socket客户端已连接, 用户ID: {session['user_id']}")
+
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    print('Client disconnected')
+    current_app.logger.info(f"Socket客户端已断开, 用户ID: {session.get('user_id')}")
+
+
+@socketio.on('join_plan')
+def handle_join_plan(data):
+    """
+    订阅志愿方案生成进度: {"plan_id": 1}
+    加入后立即推送一次当前进度
+    """
+    plan_id = (data or {}).get('plan_id')
+    user = User.query.get(session.get('user_id'))
+    if not user or user.user_type != User.USER_TYPE_PLANNER:
+        emit('error', {'message': '无权限订阅该方案'})
+        return
+
+    plan = StudentVolunteerPlan.query.get(plan_id) if plan_id else None
+    if not plan:
+        emit('error', {'message': '志愿方案不存在'})
+        return
+
+    # 验证方案所属学生是否属于该规划师(与REST接口的学生归属校验一致)
+    student = Student.query.get(plan.student_id)
+    student_user = User.query.get(student.user_id) if student else None
+    if not student_user or student_user.planner_id != user.id:
+        emit('error', {'message': '无权订阅该方案'})
+        return
+
+    join_room(PlanProgressService.room(plan.id))
+
+    progress_data = PlanProgressService.get(plan.id) or {
+        'plan_id': plan.id,
+        'generation_status': plan.generation_status,
+        'generation_progress': plan.generation_progress,
+        'generation_message': plan.generation_message,
+    }
+    emit(PlanProgressService.EVENT_PROGRESS, progress_data)
+
+
+@socketio.on('leave_plan')
+def handle_leave_plan(data):
+    """取消订阅志愿方案生成进度: {"plan_id": 1}"""
+    plan_id = (data or {}).get('plan_id')
+    if plan_id:
+        leave_room(PlanProgressService.room(plan_id))
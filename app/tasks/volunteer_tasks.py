@@ -11,33 +11,51 @@ from app.services.ai.llm_service import LLMService
 from app.services.volunteer.consultation_status_service import update_student_plan_status
 from app.services.chat.chat_service import ChatService
 from app.services.volunteer.export import export_volunteer_plan_to_pdf
+from app.services.college.recommendation_service import RecommendationService
+from app.utils.distributed_lock import SingleFlightLock
+from app.services.volunteer.plan_document_cache import PlanDocumentCache
+from app.services.volunteer.plan_archive_service import PlanArchiveService
+from celery.result import AsyncResult
+import uuid
 @celery.task(bind=True)
-def generate_volunteer_plan_task(self, student_id, planner_id, user_data_hash, is_first = False):
+def generate_volunteer_plan_task(self, student_id, planner_id, user_data_hash, is_first = False, generation_mode='ai'):
     """
     异步生成志愿方案任务
     
     :param student_id: 学生ID
     :param planner_id: 规划师ID
     :param user_data_hash: 用户数据哈希
+    :param generation_mode: 生成模式('ai'或'solver')
     :return: 任务结果
     """
     task_id = self.request.id
     current_app.logger.info(f"异步生成志愿方案任务开始，任务ID: {task_id}")
+    lock = _plan_generation_lock(student_id, user_data_hash)
     
     try:
-        # 调用完整处理流程，并传递用户数据哈希
-        result = generate_complete_volunteer_plan(
-            student_id=student_id,
-            planner_id=planner_id,
-            user_data_hash=user_data_hash,
-            is_first=is_first
-        )
+        # 执行期间以短过期时间持续续期单飞锁，worker异常退出后锁很快过期，相同请求可以重新生成
+        with lock.heartbeat(
+            task_id,
+            current_app.config.get('PLAN_GENERATION_HEARTBEAT_TTL', 60),
+            current_app.config.get('PLAN_GENERATION_HEARTBEAT_INTERVAL', 15)
+        ):
+            # 调用完整处理流程，并传递用户数据哈希
+            result = generate_complete_volunteer_plan(
+                student_id=student_id,
+                planner_id=planner_id,
+                user_data_hash=user_data_hash,
+                is_first=is_first,
+                generation_mode=generation_mode
+            )
         
         if not is_first:
             print("生成方案成功，开始更新学生志愿方案状态")
             # 更新学生志愿方案状态
             update_student_plan_status(student_id)
         
+        # 超出保留数量的旧版本转入归档表
+        schedule_plan_compaction(student_id)
+        
         # 返回结果
         return {
             'status': 'success',
@@ -51,14 +69,141 @@ def generate_volunteer_plan_task(self, student_id, planner_id, user_data_hash, i
             'status': 'error',
             'message': f'志愿方案生成失败: {str(e)}'
         }
+    finally:
+        # 释放单飞锁(仅当本任务是持有者时)
+        lock.release(task_id)
+
+def _plan_generation_lock(student_id, user_data_hash):
+    """
+    同一学生、同一份数据的方案生成单飞锁
+
+    投递时以 PLAN_GENERATION_LOCK_TIMEOUT 加锁覆盖排队时间，任务开始执行后改由心跳续期(见 generate_volunteer_plan_task)
+    """
+    return SingleFlightLock(
+        f"plan_generation_lock:{student_id}:{user_data_hash}",
+        current_app.config.get('PLAN_GENERATION_LOCK_TIMEOUT', 1800)
+    )
+
+def enqueue_plan_generation(student_id, planner_id, user_data_hash, is_first=False, generation_mode='ai'):
+    """
+    投递志愿方案生成任务，同一学生同一份数据同时只会有一个生成任务
+    
+    :param student_id: 学生ID
+    :param planner_id: 规划师ID
+    :param user_data_hash: 用户数据哈希
+    :param is_first: 是否首次生成
+    :param generation_mode: 生成模式('ai'或'solver')
+    :return: (任务ID, 是否为新投递的任务)，已有进行中的任务时返回该任务ID
+    """
+    lock = _plan_generation_lock(student_id, user_data_hash)
+    task_id = str(uuid.uuid4())
+
+    if not lock.acquire(task_id):
+        running_task_id = lock.owner()
+        if running_task_id is None:
+            # 锁恰好过期(如执行任务的worker异常退出后心跳停止)，重新尝试获取
+            if not lock.acquire(task_id):
+                return lock.owner(), False
+        elif AsyncResult(running_task_id, app=celery).ready() and lock.replace(running_task_id, task_id):
+            # 持有锁的任务已有结果却未释放，接管该锁
+            current_app.logger.warning(f"接管已结束任务{running_task_id}的方案生成锁")
+        else:
+            return running_task_id, False
+
+    try:
+        generate_volunteer_plan_task.apply_async(
+            kwargs={
+                'student_id': student_id,
+                'planner_id': planner_id,
+                'user_data_hash': user_data_hash,
+                'is_first': is_first,
+                'generation_mode': generation_mode
+            },
+            task_id=task_id
+        )
+    except Exception:
+        lock.release(task_id)
+        raise
+
+    return task_id, True
+    
+@celery.task(bind=True)
+def precompute_student_candidates_task(self, student_id):
+    """
+    预计算学生的院校统计和各志愿段候选集(低优先级后台任务)
+    
+    :param student_id: 学生ID
+    :return: 任务结果
+    """
+    try:
+        user_data_hash = RecommendationService.precompute_student_candidates(student_id)
+        return {
+            'status': 'success',
+            'user_data_hash': user_data_hash,
+            'message': '候选集预计算完成'
+        }
+    except Exception as e:
+        current_app.logger.error(f"候选集预计算失败: {str(e)}")
+        return {
+            'status': 'error',
+            'message': f'候选集预计算失败: {str(e)}'
+        }
+
+def schedule_candidate_precompute(student_id):
+    """
+    保存学生成绩或报考意向后，以低优先级投递候选集预计算任务，投递失败不影响保存
+    
+    :param student_id: 学生ID
+    """
+    try:
+        precompute_student_candidates_task.apply_async(args=[student_id], priority=9)
+    except Exception as e:
+        current_app.logger.error(f"投递候选集预计算任务失败: {str(e)}")
+
+@celery.task(bind=True)
+def compact_plan_versions_task(self, student_id=None):
+    """
+    归档超出保留数量的旧志愿方案版本(低优先级后台任务)
+    
+    :param student_id: 学生ID，不传时处理所有学生(供定时任务调用)
+    :return: 任务结果
+    """
+    try:
+        if student_id is None:
+            archived_count = PlanArchiveService.compact_all_plans()
+        else:
+            archived_count = len(PlanArchiveService.compact_student_plans(student_id))
+        return {
+            'status': 'success',
+            'archived_count': archived_count,
+            'message': '旧方案版本归档完成'
+        }
+    except Exception as e:
+        current_app.logger.error(f"旧方案版本归档失败: {str(e)}")
+        return {
+            'status': 'error',
+            'message': f'旧方案版本归档失败: {str(e)}'
+        }
+
+def schedule_plan_compaction(student_id):
+    """
+    学生生成或修改方案后，以低优先级投递旧版本归档任务，投递失败不影响方案保存
     
+    :param student_id: 学生ID
+    """
+    try:
+        compact_plan_versions_task.apply_async(args=[student_id], priority=9)
+    except Exception as e:
+        current_app.logger.error(f"投递旧方案版本归档任务失败: {str(e)}")
+
 @celery.task(bind=True)
-def analyze_volunteer_category_task(self, plan_id, category_id):
+def analyze_volunteer_category_task(self, plan_id, category_id, refresh=False):
     """
     异步分析志愿类别任务
     
     :param plan_id: 志愿方案ID
     :param category_id: 类别ID
+    :param refresh: 是否跳过响应缓存重新分析
     :return: 任务结果
     """
     task_id = self.request.id
@@ -69,6 +214,7 @@ def analyze_volunteer_category_task(self, plan_id, category_id):
         result = AIVolunteerAnalysisService.perform_volunteer_category_analysis(
             plan_id=plan_id,
             category_id=category_id,
+            refresh=refresh,
         )
         
         return result
@@ -81,18 +227,20 @@ def analyze_volunteer_category_task(self, plan_id, category_id):
         }
     
 @celery.task(bind=True)
-def analyze_college_task(self, volunteer_college_id):
+def analyze_college_task(self, volunteer_college_id, plan_id=None, refresh=False):
     """
     异步分析院校的任务
     
     :param volunteer_college_id: 志愿院校ID
+    :param plan_id: 发起分析的志愿方案ID，默认为学生当前版本中包含该院校的方案
+    :param refresh: 是否跳过响应缓存重新分析
     :return: 任务结果
     """
     task_id = self.request.id
     current_app.logger.info(f"异步分析院校任务开始，任务ID: {task_id}, 院校ID: {volunteer_college_id}")
     
     try:
-        result = AICollegeSpecialtyAnalysisService.perform_college_analysis(volunteer_college_id)
+        result = AICollegeSpecialtyAnalysisService.perform_college_analysis(volunteer_college_id, plan_id, refresh)
         
         return result
     
@@ -105,18 +253,20 @@ def analyze_college_task(self, volunteer_college_id):
         }
 
 @celery.task(bind=True)
-def analyze_specialty_task(self, specialty_id):
+def analyze_specialty_task(self, specialty_id, plan_id=None, refresh=False):
     """
     异步分析专业的任务
     
     :param specialty_id: 志愿专业ID
+    :param plan_id: 发起分析的志愿方案ID，默认为学生当前版本中包含所属院校的方案
+    :param refresh: 是否跳过响应缓存重新分析
     :return: 任务结果
     """
     task_id = self.request.id
     current_app.logger.info(f"异步分析专业任务开始，任务ID: {task_id}, 专业ID: {specialty_id}")
     
     try:
-        result = AICollegeSpecialtyAnalysisService.perform_specialty_analysis(specialty_id)
+        result = AICollegeSpecialtyAnalysisService.perform_specialty_analysis(specialty_id, plan_id, refresh)
         
         return result
     
@@ -128,6 +278,50 @@ def analyze_specialty_task(self, specialty_id):
             'message': f'分析过程出错: {str(e)}'
         }
 
+@celery.task(bind=True)
+def analyze_colleges_batch_task(self, volunteer_college_ids, plan_id=None, refresh=False):
+    """
+    批量分析院校的任务(大模型调用在本任务内并发执行)
+    
+    :param volunteer_college_ids: 志愿院校ID列表
+    :param plan_id: 发起分析的志愿方案ID，默认为学生当前版本中包含各院校的方案
+    :param refresh: 是否跳过响应缓存重新分析
+    :return: 任务结果
+    """
+    task_id = self.request.id
+    current_app.logger.info(f"批量分析院校任务开始，任务ID: {task_id}, 院校数量: {len(volunteer_college_ids)}")
+    
+    try:
+        return AICollegeSpecialtyAnalysisService.perform_batch_college_analysis(volunteer_college_ids, plan_id, refresh)
+    except Exception as e:
+        current_app.logger.error(f"批量分析院校任务失败: {str(e)}")
+        return {
+            'status': 'error',
+            'message': f'分析过程出错: {str(e)}'
+        }
+
+@celery.task(bind=True)
+def analyze_specialties_batch_task(self, specialty_ids, plan_id=None, refresh=False):
+    """
+    批量分析专业的任务(大模型调用在本任务内并发执行)
+    
+    :param specialty_ids: 志愿专业ID列表
+    :param plan_id: 发起分析的志愿方案ID，默认为学生当前版本中包含各专业所属院校的方案
+    :param refresh: 是否跳过响应缓存重新分析
+    :return: 任务结果
+    """
+    task_id = self.request.id
+    current_app.logger.info(f"批量分析专业任务开始，任务ID: {task_id}, 专业数量: {len(specialty_ids)}")
+    
+    try:
+        return AICollegeSpecialtyAnalysisService.perform_batch_specialty_analysis(specialty_ids, plan_id, refresh)
+    except Exception as e:
+        current_app.logger.error(f"批量分析专业任务失败: {str(e)}")
+        return {
+            'status': 'error',
+            'message': f'分析过程出错: {str(e)}'
+        }
+
 @celery.task(bind=True)
 def analyze_student_snapshots_ai(self, plan_id, current_snapshot, previous_snapshot):
     """
@@ -147,6 +341,7 @@ def analyze_student_snapshots_ai(self, plan_id, current_snapshot, previous_snaps
             # 更新方案的变更记录和分析状态
             current_plan.data_changes = changes_text
         db.session.commit()
+        PlanDocumentCache.invalidate(plan_id)
         return {
             "status": "success", 
             "message": "AI分析完成",
@@ -156,6 +351,7 @@ def analyze_student_snapshots_ai(self, plan_id, current_snapshot, previous_snaps
         current_plan = StudentVolunteerPlan.query.get(plan_id)
         current_plan.data_changes = f"分析失败"
         db.session.commit()
+        PlanDocumentCache.invalidate(plan_id)
         
         return {
             "status": "error", 
@@ -189,11 +385,12 @@ def generate_conversation_title_task(self, conversation_id, message_content):
         return {"status": "error", "message": str(e)}
 
 @celery.task(bind=True)
-def analyze_volunteer_plan_task(self, plan_id):
+def analyze_volunteer_plan_task(self, plan_id, refresh=False):
     """
     异步分析整体志愿方案
     
     :param plan_id: 志愿方案ID
+    :param refresh: 是否跳过响应缓存重新分析
     :return: 任务结果
     """
     task_id = self.request.id
@@ -217,9 +414,10 @@ def analyze_volunteer_plan_task(self, plan_id):
             plan_analysis.status = VolunteerCategoryAnalysis.STATUS_PROCESSING
             
         db.session.commit()
+        PlanDocumentCache.invalidate(plan_id)
         
         # 执行分析
-        result = AIVolunteerAnalysisService.perform_volunteer_plan_analysis(plan_id)
+        result = AIVolunteerAnalysisService.perform_volunteer_plan_analysis(plan_id, refresh)
         
         return {
             'status': result.get('status', 'success'),
@@ -241,6 +439,7 @@ def analyze_volunteer_plan_task(self, plan_id):
                 plan_analysis.status = VolunteerCategoryAnalysis.STATUS_FAILED
                 plan_analysis.error_message = str(e)
                 db.session.commit()
+                PlanDocumentCache.invalidate(plan_id)
         except:
             pass
             
@@ -250,6 +449,34 @@ def analyze_volunteer_plan_task(self, plan_id):
             'plan_id': plan_id
         }
     
+def refresh_plan_analyses(source_plan_id, target_plan_id):
+    """
+    修改方案生成新版本后，复用内容未变化的类别分析和整体分析，只对变化的部分重新提交AI分析任务
+    
+    :param source_plan_id: 修改前的志愿方案ID
+    :param target_plan_id: 修改后的新版本志愿方案ID
+    """
+    try:
+        changed_category_ids = AIVolunteerAnalysisService.carry_over_analyses(source_plan_id, target_plan_id)
+    except Exception as e:
+        current_app.logger.error(f"复用志愿分析结果失败: {str(e)}")
+        return
+    
+    for category_id in changed_category_ids:
+        try:
+            if category_id == 0:
+                analyze_volunteer_plan_task.delay(target_plan_id)
+            else:
+                AIVolunteerAnalysisService.store_category_analysis(
+                    plan_id=target_plan_id,
+                    category_id=category_id,
+                    analysis_content=None,
+                    status=VolunteerCategoryAnalysis.STATUS_PROCESSING
+                )
+                analyze_volunteer_category_task.delay(target_plan_id, category_id)
+        except Exception as e:
+            current_app.logger.error(f"提交志愿分析任务失败, 类别ID: {category_id}, 错误: {str(e)}")
+
 @celery.task(bind=True)
 def export_volunteer_plan_to_pdf_task(self, plan_id, template_name="standard"):
     """
@@ -0,0 +1,148 @@
+import threading
+from contextlib import contextmanager
+from app.extensions import cache
+from flask import current_app
+
+
+class SingleFlightLock:
+    """
+    基于Redis的分布式单飞锁
+
+    同一个键同时只允许一个持有者，锁的值为持有者令牌(如Celery任务ID)，
+    后来的调用方可以读取令牌复用正在进行的任务。
+    锁设置过期时间，持有者异常退出时锁会自动过期；释放时校验令牌，避免误删他人的锁。
+    执行时间较长的持有者通过 heartbeat() 以较短的过期时间定期续期，异常退出后锁很快过期，
+    正常执行时不受过期时间限制。
+    """
+
+    # 校验令牌后删除(原子操作)
+    _RELEASE_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+
+    # 校验旧令牌后替换为新令牌(原子操作)
+    _REPLACE_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        redis.call('set', KEYS[1], ARGV[2], 'EX', ARGV[3])
+        return 1
+    end
+    return 0
+    """
+
+    # 校验令牌后续期(原子操作)
+    _EXTEND_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('expire', KEYS[1], ARGV[2])
+    end
+    return 0
+    """
+
+    def __init__(self, key, timeout):
+        """
+        :param key: 锁的Redis键
+        :param timeout: 锁的过期时间(秒)
+        """
+        self.key = key
+        self.timeout = int(timeout)
+
+    @staticmethod
+    def _client():
+        return cache.cache._write_client
+
+    def acquire(self, token):
+        """
+        尝试获取锁
+
+        :param token: 持有者令牌
+        :return: 是否获取成功
+        """
+        return bool(self._client().set(self.key, token, nx=True, ex=self.timeout))
+
+    def owner(self):
+        """
+        获取当前持有者令牌
+
+        :return: 令牌字符串，未加锁时返回None
+        """
+        value = self._client().get(self.key)
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return value
+
+    def replace(self, old_token, new_token):
+        """
+        当前持有者仍为old_token时，将锁转交给new_token(用于接管已结束但未释放的锁)
+
+        :return: 是否替换成功
+        """
+        return bool(self._client().eval(
+            self._REPLACE_SCRIPT, 1, self.key, old_token, new_token, self.timeout
+        ))
+
+    def extend(self, token, timeout=None):
+        """
+        持有者为锁续期
+
+        :param token: 持有者令牌
+        :param timeout: 新的过期时间(秒)，默认为创建锁时的过期时间
+        :return: 是否续期成功(锁已过期或被他人持有时失败)
+        """
+        return bool(self._client().eval(
+            self._EXTEND_SCRIPT, 1, self.key, token, int(timeout or self.timeout)
+        ))
+
+    @contextmanager
+    def heartbeat(self, token, ttl, interval):
+        """
+        持有期间在后台线程中每隔interval秒把锁续期为ttl秒(进入时立即续期一次)
+
+        持有者异常退出后心跳停止，锁在ttl秒内过期，其他调用方即可重新获取；
+        续期失败(锁已被他人持有)时停止心跳，Redis暂时不可用时继续重试
+
+        :param token: 持有者令牌
+        :param ttl: 续期后的过期时间(秒)，应大于interval的数倍
+        :param interval: 续期间隔(秒)
+        """
+        client = self._client()
+        logger = current_app.logger
+        stopped = threading.Event()
+
+        def extend():
+            """续期一次，返回是否继续心跳"""
+            try:
+                if not client.eval(self._EXTEND_SCRIPT, 1, self.key, token, int(ttl)):
+                    logger.warning(f"分布式锁{self.key}已不由{token}持有，停止续期")
+                    return False
+            except Exception as e:
+                logger.error(f"分布式锁续期失败: {str(e)}")
+            return True
+
+        def beat():
+            while not stopped.wait(interval) and extend():
+                pass
+
+        if not extend():
+            stopped.set()
+        thread = threading.Thread(target=beat, name=f"lock-heartbeat:{self.key}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+
+    def release(self, token):
+        """
+        释放锁，只有持有者本人可以释放
+
+        :param token: 持有者令牌
+        :return: 是否释放成功
+        """
+        try:
+            return bool(self._client().eval(self._RELEASE_SCRIPT, 1, self.key, token))
+        except Exception as e:
+            current_app.logger.error(f"释放分布式锁失败: {str(e)}")
+            return False
@@ -1,6 +1,26 @@
+import os
+from celery.signals import worker_init, worker_process_shutdown
+from prometheus_client import multiprocess
 from app import create_app
 from app.extensions import celery, init_celery
+from app.services.ai.telemetry import LLMTelemetry
 import app.tasks  # 导入所有任务
 
 app = create_app()
+
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    """配置了端口时在worker主进程中启动Prometheus指标服务"""
+    port = app.config.get('CELERY_METRICS_PORT')
+    if port:
+        LLMTelemetry.start_server(port)
+
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    """多进程模式下清理已退出子进程的指标文件"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid or os.getpid())
+
 print(f"Celery配置已完成，broker: {celery.conf.broker_url}")
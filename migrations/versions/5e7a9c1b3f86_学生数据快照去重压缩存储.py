@@ -0,0 +1,96 @@
+"""学生数据快照去重压缩存储
+
+Revision ID: 5e7a9c1b3f86
+Revises: 8c1f5a3e9d42
+Create Date: 2026-10-18 14:32:08.917254
+
+"""
+import hashlib
+import zlib
+from datetime import datetime, timezone
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e7a9c1b3f86'
+down_revision = '8c1f5a3e9d42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    snapshots = op.create_table('student_data_snapshots',
+    sa.Column('content_hash', sa.String(length=64), nullable=False, comment='快照JSON内容的SHA-256哈希'),
+    sa.Column('compressed_data', sa.LargeBinary(), nullable=False, comment='zlib压缩后的快照JSON'),
+    sa.Column('raw_size', sa.Integer(), nullable=True, comment='压缩前字节数'),
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('content_hash')
+    )
+
+    with op.batch_alter_table('student_volunteer_plans', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('snapshot_id', sa.Integer(), nullable=True, comment='生成方案时的学生数据快照ID'))
+        batch_op.create_foreign_key('fk_plan_snapshot', 'student_data_snapshots', ['snapshot_id'], ['id'])
+
+    # 回填：按内容哈希去重写入快照表，并更新方案的快照引用
+    conn = op.get_bind()
+    plans = sa.table('student_volunteer_plans',
+        sa.column('id', sa.Integer),
+        sa.column('student_data_snapshot', sa.Text),
+        sa.column('snapshot_id', sa.Integer)
+    )
+    snapshot_ids = {}
+    now = datetime.now(timezone.utc)
+    rows = conn.execute(
+        sa.select(plans.c.id, plans.c.student_data_snapshot).where(plans.c.student_data_snapshot.isnot(None))
+    ).fetchall()
+    for plan_id, text in rows:
+        raw = text.encode('utf-8')
+        content_hash = hashlib.sha256(raw).hexdigest()
+        if content_hash not in snapshot_ids:
+            result = conn.execute(snapshots.insert().values(
+                content_hash=content_hash,
+                compressed_data=zlib.compress(raw, 6),
+                raw_size=len(raw),
+                created_at=now,
+                updated_at=now
+            ))
+            snapshot_ids[content_hash] = result.inserted_primary_key[0]
+        conn.execute(
+            plans.update().where(plans.c.id == plan_id).values(snapshot_id=snapshot_ids[content_hash])
+        )
+
+    with op.batch_alter_table('student_volunteer_plans', schema=None) as batch_op:
+        batch_op.drop_column('student_data_snapshot')
+
+
+def downgrade():
+    with op.batch_alter_table('student_volunteer_plans', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('student_data_snapshot', sa.Text(), nullable=True, comment='生成方案时的学生数据快照，JSON格式'))
+
+    # 将快照内容解压回写到方案表
+    conn = op.get_bind()
+    plans = sa.table('student_volunteer_plans',
+        sa.column('id', sa.Integer),
+        sa.column('student_data_snapshot', sa.Text),
+        sa.column('snapshot_id', sa.Integer)
+    )
+    snapshots = sa.table('student_data_snapshots',
+        sa.column('id', sa.Integer),
+        sa.column('compressed_data', sa.LargeBinary)
+    )
+    for snapshot_id, compressed_data in conn.execute(sa.select(snapshots.c.id, snapshots.c.compressed_data)).fetchall():
+        conn.execute(
+            plans.update().where(plans.c.snapshot_id == snapshot_id).values(
+                student_data_snapshot=zlib.decompress(compressed_data).decode('utf-8')
+            )
+        )
+
+    with op.batch_alter_table('student_volunteer_plans', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_plan_snapshot', type_='foreignkey')
+        batch_op.drop_column('snapshot_id')
+
+    op.drop_table('student_data_snapshots')
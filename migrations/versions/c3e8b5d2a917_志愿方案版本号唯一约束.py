@@ -0,0 +1,56 @@
+"""志愿方案版本号唯一约束
+
+Revision ID: c3e8b5d2a917
+Revises: a4d2f7c81b30
+Create Date: 2026-10-19 10:21:36.552814
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e8b5d2a917'
+down_revision = 'a4d2f7c81b30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 并发生成或修改方案时可能已写入重复的版本号：按(版本号, ID)顺序重新编号这些学生的方案，
+    # 并只保留版本号最大的方案为当前版本
+    conn = op.get_bind()
+    plans = sa.table('student_volunteer_plans',
+        sa.column('id', sa.Integer),
+        sa.column('student_id', sa.Integer),
+        sa.column('version', sa.Integer),
+        sa.column('is_current', sa.Boolean)
+    )
+    duplicated_student_ids = [
+        student_id for (student_id,) in conn.execute(
+            sa.select(plans.c.student_id).group_by(
+                plans.c.student_id, plans.c.version
+            ).having(sa.func.count(plans.c.id) > 1).distinct()
+        )
+    ]
+    for student_id in duplicated_student_ids:
+        plan_ids = [
+            plan_id for (plan_id,) in conn.execute(
+                sa.select(plans.c.id).where(plans.c.student_id == student_id).order_by(plans.c.version, plans.c.id)
+            )
+        ]
+        for version, plan_id in enumerate(plan_ids, start=1):
+            conn.execute(plans.update().where(plans.c.id == plan_id).values(
+                version=version,
+                is_current=version == len(plan_ids)
+            ))
+
+    with op.batch_alter_table('student_volunteer_plans', schema=None) as batch_op:
+        batch_op.create_unique_constraint('unique_student_version', ['student_id', 'version'])
+        batch_op.drop_index('idx_student_version')
+
+
+def downgrade():
+    with op.batch_alter_table('student_volunteer_plans', schema=None) as batch_op:
+        batch_op.create_index('idx_student_version', ['student_id', 'version'], unique=False)
+        batch_op.drop_constraint('unique_student_version', type_='unique')
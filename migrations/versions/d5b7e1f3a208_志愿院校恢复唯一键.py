@@ -0,0 +1,64 @@
+"""志愿院校恢复唯一键
+
+Revision ID: d5b7e1f3a208
+Revises: c3e8b5d2a917
+Create Date: 2026-10-19 15:08:42.716203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5b7e1f3a208'
+down_revision = 'c3e8b5d2a917'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 06475a15bd11 删除了(plan_id, volunteer_index)唯一键以允许不同志愿段使用相同序号，
+    # 同一志愿段内的序号仍应唯一：清理同一(方案, 志愿段, 序号)下的重复院校，保留最后写入(ID最大)的记录，
+    # 引用被删除记录的共享记录改为引用保留的记录
+    conn = op.get_bind()
+    colleges = sa.table('volunteer_colleges',
+        sa.column('id', sa.Integer),
+        sa.column('plan_id', sa.Integer),
+        sa.column('group_id', sa.Integer),
+        sa.column('volunteer_index', sa.Integer)
+    )
+    specialties = sa.table('volunteer_specialties',
+        sa.column('volunteer_college_id', sa.Integer)
+    )
+    links = sa.table('plan_volunteer_links',
+        sa.column('volunteer_college_id', sa.Integer)
+    )
+    duplicated = conn.execute(
+        sa.select(colleges.c.plan_id, colleges.c.group_id, colleges.c.volunteer_index).group_by(
+            colleges.c.plan_id, colleges.c.group_id, colleges.c.volunteer_index
+        ).having(sa.func.count(colleges.c.id) > 1)
+    ).all()
+    for plan_id, group_id, volunteer_index in duplicated:
+        college_ids = [
+            college_id for (college_id,) in conn.execute(
+                sa.select(colleges.c.id).where(
+                    colleges.c.plan_id == plan_id,
+                    colleges.c.group_id == group_id,
+                    colleges.c.volunteer_index == volunteer_index
+                ).order_by(colleges.c.id)
+            )
+        ]
+        kept_id, removed_ids = college_ids[-1], college_ids[:-1]
+        conn.execute(links.update().where(links.c.volunteer_college_id.in_(removed_ids)).values(
+            volunteer_college_id=kept_id
+        ))
+        conn.execute(specialties.delete().where(specialties.c.volunteer_college_id.in_(removed_ids)))
+        conn.execute(colleges.delete().where(colleges.c.id.in_(removed_ids)))
+
+    with op.batch_alter_table('volunteer_colleges', schema=None) as batch_op:
+        batch_op.create_unique_constraint('unique_volunteer_index', ['plan_id', 'group_id', 'volunteer_index'])
+
+
+def downgrade():
+    with op.batch_alter_table('volunteer_colleges', schema=None) as batch_op:
+        batch_op.drop_constraint('unique_volunteer_index', type_='unique')
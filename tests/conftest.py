@@ -0,0 +1,195 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+import pytest
+
+# 添加项目根目录到系统路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# 测试环境配置，必须在导入应用配置之前设置(.env 中的同名配置不会覆盖已有环境变量)
+# 数据库使用临时SQLite文件，Redis使用独立的库(测试会清空该库，不要指向业务使用的库)
+TEST_DB_DIR = tempfile.mkdtemp(prefix='college_advisor_test_')
+TEST_REDIS_URL = os.environ.get('TEST_REDIS_URL', 'redis://localhost:6379/15')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TEST_DB_DIR, 'test.db')}"
+os.environ['CELERY_BROKER_URL'] = TEST_REDIS_URL
+os.environ['CELERY_RESULT_BACKEND'] = TEST_REDIS_URL
+os.environ['SOCKETIO_MESSAGE_QUEUE'] = TEST_REDIS_URL
+# 大模型调用使用进程内桩模型，不访问网络
+os.environ['LLM_PROVIDER_OVERRIDE'] = 'stub'
+os.environ['LLM_STUB_PROFILE'] = 'instant'
+os.environ['LLM_RATE_LIMIT_ENABLED'] = '0'
+os.environ['LLM_CONTEXT_CACHE_ENABLED'] = '0'
+
+from sqlalchemy import event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.dialects.mysql import TINYINT
+from app import create_app
+from app.extensions import db, cache
+
+
+@compiles(TINYINT, 'sqlite')
+def compile_tinyint_sqlite(type_, compiler, **kwargs):
+    """数据表模型中使用了MySQL的TINYINT，在SQLite中建表时按INTEGER处理"""
+    return 'INTEGER'
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def db_session(app):
+    """每个测试使用全新的表结构，测试在应用上下文中执行"""
+    with app.app_context():
+        db.create_all()
+        try:
+            yield db.session
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+
+@pytest.fixture
+def redis_client(app):
+    """测试使用的Redis库，测试前后清空；Redis不可用时跳过测试"""
+    with app.app_context():
+        client = cache.cache._write_client
+    try:
+        client.ping()
+    except Exception:
+        pytest.skip(f"需要可用的Redis: {TEST_REDIS_URL}(可通过 TEST_REDIS_URL 指定)")
+    client.flushdb()
+    try:
+        yield client
+    finally:
+        client.flushdb()
+
+
+class StatementCounter:
+    """统计一段代码执行的SQL语句数"""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+@pytest.fixture
+def count_statements(db_session):
+    """
+    返回上下文管理器工厂，with 块内执行的SQL语句记录在计数器中
+
+    用法: with count_statements() as counter: ...; counter.count
+    """
+    from contextlib import contextmanager
+
+    engine = db.engine
+
+    @contextmanager
+    def counting():
+        counter = StatementCounter()
+        event.listen(engine, 'before_cursor_execute', counter)
+        try:
+            yield counter
+        finally:
+            event.remove(engine, 'before_cursor_execute', counter)
+
+    return counting
+
+
+@pytest.fixture
+def no_background_tasks(monkeypatch):
+    """
+    不投递后台任务：方案修改、生成后投递的分析、归档、预计算任务记录在列表中而不发送到broker
+
+    :return: 列表 [(任务名称, 参数), ...]
+    """
+    from app.tasks import volunteer_tasks
+
+    dispatched = []
+
+    def recorder(name):
+        def record(*args, **kwargs):
+            dispatched.append((name, args))
+        return record
+
+    monkeypatch.setattr(volunteer_tasks, 'refresh_plan_analyses', recorder('refresh_plan_analyses'))
+    monkeypatch.setattr(volunteer_tasks, 'schedule_plan_compaction', recorder('schedule_plan_compaction'))
+    monkeypatch.setattr(volunteer_tasks, 'schedule_candidate_precompute', recorder('schedule_candidate_precompute'))
+    return dispatched
+
+
+class PlanFactory:
+    """创建测试用的志愿方案、院校志愿和专业志愿"""
+
+    def __init__(self, session):
+        self.session = session
+
+    def plan(self, student_id=1, version=1, is_current=True, **kwargs):
+        from app.models.student_volunteer_plan import StudentVolunteerPlan
+
+        plan = StudentVolunteerPlan(
+            student_id=student_id,
+            planner_id=kwargs.pop('planner_id', 1),
+            version=version,
+            is_current=is_current,
+            generation_status=kwargs.pop('generation_status', StudentVolunteerPlan.GENERATION_STATUS_SUCCESS),
+            **kwargs
+        )
+        self.session.add(plan)
+        self.session.commit()
+        return plan
+
+    def college(self, plan, group_id=1, volunteer_index=1, college_group_id=None, specialty_count=2, **kwargs):
+        from app.models.student_volunteer_plan import VolunteerCollege, VolunteerSpecialty
+
+        college_group_id = college_group_id or 1000 + volunteer_index
+        college = VolunteerCollege(
+            plan_id=plan.id,
+            category_id=kwargs.pop('category_id', 1),
+            group_id=group_id,
+            volunteer_index=volunteer_index,
+            college_id=kwargs.pop('college_id', college_group_id // 10),
+            college_name=kwargs.pop('college_name', f'测试大学{college_group_id}'),
+            college_group_id=college_group_id,
+            **kwargs
+        )
+        self.session.add(college)
+        self.session.flush()
+        for index in range(1, specialty_count + 1):
+            self.session.add(VolunteerSpecialty(
+                volunteer_college_id=college.id,
+                specialty_id=college_group_id * 10 + index,
+                specialty_name=f'专业{index}',
+                specialty_index=index
+            ))
+        self.session.commit()
+        return college
+
+    def link(self, plan, college):
+        """新版本共享上一版本的院校志愿"""
+        from app.models.student_volunteer_plan import PlanVolunteerLink
+
+        link = PlanVolunteerLink(
+            plan_id=plan.id,
+            volunteer_college_id=college.id,
+            group_id=college.group_id,
+            volunteer_index=college.volunteer_index
+        )
+        self.session.add(link)
+        self.session.commit()
+        return link
+
+
+@pytest.fixture
+def plan_factory(db_session):
+    return PlanFactory(db_session)
@@ -0,0 +1,92 @@
+# tests/test_incremental_generation.py
+from app.core.recommendation.plan_solver import LLMCallBudget
+from app.services.volunteer.plan_service import (
+    GENERATION_MODE_AI, GENERATION_MODE_SOLVER, SEGMENT_SOURCE_AI, SEGMENT_SOURCE_LOCAL,
+    ai_select_college_ids, compute_profile_fingerprint, compute_segment_fingerprint, is_segment_reusable
+)
+
+
+def make_candidates(count=5):
+    return [
+        {
+            'cgid': 1000 + index,
+            'cname': f'测试大学{index}',
+            'area_name': '北京',
+            'tese_text': ['双一流'],
+            'specialties': [
+                {'spid': 20000 + index * 10 + number, 'spname': f'专业{number}', 'tuition': 5000}
+                for number in range(8)
+            ]
+        }
+        for index in range(count)
+    ]
+
+
+CANDIDATES = make_candidates()
+FINGERPRINT = compute_segment_fingerprint(CANDIDATES)
+PROFILE = compute_profile_fingerprint('分数: 600\n就业方向: 计算机')
+
+
+def test_ai_mode_reuses_ai_segment_with_same_profile():
+    previous = {'fingerprint': FINGERPRINT, 'profile': PROFILE, 'source': SEGMENT_SOURCE_AI}
+    assert is_segment_reusable(previous, FINGERPRINT, PROFILE, GENERATION_MODE_AI)
+
+
+def test_ai_mode_does_not_reuse_locally_selected_segment():
+    # 上一版本该志愿段走了本地求解(首次生成、预算耗尽或大模型出错)，AI模式下应重新让大模型选择
+    previous = {'fingerprint': FINGERPRINT, 'profile': PROFILE, 'source': SEGMENT_SOURCE_LOCAL}
+    assert not is_segment_reusable(previous, FINGERPRINT, PROFILE, GENERATION_MODE_AI)
+    # 仅本地求解时候选集不变即可复用
+    assert is_segment_reusable(previous, FINGERPRINT, PROFILE, GENERATION_MODE_SOLVER)
+
+
+def test_ai_mode_does_not_reuse_when_profile_changed():
+    # 候选集相同，但档案中不影响候选集的内容(如备注、就业方向之外的偏好)变化
+    previous = {'fingerprint': FINGERPRINT, 'profile': PROFILE, 'source': SEGMENT_SOURCE_AI}
+    changed_profile = compute_profile_fingerprint('分数: 600\n就业方向: 计算机\n备注: 希望离家近')
+    assert changed_profile != PROFILE
+    assert not is_segment_reusable(previous, FINGERPRINT, changed_profile, GENERATION_MODE_AI)
+    assert is_segment_reusable(previous, FINGERPRINT, changed_profile, GENERATION_MODE_SOLVER)
+
+
+def test_candidate_change_is_never_reused():
+    previous = {'fingerprint': FINGERPRINT, 'profile': PROFILE, 'source': SEGMENT_SOURCE_AI}
+    other = compute_segment_fingerprint(make_candidates(4))
+    assert not is_segment_reusable(previous, other, PROFILE, GENERATION_MODE_AI)
+    assert not is_segment_reusable(previous, other, PROFILE, GENERATION_MODE_SOLVER)
+
+
+def test_legacy_fingerprint_only_reused_by_solver():
+    # 旧数据只记录了候选集指纹，来源未知
+    assert not is_segment_reusable(FINGERPRINT, FINGERPRINT, PROFILE, GENERATION_MODE_AI)
+    assert is_segment_reusable(FINGERPRINT, FINGERPRINT, PROFILE, GENERATION_MODE_SOLVER)
+    assert not is_segment_reusable(None, FINGERPRINT, PROFILE, GENERATION_MODE_SOLVER)
+
+
+def test_selection_source_is_local_when_budget_exhausted(app):
+    with app.app_context():
+        selection, source = ai_select_college_ids(
+            CANDIDATES, '档案', {'student_score': 600}, llm_budget=LLMCallBudget(0)
+        )
+    assert source == SEGMENT_SOURCE_LOCAL
+    assert len(selection) == 4
+
+
+def test_selection_source_is_local_on_first_generation(app):
+    with app.app_context():
+        _, source = ai_select_college_ids(
+            CANDIDATES, '档案', {'student_score': 600}, is_first=True, llm_budget=LLMCallBudget(5)
+        )
+    assert source == SEGMENT_SOURCE_LOCAL
+
+
+def test_selection_source_is_ai_when_model_selects(app):
+    # 大模型为进程内桩模型(conftest 中 LLM_PROVIDER_OVERRIDE=stub)
+    budget = LLMCallBudget(1)
+    with app.app_context():
+        selection, source = ai_select_college_ids(
+            CANDIDATES, '档案', {'student_score': 600}, llm_budget=budget
+        )
+    assert source == SEGMENT_SOURCE_AI
+    assert budget.remaining == 0
+    assert set(selection) <= {str(college['cgid']) for college in CANDIDATES}
@@ -0,0 +1,59 @@
+# tests/test_llm_config_cache.py
+import pytest
+from app.services.ai.llm_config_cache import LLMConfigCache
+
+KEY = LLMConfigCache.ACTIVE_PROVIDER_KEY
+
+
+@pytest.fixture
+def config_cache(app, monkeypatch):
+    """空的进程内缓存，不启动订阅线程(测试直接调用 invalidate_local 模拟收到通知)"""
+    monkeypatch.setattr(LLMConfigCache, '_ensure_listener', classmethod(lambda cls: None))
+    LLMConfigCache.invalidate_local()
+    with app.app_context():
+        yield LLMConfigCache
+    LLMConfigCache.invalidate_local()
+
+
+class Loader:
+    """按顺序返回给定的值，可在加载过程中执行回调(模拟加载期间收到失效通知)"""
+
+    def __init__(self, *values, during_load=None):
+        self.values = list(values)
+        self.during_load = during_load
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.during_load is not None:
+            self.during_load()
+            self.during_load = None
+        return self.values.pop(0)
+
+
+def test_get_caches_loaded_value(config_cache):
+    loader = Loader('provider-1')
+
+    assert config_cache.get(KEY, loader) == 'provider-1'
+    assert config_cache.get(KEY, loader) == 'provider-1'
+    assert loader.calls == 1
+
+
+@pytest.mark.parametrize('invalidated_key', [KEY, LLMConfigCache.ALL_KEYS])
+def test_value_loaded_across_invalidation_is_not_stored(config_cache, invalidated_key):
+    # 加载读到旧配置后、写入缓存前收到失效通知，旧值不能写回缓存
+    loader = Loader('stale', 'fresh', during_load=lambda: config_cache.invalidate_local(invalidated_key))
+
+    assert config_cache.get(KEY, loader) == 'stale'
+    assert config_cache.get(KEY, loader) == 'fresh'
+    assert config_cache.get(KEY, loader) == 'fresh'
+    assert loader.calls == 2
+
+
+def test_invalidating_other_key_keeps_loaded_value(config_cache):
+    other_key = LLMConfigCache.prompt_key('college_analysis')
+    loader = Loader('provider-1', during_load=lambda: config_cache.invalidate_local(other_key))
+
+    assert config_cache.get(KEY, loader) == 'provider-1'
+    assert config_cache.get(KEY, loader) == 'provider-1'
+    assert loader.calls == 1
@@ -0,0 +1,103 @@
+# tests/test_llm_context_cache.py
+import time
+import pytest
+from app.services.ai.async_client import AsyncLLMClient
+from app.services.ai.context_cache import LLMContextCache
+from app.services.ai.llm_service import LLMService
+from app.services.ai.telemetry import LLMTelemetry
+
+PROVIDER = "stub_context"
+PROVIDER_CONFIG = {
+    "api_env_key": "STUB_CONTEXT_API_KEY",
+    "base_url": "http://stub-context.local/v1",
+    "model_name": "stub-context-model",
+    "stub": True,
+    "context_cache": True,
+}
+PREFIX = [{"role": "system", "content": "系统提示词"}, {"role": "system", "content": "学生档案" * 20}]
+
+
+@pytest.fixture
+def context_cache(app, redis_client, monkeypatch):
+    """启用上下文缓存的桩提供者，桩模型每个请求耗时0.5秒"""
+    monkeypatch.setitem(LLMService.PROVIDERS, PROVIDER, PROVIDER_CONFIG)
+    monkeypatch.setitem(app.config, 'LLM_PROVIDER_OVERRIDE', PROVIDER)
+    monkeypatch.setitem(app.config, 'LLM_CONTEXT_CACHE_ENABLED', True)
+    monkeypatch.setitem(app.config, 'LLM_CONTEXT_CACHE_MIN_CHARS', 10)
+    monkeypatch.setitem(app.config, 'LLM_STUB_TTFT', 0.5)
+    with app.app_context():
+        yield redis_client
+
+    async def close_client():
+        client = AsyncLLMClient._clients.pop(PROVIDER, None)
+        if client is not None:
+            await client.close()
+
+    AsyncLLMClient.run(close_client())
+
+
+def tag_status(redis_client):
+    status = redis_client.get(LLMContextCache._status_key(LLMContextCache.make_tag(PREFIX)))
+    return status.decode('utf-8') if isinstance(status, bytes) else status
+
+
+def wait_for_status(redis_client, timeout=10):
+    deadline = time.monotonic() + timeout
+    while tag_status(redis_client) == LLMContextCache.STATUS_CREATING and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return tag_status(redis_client)
+
+
+def test_cache_is_created_in_background(context_cache):
+    with LLMTelemetry.collect() as collector:
+        started = time.monotonic()
+        # 缓存不存在时在后台创建，调用线程不等待(桩模型需要0.5秒)，本次发送完整消息
+        assert LLMContextCache.reference(PROVIDER, PROVIDER_CONFIG, PREFIX) is None
+        assert time.monotonic() - started < 0.3
+        assert tag_status(context_cache) == LLMContextCache.STATUS_CREATING
+        # 创建中其他调用同样发送完整消息
+        assert LLMContextCache.reference(PROVIDER, PROVIDER_CONFIG, PREFIX) is None
+
+        assert wait_for_status(context_cache) == LLMContextCache.STATUS_READY
+
+    cache_message = LLMContextCache.reference(PROVIDER, PROVIDER_CONFIG, PREFIX)
+    assert cache_message["role"] == "cache"
+    assert cache_message["content"].startswith(f"tag={LLMContextCache.make_tag(PREFIX)};")
+    # 创建请求经 AsyncLLMClient 发送，计入遥测
+    assert [(record['provider'], record['call_name'], record['outcome']) for record in collector.records] == [
+        (PROVIDER, LLMContextCache.CALL_NAME, LLMTelemetry.OUTCOME_SUCCESS)
+    ]
+
+
+def test_failed_creation_keeps_sending_full_messages(context_cache, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'LLM_STUB_ERROR_RATE', 1)
+
+    assert LLMContextCache.reference(PROVIDER, PROVIDER_CONFIG, PREFIX) is None
+    assert wait_for_status(context_cache) == LLMContextCache.STATUS_FAILED
+    # 失败状态保留有效期，期间不重复创建
+    assert LLMContextCache.reference(PROVIDER, PROVIDER_CONFIG, PREFIX) is None
+    assert tag_status(context_cache) == LLMContextCache.STATUS_FAILED
+
+
+def test_calls_reference_cache_once_ready(context_cache, monkeypatch):
+    sent_messages = []
+    send = LLMService._send.__func__
+
+    def record_send(cls, request):
+        sent_messages.append(request["params"]["messages"])
+        return send(cls, request)
+
+    monkeypatch.setattr(LLMService, '_send', classmethod(record_send))
+
+    def call():
+        return LLMService._call_api(
+            user_input="本次输入", system=PREFIX[0]["content"], shared_context=PREFIX[1]["content"],
+            context_cache=True, call_name="context_cache_test"
+        )
+
+    call()
+    assert wait_for_status(context_cache) == LLMContextCache.STATUS_READY
+    call()
+
+    assert [message["role"] for message in sent_messages[0]] == ["system", "user"]
+    assert [message["role"] for message in sent_messages[1]] == ["cache", "user"]
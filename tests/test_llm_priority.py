@@ -0,0 +1,63 @@
+# tests/test_llm_priority.py
+import asyncio
+from flask_jwt_extended import create_access_token, verify_jwt_in_request
+from app.core.auth.service import AuthService
+from app.services.ai.async_client import _PrioritySemaphore
+from app.services.ai.llm_priority import LLMPriority
+
+
+def test_interactive_calls_get_concurrency_slots_first():
+    order = []
+
+    async def call(semaphore, name, priority):
+        async with semaphore.hold(priority):
+            order.append(name)
+
+    async def scenario():
+        semaphore = _PrioritySemaphore(1)
+        await semaphore.acquire(LLMPriority.BACKGROUND)
+        tasks = [
+            asyncio.ensure_future(call(semaphore, name, priority))
+            for name, priority in (
+                ('后台1', LLMPriority.BACKGROUND),
+                ('后台2', LLMPriority.BACKGROUND),
+                ('交互式', LLMPriority.INTERACTIVE),
+            )
+        ]
+        # 等待者都已排队后释放名额
+        await asyncio.sleep(0)
+        semaphore.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+
+    assert order == ['交互式', '后台1', '后台2']
+
+
+def test_cancelled_waiter_does_not_lose_slot():
+    async def scenario():
+        semaphore = _PrioritySemaphore(1)
+        await semaphore.acquire(LLMPriority.BACKGROUND)
+        waiter = asyncio.ensure_future(semaphore.acquire(LLMPriority.INTERACTIVE))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        semaphore.release()
+        # 被取消的等待者不占用名额
+        await asyncio.wait_for(semaphore.acquire(LLMPriority.BACKGROUND), timeout=1)
+
+    asyncio.run(scenario())
+
+
+def test_publish_headers_read_institution_from_token(app, db_session, count_statements):
+    user = type('User', (), {'id': 1, 'institution_id': 7})
+    token = create_access_token(identity=str(user.id), additional_claims=AuthService.access_token_claims(user))
+
+    headers = {}
+    with app.test_request_context(headers={'Authorization': f'Bearer {token}'}):
+        verify_jwt_in_request()
+        with count_statements() as counter:
+            LLMPriority.add_publish_headers(headers=headers)
+
+    assert headers == {LLMPriority.INSTITUTION_HEADER: 7}
+    # 投递任务时不查询用户表
+    assert counter.count == 0
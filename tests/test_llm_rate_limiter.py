@@ -0,0 +1,106 @@
+# tests/test_llm_rate_limiter.py
+import asyncio
+import pytest
+from app.services.ai.llm_priority import LLMPriority
+from app.services.ai.rate_limiter import LLMRateLimiter, LLMRateLimitTimeout
+
+PROVIDER = "stub_limited"
+# 预估token数 = 消息字符数 / 2 + max_tokens
+PARAMS = {"messages": [{"role": "user", "content": "问" * 200}], "max_tokens": 100}
+COST = 200
+
+
+def limits(client, priority=LLMPriority.INTERACTIVE, institution=LLMPriority.DEFAULT_INSTITUTION,
+           rpm=0, tpm=0, reserve=0, max_wait=0.1):
+    """限流配置(与 LLMRateLimiter.settings() 的结果字段一致)，等待超过0.1秒即超时"""
+    return {
+        'priority': priority,
+        'institution': institution,
+        'interactive_reserve': reserve,
+        'rpm': rpm,
+        'tpm': tpm,
+        'max_wait': max_wait,
+        'completion_tokens': 100,
+        'client': client,
+    }
+
+
+def background(client, institution, **kwargs):
+    return limits(client, priority=LLMPriority.BACKGROUND, institution=institution, **kwargs)
+
+
+def acquire(settings):
+    return asyncio.run(LLMRateLimiter.acquire(PROVIDER, PARAMS, settings))
+
+
+def acquired_count(settings, attempts):
+    """连续获取令牌，返回超时前成功的次数"""
+    for count in range(attempts):
+        try:
+            acquire(settings)
+        except LLMRateLimitTimeout:
+            return count
+    return attempts
+
+
+def tokens(redis_client, key):
+    return float(redis_client.hget(key, 'tokens'))
+
+
+def test_request_bucket_limits_calls_per_minute(redis_client):
+    settings = limits(redis_client, rpm=3)
+
+    assert acquired_count(settings, 5) == 3
+    with pytest.raises(LLMRateLimitTimeout):
+        acquire(settings)
+
+
+def test_token_bucket_is_reconciled_with_actual_usage(redis_client):
+    settings = limits(redis_client, tpm=1000)
+    tpm_key = LLMRateLimiter._keys(PROVIDER)[1]
+
+    reserved = acquire(settings)
+    assert reserved == COST
+    assert tokens(redis_client, tpm_key) == pytest.approx(800, abs=1)
+
+    # 实际用量少于预估，退还差额
+    asyncio.run(LLMRateLimiter.reconcile(PROVIDER, reserved, {'total_tokens': 50}, settings))
+    assert tokens(redis_client, tpm_key) == pytest.approx(950, abs=1)
+
+
+def test_background_reconcile_adjusts_institution_bucket(redis_client):
+    settings = background(redis_client, 'school_a', tpm=1000)
+    keys = LLMRateLimiter._keys(PROVIDER, 'school_a')
+
+    reserved = acquire(settings)
+    assert tokens(redis_client, keys[5]) == pytest.approx(800, abs=1)
+
+    # 实际用量多于预估，全局和机构token桶都补扣
+    asyncio.run(LLMRateLimiter.reconcile(PROVIDER, reserved, {'total_tokens': 500}, settings))
+    assert tokens(redis_client, keys[1]) == pytest.approx(500, abs=1)
+    assert tokens(redis_client, keys[5]) == pytest.approx(500, abs=1)
+
+
+def test_background_cannot_use_interactive_reserve(redis_client):
+    # 预留20%给交互式调用：后台调用最多使用8个请求
+    assert acquired_count(background(redis_client, 'school_a', rpm=10, reserve=0.2), 10) == 8
+    assert acquired_count(limits(redis_client, rpm=10, reserve=0.2), 3) == 2
+
+
+def test_background_yields_to_waiting_interactive_call(redis_client):
+    waiters_key = LLMRateLimiter._keys(PROVIDER)[2]
+    redis_client.zadd(waiters_key, {'interactive-request': 9999999999})
+
+    with pytest.raises(LLMRateLimitTimeout):
+        acquire(background(redis_client, 'school_a', rpm=10))
+    assert acquired_count(limits(redis_client, rpm=10), 1) == 1
+    # 交互式调用获取成功后只移出自身，其他等待者仍在
+    assert redis_client.zcard(waiters_key) == 1
+
+
+def test_background_quota_is_shared_between_active_institutions(redis_client):
+    # 机构B先登记为活跃机构，两个机构平分后台额度(各5个请求)
+    assert acquired_count(background(redis_client, 'school_b', rpm=10), 1) == 1
+
+    assert acquired_count(background(redis_client, 'school_a', rpm=10), 10) == 5
+    assert acquired_count(background(redis_client, 'school_b', rpm=10), 10) == 4
@@ -0,0 +1,121 @@
+# tests/test_llm_response_cache.py
+import pytest
+from app.services.ai.llm_service import LLMService
+from app.services.ai.response_cache import LLMResponseCache
+
+PARAMS = {
+    "model": "stub-model",
+    "messages": [{"role": "system", "content": "系统提示词"}, {"role": "user", "content": "用户输入"}],
+    "temperature": 0.3,
+    "response_format": {"type": "json_object"},
+}
+
+
+def test_cache_key_is_stable():
+    reordered = {name: PARAMS[name] for name in reversed(list(PARAMS))}
+    key = LLMResponseCache.make_key("stub", PARAMS)
+
+    assert LLMResponseCache.make_key("stub", reordered) == key
+    # 不参与缓存键的参数(如是否流式)不影响缓存键
+    assert LLMResponseCache.make_key("stub", dict(PARAMS, stream=False)) == key
+    assert key.startswith(f"{LLMResponseCache.KEY_PREFIX}:")
+
+
+@pytest.mark.parametrize('provider_name, changes', [
+    ("moonshot", {}),
+    ("stub", {"model": "other-model"}),
+    ("stub", {"temperature": 0.75}),
+    ("stub", {"response_format": None}),
+    ("stub", {"messages": [{"role": "user", "content": "用户输入"}]}),
+])
+def test_cache_key_changes_with_request(provider_name, changes):
+    assert LLMResponseCache.make_key(provider_name, dict(PARAMS, **changes)) != LLMResponseCache.make_key("stub", PARAMS)
+
+
+@pytest.fixture
+def response_cache(app, redis_client, monkeypatch):
+    """启用响应缓存(默认关闭)，测试在应用上下文中执行"""
+    monkeypatch.setitem(app.config, 'LLM_RESPONSE_CACHE_ENABLED', True)
+    with app.app_context():
+        yield redis_client
+
+
+@pytest.fixture
+def sent_requests(monkeypatch):
+    """记录实际发送给提供者的请求(同步和并发两种发送方式)"""
+    sent = []
+    send, send_async = LLMService._send.__func__, LLMService._send_async.__func__
+
+    def record_send(cls, request):
+        sent.append(request["call_name"])
+        return send(cls, request)
+
+    def record_send_async(cls, request, settings_by_provider, router_options):
+        sent.append(request["call_name"])
+        return send_async(cls, request, settings_by_provider, router_options)
+
+    monkeypatch.setattr(LLMService, '_send', classmethod(record_send))
+    monkeypatch.setattr(LLMService, '_send_async', classmethod(record_send_async))
+    return sent
+
+
+def analyze(**kwargs):
+    return LLMService.analyzing_full_plan(user_info="学生档案", volunteer_plan="志愿方案", **kwargs)
+
+
+def test_cache_is_opt_in(app, sent_requests, monkeypatch):
+    monkeypatch.delitem(app.config, 'LLM_RESPONSE_CACHE_ENABLED', raising=False)
+    with app.app_context():
+        assert not LLMResponseCache.enabled()
+        analyze()
+        analyze()
+    assert len(sent_requests) == 2
+
+
+def test_use_cache_false_skips_cached_response(response_cache, sent_requests):
+    content = analyze()
+    assert analyze() == content
+    assert len(sent_requests) == 1
+
+    # 跳过缓存读取重新调用，新结果仍写入缓存
+    assert analyze(use_cache=False) == content
+    assert len(sent_requests) == 2
+    assert analyze() == content
+    assert len(sent_requests) == 2
+
+    calls = LLMResponseCache.stats()['calls']['analyzing_full_plan']
+    assert (calls['hit'], calls['miss']) == (2, 1)
+
+
+def test_run_concurrently_honors_use_cache(response_cache, sent_requests):
+    calls = [(LLMService.analyzing_full_plan, {"user_info": "学生档案", "volunteer_plan": f"志愿方案{index}"}) for index in range(3)]
+
+    first = LLMService.run_concurrently(calls)
+    assert len(sent_requests) == 3
+    assert LLMService.run_concurrently(calls) == first
+    assert len(sent_requests) == 3
+
+    refreshed = LLMService.run_concurrently([(method, dict(kwargs, use_cache=False)) for method, kwargs in calls])
+    assert refreshed == first
+    assert len(sent_requests) == 6
+
+
+def test_oldest_entries_are_evicted(app, response_cache, monkeypatch):
+    monkeypatch.setitem(app.config, 'LLM_RESPONSE_CACHE_MAX_ENTRIES', 2)
+    keys = [LLMResponseCache.make_key("stub", dict(PARAMS, temperature=index / 10)) for index in range(3)]
+
+    for index, key in enumerate(keys):
+        LLMResponseCache.set(key, f"响应{index}")
+
+    assert LLMResponseCache.get(keys[0]) is None
+    assert [LLMResponseCache.get(key) for key in keys[1:]] == ["响应1", "响应2"]
+    assert LLMResponseCache.stats()['entry_count'] == 2
+
+
+def test_oversized_response_is_not_cached(app, response_cache, monkeypatch):
+    monkeypatch.setitem(app.config, 'LLM_RESPONSE_CACHE_MAX_BYTES', 16)
+    key = LLMResponseCache.make_key("stub", PARAMS)
+
+    LLMResponseCache.set(key, "不可压缩的长响应" * 50 + "".join(chr(0x4e00 + index * 37) for index in range(200)))
+
+    assert LLMResponseCache.get(key) is None
@@ -0,0 +1,125 @@
+# tests/test_plan_archive.py
+import pytest
+from app.models.student_volunteer_plan import (
+    StudentVolunteerPlan, VolunteerCollege, VolunteerSpecialty, PlanVolunteerLink
+)
+from app.models.volunteer_plan_archive import VolunteerPlanArchive
+from app.services.volunteer.plan_archive_service import PlanArchiveService
+from app.services.volunteer.plan_service import VolunteerPlanService
+
+# 生成中的方案不缓存对比结果，测试不依赖Redis
+PROCESSING = StudentVolunteerPlan.GENERATION_STATUS_PROCESSING
+
+
+@pytest.fixture
+def archived_plans(plan_factory):
+    """版本1自有院校A(志愿1)和B(志愿2)，版本2、3都共享A；归档版本1"""
+    v1 = plan_factory.plan(version=1, is_current=False, generation_status=PROCESSING)
+    v2 = plan_factory.plan(version=2, is_current=False)
+    v3 = plan_factory.plan(version=3, generation_status=PROCESSING)
+    shared = plan_factory.college(v1, volunteer_index=1)
+    owned = plan_factory.college(v1, volunteer_index=2)
+    plan_factory.link(v2, shared)
+    plan_factory.link(v3, shared)
+
+    assert PlanArchiveService.archive_plan(v1.id)
+    return v1.id, v2.id, v3.id, shared.id, owned.id
+
+
+def linked_plan_ids(college_id):
+    return {link.plan_id for link in PlanVolunteerLink.query.filter_by(volunteer_college_id=college_id)}
+
+
+def test_archive_transfers_shared_volunteers_to_oldest_linking_plan(archived_plans):
+    v1_id, v2_id, v3_id, shared_id, owned_id = archived_plans
+
+    assert StudentVolunteerPlan.query.get(v1_id).is_archived
+    assert VolunteerPlanArchive.query.filter_by(plan_id=v1_id).count() == 1
+    # 共享院校转交给最早引用它的版本2，版本2的共享记录删除，版本3继续引用
+    assert VolunteerCollege.query.get(shared_id).plan_id == v2_id
+    assert linked_plan_ids(shared_id) == {v3_id}
+    assert VolunteerSpecialty.query.filter_by(volunteer_college_id=shared_id).count() == 2
+    # 没有被共享的院校及其专业直接删除
+    assert VolunteerCollege.query.get(owned_id) is None
+    assert VolunteerSpecialty.query.filter_by(volunteer_college_id=owned_id).count() == 0
+    assert [college.id for college in VolunteerCollege.query_for_plan(v2_id)] == [shared_id]
+
+
+def test_archived_version_supports_detail_diff_and_export(archived_plans, app, monkeypatch, tmp_path):
+    v1_id, v2_id, v3_id, shared_id, owned_id = archived_plans
+
+    plan = VolunteerPlanService.get_volunteer_plan(v1_id)
+    assert [college['volunteer_index'] for college in plan['colleges']] == [1, 2]
+    assert all(len(college['specialties']) == 2 for college in plan['colleges'])
+
+    diff = VolunteerPlanService.diff_volunteer_plans(v1_id, v3_id)
+    assert [volunteer['volunteer_index'] for volunteer in diff['removed']] == [2]
+    assert not (diff['added'] or diff['moved'] or diff['changed'])
+    assert diff['unchanged_count'] == 1
+
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    exported = VolunteerPlanService.export_volunteer_plan_to_excel(v1_id)
+    assert exported['success'], exported.get('error')
+    assert (tmp_path / 'exports' / exported['filename']).exists()
+
+
+def test_update_from_archived_version_restores_unmodified_volunteers(archived_plans, monkeypatch, no_background_tasks):
+    v1_id, v2_id, v3_id, shared_id, owned_id = archived_plans
+    monkeypatch.setattr(VolunteerPlanService, '_resolve_submitted_volunteer_details', staticmethod(
+        lambda student_id, colleges: ({}, {})
+    ))
+
+    new_plan = VolunteerPlanService.update_volunteer_plan(v1_id, {
+        'base_version': 3,
+        'colleges': [{
+            'category_id': 2, 'group_id': 2, 'volunteer_index': 1,
+            'college_id': 300, 'college_group_id': 3000,
+            'specialties': [{'specialty_id': 30001, 'specialty_index': 1}]
+        }]
+    })
+
+    colleges = {
+        (college.group_id, college.volunteer_index): college
+        for college in VolunteerCollege.query_for_plan(new_plan['id'])
+    }
+    assert set(colleges) == {(1, 1), (1, 2), (2, 1)}
+    # 未修改的院校从归档文档恢复为新版本自有的记录，不引用其他版本的院校
+    restored = [colleges[(1, 1)], colleges[(1, 2)]]
+    assert all(college.plan_id == new_plan['id'] for college in restored)
+    assert {college.id for college in restored}.isdisjoint({shared_id, owned_id})
+    assert [college.college_group_id for college in restored] == [1001, 1002]
+    assert all(
+        VolunteerSpecialty.query.filter_by(volunteer_college_id=college.id).count() == 2
+        for college in restored
+    )
+    assert StudentVolunteerPlan.query.get(new_plan['id']).version == 4
+
+
+def test_update_from_version_archived_during_update_restores_volunteers(plan_factory, monkeypatch, no_background_tasks):
+    v1 = plan_factory.plan(version=1, is_current=False)
+    plan_factory.plan(version=2)
+    plan_factory.college(v1, volunteer_index=1)
+    plan_factory.college(v1, volunteer_index=2)
+    v1_id = v1.id
+
+    # 只读阶段读取了版本1的院校之后、写入共享记录之前，归档任务归档了版本1(院校随之删除)
+    def archive_during_update(student_id, colleges):
+        assert PlanArchiveService.archive_plan(v1_id)
+        return {}, {}
+
+    monkeypatch.setattr(VolunteerPlanService, '_resolve_submitted_volunteer_details', staticmethod(archive_during_update))
+
+    new_plan = VolunteerPlanService.update_volunteer_plan(v1_id, {
+        'base_version': 2,
+        'colleges': [{
+            'category_id': 2, 'group_id': 2, 'volunteer_index': 1,
+            'college_id': 300, 'college_group_id': 3000,
+            'specialties': [{'specialty_id': 30001, 'specialty_index': 1}]
+        }]
+    })
+
+    colleges = VolunteerCollege.query_for_plan(new_plan['id']).all()
+    assert {(college.group_id, college.volunteer_index) for college in colleges} == {(1, 1), (1, 2), (2, 1)}
+    # 源版本已归档，未修改的院校从归档文档恢复，不引用已删除的院校
+    assert all(college.plan_id == new_plan['id'] for college in colleges)
+    assert PlanVolunteerLink.query.filter_by(plan_id=new_plan['id']).count() == 0
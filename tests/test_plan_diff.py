@@ -0,0 +1,72 @@
+# tests/test_plan_diff.py
+from app.models.student_volunteer_plan import StudentVolunteerPlan, VolunteerSpecialty
+from app.services.volunteer.plan_service import VolunteerPlanService
+
+# 生成中的方案不缓存对比结果，测试不依赖Redis
+PROCESSING = StudentVolunteerPlan.GENERATION_STATUS_PROCESSING
+
+
+def test_diff_reports_moves_by_volunteer_index(plan_factory, db_session):
+    old_plan = plan_factory.plan(version=1, is_current=False, generation_status=PROCESSING)
+    new_plan = plan_factory.plan(version=2, generation_status=PROCESSING)
+    plan_factory.college(old_plan, volunteer_index=1, college_group_id=1001)
+    plan_factory.college(old_plan, volunteer_index=2, college_group_id=1002)
+    plan_factory.college(old_plan, volunteer_index=3, college_group_id=1003)
+    # 新版本：1001与1002交换位置，1001的第2个专业换成其他专业，删除1003，新增1004
+    plan_factory.college(new_plan, volunteer_index=1, college_group_id=1002)
+    swapped = plan_factory.college(new_plan, volunteer_index=2, college_group_id=1001)
+    VolunteerSpecialty.query.filter_by(volunteer_college_id=swapped.id, specialty_index=2).update({'specialty_id': 99})
+    db_session.commit()
+    plan_factory.college(new_plan, volunteer_index=4, college_group_id=1004)
+
+    diff = VolunteerPlanService.diff_volunteer_plans(old_plan.id, new_plan.id)
+
+    assert [volunteer['college_group_id'] for volunteer in diff['added']] == [1004]
+    assert [volunteer['college_group_id'] for volunteer in diff['removed']] == [1003]
+    assert [
+        (move['college_group_id'], move['from']['volunteer_index'], move['to']['volunteer_index'])
+        for move in diff['moved']
+    ] == [(1002, 2, 1), (1001, 1, 2)]
+    [changed] = diff['changed']
+    assert changed['college_group_id'] == 1001
+    assert [specialty['specialty_id'] for specialty in changed['specialties']['added']] == [99]
+    assert diff['unchanged_count'] == 0
+
+
+def test_diff_of_identical_shared_versions_is_empty(plan_factory, db_session):
+    old_plan = plan_factory.plan(version=1, is_current=False, generation_status=PROCESSING)
+    new_plan = plan_factory.plan(version=2, generation_status=PROCESSING)
+    for index in range(1, 4):
+        plan_factory.link(new_plan, plan_factory.college(old_plan, volunteer_index=index))
+
+    diff = VolunteerPlanService.diff_volunteer_plans(old_plan.id, new_plan.id)
+
+    assert not (diff['added'] or diff['removed'] or diff['moved'] or diff['changed'])
+    assert diff['unchanged_count'] == 3
+
+
+def test_diff_keys_volunteers_by_group_and_index(plan_factory, db_session):
+    old_plan = plan_factory.plan(version=1, is_current=False, generation_status=PROCESSING)
+    new_plan = plan_factory.plan(version=2, generation_status=PROCESSING)
+    # 两个志愿段都使用序号1、2；1001在两个志愿段都填报
+    for group_id in (1, 2):
+        plan_factory.college(old_plan, group_id=group_id, volunteer_index=1, college_group_id=1001)
+    plan_factory.college(old_plan, group_id=1, volunteer_index=2, college_group_id=1002)
+    plan_factory.college(old_plan, group_id=2, volunteer_index=2, college_group_id=2002)
+    # 新版本：志愿段1不变；志愿段2的1001换成2003，2002移到序号1
+    plan_factory.college(new_plan, group_id=1, volunteer_index=1, college_group_id=1001)
+    plan_factory.college(new_plan, group_id=1, volunteer_index=2, college_group_id=1002)
+    plan_factory.college(new_plan, group_id=2, volunteer_index=1, college_group_id=2002)
+    plan_factory.college(new_plan, group_id=2, volunteer_index=2, college_group_id=2003)
+
+    diff = VolunteerPlanService.diff_volunteer_plans(old_plan.id, new_plan.id)
+
+    assert [(volunteer['group_id'], volunteer['college_group_id']) for volunteer in diff['added']] == [(2, 2003)]
+    # 在旧版本中出现两次的1001只按位置对应，不视为位置变化
+    assert [(volunteer['group_id'], volunteer['college_group_id']) for volunteer in diff['removed']] == [(2, 1001)]
+    assert [
+        (move['college_group_id'], move['from']['group_id'], move['from']['volunteer_index'], move['to']['volunteer_index'])
+        for move in diff['moved']
+    ] == [(2002, 2, 2, 1)]
+    assert not diff['changed']
+    assert diff['unchanged_count'] == 2
@@ -0,0 +1,46 @@
+# tests/test_plan_generation_lock.py
+import time
+import pytest
+from app.utils.distributed_lock import SingleFlightLock
+
+KEY = "plan_generation_lock:test"
+
+
+@pytest.fixture
+def lock(app, redis_client):
+    with app.app_context():
+        yield SingleFlightLock(KEY, 1800)
+
+
+def test_heartbeat_keeps_long_running_holder(lock, redis_client):
+    assert lock.acquire('task-1')
+
+    with lock.heartbeat('task-1', ttl=1, interval=0.2):
+        # 心跳把排队期间的长过期时间缩短为1秒，执行超过过期时间仍持有锁
+        assert redis_client.ttl(KEY) <= 1
+        time.sleep(1.5)
+        assert lock.owner() == 'task-1'
+        assert not lock.acquire('task-2')
+
+
+def test_lock_lapses_after_heartbeat_stops(lock):
+    assert lock.acquire('task-1')
+
+    # 持有者异常退出(心跳停止且未释放锁)后，锁在心跳过期时间内过期，其他调用方可以获取
+    with lock.heartbeat('task-1', ttl=1, interval=0.2):
+        pass
+    time.sleep(1.2)
+
+    assert lock.owner() is None
+    assert lock.acquire('task-2')
+
+
+def test_heartbeat_does_not_extend_lock_held_by_other(lock):
+    assert lock.acquire('task-2')
+
+    with lock.heartbeat('task-1', ttl=1, interval=0.2):
+        time.sleep(0.3)
+
+    assert lock.owner() == 'task-2'
+    assert not lock.extend('task-1')
+    assert lock.extend('task-2', 5)
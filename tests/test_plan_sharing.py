@@ -0,0 +1,128 @@
+# tests/test_plan_sharing.py
+import pytest
+from app.extensions import db
+from app.models.student_volunteer_plan import StudentVolunteerPlan, VolunteerCollege, VolunteerSpecialty, PlanVolunteerLink
+from app.services.volunteer.plan_service import VolunteerPlanService
+from app.services.volunteer.ai_college_specialty_service import AICollegeSpecialtyAnalysisService
+
+
+@pytest.fixture
+def shared_plans(plan_factory):
+    """版本1写入两个院校，版本2共享其中第一个院校"""
+    old_plan = plan_factory.plan(version=1, is_current=False)
+    new_plan = plan_factory.plan(version=2, is_current=True, parent_plan_id=old_plan.id)
+    shared = plan_factory.college(old_plan, volunteer_index=1)
+    unshared = plan_factory.college(old_plan, volunteer_index=2)
+    plan_factory.link(new_plan, shared)
+    return old_plan.id, new_plan.id, shared.id, unshared.id
+
+
+def effective_colleges(plan_id):
+    return VolunteerCollege.query_for_plan(plan_id).order_by(VolunteerCollege.volunteer_index).all()
+
+
+def test_college_analysis_on_sharing_version_is_copied(db_session, shared_plans):
+    old_plan_id, new_plan_id, shared_id, _ = shared_plans
+
+    stored_id = AICollegeSpecialtyAnalysisService.update_college_analysis(shared_id, '新版本的分析', plan_id=new_plan_id)
+
+    assert stored_id and stored_id != shared_id
+    assert VolunteerCollege.query.get(shared_id).ai_analysis is None
+    assert VolunteerCollege.query.get(shared_id).plan_id == old_plan_id
+    [clone] = effective_colleges(new_plan_id)
+    assert clone.id == stored_id and clone.plan_id == new_plan_id
+    assert clone.ai_analysis == '新版本的分析'
+    assert clone.specialties.count() == 2
+    assert PlanVolunteerLink.query.filter_by(plan_id=new_plan_id).count() == 0
+
+
+def test_college_analysis_on_owner_transfers_shared_row(db_session, shared_plans):
+    old_plan_id, new_plan_id, shared_id, _ = shared_plans
+
+    stored_id = AICollegeSpecialtyAnalysisService.update_college_analysis(shared_id, '旧版本的分析', plan_id=old_plan_id)
+
+    # 原记录转交给共享它的版本，发起分析的版本改用克隆
+    assert stored_id != shared_id
+    shared = VolunteerCollege.query.get(shared_id)
+    assert shared.plan_id == new_plan_id and shared.ai_analysis is None
+    assert [college.id for college in effective_colleges(new_plan_id)] == [shared_id]
+    old_colleges = effective_colleges(old_plan_id)
+    assert old_colleges[0].id == stored_id and old_colleges[0].ai_analysis == '旧版本的分析'
+    assert PlanVolunteerLink.query.count() == 0
+
+
+def test_analysis_without_plan_defaults_to_current_version(db_session, shared_plans):
+    old_plan_id, new_plan_id, shared_id, _ = shared_plans
+
+    stored_id = AICollegeSpecialtyAnalysisService.update_college_analysis(shared_id, '当前版本的分析')
+
+    # 未指定方案时写入包含该院校的当前版本，旧版本仍使用原记录
+    [college] = effective_colleges(new_plan_id)
+    assert college.id == stored_id != shared_id
+    assert college.ai_analysis == '当前版本的分析'
+    assert VolunteerCollege.query.get(shared_id).plan_id == old_plan_id
+    assert VolunteerCollege.query.get(shared_id).ai_analysis is None
+
+
+def test_prepare_returns_id_written_by_analysis(db_session, shared_plans):
+    _, new_plan_id, shared_id, _ = shared_plans
+
+    plan_id, target_id = AICollegeSpecialtyAnalysisService.prepare_college_analysis(shared_id)
+
+    assert plan_id == new_plan_id and target_id != shared_id
+    assert [college.id for college in effective_colleges(new_plan_id)] == [target_id]
+    # 任务按返回的ID写入时不再复制
+    assert AICollegeSpecialtyAnalysisService.update_college_analysis(target_id, '分析', plan_id=plan_id) == target_id
+    assert VolunteerCollege.query.get(target_id).ai_analysis == '分析'
+
+
+def test_unshared_college_is_written_in_place(db_session, shared_plans):
+    old_plan_id, _, _, unshared_id = shared_plans
+
+    assert AICollegeSpecialtyAnalysisService.update_college_analysis(unshared_id, '分析') == unshared_id
+    assert VolunteerCollege.query.get(unshared_id).ai_analysis == '分析'
+    assert VolunteerCollege.query.filter_by(plan_id=old_plan_id).count() == 2
+
+
+def test_specialty_analysis_on_sharing_version_is_copied(db_session, shared_plans):
+    _, new_plan_id, shared_id, _ = shared_plans
+    specialty = VolunteerSpecialty.query.filter_by(volunteer_college_id=shared_id, specialty_index=2).first()
+    specialty_id = specialty.id
+
+    stored_id = AICollegeSpecialtyAnalysisService.update_specialty_analysis(specialty_id, '专业分析', plan_id=new_plan_id)
+
+    assert stored_id != specialty_id
+    assert VolunteerSpecialty.query.get(specialty_id).ai_analysis is None
+    stored = VolunteerSpecialty.query.get(stored_id)
+    assert stored.ai_analysis == '专业分析' and stored.specialty_index == 2
+    assert stored.volunteer.plan_id == new_plan_id
+
+
+def test_delete_plan_transfers_shared_volunteers(db_session, shared_plans):
+    old_plan_id, new_plan_id, shared_id, unshared_id = shared_plans
+
+    assert VolunteerPlanService.delete_volunteer_plan(old_plan_id)
+
+    assert StudentVolunteerPlan.query.get(old_plan_id) is None
+    assert VolunteerCollege.query.get(unshared_id) is None
+    [college] = effective_colleges(new_plan_id)
+    assert college.id == shared_id and college.plan_id == new_plan_id
+    assert college.specialties.count() == 2
+
+
+def test_deleting_plan_with_shared_volunteers_directly_is_blocked(db_session, shared_plans):
+    old_plan_id, new_plan_id, shared_id, _ = shared_plans
+
+    db.session.delete(StudentVolunteerPlan.query.get(old_plan_id))
+    with pytest.raises(ValueError):
+        db.session.commit()
+    db.session.rollback()
+
+    assert [college.id for college in effective_colleges(new_plan_id)] == [shared_id]
+
+
+def test_current_plan_is_not_deleted(db_session, shared_plans):
+    _, new_plan_id, _, _ = shared_plans
+
+    assert not VolunteerPlanService.delete_volunteer_plan(new_plan_id)
+    assert StudentVolunteerPlan.query.get(new_plan_id) is not None
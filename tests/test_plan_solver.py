@@ -0,0 +1,101 @@
+# tests/test_plan_solver.py
+from app.core.recommendation.plan_solver import PlanSolver
+
+STUDENT_SCORE = 600
+
+
+def specialty(spid, prediction_score=STUDENT_SCORE, tuition=5000, plan_number=5):
+    return {'spid': spid, 'prediction_score': prediction_score, 'tuition': tuition, 'plan_number': plan_number}
+
+
+def college(cgid, cid=None, score_diff=0, specialties=None, **kwargs):
+    """院校专业组候选，默认两个学费5000的专业"""
+    return {
+        'cgid': cgid,
+        'cid': cid if cid is not None else cgid,
+        'score_diff': score_diff,
+        'specialties': specialties if specialties is not None else [specialty(cgid * 10 + 1), specialty(cgid * 10 + 2)],
+        **kwargs
+    }
+
+
+def test_admission_probability_decreases_with_score_diff():
+    solver = PlanSolver(STUDENT_SCORE)
+    probabilities = [solver._admission_probability(score_diff) for score_diff in (-20, -5, 0, 5, 20)]
+
+    assert probabilities == sorted(probabilities, reverse=True)
+    assert solver._admission_probability(0) == 0.5
+    # 极端分差不溢出
+    assert 0 <= solver._admission_probability(10000) < solver._admission_probability(-10000) <= 1
+
+
+def test_safer_colleges_score_higher():
+    solver = PlanSolver(STUDENT_SCORE)
+    candidates = [college(1, score_diff=15), college(2, score_diff=-15), college(3, score_diff=0)]
+
+    selection = solver.solve(candidates)
+
+    # 同等条件下分差越小(越稳)得分越高
+    scores = {candidate['cgid']: solver.score_college(candidate, [1, 2]) for candidate in candidates}
+    assert scores[2] > scores[3] > scores[1]
+    # 段内按分差从高到低排列
+    assert list(selection) == ['1', '3', '2']
+
+
+def test_segment_is_limited_to_four_colleges():
+    solver = PlanSolver(STUDENT_SCORE)
+
+    selection = solver.solve([college(cgid, score_diff=cgid) for cgid in range(1, 8)])
+
+    # 只保留得分最高(分差最小)的4个专业组
+    assert sorted(selection, key=int) == ['1', '2', '3', '4']
+    assert len(selection) == PlanSolver.MAX_COLLEGES_PER_SEGMENT
+
+
+def test_college_is_limited_to_six_specialties():
+    solver = PlanSolver(STUDENT_SCORE)
+    # 预测分越低录取概率越高，专业8最不容易录取
+    specialties = [specialty(spid, prediction_score=STUDENT_SCORE + spid) for spid in range(8, 0, -1)]
+
+    selection = solver.solve([college(1, specialties=specialties)])
+
+    # 保留概率最高的6个专业，按候选列表中的原始顺序输出
+    assert selection == {'1': ['6', '5', '4', '3', '2', '1']}
+    assert len(selection['1']) == PlanSolver.MAX_SPECIALTIES_PER_COLLEGE
+
+
+def test_tuition_outside_ranges_is_excluded():
+    solver = PlanSolver(STUDENT_SCORE, tuition_ranges=[(0, 6000), (20000, None)])
+    specialties = [
+        specialty(11, tuition=5000),
+        specialty(12, tuition=10000),
+        specialty(13, tuition=30000),
+        specialty(14, tuition=None),
+    ]
+
+    selection = solver.solve([college(1, specialties=specialties), college(2, specialties=[specialty(21, tuition=8000)])])
+
+    # 学费未知视为满足；没有满足学费范围的专业时不选该专业组
+    assert selection == {'1': ['11', '13', '14']}
+
+
+def test_diversity_cap_applies_across_segments():
+    solver = PlanSolver(STUDENT_SCORE, diversity_cap=2)
+
+    # 同一院校(cid=1)的三个专业组，段内最多选2个
+    first = solver.solve([college(1, cid=1), college(2, cid=1), college(3, cid=1), college(4, cid=4)])
+    assert sorted(first, key=int) == ['1', '2', '4']
+
+    # 后续志愿段中该院校已达上限，已选过的专业组也不再选
+    second = solver.solve([college(5, cid=1), college(4, cid=4), college(6, cid=6)])
+    assert second == {'6': ['61', '62']}
+
+
+def test_registered_selection_counts_towards_constraints():
+    solver = PlanSolver(STUDENT_SCORE, diversity_cap=1)
+    candidates = [college(1, cid=1), college(2, cid=1)]
+
+    # 其他方式(如大模型)选出的结果登记后同样参与去重和多样性约束
+    solver.register(candidates, {'1': ['11']})
+
+    assert solver.solve(candidates + [college(3, cid=3)]) == {'3': ['31', '32']}
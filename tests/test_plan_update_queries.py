@@ -0,0 +1,101 @@
+# tests/test_plan_update_queries.py
+import pytest
+from app.models.zwh_areas import ZwhAreas
+from app.models.zwh_xgk_fenzu_2025 import ZwhXgkFenzu2025
+from app.models.zwh_xgk_yuanxiao_2025 import ZwhXgkYuanxiao2025
+from app.models.zwh_xgk_fenshuxian_2025 import ZwhXgkFenshuxian2025
+from app.services.student.student_data_service import StudentDataService
+from app.services.volunteer.plan_service import VolunteerPlanService
+
+SUBJECT_TYPE = 2
+EDUCATION_LEVEL = 11
+SPECIALTY_COUNT = 3
+
+
+@pytest.fixture
+def college_data(db_session, monkeypatch):
+    """8个院校专业组，每组3个专业，院校都位于二级地区下"""
+    monkeypatch.setattr(StudentDataService, 'extract_college_recommendation_data', staticmethod(
+        lambda student_id: {'subject_type': SUBJECT_TYPE, 'education_level': EDUCATION_LEVEL, 'student_subjects': {}}
+    ))
+    db_session.add_all([
+        ZwhAreas(aid=1, aname='河北省', afather=0),
+        ZwhAreas(aid=2, aname='石家庄市', afather=1),
+    ])
+    for index in range(8):
+        cgid = 5000 + index
+        db_session.add(ZwhXgkYuanxiao2025(cid=100 + index, aid=2, cname=f'测试大学{index}', tese='101', leixing='102', xingzhi=1))
+        db_session.add(ZwhXgkFenzu2025(cgid=cgid, newcid=100 + index, cgname=f'第{index}组', minxuefei=4000, maxxuefei=6000))
+        db_session.add(ZwhXgkFenshuxian2025(
+            cgid=cgid, spid=32767, suid=SUBJECT_TYPE, newbid=EDUCATION_LEVEL, yuce=600, csbplannum=30
+        ))
+        for spid in range(1, SPECIALTY_COUNT + 1):
+            db_session.add(ZwhXgkFenshuxian2025(
+                cgid=cgid, spid=spid, suid=SUBJECT_TYPE, newbid=EDUCATION_LEVEL, yuce=600 + spid,
+                csbplannum=5, tuitions=5000
+            ))
+    db_session.commit()
+
+
+def submitted_colleges(count):
+    return [
+        {
+            'college_group_id': 5000 + index,
+            'specialties': [{'specialty_id': spid} for spid in range(1, SPECIALTY_COUNT + 1)]
+        }
+        for index in range(count)
+    ]
+
+
+def test_resolve_submitted_details_uses_constant_queries(college_data, count_statements):
+    with count_statements() as single:
+        groups, specialties = VolunteerPlanService._resolve_submitted_volunteer_details(1, submitted_colleges(1))
+    assert set(groups) == {5000}
+    assert len(specialties) == SPECIALTY_COUNT
+
+    with count_statements() as many:
+        groups, specialties = VolunteerPlanService._resolve_submitted_volunteer_details(1, submitted_colleges(8))
+    assert len(groups) == 8
+    assert len(specialties) == 8 * SPECIALTY_COUNT
+    assert groups[5003]['area_name'] == '石家庄市'
+    assert specialties[(5003, 2)]['prediction_score'] == 602
+
+    # 院校组、地区(按层级)、专业各一次批量查询，与提交的院校和专业数量无关
+    assert many.count == single.count
+
+
+def edited_volunteers(count):
+    """修改第2志愿段的志愿：每个志愿一个院校专业组(循环使用测试数据中的8个)"""
+    return [
+        {
+            'category_id': 2, 'group_id': 2, 'volunteer_index': index + 1,
+            'college_id': 100 + index % 8, 'college_group_id': 5000 + index % 8,
+            'specialties': [
+                {'specialty_id': spid, 'specialty_index': spid} for spid in range(1, SPECIALTY_COUNT + 1)
+            ]
+        }
+        for index in range(count)
+    ]
+
+
+def test_update_plan_uses_constant_queries(college_data, plan_factory, count_statements, no_background_tasks):
+    # 两个学生的方案相同：第1志愿段有两个未修改的院校(新版本共享)
+    plans = [plan_factory.plan(student_id=student_id) for student_id in (1, 2)]
+    for plan in plans:
+        plan_factory.college(plan, volunteer_index=1)
+        plan_factory.college(plan, volunteer_index=2)
+    plan_ids = [plan.id for plan in plans]
+
+    with count_statements() as single:
+        updated = VolunteerPlanService.update_volunteer_plan(plan_ids[0], {'colleges': edited_volunteers(1)})
+    assert len(updated['colleges']) == 3
+
+    with count_statements() as many:
+        updated = VolunteerPlanService.update_volunteer_plan(plan_ids[1], {'colleges': edited_volunteers(48)})
+    assert len(updated['colleges']) == 2 + 48
+    edited = [college for college in updated['colleges'] if college['group_id'] == 2]
+    assert len(edited) == 48
+    assert all(len(college['specialties']) == SPECIALTY_COUNT for college in edited)
+
+    # 整个修改(读取、写入新版本、返回详情)的语句数与修改的志愿和专业数量无关
+    assert many.count == single.count, many.statements
@@ -0,0 +1,99 @@
+# tests/test_plan_upsert.py
+from datetime import datetime, timezone
+from app.models.student_volunteer_plan import VolunteerCollege, VolunteerSpecialty
+from app.services.volunteer.plan_service import VolunteerPlanService
+
+
+def college_data(volunteer_index, name, group_id=1):
+    return {
+        'category_id': 1,
+        'group_id': group_id,
+        'volunteer_index': volunteer_index,
+        'college_id': 100 + volunteer_index,
+        'college_name': name,
+        'college_group_id': 1000 + volunteer_index,
+    }
+
+
+def college_names(plan_id):
+    return {
+        college.volunteer_index: college.college_name
+        for college in VolunteerCollege.query.filter_by(plan_id=plan_id)
+    }
+
+
+def test_batch_add_colleges_inserts_then_overwrites(plan_factory, count_statements):
+    plan = plan_factory.plan()
+
+    with count_statements() as counter:
+        VolunteerPlanService.batch_add_volunteer_colleges(plan.id, [college_data(index, f'院校{index}') for index in range(1, 49)])
+    assert len(college_names(plan.id)) == 48
+    # 48个院校一条插入语句完成(不含事务控制语句)
+    assert len([statement for statement in counter.statements if statement.lstrip().upper().startswith('INSERT')]) == 1
+
+    VolunteerPlanService.batch_add_volunteer_colleges(plan.id, [college_data(2, '新院校2'), college_data(49, '院校49')])
+    names = college_names(plan.id)
+    assert len(names) == 49
+    assert names[2] == '新院校2' and names[1] == '院校1'
+
+
+def test_batch_add_specialties_only_updates_provided_columns(plan_factory):
+    plan = plan_factory.plan()
+    college = plan_factory.college(plan, specialty_count=0)
+    VolunteerPlanService.batch_add_volunteer_specialties(college.id, [
+        {'specialty_id': 1, 'specialty_name': '专业1', 'specialty_index': 1, 'remarks': '原备注'},
+        {'specialty_id': 2, 'specialty_name': '专业2', 'specialty_index': 2, 'remarks': '原备注'},
+    ])
+
+    VolunteerPlanService.batch_add_volunteer_specialties(college.id, [
+        {'specialty_id': 3, 'specialty_name': '专业3', 'specialty_index': 2},
+    ])
+
+    specialties = {
+        specialty.specialty_index: specialty
+        for specialty in VolunteerSpecialty.query.filter_by(volunteer_college_id=college.id)
+    }
+    assert len(specialties) == 2
+    assert specialties[2].specialty_id == 3 and specialties[2].specialty_name == '专业3'
+    assert specialties[2].remarks == '原备注'
+
+
+def test_generic_upsert_updates_existing_and_inserts_new_rows(plan_factory, db_session, count_statements):
+    plan = plan_factory.plan()
+    plan_factory.college(plan, volunteer_index=1, specialty_count=0)
+    now = datetime.now(timezone.utc)
+
+    def row(volunteer_index, name):
+        return dict(college_data(volunteer_index, name), plan_id=plan.id, created_at=now, updated_at=now)
+
+    rows = [row(1, '旧名称'), row(2, '院校2'), row(1, '新院校1')]
+    with count_statements() as counter:
+        affected_rows = VolunteerPlanService._upsert_rows_generic(
+            VolunteerCollege, rows, ['plan_id', 'group_id', 'volunteer_index'], ['college_name', 'updated_at']
+        )
+    db_session.commit()
+
+    # 查询已存在的行、批量更新、批量插入各一次
+    assert counter.count == 3
+    assert affected_rows == 2
+    assert college_names(plan.id) == {1: '新院校1', 2: '院校2'}
+
+
+def test_batch_add_colleges_keeps_unsupplied_columns(plan_factory):
+    plan = plan_factory.plan()
+    VolunteerPlanService.batch_add_volunteer_colleges(plan.id, [
+        dict(college_data(1, '院校1'), ai_analysis='原解析'),
+        college_data(1, '二段院校1', group_id=2),
+    ])
+
+    VolunteerPlanService.batch_add_volunteer_colleges(plan.id, [college_data(1, '新院校1')])
+
+    colleges = {
+        (college.group_id, college.volunteer_index): college
+        for college in VolunteerCollege.query.filter_by(plan_id=plan.id)
+    }
+    # 不同志愿段可以使用相同序号；冲突更新不覆盖未传入的AI解析
+    assert len(colleges) == 2
+    assert colleges[(1, 1)].college_name == '新院校1'
+    assert colleges[(1, 1)].ai_analysis == '原解析'
+    assert colleges[(2, 1)].college_name == '二段院校1'
@@ -0,0 +1,82 @@
+# tests/test_plan_versioning.py
+import threading
+import pytest
+from app.models.student_volunteer_plan import StudentVolunteerPlan
+from app.services.volunteer.plan_service import VolunteerPlanService, PlanVersionConflictError
+
+STUDENT_ID = 1
+
+
+def run_concurrently(app, func, count):
+    """在多个线程(各自的应用上下文和数据库会话)中同时执行func，返回结果或异常列表"""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def worker(index):
+        with app.app_context():
+            barrier.wait()
+            try:
+                results[index] = func(index)
+            except Exception as e:
+                results[index] = e
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def plan_versions():
+    return sorted(
+        (plan.version, plan.is_current)
+        for plan in StudentVolunteerPlan.query.filter_by(student_id=STUDENT_ID)
+    )
+
+
+def test_concurrent_updates_from_same_base_create_one_version(app, plan_factory, no_background_tasks):
+    plan_id = plan_factory.plan(student_id=STUDENT_ID, version=1).id
+
+    results = run_concurrently(app, lambda index: VolunteerPlanService.update_volunteer_plan(
+        plan_id, {'base_version': 1, 'remarks': f'修改{index}'}
+    ), 4)
+
+    succeeded = [result for result in results if not isinstance(result, Exception)]
+    conflicts = [result for result in results if isinstance(result, PlanVersionConflictError)]
+    assert len(succeeded) == 1 and len(conflicts) == 3
+    assert all(conflict.latest_version == 2 for conflict in conflicts)
+    assert plan_versions() == [(1, False), (2, True)]
+
+
+def test_concurrent_first_generations_create_one_version(app, db_session):
+    results = run_concurrently(app, lambda index: VolunteerPlanService.create_empty_plan(
+        STUDENT_ID, 1, f'生成{index}', base_version=0
+    ), 4)
+
+    succeeded = [result for result in results if not isinstance(result, Exception)]
+    conflicts = [result for result in results if isinstance(result, PlanVersionConflictError)]
+    # 学生还没有方案时没有可交换的当前版本，由唯一约束拒绝重复的版本1
+    assert len(succeeded) == 1 and len(conflicts) == 3
+    assert plan_versions() == [(1, True)]
+
+
+def test_duplicate_version_insert_raises_conflict(plan_factory):
+    plan_factory.plan(student_id=STUDENT_ID, version=1)
+
+    with pytest.raises(PlanVersionConflictError) as error:
+        VolunteerPlanService.create_empty_plan(STUDENT_ID, 1, '重复生成', base_version=0)
+    assert error.value.latest_version == 1
+    assert plan_versions() == [(1, True)]
+
+
+def test_generation_from_stale_base_raises_conflict(plan_factory):
+    plan_factory.plan(student_id=STUDENT_ID, version=1, is_current=False)
+    plan_factory.plan(student_id=STUDENT_ID, version=2)
+
+    with pytest.raises(PlanVersionConflictError):
+        VolunteerPlanService.create_empty_plan(STUDENT_ID, 1, '过期的生成', base_version=1)
+
+    plan = VolunteerPlanService.create_empty_plan(STUDENT_ID, 1, '最新的生成')
+    assert plan['version'] == 3
+    assert plan_versions() == [(1, False), (2, False), (3, True)]
@@ -0,0 +1,274 @@
+# tests/test_provider_router.py
+import time
+from types import SimpleNamespace
+import httpx
+import openai
+import pytest
+from app.services.ai.async_client import AsyncLLMClient
+from app.services.ai.llm_service import LLMService
+from app.services.ai.provider_router import ProviderRouter
+from app.services.ai.response_cache import LLMResponseCache
+from app.services.ai.telemetry import LLMTelemetry
+
+PRIMARY, BACKUP, FLAKY = "stub_primary", "stub_backup", "stub_flaky"
+PARAMS = {"messages": [{"role": "user", "content": "你好"}], "temperature": 0.75, "stream": False}
+
+
+def stub_provider(name):
+    return {
+        "api_env_key": f"{name.upper()}_API_KEY",
+        "base_url": f"http://{name}.local/v1",
+        "model_name": f"{name}-model",
+        "stub": True,
+    }
+
+
+@pytest.fixture
+def providers(app, monkeypatch):
+    """
+    三个互为备选的桩提供者，路由统计和客户端从空开始
+
+    熔断阈值2次，冷却0.2秒；主提供者为活跃提供者
+    """
+    providers = {name: stub_provider(name) for name in (PRIMARY, BACKUP, FLAKY)}
+    for config in providers.values():
+        monkeypatch.setenv(config["api_env_key"], "stub")
+    monkeypatch.setattr(LLMService, 'PROVIDERS', providers)
+    monkeypatch.setattr(ProviderRouter, '_health', {})
+    monkeypatch.setitem(app.config, 'LLM_PROVIDER_OVERRIDE', PRIMARY)
+    monkeypatch.setitem(app.config, 'LLM_ROUTER_ENABLED', True)
+    monkeypatch.setitem(app.config, 'LLM_HEDGE_ENABLED', False)
+    monkeypatch.setitem(app.config, 'LLM_CIRCUIT_FAILURE_THRESHOLD', 2)
+    monkeypatch.setitem(app.config, 'LLM_CIRCUIT_RESET_TIMEOUT', 0.2)
+    monkeypatch.setitem(app.config, 'LLM_STUB_ERROR_RATE', 0)
+
+    with app.app_context():
+        for name in providers:
+            install_stub(monkeypatch, name)
+        yield providers
+        AsyncLLMClient.run(close_clients(providers))
+
+
+def install_stub(monkeypatch, name, error_rate=0, time_to_first_token=0):
+    """
+    按给定的注入错误比例(LLM_STUB_ERROR_RATE)和首个分块耗时重新创建提供者的桩客户端
+
+    桩客户端在首次使用时按当时的配置创建，这里在事件循环中按生产配置(含SDK重试次数)预先创建
+    """
+    from flask import current_app
+    monkeypatch.setitem(current_app.config, 'LLM_STUB_ERROR_RATE', error_rate)
+    monkeypatch.setitem(current_app.config, 'LLM_STUB_TTFT', time_to_first_token)
+    settings = AsyncLLMClient.settings(name)
+    config = LLMService.PROVIDERS[name]
+
+    async def install():
+        client = AsyncLLMClient._clients.pop(name, None)
+        if client is not None:
+            await client.close()
+        AsyncLLMClient._get_client(name, config, settings)
+
+    AsyncLLMClient.run(install())
+    monkeypatch.setitem(current_app.config, 'LLM_STUB_ERROR_RATE', 0)
+    monkeypatch.setitem(current_app.config, 'LLM_STUB_TTFT', 0)
+
+
+async def close_clients(providers):
+    for name in providers:
+        client = AsyncLLMClient._clients.pop(name, None)
+        if client is not None:
+            await client.close()
+
+
+def route(primary=PRIMARY, params=PARAMS, trace=None):
+    return ProviderRouter.create(LLMService.PROVIDERS, primary, params, trace)
+
+
+def state(name):
+    return ProviderRouter.status()[name]['state']
+
+
+def test_circuit_opens_then_half_open_trial_closes_it(providers, monkeypatch):
+    # 只保留主提供者，失败时没有备选
+    monkeypatch.setattr(LLMService, 'PROVIDERS', {PRIMARY: providers[PRIMARY]})
+    install_stub(monkeypatch, PRIMARY, error_rate=1)
+
+    for _ in range(2):
+        with pytest.raises(Exception):
+            route()
+    assert state(PRIMARY) == 'open'
+    with pytest.raises(RuntimeError, match="熔断"):
+        route()
+
+    # 冷却结束后放行一个试探请求，试探失败立即重新熔断
+    time.sleep(0.25)
+    with pytest.raises(Exception):
+        route()
+    assert state(PRIMARY) == 'open'
+    assert ProviderRouter.status()[PRIMARY]['consecutive_failures'] == 3
+
+    # 提供者恢复后，试探请求成功则关闭熔断
+    install_stub(monkeypatch, PRIMARY)
+    time.sleep(0.25)
+    answered_by, completion = route()
+    assert answered_by == PRIMARY
+    assert state(PRIMARY) == 'closed'
+    assert ProviderRouter.status()[PRIMARY]['consecutive_failures'] == 0
+
+
+def test_clients_do_not_retry_by_default(providers):
+    # SDK重试会绕过限流并放大耗时，失败由路由切换提供者
+    assert AsyncLLMClient.settings(PRIMARY)['max_retries'] == 0
+    assert AsyncLLMClient._clients[PRIMARY].max_retries == 0
+
+
+def status_error(error_class, status_code):
+    response = httpx.Response(status_code, request=httpx.Request("POST", "http://stub_primary.local/v1/chat/completions"))
+    return error_class("桩错误", response=response, body=None)
+
+
+@pytest.mark.parametrize('error, counted', [
+    (status_error(openai.BadRequestError, 400), False),
+    (status_error(openai.UnprocessableEntityError, 422), False),
+    (status_error(openai.RateLimitError, 429), True),
+    (status_error(openai.InternalServerError, 503), True),
+    (openai.APITimeoutError(httpx.Request("POST", "http://stub_primary.local/v1")), True),
+])
+def test_only_provider_failures_open_circuit(providers, monkeypatch, error, counted):
+    monkeypatch.setattr(LLMService, 'PROVIDERS', {PRIMARY: providers[PRIMARY]})
+
+    async def failing_create(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(AsyncLLMClient, 'acreate', failing_create)
+    # 熔断阈值为2次
+    for _ in range(2):
+        with pytest.raises(type(error)):
+            route()
+
+    assert state(PRIMARY) == ('open' if counted else 'closed')
+    assert ProviderRouter.status()[PRIMARY]['samples'] == (2 if counted else 0)
+
+
+def test_invalid_content_fails_over_without_opening_circuit(providers, monkeypatch):
+    create = AsyncLLMClient.acreate.__func__
+
+    async def invalid_primary(cls, provider_name, *args, **kwargs):
+        if provider_name == PRIMARY:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="不是JSON"))])
+        return await create(cls, provider_name, *args, **kwargs)
+
+    monkeypatch.setattr(AsyncLLMClient, 'acreate', classmethod(invalid_primary))
+    params = dict(PARAMS, response_format={"type": "json_object"})
+    for _ in range(3):
+        assert route(params=params)[0] == BACKUP
+
+    assert state(PRIMARY) == 'closed'
+    assert ProviderRouter.status()[PRIMARY]['samples'] == 0
+
+
+@pytest.mark.parametrize('usage_in_choice', [False, True])
+def test_stream_reports_usage(providers, monkeypatch, usage_in_choice):
+    # moonshot在结束分块的choice中返回usage，其他提供者需要请求 stream_options.include_usage
+    config = dict(providers[PRIMARY], stream_usage_in_choice=usage_in_choice)
+    params = dict(PARAMS, model=config["model_name"], stream=True)
+
+    with LLMTelemetry.collect() as collector:
+        chunks = list(AsyncLLMClient.stream(PRIMARY, config, params, LLMTelemetry.trace("stream_usage_test")))
+
+    # 只含usage的最后一个分块不产出给调用方(调用方按 chunk.choices[0] 读取内容)
+    assert chunks and all(chunk.choices for chunk in chunks)
+    assert "".join(chunk.choices[0].delta.content or "" for chunk in chunks)
+    summary = collector.summary()
+    assert summary['prompt_tokens'] > 0 and summary['completion_tokens'] > 0
+    assert "stream_options" not in params
+
+
+def test_failover_prefers_lower_error_rate(providers, monkeypatch):
+    install_stub(monkeypatch, PRIMARY, error_rate=1)
+    options = ProviderRouter.options()
+    # 备选提供者中 stub_flaky 近期错误率更高，排在 stub_backup 之后
+    ProviderRouter.record(FLAKY, 0.1, True, options)
+    ProviderRouter.record(FLAKY, 0.1, False, options)
+    ProviderRouter.record(BACKUP, 0.1, True, options)
+    assert ProviderRouter.candidates(LLMService.PROVIDERS, PRIMARY, options) == [PRIMARY, BACKUP, FLAKY]
+
+    answered_by, completion = route()
+
+    assert answered_by == BACKUP
+    assert completion.model == f"{BACKUP}-model"
+    assert ProviderRouter.status()[PRIMARY]['error_rate'] == 1
+
+
+def test_open_circuit_is_skipped(providers, monkeypatch):
+    install_stub(monkeypatch, PRIMARY, error_rate=1)
+    for _ in range(2):
+        assert route()[0] == BACKUP
+    assert state(PRIMARY) == 'open'
+    assert PRIMARY not in ProviderRouter.candidates(LLMService.PROVIDERS, PRIMARY, ProviderRouter.options())
+
+    assert route()[0] == BACKUP
+    assert ProviderRouter.status()[PRIMARY]['samples'] == 2
+
+
+def test_hedge_winner_cancels_slow_primary(providers, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'LLM_HEDGE_ENABLED', True)
+    monkeypatch.setitem(app.config, 'LLM_HEDGE_MIN_SAMPLES', 3)
+    monkeypatch.setitem(app.config, 'LLM_HEDGE_MIN_DELAY', 0.1)
+    options = ProviderRouter.options()
+    for _ in range(3):
+        ProviderRouter.record(PRIMARY, 0.05, True, options)
+    install_stub(monkeypatch, PRIMARY, time_to_first_token=5)
+
+    started = time.monotonic()
+    with LLMTelemetry.collect() as collector:
+        answered_by, completion = route(trace=LLMTelemetry.trace("hedge_test"))
+        # 首选提供者的请求在事件循环中被取消后记录
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline and collector.summary()['outcomes'].get('cancelled') is None:
+            time.sleep(0.01)
+
+    assert answered_by == BACKUP
+    assert time.monotonic() - started < 2
+    outcomes = {(record['provider'], record['outcome']) for record in collector.records}
+    assert outcomes == {(BACKUP, 'success'), (PRIMARY, 'cancelled')}
+    # 被取消的请求不计入首选提供者的统计
+    assert ProviderRouter.status()[PRIMARY]['samples'] == 3
+    assert state(PRIMARY) == 'closed'
+
+
+@pytest.fixture
+def response_cache(app, redis_client, monkeypatch):
+    monkeypatch.setitem(app.config, 'LLM_RESPONSE_CACHE_ENABLED', True)
+    return redis_client
+
+
+def cache_key(provider_name, user_input):
+    return LLMResponseCache.make_key(provider_name, {
+        "model": f"{provider_name}-model",
+        "messages": [{"role": "user", "content": user_input}],
+        "temperature": 0.75,
+    })
+
+
+def test_failover_response_is_cached_under_answering_provider(providers, response_cache, monkeypatch):
+    install_stub(monkeypatch, PRIMARY, error_rate=1)
+
+    content = LLMService._call_api(user_input="单次调用", call_name="failover_test", cache_response=True)
+
+    assert LLMResponseCache.get(cache_key(PRIMARY, "单次调用")) is None
+    assert LLMResponseCache.get(cache_key(BACKUP, "单次调用")) == content
+
+
+def test_concurrent_failover_responses_are_cached_under_answering_provider(providers, response_cache, monkeypatch):
+    install_stub(monkeypatch, PRIMARY, error_rate=1)
+    inputs = [f"并发调用{index}" for index in range(3)]
+
+    results = LLMService.run_concurrently([
+        (LLMService._call_api, {"user_input": user_input, "call_name": "failover_test", "cache_response": True})
+        for user_input in inputs
+    ])
+
+    assert not any(isinstance(result, Exception) for result in results)
+    for user_input, content in zip(inputs, results):
+        assert LLMResponseCache.get(cache_key(PRIMARY, user_input)) is None
+        assert LLMResponseCache.get(cache_key(BACKUP, user_input)) == content
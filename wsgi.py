@@ -1,6 +1,12 @@
 from app import create_app
+from app.extensions import socketio
 
 app = create_app()
 
+# 生产环境(Socket.IO为线程模式，见 app/extensions.py)：
+#   gunicorn -w 1 --threads 100 wsgi:app
+# 需要多个进程时每个进程单独监听端口，由反向代理按客户端做会话保持(sticky session)，
+# 进程间及Celery worker的推送通过 SOCKETIO_MESSAGE_QUEUE 转发。
+# 下面的 socketio.run 使用Werkzeug开发服务器，仅用于本地调试
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', debug=True)
+    socketio.run(app, host='0.0.0.0', debug=True)